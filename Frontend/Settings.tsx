@@ -431,6 +431,25 @@ const Settings: React.FC = () => {
     URL.revokeObjectURL(url);
   };
 
+  const waitForImportJob = async (jobId: number) => {
+    // Imports run in the background; poll the job until it has finished
+    while (true) {
+      await new Promise(resolve => setTimeout(resolve, 1000));
+      const response = await fetch(`/api/import/jobs/${jobId}`, {
+        headers: {
+          'Authorization': `Bearer ${localStorage.getItem('token')}`
+        }
+      });
+      if (!response.ok) {
+        throw new Error('Import status unavailable');
+      }
+      const { job } = await response.json();
+      if (job.status === 'completed' || job.status === 'failed') {
+        return job;
+      }
+    }
+  };
+
   const uploadFile = async (type: 'products' | 'materials' | 'inventory') => {
     const file = importFiles[type];
     if (!file) return;
@@ -458,13 +477,17 @@ const Settings: React.FC = () => {
       }
 
       const result = await response.json();
+      const job = await waitForImportJob(result.job.id);
+      if (job.status === 'failed') {
+        throw new Error(job.error_message || 'Import failed');
+      }
       
       setImportProgress(prev => ({
         ...prev,
         [type]: { uploading: false, success: true, error: null }
       }));
 
-      showMessage('success', `${result.imported_count} ${t('import.records_imported')} ${type}`);
+      showMessage('success', `${job.rows_inserted + job.rows_updated} ${t('import.records_imported')} ${type}`);
       
     } catch (error) {
       setImportProgress(prev => ({
@@ -1,6 +1,8 @@
 from flask import Flask
 from flask_cors import CORS
 from middleware.i18n import setup_i18n_middleware
+from middleware.audit import setup_audit_middleware
+from middleware.maintenance import setup_maintenance_middleware
 from flask_jwt_extended import JWTManager
 from flask_bcrypt import Bcrypt
 from config import Config
@@ -23,6 +25,8 @@ def create_app(config_class=Config):
     app.bcrypt = bcrypt  # Make bcrypt accessible from app instance
     # More permissive CORS for LAN access
     setup_i18n_middleware(app)
+    setup_audit_middleware(app)
+    setup_maintenance_middleware(app)
     
     CORS(app, 
          origins=['*'],  # Allow all origins for LAN access
@@ -111,6 +115,35 @@ def create_app(config_class=Config):
     from routes.wip_job_costing import wip_job_costing_bp
     app.register_blueprint(wip_job_costing_bp, url_prefix='/api/wip')
     
+    # Stock summary maintenance commands (flask stock-summary rebuild|verify)
+    from services.stock_summary import register_commands as register_stock_summary_commands
+    register_stock_summary_commands(app)
+    
+    # Data sync worker and manual runs (flask data-sync worker|run)
+    from services.data_sync import register_commands as register_data_sync_commands
+    register_data_sync_commands(app)
+    
+    # OEE rollups kept current on every OEE record change (flask oee-rollups rebuild)
+    from services.oee_rollups import register_commands as register_oee_rollup_commands
+    register_oee_rollup_commands(app)
+    
+    # Per-shift OEE kept current from production input (flask shift-oee rebuild)
+    from services.oee_engine import register_commands as register_shift_oee_commands
+    register_shift_oee_commands(app)
+    
+    # Machine metric history fed from OEE and production input (flask machine-history rebuild)
+    from services.machine_history import register_commands as register_machine_history_commands
+    register_machine_history_commands(app)
+    
+    # Webhook deliveries for business events (sales_order.confirmed, ...); the
+    # dispatcher starts with the first request so CLI commands don't run one
+    if app.config.get('WEBHOOK_DISPATCH_ENABLED', True):
+        from services.webhook_dispatcher import webhook_dispatcher
+        
+        @app.before_request
+        def start_webhook_dispatcher():
+            webhook_dispatcher.start(app)
+    
     # Public company info endpoint for showcase page (no auth required)
     @app.route('/api/company/public', methods=['GET'])
     def get_public_company_info():
@@ -209,6 +242,7 @@ def create_app(config_class=Config):
     # Create required directories
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(app.config['BACKUP_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['REPORT_FOLDER'], exist_ok=True)
     
     return app
 def create_initial_data(app):
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Data sync benchmark
+
+Seeds a throw-away SQLite database with a product master, then runs the
+sync engine in services/data_sync.py against a local HTTP stub server:
+an initial full export, an incremental run after a small fraction of the
+products changed, and an incremental run with nothing to do. Prints the
+records pushed, batches and throughput of each run and checks that the
+incremental run pushed exactly the changed rows, and that with
+error_handling 'continue' the rows of a rejected batch are pushed again by
+the next run.
+
+Usage: python benchmarks/data_sync_benchmark.py [--products N] [--changed N] [--batch-size N] [--parallel N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from flask import Flask
+from sqlalchemy import insert, update
+
+from models import db, Product, DataSyncJob, ExternalConnector
+from services import data_sync
+from services.data_sync import execute_sync, start_sync_execution
+
+received = []
+received_lock = threading.Lock()
+# Batches holding one of these codes are rejected
+rejected_codes = set()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Accepts every batch after a short delay, like a remote bulk endpoint"""
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(0.01)
+        if rejected_codes.intersection(record['code'] for record in payload['records']):
+            self.send_response(500)
+            self.end_headers()
+            return
+        with received_lock:
+            received.extend(record['code'] for record in payload['records'])
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+def create_benchmark_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def run(job_id, label, expected_status='success'):
+    received.clear()
+    job = db.session.get(DataSyncJob, job_id)
+    execution = execute_sync(start_sync_execution(job, 'manual').id)
+    print(f'{label:<22} {execution.status:<8} {execution.records_processed:>8} records '
+          f'{execution.batches_total:>5} batches {float(execution.records_per_second or 0):>10.0f} records/s')
+    assert execution.status == expected_status, execution.error_message
+    return set(received)
+
+
+def touch(product_ids):
+    db.session.execute(update(Product).where(Product.id.in_(product_ids)).values(
+        price=12, updated_at=datetime.utcnow() - timedelta(seconds=1)
+    ))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--changed', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--parallel', type=int, default=4)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    fd, database_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_benchmark_app(database_path)
+    # Rows are stamped in the past below, so no lag is needed
+    data_sync.WATERMARK_LAG_SECONDS = 0
+
+    with app.app_context():
+        db.create_all()
+        stamped = datetime.utcnow() - timedelta(hours=1)
+        db.session.execute(insert(Product), [{
+            'id': product_id, 'code': f'P-{product_id:06d}', 'name': f'Product {product_id}',
+            'primary_uom': 'pcs', 'price': 10, 'cost': 7, 'material_type': 'finished_goods',
+            'is_active': True, 'is_sellable': True, 'is_purchasable': True, 'is_producible': True,
+            'created_at': stamped, 'updated_at': stamped
+        } for product_id in range(1, args.products + 1)])
+        connector = ExternalConnector(
+            connector_name='Stub', connector_type='api', provider='stub', authentication_type='api_key',
+            api_key='key', endpoint_url=f'http://127.0.0.1:{server.server_port}/api', retry_attempts=0
+        )
+        db.session.add(connector)
+        db.session.flush()
+        job = DataSyncJob(
+            job_name='Product master', job_code='PRODUCTS', source_connector_id=connector.id,
+            target_system='external_api', sync_type='incremental', sync_direction='export',
+            schedule_type='interval', schedule_interval_minutes=60,
+            mapping_configuration=json.dumps({'entity': 'products', 'path': '/products/bulk'}),
+            batch_size=args.batch_size, parallel_batches=args.parallel
+        )
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+
+        first = run(job_id, 'initial export')
+        assert len(first) == args.products
+
+        step = max(args.products // args.changed, 1)
+        changed_ids = list(range(1, args.products + 1, step))[:args.changed]
+        touch(changed_ids)
+
+        second = run(job_id, 'incremental (changed)')
+        assert second == {f'P-{product_id:06d}' for product_id in changed_ids}
+        third = run(job_id, 'incremental (idle)')
+        assert not third
+
+        # One batch in the middle is rejected while the others go through
+        job = db.session.get(DataSyncJob, job_id)
+        job.error_handling = 'continue'
+        db.session.commit()
+        touch(changed_ids)
+        rejected_id = changed_ids[len(changed_ids) // 2]
+        rejected_codes.add(f'P-{rejected_id:06d}')
+        partial = run(job_id, 'continue (rejected)', expected_status='failed')
+        assert rejected_codes.isdisjoint(partial)
+        rejected_codes.clear()
+        retried = run(job_id, 'continue (retried)')
+        assert f'P-{rejected_id:06d}' in retried
+        assert partial | retried == {f'P-{product_id:06d}' for product_id in changed_ids}
+
+    print('OK')
+    server.shutdown()
+    os.remove(database_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Document number allocation check
+
+Allocates document numbers from many threads at once against a
+throw-away SQLite database through services/document_numbers.py and
+checks that:
+
+- numbers allocated in committed transactions are unique and gap-free
+- numbers of rolled back transactions are handed out again
+- a new period continues after the highest number already stored
+- tables sharing a prefix (WO) keep a sequence each, so one seeded from
+  the other never reuses its numbers
+- block reservation hands every number out exactly once across threads
+
+Usage: python benchmarks/document_number_check.py [--threads N] [--per-thread N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from flask import Flask
+from sqlalchemy import insert
+
+from models import db, BackupRecord, MaintenanceRecord, WorkOrder
+from services.document_numbers import allocate_number, current_period, number_blocks, _reserve_block
+
+
+def create_check_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+    return app
+
+
+def run_threads(app, threads, work):
+    errors = []
+
+    def target(index):
+        with app.app_context():
+            try:
+                work(index)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    workers = [threading.Thread(target=target, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert not errors, errors
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--per-thread', type=int, default=50)
+    args = parser.parse_args()
+
+    fd, database_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_check_app(database_path)
+    period = current_period()
+    total = args.threads * args.per_thread
+
+    with app.app_context():
+        db.create_all()
+
+        # An existing document of this period
+        db.session.add(BackupRecord(
+            backup_number=f'BKP-{period}-00041', backup_date=datetime.utcnow(), backup_type='full',
+            file_name='seed.db', file_path='seed.db', status='completed'
+        ))
+        db.session.commit()
+
+    committed = []
+    committed_lock = threading.Lock()
+
+    def allocate(index):
+        for attempt in range(args.per_thread):
+            number = allocate_number('BKP', BackupRecord, 'backup_number')
+            if attempt % 5 == 4:
+                db.session.rollback()
+                continue
+            db.session.commit()
+            with committed_lock:
+                committed.append(number)
+
+    elapsed = run_threads(app, args.threads, allocate)
+    values = sorted(int(number.rsplit('-', 1)[-1]) for number in committed)
+    print(f'{len(committed)} committed numbers from {args.threads} threads in {elapsed:.2f}s '
+          f'({values[0]}..{values[-1]})')
+    assert len(set(committed)) == len(committed), 'duplicate numbers'
+    assert values == list(range(42, 42 + len(committed))), 'gaps or wrong seed'
+
+    with app.app_context():
+        db.session.execute(insert(WorkOrder), [{
+            'wo_number': f'WO-{period}-00007', 'product_id': 1, 'uom': 'pcs', 'status': 'planned',
+            'priority': 'normal', 'workflow_status': 'pending', 'created_at': datetime.utcnow()
+        }])
+        db.session.commit()
+        # A maintenance record takes the first WO number of the period
+        maintenance = allocate_number('WO', MaintenanceRecord, 'maintenance_number')
+        work_order = allocate_number('WO', WorkOrder, 'wo_number')
+        db.session.commit()
+    print(f'WO numbers: maintenance {maintenance}, work order {work_order}')
+    assert maintenance == f'WO-{period}-00001' and work_order == f'WO-{period}-00008', 'shared WO sequence'
+
+    blocked = []
+    blocked_lock = threading.Lock()
+
+    def take_from_blocks(index):
+        for _ in range(args.per_thread):
+            value = number_blocks.take(('QI', '', period), 20, lambda size: _reserve_block('QI', period, size, None, None))
+            with blocked_lock:
+                blocked.append(value)
+
+    elapsed = run_threads(app, args.threads, take_from_blocks)
+    print(f'{len(blocked)} block numbers in {elapsed:.2f}s')
+    assert sorted(blocked) == list(range(1, total + 1)), 'block numbers repeated or skipped'
+
+    print('OK')
+    os.remove(database_path)
+
+
+if __name__ == '__main__':
+    main()
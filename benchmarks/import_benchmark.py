@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Bulk import benchmark
+
+Writes a product catalogue CSV with a sprinkling of bad and repeated rows
+and an inventory CSV for it, then runs the import jobs of
+services/bulk_import.py against a throw-away SQLite database: the first
+product import, a skip-mode re-import (every row already exists), an
+upsert re-import, the inventory import and an upsert changing every cost.
+Prints the time and row counts of each run and checks the counts, the
+error report and the stock summaries, including their stock value after
+the cost change.
+
+Usage: python benchmarks/import_benchmark.py [--products N] [--chunk-size N]
+"""
+
+import argparse
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from flask import Flask
+from sqlalchemy import func
+
+from models import db, Product, ProductCategory, Inventory, StockSummary, WarehouseZone, WarehouseLocation
+from services.bulk_import import create_import_job, run_import_job
+
+BAD_EVERY = 1000  # one row in BAD_EVERY has a bad price, one a repeated code
+
+
+def create_benchmark_app(work_dir):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(work_dir, "import.db")}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['REPORT_FOLDER'] = os.path.join(work_dir, 'reports')
+    db.init_app(app)
+    return app
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def product_rows(count, price, cost=7):
+    for index in range(1, count + 1):
+        code = f'P-{index:06d}'
+        row_price = price
+        if index % BAD_EVERY == 0:
+            row_price = 'n/a'
+        elif index % BAD_EVERY == 1 and index > 1:
+            code = f'P-{index - 2:06d}'
+        yield [code, f'Product {index}', 'FG' if index % 2 else 'Packaging', 'finished_goods', 'pcs', row_price, cost]
+
+
+def run(work_dir, import_type, mode, header, rows, chunk_size):
+    path = os.path.join(work_dir, f'{import_type}.csv')
+    write_csv(path, header, rows)
+    job = create_import_job(import_type, mode, os.path.basename(path), path, None)
+    started = time.perf_counter()
+    run_import_job(job.id, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - started
+    db.session.refresh(job)
+    print(f'{import_type + " (" + mode + ")":<20} {job.status:<9} {elapsed:>6.2f}s {job.rows_processed / elapsed:>9.0f} rows/s '
+          f'inserted {job.rows_inserted:>6} updated {job.rows_updated:>6} skipped {job.rows_skipped:>6} failed {job.rows_failed:>4}')
+    assert job.status == 'completed', job.error_message
+    return job
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='import-benchmark-')
+    app = create_benchmark_app(work_dir)
+    product_header = ['product_code', 'product_name', 'category', 'material_type', 'unit', 'unit_price', 'cost_price']
+    bad = args.products // BAD_EVERY
+    repeated = (args.products - 1) // BAD_EVERY
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            ProductCategory(code='FG', name='Finished goods'),
+            ProductCategory(code='PKG', name='Packaging')
+        ])
+        zone = WarehouseZone(code='Z1', name='Zone 1', material_type='finished_goods')
+        db.session.add(zone)
+        db.session.flush()
+        db.session.add_all([
+            WarehouseLocation(zone_id=zone.id, location_code=f'Z1-A-{level}-1', rack='A', level=str(level),
+                              position='1', capacity=1000000, capacity_uom='pcs')
+            for level in (1, 2)
+        ])
+        db.session.commit()
+
+        job = run(work_dir, 'products', 'skip', product_header, product_rows(args.products, 10), args.chunk_size)
+        assert job.rows_failed == bad + repeated
+        assert job.rows_inserted == args.products - bad - repeated
+        with open(job.error_report_path, newline='') as handle:
+            assert sum(1 for _ in handle) == bad + repeated + 1
+
+        job = run(work_dir, 'products', 'skip', product_header, product_rows(args.products, 10), args.chunk_size)
+        assert job.rows_inserted == 0 and job.rows_skipped == args.products - bad - repeated
+
+        job = run(work_dir, 'products', 'upsert', product_header, product_rows(args.products, 12), args.chunk_size)
+        assert job.rows_updated == args.products - bad - repeated
+        assert db.session.query(func.count(Product.id)).filter(Product.price == 12).scalar() == job.rows_updated
+
+        codes = [code for (code,) in db.session.query(Product.code).order_by(Product.id)]
+        job = run(work_dir, 'inventory', 'upsert', ['product_code', 'location_code', 'quantity', 'batch_number'], (
+            [code, f'Z1-A-{1 + index % 2}-1', 5, ''] for index, code in enumerate(codes)
+        ), args.chunk_size)
+        assert job.rows_inserted == len(codes)
+        on_hand = db.session.query(func.sum(StockSummary.on_hand_quantity)).scalar()
+        assert float(on_hand) == 5 * len(codes) == float(db.session.query(func.sum(Inventory.quantity)).scalar())
+
+        # Bulk product updates bypass the mapper event revaluing stock
+        job = run(work_dir, 'products', 'upsert', product_header, product_rows(args.products, 12, cost=14),
+                  args.chunk_size)
+        stock_value = db.session.query(func.sum(StockSummary.stock_value)).scalar()
+        assert float(stock_value) == 14 * 5 * len(codes), stock_value
+
+    print('OK')
+    shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+MRP explosion benchmark
+
+Seeds a throw-away SQLite database with 10k confirmed order lines and 2k
+active BOMs (finished goods plus two levels of sub-assemblies), then times
+the set-based explosion in services/mrp_engine.py and counts the SQL
+statements it issues.
+
+Usage: python benchmarks/mrp_benchmark.py [--order-lines N] [--boms N] [--runs N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from flask import Flask
+from sqlalchemy import event, insert
+
+from models import (
+    db, User, Customer, Material, Product, BillOfMaterials, BOMItem,
+    SalesOrder, SalesOrderItem, WarehouseZone, WarehouseLocation, Inventory
+)
+from services.mrp_engine import calculate_material_requirements
+
+MATERIAL_COUNT = 500
+LINES_PER_ORDER = 5
+
+
+def create_benchmark_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed(order_lines, bom_count):
+    """Bulk-insert the benchmark data set"""
+    rng = random.Random(42)
+    today = datetime.utcnow().date()
+    now = datetime.utcnow()
+
+    db.session.execute(insert(User), [{
+        'id': 1, 'username': 'bench', 'email': 'bench@example.com',
+        'password_hash': 'x', 'full_name': 'Benchmark', 'is_active': True,
+        'is_admin': True, 'created_at': now
+    }])
+    db.session.execute(insert(Customer), [{
+        'id': 1, 'code': 'CUST-BENCH', 'company_name': 'Benchmark Customer',
+        'priority': 'normal', 'is_active': True, 'created_at': now
+    }])
+    db.session.execute(insert(Material), [{
+        'id': i, 'code': f'MAT-{i:05d}', 'name': f'Material {i}',
+        'material_type': 'raw_materials', 'category': 'bench', 'primary_uom': 'kg',
+        'cost_per_unit': 1, 'is_active': True, 'is_hazardous': False, 'created_at': now
+    } for i in range(1, MATERIAL_COUNT + 1)])
+
+    # 60% finished goods, 30% level-1 and 10% level-2 sub-assemblies
+    finished_count = int(bom_count * 0.6)
+    level1_count = int(bom_count * 0.3)
+    product_ids = list(range(1, bom_count + 1))
+    finished = product_ids[:finished_count]
+    level1 = product_ids[finished_count:finished_count + level1_count]
+    level2 = product_ids[finished_count + level1_count:]
+
+    db.session.execute(insert(Product), [{
+        'id': product_id, 'code': f'PRD-{product_id:05d}', 'name': f'Product {product_id}',
+        'primary_uom': 'pcs', 'price': 10, 'cost': 5,
+        'material_type': 'finished_goods' if product_id in finished else 'semi_finished',
+        'is_active': True, 'is_sellable': True, 'is_purchasable': False,
+        'is_producible': True, 'created_at': now
+    } for product_id in product_ids])
+
+    db.session.execute(insert(BillOfMaterials), [{
+        'id': product_id, 'bom_number': f'BOM-{product_id:05d}', 'product_id': product_id,
+        'version': '1.0', 'is_active': True, 'batch_size': 1, 'batch_uom': 'pcs',
+        'created_at': now
+    } for product_id in product_ids])
+
+    bom_items = []
+    item_id = 1
+    for product_id in product_ids:
+        line_number = 1
+        for material_id in rng.sample(range(1, MATERIAL_COUNT + 1), 4):
+            bom_items.append({
+                'id': item_id, 'bom_id': product_id, 'line_number': line_number,
+                'material_id': material_id, 'quantity': rng.uniform(0.1, 5),
+                'uom': 'kg', 'scrap_percent': rng.choice([0, 1, 2.5, 5]),
+                'is_critical': False, 'lead_time_days': rng.randint(0, 14),
+                'created_at': now
+            })
+            item_id += 1
+            line_number += 1
+
+        children = level1 if product_id in finished else level2 if product_id in level1 else []
+        if children:
+            bom_items.append({
+                'id': item_id, 'bom_id': product_id, 'line_number': line_number,
+                'product_id': rng.choice(children), 'quantity': rng.uniform(1, 3),
+                'uom': 'pcs', 'scrap_percent': 0, 'is_critical': True,
+                'lead_time_days': 0, 'created_at': now
+            })
+            item_id += 1
+    db.session.execute(insert(BOMItem), bom_items)
+
+    order_count = order_lines // LINES_PER_ORDER
+    db.session.execute(insert(SalesOrder), [{
+        'id': order_id, 'order_number': f'SO-BENCH-{order_id:06d}', 'customer_id': 1,
+        'order_date': today + timedelta(days=rng.randint(0, 29)),
+        'required_date': today + timedelta(days=rng.randint(30, 60)),
+        'status': 'confirmed', 'priority': 'normal', 'created_at': now
+    } for order_id in range(1, order_count + 1)])
+    db.session.execute(insert(SalesOrderItem), [{
+        'order_id': order_id, 'line_number': line_number,
+        'product_id': rng.choice(finished), 'quantity': rng.randint(1, 500),
+        'uom': 'pcs', 'unit_price': 10, 'total_price': 10, 'created_at': now
+    } for order_id in range(1, order_count + 1) for line_number in range(1, LINES_PER_ORDER + 1)])
+
+    db.session.execute(insert(WarehouseZone), [{
+        'id': 1, 'code': 'ZONE-BENCH', 'name': 'Benchmark', 'material_type': 'raw_materials',
+        'is_active': True, 'created_at': now
+    }])
+    db.session.execute(insert(WarehouseLocation), [{
+        'id': 1, 'zone_id': 1, 'location_code': 'BENCH-01-01-01', 'rack': '01',
+        'level': '01', 'position': '01', 'capacity': 0, 'capacity_uom': 'pcs',
+        'occupied': 0, 'is_active': True, 'is_available': True, 'created_at': now
+    }])
+    db.session.execute(insert(Inventory), [{
+        'product_id': product_id, 'location_id': 1, 'quantity': qty,
+        'reserved_quantity': 0, 'available_quantity': qty, 'created_at': now
+    } for product_id, qty in ((p, rng.randint(0, 2000)) for p in product_ids)])
+
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the set-based MRP explosion')
+    parser.add_argument('--order-lines', type=int, default=10000)
+    parser.add_argument('--boms', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    fd, database_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+
+    try:
+        app = create_benchmark_app(database_path)
+        with app.app_context():
+            db.create_all()
+
+            started = time.perf_counter()
+            seed(args.order_lines, args.boms)
+            print(f"Seeded {args.order_lines} order lines / {args.boms} BOMs "
+                  f"in {time.perf_counter() - started:.2f}s")
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute',
+                         lambda *a, **kw: statements.append(1))
+
+            start_date = datetime.utcnow().date()
+            end_date = start_date + timedelta(days=30)
+            timings = []
+
+            for _ in range(args.runs):
+                statements.clear()
+                db.session.expire_all()
+                started = time.perf_counter()
+                result = calculate_material_requirements(start_date, end_date, include_forecasts=True)
+                timings.append(time.perf_counter() - started)
+
+            timings.sort()
+            print(f"Materials: {len(result['requirements'])}, "
+                  f"confirmed orders: {result['confirmed_orders']}")
+            print(f"SQL statements per run: {len(statements)}")
+            print(f"Best: {timings[0] * 1000:.1f} ms, "
+                  f"median: {timings[len(timings) // 2] * 1000:.1f} ms over {args.runs} runs")
+    finally:
+        os.remove(database_path)
+
+
+if __name__ == '__main__':
+    main()
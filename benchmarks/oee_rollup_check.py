@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+OEE rollup check
+
+Seeds a throw-away SQLite database with machines, OEE records and
+downtime records through the ORM, then inserts, moves, edits and deletes
+records and checks after every step that the incrementally maintained
+OEEAnalytics rows equal a full rebuild from the source rows. Also times
+the dashboard readers against averaging the raw records.
+
+Usage: python benchmarks/oee_rollup_check.py [--machines N] [--days N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from flask import Flask
+
+from models import db, Machine
+from models.oee import OEERecord, OEEDowntimeRecord, OEEAnalytics
+from services import oee_rollups
+
+CATEGORIES = ('breakdown', 'changeover', 'setup', 'planned_maintenance')
+COMPARED = ('total_records', 'avg_availability', 'avg_performance', 'avg_quality', 'avg_oee', 'best_oee',
+            'worst_oee', 'downtime_minutes', 'total_units_produced', 'defect_rate', 'maintenance_hours',
+            'breakdown_count', 'downtime_by_category')
+
+
+def create_check_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def make_record(number, machine_id, day, rng):
+    availability, performance, quality = rng.uniform(60, 100), rng.uniform(60, 100), rng.uniform(90, 100)
+    produced = rng.randint(500, 2000)
+    good = int(produced * quality / 100)
+    return OEERecord(
+        record_number=f'OEE-{number:07d}', machine_id=machine_id, record_date=day, shift='day',
+        planned_production_time=480, downtime=rng.randint(0, 90), actual_production_time=rng.randint(380, 480),
+        total_pieces_produced=produced, good_pieces=good, rejected_pieces=produced - good,
+        availability=availability, performance=performance, quality=quality,
+        oee=availability * performance * quality / 10000
+    )
+
+
+def snapshot():
+    return {
+        (row.machine_id, row.analysis_date, row.period_type): tuple(
+            getattr(row, name) if name == 'downtime_by_category' else float(getattr(row, name) or 0)
+            for name in COMPARED
+        )
+        for row in db.session.query(OEEAnalytics).populate_existing()
+    }
+
+
+def assert_consistent(step):
+    incremental = snapshot()
+    oee_rollups.rebuild_rollups()
+    rebuilt = snapshot()
+    assert incremental == rebuilt, f'{step}: rollups differ from a rebuild'
+    print(f'{step}: {len(rebuilt)} rollups match a rebuild')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--machines', type=int, default=10)
+    parser.add_argument('--days', type=int, default=90)
+    args = parser.parse_args()
+
+    fd, database_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_check_app(database_path)
+    rng = random.Random(7)
+    today = date.today()
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(
+            Machine(id=machine_id, code=f'M{machine_id}', name=f'Machine {machine_id}', machine_type='nonwoven_machine')
+            for machine_id in range(1, args.machines + 1)
+        )
+        db.session.commit()
+
+        started = time.perf_counter()
+        number = 0
+        for offset in range(args.days):
+            day = today - timedelta(days=offset)
+            for machine_id in range(1, args.machines + 1):
+                number += 1
+                record = make_record(number, machine_id, day, rng)
+                db.session.add(record)
+                db.session.flush()
+                db.session.add(OEEDowntimeRecord(
+                    oee_record_id=record.id, machine_id=machine_id,
+                    start_time=datetime.combine(day, datetime.min.time()) + timedelta(hours=rng.randint(0, 23)),
+                    duration_minutes=rng.randint(5, 60), downtime_category=rng.choice(CATEGORIES)
+                ))
+            db.session.commit()
+        print(f'{number} records with rollups in {time.perf_counter() - started:.2f}s')
+        assert_consistent('insert')
+
+        record = db.session.query(OEERecord).filter_by(machine_id=1, record_date=today).first()
+        record.record_date = today - timedelta(days=45)
+        record.machine_id = 2
+        db.session.commit()
+        assert_consistent('move record')
+
+        record.oee = 12.5
+        downtime = db.session.query(OEEDowntimeRecord).filter_by(machine_id=3).first()
+        downtime.duration_minutes = 300
+        downtime.downtime_category = 'breakdown'
+        db.session.commit()
+        assert_consistent('edit')
+
+        db.session.delete(downtime)
+        for record in db.session.query(OEERecord).filter_by(machine_id=4).all():
+            for record_downtime in record.downtime_records:
+                db.session.delete(record_downtime)
+            db.session.delete(record)
+        db.session.commit()
+        assert_consistent('delete')
+
+        db.session.add(make_record(number + 1, 5, today, rng))
+        db.session.rollback()
+        assert_consistent('rollback')
+
+        start_date = today - timedelta(days=30)
+        started = time.perf_counter()
+        summary = oee_rollups.summary(start_date, today)
+        rollup_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        records = db.session.query(OEERecord).filter(OEERecord.record_date.between(start_date, today)).all()
+        raw_average = round(sum(float(r.oee) for r in records) / len(records), 2)
+        raw_seconds = time.perf_counter() - started
+        assert summary['total_records'] == len(records)
+        assert abs(summary['avg_oee'] - raw_average) <= 0.01 * args.machines, (summary['avg_oee'], raw_average)
+        print(f'30-day summary: rollups {rollup_seconds * 1000:.1f} ms, raw records {raw_seconds * 1000:.1f} ms')
+
+    print('OK')
+    os.remove(database_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Payroll calculation benchmark
+
+Seeds a throw-away SQLite database with 1,500 active operators, a month of
+attendance and three earning components each, then times the batched
+payroll calculation in services/payroll_engine.py: a first run that
+inserts every record and a recalculation that updates them in place.
+
+Usage: python benchmarks/payroll_benchmark.py [--employees N] [--days N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from flask import Flask
+from sqlalchemy import event, func, insert
+
+from models import (
+    db, Employee, Attendance, PayrollPeriod, PayrollRecord, SalaryComponent, EmployeeSalaryComponent
+)
+from services.payroll_engine import calculate_period_payroll
+
+COMPONENTS_PER_EMPLOYEE = 3
+
+
+def create_benchmark_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed(employee_count, days):
+    """Bulk-insert the benchmark data set; returns the period id"""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    start_date = date(now.year, now.month, 1)
+
+    db.session.execute(insert(Employee), [{
+        'id': employee_id, 'employee_number': f'EMP-{employee_id:05d}',
+        'first_name': 'Operator', 'last_name': str(employee_id), 'full_name': f'Operator {employee_id}',
+        'status': 'active', 'is_active': True, 'salary': rng.randint(4000, 9000) * 1000,
+        'created_at': now
+    } for employee_id in range(1, employee_count + 1)])
+
+    db.session.execute(insert(SalaryComponent), [
+        {'id': 1, 'name': 'Transport', 'component_type': 'earning', 'calculation_type': 'fixed', 'created_at': now},
+        {'id': 2, 'name': 'Meal', 'component_type': 'earning', 'calculation_type': 'fixed', 'created_at': now},
+        {'id': 3, 'name': 'Shift', 'component_type': 'earning', 'calculation_type': 'fixed', 'created_at': now},
+        {'id': 4, 'name': 'Cooperative', 'component_type': 'deduction', 'calculation_type': 'fixed', 'created_at': now}
+    ])
+    db.session.execute(insert(EmployeeSalaryComponent), [{
+        'employee_id': employee_id, 'salary_component_id': component_id,
+        'amount': rng.randint(100, 500) * 1000, 'effective_from': start_date - timedelta(days=90),
+        'is_active': True, 'created_at': now
+    } for employee_id in range(1, employee_count + 1)
+      for component_id in rng.sample(range(1, 5), COMPONENTS_PER_EMPLOYEE)])
+
+    db.session.execute(insert(Attendance), [{
+        'employee_id': employee_id, 'attendance_date': start_date + timedelta(days=day),
+        'status': rng.choices(('present', 'absent', 'late'), weights=(90, 5, 5))[0],
+        'worked_hours': 8, 'overtime_hours': rng.choice((0, 0, 0, 1, 2, 3)), 'created_at': now
+    } for employee_id in range(1, employee_count + 1) for day in range(days)])
+
+    period = PayrollPeriod(
+        period_name=start_date.strftime('%B %Y'),
+        start_date=start_date,
+        end_date=start_date + timedelta(days=days - 1)
+    )
+    db.session.add(period)
+    db.session.commit()
+    return period.id
+
+
+def timed_run(period_id, statements):
+    period = db.session.get(PayrollPeriod, period_id)
+    period.status = 'draft'
+    statements.clear()
+    started = time.perf_counter()
+    summary = calculate_period_payroll(period)
+    db.session.commit()
+    return summary, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the batched payroll calculation')
+    parser.add_argument('--employees', type=int, default=1500)
+    parser.add_argument('--days', type=int, default=30)
+    args = parser.parse_args()
+
+    fd, database_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+
+    try:
+        app = create_benchmark_app(database_path)
+        with app.app_context():
+            db.create_all()
+
+            started = time.perf_counter()
+            period_id = seed(args.employees, args.days)
+            print(f"Seeded {args.employees} employees / {args.employees * args.days} attendance rows "
+                  f"in {time.perf_counter() - started:.2f}s")
+
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute',
+                         lambda *a, **kw: statements.append(1))
+
+            for label in ('First calculation', 'Recalculation'):
+                summary, elapsed = timed_run(period_id, statements)
+                print(f"{label}: {elapsed * 1000:.1f} ms, {len(statements)} SQL statements, "
+                      f"{summary['records_created']} created / {summary['records_updated']} updated, "
+                      f"net {summary['total_net_salary']:,.2f}")
+
+            records = db.session.query(func.count(PayrollRecord.id)).scalar()
+            print(f"Payroll records: {records}")
+    finally:
+        os.remove(database_path)
+
+
+if __name__ == '__main__':
+    main()
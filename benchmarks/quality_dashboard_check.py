@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Quality dashboard check
+
+Seeds a throw-away SQLite database with machines, products, quality
+inspections, alerts and CAPAs, then checks that the grouped, cached
+quality dashboard equals the figures computed with one count()/sum() per
+figure and per trend day and with per-machine inspection loading
+(machines linked to products through their work orders), that a
+commit changing an inspection or an alert drops the cached window and
+that a rollback does not. Also times both ways.
+
+Usage: python benchmarks/quality_dashboard_check.py [--machines N] [--inspections N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from flask import Flask
+from sqlalchemy import func, insert
+
+from models import db, Machine, Product, WorkOrder
+from models.quality import QualityInspection, CAPA
+from models.quality_enhanced import QualityAlert
+from services import quality_metrics
+
+RESULTS = ('accepted', 'accepted', 'accepted', 'rejected', 'rework', None)
+SEVERITIES = ('low', 'medium', 'high', 'critical')
+
+
+def create_check_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def per_query_dashboard(days, today):
+    """The figures as computed one query per figure, per trend day and per machine"""
+    week_start = today - timedelta(days=days)
+    total_week = QualityInspection.query.filter(QualityInspection.inspection_date >= week_start).count()
+    passed_week = QualityInspection.query.filter(
+        QualityInspection.inspection_date >= week_start, QualityInspection.result == 'accepted'
+    ).count()
+
+    trend = []
+    for i in range(days):
+        trend_date = today - timedelta(days=days - 1 - i)
+        daily = QualityInspection.query.filter(func.date(QualityInspection.inspection_date) == trend_date).count()
+        daily_passed = QualityInspection.query.filter(
+            func.date(QualityInspection.inspection_date) == trend_date, QualityInspection.result == 'accepted'
+        ).count()
+        trend.append({
+            'date': trend_date.isoformat(),
+            'pass_rate': round(daily_passed / daily * 100, 2) if daily else 0,
+            'inspections': daily
+        })
+
+    machines = []
+    for machine in db.session.query(Machine).order_by(Machine.name):
+        product_ids = {
+            product_id for (product_id,) in db.session.query(WorkOrder.product_id).filter_by(machine_id=machine.id)
+        }
+        inspections = QualityInspection.query.filter(
+            QualityInspection.product_id.in_(product_ids), QualityInspection.inspection_date >= week_start
+        ).all()
+        if inspections:
+            passed = len([i for i in inspections if i.result == 'accepted'])
+            machines.append({
+                'machine': machine.name,
+                'pass_rate': round(passed / len(inspections) * 100, 2),
+                'total_inspections': len(inspections),
+                'total_defects': sum(i.defect_count or 0 for i in inspections)
+            })
+
+    return {
+        'summary': {
+            'inspections_today': QualityInspection.query.filter(
+                func.date(QualityInspection.inspection_date) == today
+            ).count(),
+            'inspections_this_week': total_week,
+            'pass_rate': round(passed_week / total_week * 100, 2) if total_week else 0,
+            'active_alerts': QualityAlert.query.filter_by(status='active').count(),
+            'critical_alerts': QualityAlert.query.filter(
+                QualityAlert.status == 'active', QualityAlert.severity.in_(['high', 'critical'])
+            ).count(),
+            'open_capas': CAPA.query.filter_by(status='open').count(),
+            'overdue_capas': CAPA.query.filter(
+                CAPA.status.in_(['open', 'in_progress']), CAPA.target_date < today
+            ).count(),
+            'total_defects_week': int(db.session.query(func.sum(QualityInspection.defect_count)).filter(
+                QualityInspection.inspection_date >= week_start
+            ).scalar() or 0)
+        },
+        'trends': {
+            'pass_rate': trend
+        },
+        'machine_performance': machines
+    }
+
+
+def timed(label, function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    print(f'{label:<40} {(time.perf_counter() - started) * 1000:>8.1f} ms')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--machines', type=int, default=20)
+    parser.add_argument('--inspections', type=int, default=50000)
+    args = parser.parse_args()
+
+    fd, database_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_check_app(database_path)
+    rng = random.Random(5)
+    today = date.today()
+    now = datetime.combine(today, datetime.min.time()) + timedelta(hours=12)
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(Machine), [
+            {'id': machine_id, 'code': f'M{machine_id:03d}', 'name': f'Machine {machine_id}',
+             'machine_type': 'nonwoven_machine', 'status': 'running', 'is_active': True, 'created_at': now}
+            for machine_id in range(1, args.machines + 1)
+        ])
+        db.session.execute(insert(Product), [
+            {'id': product_id, 'code': f'P{product_id:04d}', 'name': f'Product {product_id}', 'primary_uom': 'kg',
+             'price': 0, 'cost': 0, 'material_type': 'finished_goods', 'is_active': True, 'is_sellable': True,
+             'is_purchasable': False, 'is_producible': True, 'created_at': now}
+            for product_id in range(1, args.machines * 3 + 1)
+        ])
+        # Some products run on two machines, some on none
+        db.session.execute(insert(WorkOrder), [
+            {'wo_number': f'WO-{number:05d}', 'product_id': rng.randint(1, args.machines * 2), 'uom': 'kg',
+             'status': 'completed', 'priority': 'normal', 'workflow_status': 'pending',
+             'machine_id': rng.randint(1, args.machines) if number % 4 else None, 'created_at': now}
+            for number in range(args.machines * 3)
+        ])
+        db.session.execute(insert(QualityInspection), [
+            {'inspection_number': f'QI-{number:07d}', 'inspection_type': 'final',
+             'inspection_date': now - timedelta(minutes=rng.randint(-600, 60 * 24 * 60)),
+             'product_id': rng.randint(1, args.machines * 3), 'defect_count': rng.randint(0, 5),
+             'status': 'completed', 'result': rng.choice(RESULTS), 'created_at': now}
+            for number in range(args.inspections)
+        ])
+        db.session.execute(insert(QualityAlert), [
+            {'alert_number': f'QA-{number:05d}', 'alert_type': 'pass_rate', 'severity': rng.choice(SEVERITIES),
+             'title': 'Pass rate', 'message': 'Below target', 'created_at': now,
+             'status': rng.choice(('active', 'active', 'acknowledged', 'resolved'))}
+            for number in range(200)
+        ])
+        db.session.execute(insert(CAPA), [
+            {'capa_number': f'CAPA-{number:05d}', 'capa_type': 'corrective', 'issue_date': today,
+             'problem_description': 'Defects', 'target_date': today + timedelta(days=rng.randint(-20, 20)),
+             'status': rng.choice(('open', 'in_progress', 'completed', 'cancelled')), 'created_at': now}
+            for number in range(100)
+        ])
+        db.session.commit()
+
+        for days in (1, 7, 30):
+            grouped = quality_metrics.compute_dashboard(days, today)
+            assert grouped == per_query_dashboard(days, today), f'{days}-day window differs from per-figure queries'
+        print('grouped dashboard matches per-figure queries for 1, 7 and 30 days')
+
+        timed('per-figure queries, 7 days', per_query_dashboard, 7, today)
+        timed('grouped queries, 7 days', quality_metrics.compute_dashboard, 7, today)
+        first = quality_metrics.get_dashboard(7)
+        timed('cached, 7 days', quality_metrics.get_dashboard, 7)
+        assert quality_metrics.get_dashboard(7) is first
+
+        # A rollback keeps the cached window, a commit drops it
+        db.session.add(QualityAlert(alert_number='QA-NEW', alert_type='pass_rate', severity='critical',
+                                    title='Pass rate', message='Below target'))
+        db.session.flush()
+        db.session.rollback()
+        assert quality_metrics.get_dashboard(7) is first, 'rollback invalidated the cache'
+
+        inspection = db.session.query(QualityInspection).filter(QualityInspection.result == 'accepted').filter(
+            QualityInspection.inspection_date >= now - timedelta(days=2)
+        ).first()
+        inspection.result = 'rejected'
+        db.session.commit()
+        changed = quality_metrics.get_dashboard(7)
+        assert changed is not first and changed.value == per_query_dashboard(7, today)
+
+        db.session.query(QualityAlert).filter(QualityAlert.status == 'active').update({'status': 'closed'})
+        db.session.commit()
+        assert quality_metrics.get_dashboard(7).value['summary']['active_alerts'] == 0
+        print('commits invalidate the cache, rollbacks do not')
+
+    print('OK')
+    os.remove(database_path)
+
+
+if __name__ == '__main__':
+    main()
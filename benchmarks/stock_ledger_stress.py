@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Stock ledger stress test
+
+Starts several threads that post receipts, issues and transfers against
+the same few (product, location, batch) stock rows through
+services/stock_ledger.py, then checks that the stock at every product and
+location equals the sum of the changes the ledger reported applying, and
+that the stock summary table agrees with Inventory. Any lost update makes
+the check fail.
+
+Usage: python benchmarks/stock_ledger_stress.py [--threads N] [--batches N] [--batch-size N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from flask import Flask
+from sqlalchemy import insert
+
+from models import db, User, Product, WarehouseZone, WarehouseLocation, Inventory
+from services.stock_ledger import post_movements
+from services.stock_summary import verify_stock_summaries
+
+PRODUCT_IDS = (1, 2)
+LOCATION_IDS = (1, 2)
+BATCHES = (None, 'LOT-A')
+
+
+def create_stress_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Writers queue on the database lock instead of failing fast
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}}
+    db.init_app(app)
+    return app
+
+
+def seed():
+    now = datetime.utcnow()
+    db.session.execute(insert(User), [{
+        'id': 1, 'username': 'stress', 'email': 'stress@example.com',
+        'password_hash': 'x', 'full_name': 'Stress', 'is_active': True,
+        'is_admin': True, 'created_at': now
+    }])
+    db.session.execute(insert(Product), [{
+        'id': product_id, 'code': f'PRD-{product_id}', 'name': f'Product {product_id}',
+        'primary_uom': 'pcs', 'price': 1, 'cost': 1, 'material_type': 'finished_goods',
+        'is_active': True, 'is_sellable': True, 'is_purchasable': True,
+        'is_producible': False, 'created_at': now
+    } for product_id in PRODUCT_IDS])
+    db.session.execute(insert(WarehouseZone), [{
+        'id': 1, 'code': 'ZONE-STRESS', 'name': 'Stress', 'material_type': 'finished_goods',
+        'is_active': True, 'created_at': now
+    }])
+    db.session.execute(insert(WarehouseLocation), [{
+        'id': location_id, 'zone_id': 1, 'location_code': f'STRESS-{location_id:02d}',
+        'rack': '01', 'level': '01', 'position': f'{location_id:02d}', 'capacity': 0,
+        'capacity_uom': 'pcs', 'occupied': 0, 'is_active': True, 'is_available': True,
+        'created_at': now
+    } for location_id in LOCATION_IDS])
+    db.session.commit()
+
+
+def random_movement(rng):
+    movement_type = rng.choice(('receive', 'receive', 'issue', 'transfer'))
+    from_location, to_location = rng.sample(LOCATION_IDS, 2)
+    return {
+        'product_id': rng.choice(PRODUCT_IDS),
+        'movement_type': movement_type,
+        'from_location_id': from_location if movement_type != 'receive' else None,
+        'to_location_id': to_location if movement_type != 'issue' else None,
+        'batch_number': rng.choice(BATCHES),
+        'quantity': rng.randint(1, 20),
+        'uom': 'pcs'
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the stock ledger for lost updates')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=5)
+    args = parser.parse_args()
+
+    fd, database_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+
+    try:
+        app = create_stress_app(database_path)
+        with app.app_context():
+            db.create_all()
+            seed()
+
+        expected = defaultdict(Decimal)
+        expected_lock = threading.Lock()
+        errors = []
+
+        def worker(seed_value):
+            rng = random.Random(seed_value)
+            with app.app_context():
+                for _ in range(args.batches):
+                    movements = [random_movement(rng) for _ in range(args.batch_size)]
+                    try:
+                        _, applied = post_movements(movements, user_id=1)
+                    except Exception as e:
+                        errors.append(str(e))
+                        continue
+                    with expected_lock:
+                        for change in applied:
+                            if change['result'] != 'missing':
+                                key = (change['product_id'], change['location_id'])
+                                expected[key] += Decimal(str(change['delta']))
+                db.session.remove()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            actual = defaultdict(Decimal)
+            for product_id, location_id, batch_number, quantity, available in db.session.query(
+                    Inventory.product_id, Inventory.location_id, Inventory.batch_number,
+                    Inventory.quantity, Inventory.available_quantity):
+                actual[(product_id, location_id)] += Decimal(str(quantity))
+                if Decimal(str(quantity)) != Decimal(str(available)):
+                    errors.append(f'quantity/available mismatch at {(product_id, location_id, batch_number)}')
+            summary_mismatches = verify_stock_summaries()
+
+        # Unbatched issues may draw from another batch at the same location,
+        # so stock is compared per product and location
+        mismatches = {
+            key: (float(expected[key]), float(actual[key]))
+            for key in set(expected) | set(actual) if actual[key] != expected[key]
+        }
+
+        total = args.threads * args.batches * args.batch_size
+        print(f"Posted {total} movements from {args.threads} threads in {elapsed:.2f}s "
+              f"({total / elapsed:.0f} movements/s)")
+        if errors:
+            print(f"{len(errors)} errors, first: {errors[0]}")
+        if mismatches:
+            print(f"LOST UPDATES on {len(mismatches)} stock rows: {mismatches}")
+            sys.exit(1)
+        if summary_mismatches:
+            print(f"STOCK SUMMARY out of step for {len(summary_mismatches)} products: {summary_mismatches}")
+            sys.exit(1)
+        print(f"OK: stock at {len(actual)} product/locations matches the posted movements")
+    finally:
+        os.remove(database_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Webhook delivery check
+
+Runs the webhook dispatcher in services/webhook_dispatcher.py against a
+local HTTP stub server on a throw-away SQLite database:
+
+- recording completed shift productions enqueues one signed delivery
+  per subscriber
+- the stub rejects the first attempts of one endpoint, which must be
+  retried with backoff until they succeed
+- a slow endpoint must never see more than WEBHOOK_ENDPOINT_CONCURRENCY
+  requests at a time from each dispatcher
+- a dead endpoint must end up failed after its retries
+- two dispatchers (as in two worker processes) never send the same
+  attempt twice
+- releasing stale claims leaves live claims of other processes alone
+- a delivery that cannot be built (a broken payload, a deleted webhook)
+  is retried with backoff until it fails instead of looping forever, and
+  non-object custom headers are ignored
+
+Usage: python benchmarks/webhook_delivery_check.py [--events N]
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, time as clock_time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Add the backend directory to Python path
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from flask import Flask
+from sqlalchemy import func
+
+from models import db, ShiftProduction, Webhook, WebhookDelivery
+from services.webhook_dispatcher import (
+    WEBHOOK_CLAIM_TIMEOUT_SECONDS, WEBHOOK_ENDPOINT_CONCURRENCY, WebhookDispatcher, webhook_dispatcher
+)
+
+SECRET = 'check-secret'
+FLAKY_FAILURES = 2
+
+
+class StubState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.received = {}
+        self.attempts = {}
+        self.concurrent = {}
+        self.max_concurrent = {}
+        self.bad_signatures = 0
+
+
+state = StubState()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """``/ok`` accepts, ``/slow`` accepts after 0.2 s, ``/flaky`` fails the first attempts, ``/dead`` always fails"""
+
+    def do_POST(self):
+        endpoint = self.path.strip('/')
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        expected = 'sha256=' + hmac.new(
+            SECRET.encode(), f"{self.headers['X-Webhook-Timestamp']}.".encode() + body, hashlib.sha256
+        ).hexdigest()
+        delivery_id = self.headers['X-Webhook-Delivery']
+
+        with state.lock:
+            if not hmac.compare_digest(expected, self.headers.get('X-Webhook-Signature', '')):
+                state.bad_signatures += 1
+            state.concurrent[endpoint] = state.concurrent.get(endpoint, 0) + 1
+            state.max_concurrent[endpoint] = max(state.max_concurrent.get(endpoint, 0), state.concurrent[endpoint])
+            attempt = state.attempts[delivery_id] = state.attempts.get(delivery_id, 0) + 1
+
+        if endpoint == 'slow':
+            time.sleep(0.2)
+        failed = endpoint == 'dead' or (endpoint == 'flaky' and attempt <= FLAKY_FAILURES)
+
+        with state.lock:
+            state.concurrent[endpoint] -= 1
+            if not failed:
+                state.received.setdefault(endpoint, set()).add(delivery_id)
+
+        self.send_response(500 if failed else 200)
+        self.end_headers()
+        self.wfile.write(b'{"received": true}')
+
+    def log_message(self, *args):
+        pass
+
+
+def create_check_app(database_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=20)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    fd, database_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_check_app(database_path)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Webhook(webhook_name=name, webhook_url=f'{base_url}/{name}', secret_token=SECRET,
+                    events=json.dumps(['shift_production.completed']), retry_count=retries,
+                    retry_delay_seconds=1, timeout_seconds=5)
+            for name, retries in (('ok', 3), ('slow', 3), ('flaky', 3), ('dead', 1))
+        ])
+        db.session.commit()
+
+        def shift_production(index, status):
+            return ShiftProduction(
+                production_date=date.today(), shift='shift_1', shift_start=clock_time(7), shift_end=clock_time(15),
+                machine_id=1, product_id=1, target_quantity=1000, actual_quantity=900 + index,
+                good_quantity=880, uom='pcs', planned_runtime=480, actual_runtime=450, status=status
+            )
+
+        # Running shifts fire nothing; completed ones do
+        db.session.add_all([shift_production(i, 'running') for i in range(args.events)])
+        db.session.commit()
+        assert db.session.query(func.count(WebhookDelivery.id)).scalar() == 0
+        db.session.add_all([shift_production(i, 'completed') for i in range(args.events)])
+        db.session.commit()
+        enqueued = db.session.query(func.count(WebhookDelivery.id)).scalar()
+        print(f'Enqueued {enqueued} deliveries for {args.events} completed shift productions')
+        assert enqueued == 4 * args.events
+
+    # A second dispatcher stands in for another worker process
+    other_process = WebhookDispatcher()
+    started = time.perf_counter()
+    webhook_dispatcher.start(app)
+    other_process.start(app)
+    webhook_dispatcher.wake()
+    other_process.wake()
+
+    with app.app_context():
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            open_count = db.session.query(func.count(WebhookDelivery.id)).filter(
+                WebhookDelivery.status.in_(('pending', 'retrying', 'delivering'))
+            ).scalar()
+            db.session.remove()
+            if not open_count:
+                break
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - started
+
+        statuses = dict(db.session.query(Webhook.webhook_name, func.count(WebhookDelivery.id)).join(
+            WebhookDelivery, WebhookDelivery.webhook_id == Webhook.id
+        ).filter(WebhookDelivery.status == 'success').group_by(Webhook.webhook_name).all())
+        failed = db.session.query(func.count(WebhookDelivery.id)).filter(WebhookDelivery.status == 'failed').scalar()
+        avg_ms = db.session.query(func.avg(WebhookDelivery.response_time_ms)).scalar()
+        counters = {w.webhook_name: (w.success_count, w.failure_count) for w in Webhook.query.all()}
+
+    print(f'Settled in {elapsed:.1f}s; successes per endpoint {statuses}, failed {failed}')
+    print(f'Average response time {avg_ms:.0f} ms; max concurrency per endpoint {state.max_concurrent}')
+    print(f'Webhook counters (success, failure): {counters}')
+
+    assert state.bad_signatures == 0, 'signature mismatch'
+    duplicates = [
+        delivery_id for endpoint in ('ok', 'slow') for delivery_id in state.received[endpoint]
+        if state.attempts[delivery_id] != 1
+    ]
+    assert not duplicates, f'{len(duplicates)} deliveries sent more than once'
+    # The limit holds per process, so two dispatchers may reach twice it
+    assert all(value <= 2 * WEBHOOK_ENDPOINT_CONCURRENCY for value in state.max_concurrent.values())
+    for name in ('ok', 'slow', 'flaky'):
+        assert statuses.get(name) == args.events, name
+        assert len(state.received[name]) == args.events, name
+    assert failed == args.events
+    assert counters['flaky'] == (args.events, FLAKY_FAILURES * args.events)
+    assert counters['dead'] == (0, 2 * args.events)
+
+    with app.app_context():
+        now = datetime.utcnow()
+        stale, live = [
+            WebhookDelivery(webhook_id=1, delivery_id=f'claim-{name}', event_type='webhook.test', status='delivering',
+                            claimed_at=claimed_at, attempt_count=0, max_attempts=1)
+            for name, claimed_at in (('stale', now - timedelta(seconds=WEBHOOK_CLAIM_TIMEOUT_SECONDS + 60)),
+                                     ('live', now))
+        ]
+        db.session.add_all([stale, live])
+        db.session.commit()
+        WebhookDispatcher()._release_stale_claims()
+        assert db.session.get(WebhookDelivery, stale.id).status == 'retrying'
+        assert db.session.get(WebhookDelivery, live.id).status == 'delivering'
+    print('Stale claims released, live claims kept')
+
+    with app.app_context():
+        ok = Webhook.query.filter_by(webhook_name='ok').one()
+        ok.custom_headers = '5'
+        broken = [
+            WebhookDelivery(webhook_id=webhook_id, delivery_id=f'broken-{name}', event_type='webhook.test',
+                            event_data=event_data, status='pending', attempt_count=0, max_attempts=2,
+                            next_retry_at=datetime.utcnow())
+            for name, webhook_id, event_data in (('payload', ok.id, '{not json'), ('webhook', 9999, 'null'),
+                                                 ('headers', ok.id, 'null'))
+        ]
+        db.session.add_all(broken)
+        db.session.commit()
+        broken_ids = [delivery.id for delivery in broken]
+        webhook_dispatcher.wake()
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            outcomes = {
+                delivery.delivery_id: (delivery.status, delivery.attempt_count)
+                for delivery in WebhookDelivery.query.filter(WebhookDelivery.id.in_(broken_ids))
+            }
+            db.session.remove()
+            if all(status in ('success', 'failed') for status, _ in outcomes.values()):
+                break
+            time.sleep(0.2)
+    print(f'Broken deliveries (status, attempts): {outcomes}')
+    assert outcomes == {
+        'broken-payload': ('failed', 2), 'broken-webhook': ('failed', 1), 'broken-headers': ('success', 1)
+    }
+    print('OK')
+
+    server.shutdown()
+    os.remove(database_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -38,3 +38,16 @@ class Config:
     
     # Backup
     BACKUP_FOLDER = 'backups'
+    
+    # Generated report files
+    REPORT_FOLDER = 'reports'
+    
+    # Request audit trail
+    AUDIT_LOG_ENABLED = os.environ.get('AUDIT_LOG_ENABLED', 'true').lower() != 'false'
+    AUDIT_LOG_EXCLUDED_PREFIXES = ('/api/tv/',)
+    
+    # Outgoing webhook deliveries
+    WEBHOOK_DISPATCH_ENABLED = os.environ.get('WEBHOOK_DISPATCH_ENABLED', 'true').lower() != 'false'
+    
+    # Data sync exports written to the file system
+    SYNC_EXPORT_FOLDER = 'sync_exports'
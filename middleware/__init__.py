@@ -0,0 +1 @@
+"""Request middleware installed by the application factory"""
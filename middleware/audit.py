@@ -0,0 +1,96 @@
+"""
+Request audit trail
+
+Records one AuditLog row per API request: user, method, URL, response
+status and duration. Rows are handed to the buffered writer in
+services/audit_log.py, so capturing them costs the request a queue append.
+"""
+
+import time
+from datetime import datetime
+
+from flask import g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from services.audit_log import audit_writer
+
+# Requests that are not audited: CORS preflights, and TV screens that
+# poll or stream without a user
+SKIPPED_METHODS = ('OPTIONS', 'HEAD')
+DEFAULT_EXCLUDED_PREFIXES = ('/api/tv/',)
+
+METHOD_ACTIONS = {
+    'GET': 'read',
+    'POST': 'create',
+    'PUT': 'update',
+    'PATCH': 'update',
+    'DELETE': 'delete'
+}
+
+
+def _request_user_id():
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+        return int(identity) if identity is not None else None
+    except Exception:
+        return None
+
+
+def _resource(path):
+    """``(resource_type, resource_id)`` from an ``/api/<resource>/<id>/...`` path"""
+    parts = [part for part in path.split('/') if part][1:]
+    resource_type = parts[0] if parts else 'api'
+    resource_id = next((part for part in parts[1:] if part.isdigit()), None)
+    return resource_type, resource_id
+
+
+def _action(method, path):
+    if path.endswith('/login'):
+        return 'login'
+    if path.endswith('/logout'):
+        return 'logout'
+    return METHOD_ACTIONS.get(method, method.lower())
+
+
+def setup_audit_middleware(app):
+    """Install the request audit hooks and start the background writer"""
+    if not app.config.get('AUDIT_LOG_ENABLED', True):
+        return
+
+    excluded_prefixes = tuple(app.config.get('AUDIT_LOG_EXCLUDED_PREFIXES', DEFAULT_EXCLUDED_PREFIXES))
+    audit_writer.start(app)
+
+    def audited():
+        return (
+            request.method not in SKIPPED_METHODS
+            and request.path.startswith('/api/')
+            and not request.path.startswith(excluded_prefixes)
+        )
+
+    @app.before_request
+    def start_audit_timer():
+        g.audit_started = time.perf_counter()
+
+    @app.after_request
+    def record_audit_entry(response):
+        if not audited() or 'audit_started' not in g:
+            return response
+
+        resource_type, resource_id = _resource(request.path)
+        failed = response.status_code >= 400
+        audit_writer.record({
+            'user_id': _request_user_id(),
+            'action': _action(request.method, request.path),
+            'resource_type': resource_type,
+            'resource_id': resource_id,
+            'ip_address': (request.headers.get('X-Forwarded-For', request.remote_addr) or '').split(',')[0].strip()[:45] or None,
+            'user_agent': request.user_agent.string or None,
+            'request_method': request.method,
+            'request_url': request.full_path.rstrip('?')[:1000],
+            'status': 'failed' if failed else 'success',
+            'status_code': response.status_code,
+            'duration_ms': int((time.perf_counter() - g.audit_started) * 1000),
+            'timestamp': datetime.utcnow()
+        })
+        return response
@@ -0,0 +1,39 @@
+"""
+Maintenance gate
+
+Counts in-flight requests for services/backup_engine.py so a restore can
+wait for them to finish, and answers 503 to new requests while the
+database is being swapped. Long-lived streams (TV displays) are not
+counted; they would otherwise hold a restore off indefinitely. The first
+request of each process registers it, so a restore can tell whether other
+processes serve requests.
+"""
+
+from flask import g, jsonify, request
+
+from services.backup_engine import process_lock, request_gate
+
+UNGATED_PREFIXES = ('/api/tv/stream',)
+RETRY_AFTER_SECONDS = 5
+
+
+def setup_maintenance_middleware(app):
+    """Install the request gate hooks"""
+
+    @app.before_request
+    def enter_request_gate():
+        process_lock.register()
+        if request.method == 'OPTIONS' or request.path.startswith(UNGATED_PREFIXES):
+            return None
+        if not request_gate.enter():
+            response = jsonify({'error': 'Database restore in progress, please retry shortly'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+            return response
+        g.request_gate_entered = True
+        return None
+
+    @app.teardown_request
+    def leave_request_gate(exc):
+        if g.pop('request_gate_entered', False):
+            request_gate.leave()
@@ -6,7 +6,7 @@ db = SQLAlchemy()
 # Import all models
 from .user import User, Role, UserRole, Permission, RolePermission
 from .product import Material, Product, ProductSpecification, ProductPackaging, ProductCategory
-from .warehouse import WarehouseZone, WarehouseLocation, Inventory, InventoryMovement
+from .warehouse import WarehouseZone, WarehouseLocation, Inventory, InventoryMovement, StockSummary
 from .sales import Customer, SalesOrder, SalesOrderItem, SalesForecast
 from .purchasing import Supplier, PurchaseOrder, PurchaseOrderItem, GoodsReceivedNote, GRNItem
 from .production import Machine, WorkOrder, ProductionRecord, BillOfMaterials, BOMItem, ProductionSchedule, ShiftProduction, DowntimeRecord
@@ -35,8 +35,8 @@ from .warehouse_enhanced import (
 from .notification import Notification, SystemAlert
 from .backup import BackupRecord
 from .integration import IntegrationLog, ThirdPartyAPI
-from .analytics import AnalyticsReport, KPI, MetricData
-from .settings import SystemSetting, CompanyProfile
+from .analytics import AnalyticsReport, KPI, MetricData, ReportJob, ImportJob
+from .settings import SystemSetting, CompanyProfile, DocumentSequence
 from .settings_extended import (
     AdvancedUserRole, AdvancedPermission, AdvancedRolePermission,
     AdvancedUserRoleAssignment, AuditLog, SystemConfiguration, BackupConfiguration
@@ -46,7 +46,7 @@ from .integration_extended import (
     Webhook, WebhookDelivery
 )
 from .workflow_integration import (
-    WorkflowStep, MRPRequirement, ProductionBuffer, WorkflowAutomation
+    WorkflowStep, MRPRequirement, MRPRun, MRPRunLine, ProductionBuffer, WorkflowAutomation
 )
 
 __all__ = [
@@ -56,7 +56,7 @@ __all__ = [
     # Product models
     'Material', 'Product', 'ProductSpecification', 'ProductPackaging', 'ProductCategory',
     # Warehouse models
-    'WarehouseZone', 'WarehouseLocation', 'Inventory', 'InventoryMovement',
+    'WarehouseZone', 'WarehouseLocation', 'Inventory', 'InventoryMovement', 'StockSummary',
     # Sales models
     'Customer', 'SalesOrder', 'SalesOrderItem', 'SalesForecast',
     # Purchasing models
@@ -95,9 +95,9 @@ __all__ = [
     # Integration models
     'IntegrationLog', 'ThirdPartyAPI',
     # Analytics models
-    'AnalyticsReport', 'KPI', 'MetricData',
+    'AnalyticsReport', 'KPI', 'MetricData', 'ReportJob', 'ImportJob',
     # Settings models
-    'SystemSetting', 'CompanyProfile',
+    'SystemSetting', 'CompanyProfile', 'DocumentSequence',
     # Extended Settings models
     'AdvancedUserRole', 'AdvancedPermission', 'AdvancedRolePermission',
     'AdvancedUserRoleAssignment', 'AuditLog', 'SystemConfiguration', 'BackupConfiguration',
@@ -105,5 +105,5 @@ __all__ = [
     'ExternalConnector', 'APIEndpoint', 'DataSyncJob', 'SyncJobExecution',
     'Webhook', 'WebhookDelivery',
     # Workflow Integration models
-    'WorkflowStep', 'MRPRequirement', 'ProductionBuffer', 'WorkflowAutomation',
+    'WorkflowStep', 'MRPRequirement', 'MRPRun', 'MRPRunLine', 'ProductionBuffer', 'WorkflowAutomation',
 ]
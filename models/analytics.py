@@ -76,3 +76,53 @@ class AnalyticsReport(db.Model):
     
     # Relationships
     generated_by_user = db.relationship('User')
+
+class ReportJob(db.Model):
+    """Report generated in the background to a downloadable file"""
+    __tablename__ = 'report_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    report_type = db.Column(db.String(50), nullable=False)  # sales, production
+    file_format = db.Column(db.String(20), nullable=False)  # csv, ndjson, json
+    filters = db.Column(db.JSON, nullable=True)
+    status = db.Column(db.String(50), nullable=False, default='queued', index=True)  # queued, running, completed, failed
+    summary = db.Column(db.JSON, nullable=True)  # report totals
+    total_rows = db.Column(db.Integer, nullable=True)
+    rows_written = db.Column(db.Integer, default=0)
+    file_path = db.Column(db.String(1000), nullable=True)
+    file_size = db.Column(db.BigInteger, nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Relationships
+    requested_by_user = db.relationship('User')
+
+class ImportJob(db.Model):
+    """Spreadsheet import of products, materials or inventory run in the background"""
+    __tablename__ = 'import_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    import_type = db.Column(db.String(50), nullable=False)  # products, materials, inventory
+    mode = db.Column(db.String(20), nullable=False, default='skip')  # skip, upsert (existing records)
+    file_name = db.Column(db.String(500), nullable=False)
+    file_path = db.Column(db.String(1000), nullable=False)
+    status = db.Column(db.String(50), nullable=False, default='queued', index=True)  # queued, running, completed, failed
+    total_rows = db.Column(db.Integer, nullable=True)  # estimated until the file is read
+    rows_processed = db.Column(db.Integer, default=0)
+    rows_inserted = db.Column(db.Integer, default=0)
+    rows_updated = db.Column(db.Integer, default=0)
+    rows_skipped = db.Column(db.Integer, default=0)
+    rows_failed = db.Column(db.Integer, default=0)
+    errors = db.Column(db.JSON, nullable=True)  # first row errors, for display
+    error_report_path = db.Column(db.String(1000), nullable=True)  # CSV of every row error
+    error_message = db.Column(db.Text, nullable=True)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Relationships
+    requested_by_user = db.relationship('User')
@@ -12,6 +12,7 @@ class BackupRecord(db.Model):
     file_path = db.Column(db.String(1000), nullable=False)
     file_size_mb = db.Column(db.Numeric(15, 2), nullable=True)
     compression_type = db.Column(db.String(50), nullable=True)
+    base_backup_id = db.Column(db.Integer, db.ForeignKey('backup_records.id'), nullable=True)  # full backup an incremental applies to
     status = db.Column(db.String(50), nullable=False, default='in_progress')  # in_progress, completed, failed
     is_scheduled = db.Column(db.Boolean, default=False)
     retention_days = db.Column(db.Integer, default=30)
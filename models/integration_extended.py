@@ -103,6 +103,10 @@ class DataSyncJob(db.Model):
     filter_conditions = db.Column(db.Text, nullable=True)  # JSON filter conditions
     transformation_rules = db.Column(db.Text, nullable=True)  # JSON transformation rules
     error_handling = db.Column(db.String(50), default='stop')  # stop, continue, retry
+    batch_size = db.Column(db.Integer, default=500)  # records per pushed batch
+    parallel_batches = db.Column(db.Integer, default=4)  # batches pushed concurrently
+    watermark_updated_at = db.Column(db.DateTime, nullable=True)  # last synced (updated_at, id)
+    watermark_record_id = db.Column(db.Integer, nullable=True)
     notification_email = db.Column(db.String(255), nullable=True)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -127,6 +131,10 @@ class SyncJobExecution(db.Model):
     records_success = db.Column(db.Integer, default=0)
     records_failed = db.Column(db.Integer, default=0)
     records_skipped = db.Column(db.Integer, default=0)
+    batches_total = db.Column(db.Integer, default=0)
+    records_per_second = db.Column(db.Numeric(12, 2), nullable=True)
+    watermark_from = db.Column(db.DateTime, nullable=True)
+    watermark_to = db.Column(db.DateTime, nullable=True)
     error_message = db.Column(db.Text, nullable=True)
     execution_log = db.Column(db.Text, nullable=True)  # Detailed execution log
     triggered_by = db.Column(db.String(50), nullable=False)  # manual, scheduled, api
@@ -183,9 +191,15 @@ class WebhookDelivery(db.Model):
     attempt_count = db.Column(db.Integer, default=1)
     max_attempts = db.Column(db.Integer, default=3)
     next_retry_at = db.Column(db.DateTime, nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)  # when a dispatcher marked it delivering
     error_message = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     delivered_at = db.Column(db.DateTime, nullable=True)
     
+    # The dispatcher polls for due deliveries by status and retry time
+    __table_args__ = (
+        db.Index('idx_webhook_delivery_due', 'status', 'next_retry_at'),
+    )
+    
     # Relationships
     webhook = db.relationship('Webhook', back_populates='delivery_logs')
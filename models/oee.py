@@ -40,6 +40,11 @@ class OEERecord(db.Model):
     recorded_by_user = db.relationship('User')
     downtime_records = db.relationship('OEEDowntimeRecord', back_populates='oee_record')
     defect_records = db.relationship('QualityDefect', back_populates='oee_record')
+    
+    # OEE rollups re-aggregate one machine's records of a day, week or month
+    __table_args__ = (
+        db.Index('idx_oee_record_machine_date', 'machine_id', 'record_date'),
+    )
 
 class OEEDowntimeRecord(db.Model):
     __tablename__ = 'oee_downtime_records'
@@ -62,6 +67,10 @@ class OEEDowntimeRecord(db.Model):
     oee_record = db.relationship('OEERecord', back_populates='downtime_records')
     machine = db.relationship('Machine')
     recorded_by_user = db.relationship('User')
+    
+    __table_args__ = (
+        db.Index('idx_oee_downtime_machine_start', 'machine_id', 'start_time'),
+    )
 
 class QualityDefect(db.Model):
     __tablename__ = 'quality_defects'
@@ -202,6 +211,13 @@ class OEEAnalytics(db.Model):
     defect_rate = db.Column(db.Numeric(5, 2), default=0)
     maintenance_hours = db.Column(db.Numeric(10, 2), default=0)
     breakdown_count = db.Column(db.Integer, default=0)
+    # Sums behind the averages, so rollups can be combined over any range
+    sum_availability = db.Column(db.Numeric(15, 2), default=0)
+    sum_performance = db.Column(db.Numeric(15, 2), default=0)
+    sum_quality = db.Column(db.Numeric(15, 2), default=0)
+    sum_oee = db.Column(db.Numeric(15, 2), default=0)
+    downtime_minutes = db.Column(db.Integer, default=0)  # OEE record downtime
+    downtime_by_category = db.Column(db.JSON, nullable=True)  # {category: minutes} from downtime records
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -212,3 +228,75 @@ class OEEAnalytics(db.Model):
         db.Index('idx_oee_analytics_machine_date', 'machine_id', 'analysis_date'),
         db.UniqueConstraint('machine_id', 'analysis_date', 'period_type', name='uq_oee_analytics_machine_period'),
     )
+
+class ShiftOEE(db.Model):
+    __tablename__ = 'shift_oee'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    machine_id = db.Column(db.Integer, db.ForeignKey('machines.id'), nullable=False)
+    production_date = db.Column(db.Date, nullable=False)
+    shift = db.Column(db.String(20), nullable=False)  # shift_1, shift_2, shift_3
+    shift_start_at = db.Column(db.DateTime, nullable=False)
+    shift_end_at = db.Column(db.DateTime, nullable=False)
+    
+    # Totals of the shift's ShiftProduction and DowntimeRecord rows
+    production_count = db.Column(db.Integer, default=0)
+    planned_minutes = db.Column(db.Integer, default=0)
+    downtime_minutes = db.Column(db.Integer, default=0)  # closed downtime
+    open_downtime_since = db.Column(db.DateTime, nullable=True)  # start of downtime still in progress
+    target_quantity = db.Column(db.Numeric(15, 2), default=0)
+    total_quantity = db.Column(db.Numeric(15, 2), default=0)
+    good_quantity = db.Column(db.Numeric(15, 2), default=0)
+    reject_quantity = db.Column(db.Numeric(15, 2), default=0)
+    ideal_rate = db.Column(db.Numeric(15, 2), nullable=True)  # Machine.capacity_per_hour
+    
+    # Metrics over the whole shift
+    availability = db.Column(db.Numeric(5, 2), default=0)  # percentage
+    performance = db.Column(db.Numeric(5, 2), default=0)  # percentage
+    quality = db.Column(db.Numeric(5, 2), default=0)  # percentage
+    oee = db.Column(db.Numeric(5, 2), default=0)  # percentage
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    machine = db.relationship('Machine')
+    
+    __table_args__ = (
+        db.Index('idx_shift_oee_window', 'shift_end_at', 'shift_start_at'),
+        db.UniqueConstraint('machine_id', 'production_date', 'shift', name='uq_shift_oee_machine_shift'),
+    )
+
+class MachineMetricSample(db.Model):
+    __tablename__ = 'machine_metric_samples'
+    
+    # One value of one metric of a machine at one time, kept narrow so range
+    # scans are served from the covering index alone
+    id = db.Column(db.Integer, primary_key=True)
+    machine_id = db.Column(db.Integer, db.ForeignKey('machines.id'), nullable=False)
+    metric = db.Column(db.String(32), nullable=False)  # oee, availability, output, downtime_minutes, ...
+    ts = db.Column(db.Integer, nullable=False)  # local wall-clock time as seconds since 1970-01-01
+    value = db.Column(db.Float, nullable=False)
+    source = db.Column(db.String(20), nullable=False)  # oee_record, machine_performance, shift_production, downtime
+    source_id = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        db.Index('idx_metric_samples_series', 'metric', 'machine_id', 'ts', 'value'),
+        db.Index('idx_metric_samples_source', 'source', 'source_id'),
+    )
+
+class MachineMetricBlock(db.Model):
+    __tablename__ = 'machine_metric_blocks'
+    
+    # One month of one metric of a machine as packed column arrays, rebuilt
+    # from MachineMetricSample whenever one of its samples changes
+    id = db.Column(db.Integer, primary_key=True)
+    machine_id = db.Column(db.Integer, db.ForeignKey('machines.id'), nullable=False)
+    metric = db.Column(db.String(32), nullable=False)
+    period_start = db.Column(db.Integer, nullable=False)  # first second of the month, as MachineMetricSample.ts
+    sample_count = db.Column(db.Integer, nullable=False, default=0)
+    ts_data = db.Column(db.LargeBinary, nullable=False)  # little-endian int64 per sample, ascending
+    value_data = db.Column(db.LargeBinary, nullable=False)  # little-endian float64 per sample
+    
+    __table_args__ = (
+        db.UniqueConstraint('metric', 'machine_id', 'period_start', name='uq_metric_block_period'),
+    )
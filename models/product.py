@@ -89,6 +89,11 @@ class Product(db.Model):
     
     work_orders = db.relationship('WorkOrder', back_populates='product')
 
+    # Incremental data sync reads changes in (updated_at, id) order
+    __table_args__ = (
+        db.Index('idx_product_updated', 'updated_at', 'id'),
+    )
+
     def __repr__(self):
         return f'<Product {self.code} - {self.name}>'
 
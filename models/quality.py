@@ -68,6 +68,11 @@ class QualityInspection(db.Model):
     # Relationships
     product = db.relationship('Product')
     inspector = db.relationship('User')
+    
+    # The quality dashboard groups a date range of inspections by day and by product
+    __table_args__ = (
+        db.Index('idx_quality_inspection_date', 'inspection_date', 'result', 'defect_count', 'product_id'),
+    )
 
 class CAPA(db.Model):
     __tablename__ = 'capa'
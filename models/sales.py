@@ -216,6 +216,11 @@ class Customer(db.Model):
     activities = db.relationship('SalesActivity', back_populates='customer', cascade='all, delete-orphan')
     contacts = db.relationship('CustomerContact', back_populates='customer', cascade='all, delete-orphan')
     
+    # Incremental data sync reads changes in (updated_at, id) order
+    __table_args__ = (
+        db.Index('idx_customer_updated', 'updated_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Customer {self.code} - {self.company_name}>'
 
@@ -366,7 +371,7 @@ class SalesOrder(db.Model):
     approved_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     approved_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # MRP net change
     
     # Relationships
     customer = db.relationship('Customer', back_populates='sales_orders')
@@ -403,7 +408,7 @@ class SalesOrderItem(db.Model):
     required_date = db.Column(db.Date, nullable=True)
     notes = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # MRP net change
     
     # Relationships
     order = db.relationship('SalesOrder', back_populates='items')
@@ -661,7 +666,7 @@ class SalesForecast(db.Model):
     approved_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     approved_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # MRP net change
     
     # Relationships
     user = db.relationship('User', foreign_keys=[user_id])
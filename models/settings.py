@@ -53,3 +53,18 @@ class CompanyProfile(db.Model):
     
     # Relationships
     updated_by_user = db.relationship('User')
+
+class DocumentSequence(db.Model):
+    """Last document number handed out per prefix, document column and period (see services/document_numbers.py)"""
+    __tablename__ = 'document_sequences'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    prefix = db.Column(db.String(20), nullable=False)  # SO, PO, WO, QI, ...
+    document = db.Column(db.String(100), nullable=False, default='')  # table.column numbered, '' when unnamed
+    period = db.Column(db.String(10), nullable=False)  # YYYYMM
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('prefix', 'document', 'period', name='unique_document_sequence'),
+    )
@@ -85,12 +85,19 @@ class AuditLog(db.Model):
     request_method = db.Column(db.String(10), nullable=True)  # GET, POST, PUT, DELETE
     request_url = db.Column(db.String(1000), nullable=True)
     status = db.Column(db.String(20), nullable=False, default='success')  # success, failed, warning
+    status_code = db.Column(db.Integer, nullable=True)  # HTTP response status
     error_message = db.Column(db.Text, nullable=True)
     duration_ms = db.Column(db.Integer, nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     
     # Relationships
     user = db.relationship('User')
+    
+    __table_args__ = (
+        db.Index('idx_audit_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('idx_audit_resource_timestamp', 'resource_type', 'timestamp'),
+        db.Index('idx_audit_action_timestamp', 'action', 'timestamp'),
+    )
 
 class SystemConfiguration(db.Model):
     __tablename__ = 'system_configurations'
@@ -61,7 +61,7 @@ class Inventory(db.Model):
     expiry_date = db.Column(db.Date, nullable=True)
     last_stock_check = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # MRP net change
     
     # Relationships
     product = db.relationship('Product', back_populates='inventory_records')
@@ -106,3 +106,20 @@ class InventoryMovement(db.Model):
     __table_args__ = (
         db.Index('idx_reference', 'reference_type', 'reference_id'),
     )
+
+class StockSummary(db.Model):
+    """Per-product stock totals, maintained whenever Inventory changes"""
+    __tablename__ = 'stock_summaries'
+    
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    on_hand_quantity = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    reserved_quantity = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    available_quantity = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    stock_value = db.Column(db.Numeric(18, 2), nullable=False, default=0)  # on hand x product cost
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    product = db.relationship('Product')
+    
+    def __repr__(self):
+        return f'<StockSummary product {self.product_id} - {self.available_quantity} available>'
@@ -330,11 +330,13 @@ class WIPWorkflowIntegration:
             
         # Calculate material cost from BOM
         from .production import WorkOrder
+        from services.bom_graph import bom_graph
         work_order = WorkOrder.query.get(work_order_id)
         
-        # Simplified material cost calculation
-        # In real implementation, this would calculate from BOM and material issues
-        estimated_material_cost = work_order.quantity_to_produce * 50000  # IDR 50k per unit
+        # Multi-level material cost per unit from the cached BOM graph,
+        # falling back to the flat estimate for products without a BOM
+        unit_material_cost = bom_graph.snapshot().unit_material_cost(work_order.product_id) or 50000  # IDR 50k per unit
+        estimated_material_cost = float(work_order.quantity_to_produce or 0) * unit_material_cost
         
         wip_batch.material_cost = estimated_material_cost
         wip_batch.update_wip_value()
@@ -348,7 +350,7 @@ class WIPWorkflowIntegration:
             cost_category='raw_material',
             description='Material cost for production',
             quantity=work_order.quantity_to_produce,
-            unit_cost=50000,  # IDR 50k per unit
+            unit_cost=unit_material_cost,
             total_cost=estimated_material_cost,
             created_by=user_id
         )
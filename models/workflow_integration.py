@@ -69,6 +69,78 @@ class MRPRequirement(db.Model):
     product = db.relationship('Product')
     analyzer = db.relationship('User')
 
+class MRPRun(db.Model):
+    """Persisted snapshot of one MRP requirements calculation"""
+    __tablename__ = 'mrp_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_number = db.Column(db.String(100), unique=True, nullable=False, index=True)
+    mode = db.Column(db.String(20), nullable=False, default='full')  # full, net_change
+    base_run_id = db.Column(db.Integer, db.ForeignKey('mrp_runs.id'), nullable=True)
+
+    # Horizon
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    days_ahead = db.Column(db.Integer, nullable=False)
+    include_forecasts = db.Column(db.Boolean, nullable=False, default=True)
+
+    # Change detection for the next net-change run
+    watermark = db.Column(db.DateTime, nullable=False)
+    table_states = db.Column(db.JSON, nullable=True)  # {table: [row count, highest id]}
+
+    # Results
+    total_materials = db.Column(db.Integer, default=0)
+    confirmed_orders = db.Column(db.Integer, default=0)
+    forecasts_included = db.Column(db.Integer, default=0)
+    changed_products = db.Column(db.Integer, default=0)
+    recomputed_materials = db.Column(db.Integer, default=0)
+    duration_ms = db.Column(db.Integer, nullable=True)
+
+    status = db.Column(db.String(50), nullable=False, default='completed')  # completed, superseded
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Relationships
+    lines = db.relationship('MRPRunLine', backref='run', cascade='all, delete-orphan', order_by='MRPRunLine.id')
+    base_run = db.relationship('MRPRun', remote_side=[id])
+    creator = db.relationship('User')
+
+    __table_args__ = (
+        db.Index('idx_mrp_run_horizon', 'start_date', 'days_ahead', 'include_forecasts', 'status'),
+    )
+
+class MRPRunLine(db.Model):
+    """One material requirement line of an MRP run"""
+    __tablename__ = 'mrp_run_lines'
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('mrp_runs.id', ondelete='CASCADE'), nullable=False, index=True)
+    material_id = db.Column(db.Integer, nullable=False)
+    material_code = db.Column(db.String(100), nullable=True)
+    material_name = db.Column(db.String(200), nullable=True)
+    uom = db.Column(db.String(20), nullable=True)
+    confirmed_quantity = db.Column(db.Float, default=0)
+    forecast_quantity = db.Column(db.Float, default=0)
+    total_quantity = db.Column(db.Float, default=0)
+    current_stock = db.Column(db.Float, default=0)
+    net_requirement = db.Column(db.Float, default=0)
+    sources = db.Column(db.JSON, nullable=True)
+
+    def to_requirement(self):
+        """Same shape as a freshly calculated requirement"""
+        return {
+            'material_id': self.material_id,
+            'material_code': self.material_code,
+            'material_name': self.material_name,
+            'total_quantity': self.total_quantity,
+            'confirmed_quantity': self.confirmed_quantity,
+            'forecast_quantity': self.forecast_quantity,
+            'uom': self.uom,
+            'sources': self.sources or [],
+            'current_stock': self.current_stock,
+            'net_requirement': self.net_requirement
+        }
+
 class ProductionBuffer(db.Model):
     """Track excess production that goes to buffer stock"""
     __tablename__ = 'production_buffer'
@@ -4,6 +4,7 @@ from werkzeug.security import check_password_hash, generate_password_hash
 from models import db, User, Role, UserRole
 from datetime import datetime
 from utils.i18n import success_response, error_response, get_message
+from services.identity_cache import get_identity
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -116,21 +117,13 @@ def get_current_user():
     """Get current user information"""
     try:
         user_id = get_jwt_identity()
-        # Get user with eager loading of roles
-        from sqlalchemy.orm import joinedload
-        user = User.query.options(
-            joinedload(User.roles).joinedload(UserRole.role)
-        ).get(int(user_id))  # Convert string to int
+        user = db.session.get(User, int(user_id))  # Convert string to int
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get user roles safely
-        try:
-            user_roles = [ur.role.name for ur in user.roles if ur.role]
-        except Exception as e:
-            print(f"Error getting user roles in /me: {e}")
-            user_roles = []
+        # Roles and permissions come from the identity cache the permission checks use
+        identity = get_identity(user.id)
         
         return jsonify({
             'user': {
@@ -140,7 +133,8 @@ def get_current_user():
                 'full_name': user.full_name,
                 'is_active': user.is_active,
                 'is_admin': user.is_admin,
-                'roles': user_roles,
+                'roles': sorted(identity.roles) if identity else [],
+                'permissions': sorted(identity.permissions) if identity else [],
                 'last_login': user.last_login.isoformat() if user.last_login else None,
                 'created_at': user.created_at.isoformat()
             }
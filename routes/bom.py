@@ -7,6 +7,8 @@ from models.warehouse import Inventory
 from models.purchasing import Supplier
 from utils.i18n import success_response, error_response, get_message
 from utils import generate_number
+from services.bom_graph import bom_graph
+from services.mrp_engine import load_stock_levels
 from datetime import datetime, date
 from sqlalchemy import func, desc, and_
 
@@ -268,39 +270,46 @@ def delete_bom(bom_id):
 def get_bom_shortage_analysis(bom_id):
     """Get material shortage analysis for BOM"""
     try:
-        bom = BillOfMaterials.query.get_or_404(bom_id)
+        bom_snapshot = bom_graph.snapshot()
+        bom = bom_snapshot.headers.get(bom_id)
+        if not bom:
+            return error_response('BOM not found'), 404
+
         production_qty = request.args.get('production_qty', 1, type=float)
+        bom_items = bom_snapshot.items.get(bom_id, [])
+        stock = load_stock_levels(item['material_id'] for item in bom_items)
 
         shortage_items = []
         total_shortage_cost = 0
 
-        for item in bom.items:
-            required_qty = float(item.effective_quantity) * production_qty
-            available_qty = item.current_stock
+        for item in bom_items:
+            required_qty = item['coefficient'] * production_qty
+            available_qty = stock.get(item['material_id'], 0.0)
             shortage_qty = max(0, required_qty - available_qty)
             
             if shortage_qty > 0:
-                shortage_cost = shortage_qty * (float(item.unit_cost) if item.unit_cost else 0)
+                unit_cost = item['unit_cost'] if item['has_unit_cost'] else 0
+                shortage_cost = shortage_qty * unit_cost
                 total_shortage_cost += shortage_cost
                 
                 shortage_items.append({
-                    'item_id': item.id,
-                    'item_name': item.item_name,
-                    'item_code': item.item_code,
-                    'item_type': item.item_type,
+                    'item_id': item['item_id'],
+                    'item_name': item['name'],
+                    'item_code': item['code'],
+                    'item_type': item['item_type'],
                     'required_quantity': required_qty,
                     'available_quantity': available_qty,
                     'shortage_quantity': shortage_qty,
-                    'unit_cost': float(item.unit_cost) if item.unit_cost else 0,
+                    'unit_cost': unit_cost,
                     'shortage_cost': shortage_cost,
-                    'is_critical': item.is_critical,
-                    'supplier_name': item.supplier.name if item.supplier else None,
-                    'lead_time_days': item.lead_time_days
+                    'is_critical': item['is_critical'],
+                    'supplier_name': item['supplier_name'],
+                    'lead_time_days': item['lead_time_days']
                 })
 
         return jsonify({
-            'bom_number': bom.bom_number,
-            'product_name': bom.product.name,
+            'bom_number': bom['bom_number'],
+            'product_name': bom['product_name'],
             'production_quantity': production_qty,
             'total_shortage_items': len(shortage_items),
             'total_shortage_cost': total_shortage_cost,
@@ -315,7 +324,10 @@ def get_bom_shortage_analysis(bom_id):
 def create_bom_cost_analysis(bom_id):
     """Create cost analysis for BOM"""
     try:
-        bom = BillOfMaterials.query.get_or_404(bom_id)
+        bom_snapshot = bom_graph.snapshot()
+        bom = bom_snapshot.headers.get(bom_id)
+        if not bom:
+            return error_response('BOM not found'), 404
         
         # Calculate costs by material type
         raw_material_cost = 0
@@ -323,16 +335,16 @@ def create_bom_cost_analysis(bom_id):
         chemical_cost = 0
         total_material_cost = 0
 
-        for item in bom.items:
-            item_cost = float(item.total_cost)
+        for item in bom_snapshot.items.get(bom_id, []):
+            item_cost = item['coefficient'] * item['unit_cost']
             total_material_cost += item_cost
             
-            if item.material:
-                if item.material.material_type == 'raw_materials':
+            if item['is_material']:
+                if item['item_type'] == 'raw_materials':
                     raw_material_cost += item_cost
-                elif item.material.material_type == 'packaging_materials':
+                elif item['item_type'] == 'packaging_materials':
                     packaging_cost += item_cost
-                elif item.material.material_type == 'chemical_materials':
+                elif item['item_type'] == 'chemical_materials':
                     chemical_cost += item_cost
 
         # Return cost analysis without saving to database for now
@@ -340,7 +352,7 @@ def create_bom_cost_analysis(bom_id):
             'cost_analysis': {
                 'analysis_date': date.today().isoformat(),
                 'total_material_cost': float(total_material_cost),
-                'cost_per_unit': float(total_material_cost / float(bom.batch_size)) if bom.batch_size > 0 else 0,
+                'cost_per_unit': float(total_material_cost / bom['batch_size']) if bom['batch_size'] > 0 else 0,
                 'raw_material_cost': float(raw_material_cost),
                 'packaging_cost': float(packaging_cost),
                 'chemical_cost': float(chemical_cost)
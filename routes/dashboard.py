@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from models import db, SalesOrder, WorkOrder, Inventory, Machine, Product, User, Customer, Supplier, PurchaseOrder
+from models import db, SalesOrder, WorkOrder, Machine, Product, User, Customer, Supplier, PurchaseOrder
 from utils.i18n import success_response, error_response, get_message
 from models.oee import OEERecord, OEEAlert
 from models.quality import QualityInspection
@@ -11,6 +11,8 @@ from models.returns import CustomerReturn
 from models.waste import WasteRecord
 from models.rd import ResearchProject
 from sqlalchemy import func, desc, and_
+from utils import conditional_json
+from services.dashboard_metrics import get_kpis
 from datetime import datetime, timedelta, date
 import json
 
@@ -20,53 +22,27 @@ dashboard_bp = Blueprint('dashboard', __name__)
 @jwt_required()
 def get_overview():
     try:
-        # Sales metrics
-        today = datetime.now().date()
-        month_start = today.replace(day=1)
+        entry = get_kpis()
+        kpis = entry.value
         
-        sales_today = db.session.query(func.sum(SalesOrder.total_amount)).filter(
-            func.date(SalesOrder.order_date) == today
-        ).scalar() or 0
-        
-        sales_this_month = db.session.query(func.sum(SalesOrder.total_amount)).filter(
-            SalesOrder.order_date >= month_start
-        ).scalar() or 0
-        
-        # Production metrics
-        active_work_orders = WorkOrder.query.filter_by(status='in_progress').count()
-        completed_today = WorkOrder.query.filter(
-            func.date(WorkOrder.actual_end_date) == today,
-            WorkOrder.status == 'completed'
-        ).count()
-        
-        # Inventory metrics
-        low_stock_items = db.session.query(Product).join(Inventory).group_by(Product.id).having(
-            func.sum(Inventory.available_quantity) < Product.min_stock_level
-        ).count()
-        
-        # Machine status
-        machines_running = Machine.query.filter_by(status='running').count()
-        machines_idle = Machine.query.filter_by(status='idle').count()
-        machines_maintenance = Machine.query.filter_by(status='maintenance').count()
-        
-        return jsonify({
+        return conditional_json({
             'sales': {
-                'today': float(sales_today),
-                'this_month': float(sales_this_month)
+                'today': kpis['sales']['today'],
+                'this_month': kpis['sales']['this_month']
             },
             'production': {
-                'active_work_orders': active_work_orders,
-                'completed_today': completed_today
+                'active_work_orders': kpis['production']['active_work_orders'],
+                'completed_today': kpis['production']['completed_today']
             },
             'inventory': {
-                'low_stock_items': low_stock_items
+                'low_stock_items': kpis['inventory']['low_stock_items']
             },
             'machines': {
-                'running': machines_running,
-                'idle': machines_idle,
-                'maintenance': machines_maintenance
+                'running': kpis['machines']['running'],
+                'idle': kpis['machines']['idle'],
+                'maintenance': kpis['machines']['maintenance']
             }
-        }), 200
+        }, entry.etag)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -122,50 +98,15 @@ def get_production_chart():
 def get_executive_dashboard():
     """Comprehensive executive dashboard with all modules KPIs"""
     try:
-        # Date ranges
-        today = date.today()
-        week_start = today - timedelta(days=7)
-        month_start = today.replace(day=1)
-        
-        # Basic metrics that we know work
-        sales_today = db.session.query(func.coalesce(func.sum(SalesOrder.total_amount), 0)).filter(
-            func.date(SalesOrder.order_date) == today
-        ).scalar() or 0
+        # One cached, grouped computation shared with /overview
+        entry = get_kpis()
+        kpis = entry.value
         
-        sales_this_month = db.session.query(func.coalesce(func.sum(SalesOrder.total_amount), 0)).filter(
-            SalesOrder.order_date >= month_start
-        ).scalar() or 0
-        
-        active_work_orders = WorkOrder.query.filter_by(status='in_progress').count()
-        
-        machines_running = Machine.query.filter_by(status='running', is_active=True).count()
-        total_machines = Machine.query.filter_by(is_active=True).count()
-        machine_utilization = (machines_running / total_machines * 100) if total_machines > 0 else 0
-        
-        avg_oee = db.session.query(func.coalesce(func.avg(OEERecord.oee), 0)).filter(
-            OEERecord.record_date >= week_start
-        ).scalar() or 0
-        
-        critical_alerts = OEEAlert.query.filter(
-            OEEAlert.status == 'active',
-            OEEAlert.severity.in_(['high', 'critical'])
-        ).count()
+        critical_alerts = kpis['oee']['critical_alerts']
         
         # Safe calculations
         revenue_growth = 0  # Simplified for now
         
-        # Simple trend data
-        sales_trend = []
-        for i in range(7):
-            trend_date = today - timedelta(days=6-i)
-            daily_sales = db.session.query(func.coalesce(func.sum(SalesOrder.total_amount), 0)).filter(
-                func.date(SalesOrder.order_date) == trend_date
-            ).scalar() or 0
-            sales_trend.append({
-                'date': trend_date.isoformat(),
-                'value': float(daily_sales)
-            })
-        
         # Critical issues
         critical_issues = []
         if critical_alerts > 0:
@@ -176,30 +117,30 @@ def get_executive_dashboard():
                 'module': 'OEE'
             })
         
-        return jsonify({
+        return conditional_json({
             'financial': {
-                'sales_today': float(sales_today),
-                'sales_this_month': float(sales_this_month),
+                'sales_today': kpis['sales']['today'],
+                'sales_this_month': kpis['sales']['this_month'],
                 'revenue_growth': revenue_growth,
                 'outstanding_invoices': 0
             },
             'production': {
-                'active_work_orders': active_work_orders,
-                'completed_today': 0,
+                'active_work_orders': kpis['production']['active_work_orders'],
+                'completed_today': kpis['production']['completed_today'],
                 'efficiency': 0
             },
             'oee': {
-                'average_oee': round(float(avg_oee), 2),
+                'average_oee': round(kpis['oee']['average_oee'], 2),
                 'critical_alerts': critical_alerts,
-                'machine_utilization': round(machine_utilization, 2)
+                'machine_utilization': round(kpis['machines']['utilization'], 2)
             },
             'quality': {
                 'inspections_today': 0,
                 'pass_rate': 0
             },
             'inventory': {
-                'low_stock_items': 0,
-                'total_value': 0
+                'low_stock_items': kpis['inventory']['low_stock_items'],
+                'total_value': kpis['inventory']['total_value']
             },
             'purchasing': {
                 'pending_orders': 0
@@ -222,14 +163,14 @@ def get_executive_dashboard():
                 'this_week_kg': 0
             },
             'trends': {
-                'sales': sales_trend
+                'sales': kpis['sales']['trend']
             },
             'critical_issues': critical_issues,
             'summary': {
                 'total_modules': 11,
-                'last_updated': datetime.now().isoformat()
+                'last_updated': entry.computed_at.isoformat()
             }
-        }), 200
+        }, entry.etag)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -393,7 +393,7 @@ def create_leave_request():
         end_date = datetime.fromisoformat(data['end_date']).date()
         total_days = (end_date - start_date).days + 1
         
-        leave_number = generate_number('LV')
+        leave_number = generate_number('LV', Leave, 'leave_number')
         
         leave = Leave(
             leave_number=leave_number,
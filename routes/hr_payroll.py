@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Employee, PayrollPeriod, PayrollRecord, SalaryComponent, EmployeeSalaryComponent, Attendance
 from utils.i18n import success_response, error_response, get_message
 from utils import generate_number
+from services.payroll_engine import calculate_period_payroll
 from datetime import datetime, date
 from sqlalchemy import func, and_
 from decimal import Decimal
@@ -114,143 +115,20 @@ def calculate_payroll(period_id):
         if period.status != 'draft':
             return jsonify(error_response('api.error', error_code=400)), 400
         
-        # Get all active employees
-        employees = Employee.query.filter_by(is_active=True, status='active').all()
-        
-        total_gross = Decimal('0')
-        total_deductions = Decimal('0')
-        total_net = Decimal('0')
-        
-        for employee in employees:
-            # Calculate attendance data
-            attendance_data = calculate_employee_attendance(employee.id, period.start_date, period.end_date)
-            
-            # Get employee salary components
-            salary_components = get_employee_salary_components(employee.id)
-            
-            # Calculate payroll record
-            payroll_record = calculate_employee_payroll(
-                employee, period, attendance_data, salary_components
-            )
-            
-            total_gross += payroll_record.gross_salary
-            total_deductions += payroll_record.total_deductions
-            total_net += payroll_record.net_salary
-        
-        # Update period totals
-        period.total_employees = len(employees)
-        period.total_gross_salary = total_gross
-        period.total_deductions = total_deductions
-        period.total_net_salary = total_net
-        period.status = 'processing'
+        # Attendance, salary components and existing records are loaded
+        # with one grouped query each and the records written in bulk
+        summary = calculate_period_payroll(period)
         
         db.session.commit()
         
         return jsonify({
             'message': 'Payroll calculated successfully',
-            'summary': {
-                'total_employees': len(employees),
-                'total_gross_salary': float(total_gross),
-                'total_deductions': float(total_deductions),
-                'total_net_salary': float(total_net)
-            }
+            'summary': summary
         })
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-def calculate_employee_attendance(employee_id, start_date, end_date):
-    """Calculate attendance data for employee in period"""
-    attendances = Attendance.query.filter(
-        and_(
-            Attendance.employee_id == employee_id,
-            Attendance.attendance_date >= start_date,
-            Attendance.attendance_date <= end_date
-        )
-    ).all()
-    
-    total_days = (end_date - start_date).days + 1
-    days_worked = len([a for a in attendances if a.status == 'present'])
-    days_absent = len([a for a in attendances if a.status == 'absent'])
-    total_overtime_hours = sum([float(a.overtime_hours) for a in attendances])
-    
-    return {
-        'total_working_days': total_days,
-        'days_worked': days_worked,
-        'days_absent': days_absent,
-        'overtime_hours': total_overtime_hours
-    }
-
-def get_employee_salary_components(employee_id):
-    """Get active salary components for employee"""
-    components = EmployeeSalaryComponent.query.filter(
-        and_(
-            EmployeeSalaryComponent.employee_id == employee_id,
-            EmployeeSalaryComponent.is_active == True,
-            EmployeeSalaryComponent.effective_from <= date.today()
-        )
-    ).join(SalaryComponent).all()
-    
-    return components
-
-def calculate_employee_payroll(employee, period, attendance_data, salary_components):
-    """Calculate individual employee payroll"""
-    # Basic salary calculation
-    basic_salary = Decimal(str(employee.salary or 0))
-    
-    # Calculate allowances and other earnings
-    allowances = Decimal('0')
-    for comp in salary_components:
-        if comp.salary_component.component_type == 'earning':
-            allowances += Decimal(str(comp.amount))
-    
-    # Calculate overtime
-    overtime_rate = basic_salary / Decimal('160')  # Assuming 160 hours per month
-    overtime_amount = overtime_rate * Decimal(str(attendance_data['overtime_hours']))
-    
-    # Gross salary
-    gross_salary = basic_salary + allowances + overtime_amount
-    
-    # Calculate deductions
-    tax_deduction = gross_salary * Decimal('0.10')  # 10% tax
-    insurance_deduction = gross_salary * Decimal('0.02')  # 2% insurance
-    
-    total_deductions = tax_deduction + insurance_deduction
-    
-    # Net salary
-    net_salary = gross_salary - total_deductions
-    
-    # Create or update payroll record
-    existing_record = PayrollRecord.query.filter_by(
-        payroll_period_id=period.id,
-        employee_id=employee.id
-    ).first()
-    
-    if existing_record:
-        record = existing_record
-    else:
-        record = PayrollRecord(
-            payroll_period_id=period.id,
-            employee_id=employee.id
-        )
-        db.session.add(record)
-    
-    # Update record values
-    record.basic_salary = basic_salary
-    record.allowances = allowances
-    record.overtime_amount = overtime_amount
-    record.gross_salary = gross_salary
-    record.tax_deduction = tax_deduction
-    record.insurance_deduction = insurance_deduction
-    record.total_deductions = total_deductions
-    record.net_salary = net_salary
-    record.total_working_days = attendance_data['total_working_days']
-    record.days_worked = attendance_data['days_worked']
-    record.days_absent = attendance_data['days_absent']
-    record.overtime_hours = Decimal(str(attendance_data['overtime_hours']))
-    
-    return record
-
 # ===============================
 # PAYROLL RECORDS
 # ===============================
@@ -8,6 +8,13 @@ from models.integration_extended import (
 )
 from datetime import datetime, timedelta
 import json
+import uuid
+from services.webhook_dispatcher import deliver, EVENT_TYPES
+from services.data_sync import (
+    SYNC_ENTITIES, DEFAULT_BATCH_SIZE, DEFAULT_PARALLEL_BATCHES,
+    load_job_config, start_sync_execution, execute_sync, serialize_execution
+)
+from services.background_jobs import submit_job
 
 integration_bp = Blueprint('integration', __name__)
 
@@ -287,56 +294,48 @@ def create_api_endpoint():
         }), 500
 
 # Data Synchronization
+def _schedule_label(job):
+    if job.schedule_type == 'interval' and job.schedule_interval_minutes:
+        return f'Every {job.schedule_interval_minutes} minutes'
+    if job.schedule_type == 'cron' and job.schedule_cron:
+        return job.schedule_cron
+    return 'Manual'
+
+
+def _serialize_sync_job(job, connector_names):
+    return {
+        'id': job.id,
+        'name': job.job_name,
+        'job_code': job.job_code,
+        'source_system': connector_names.get(job.source_connector_id),
+        'target_system': job.target_system,
+        'sync_type': job.sync_type,
+        'schedule': _schedule_label(job),
+        'is_active': job.is_active,
+        'batch_size': job.batch_size,
+        'parallel_batches': job.parallel_batches,
+        'watermark': job.watermark_updated_at.isoformat() if job.watermark_updated_at else None,
+        'last_run': job.last_run_at.isoformat() if job.last_run_at else None,
+        'next_run': job.next_run_at.isoformat() if job.next_run_at else None,
+        'status': job.last_run_status,
+        'records_synced': job.last_run_records_success or 0,
+        'last_run_duration_seconds': job.last_run_duration_seconds,
+        'error_message': job.last_run_error_message
+    }
+
+
 @integration_bp.route('/data-sync/jobs', methods=['GET'])
 @jwt_required()
 def get_sync_jobs():
     """Get data synchronization jobs"""
     try:
-        jobs = [
-            {
-                'id': 1,
-                'name': 'Product Sync - SAP to ERP',
-                'source_system': 'SAP',
-                'target_system': 'ERP Database',
-                'sync_type': 'incremental',
-                'schedule': 'Every 4 hours',
-                'is_active': True,
-                'last_run': (datetime.utcnow() - timedelta(hours=3)).isoformat(),
-                'next_run': (datetime.utcnow() + timedelta(hours=1)).isoformat(),
-                'status': 'success',
-                'records_synced': 1250
-            },
-            {
-                'id': 2,
-                'name': 'Customer Data - CRM to ERP',
-                'source_system': 'Salesforce',
-                'target_system': 'ERP Database',
-                'sync_type': 'full',
-                'schedule': 'Daily at 2:00 AM',
-                'is_active': True,
-                'last_run': (datetime.utcnow() - timedelta(hours=18)).isoformat(),
-                'next_run': (datetime.utcnow() + timedelta(hours=6)).isoformat(),
-                'status': 'success',
-                'records_synced': 850
-            },
-            {
-                'id': 3,
-                'name': 'Inventory Sync - Warehouse',
-                'source_system': 'Warehouse System',
-                'target_system': 'ERP Database',
-                'sync_type': 'incremental',
-                'schedule': 'Every hour',
-                'is_active': False,
-                'last_run': (datetime.utcnow() - timedelta(days=1)).isoformat(),
-                'status': 'failed',
-                'error_message': 'Connection refused by source system',
-                'records_synced': 0
-            }
-        ]
+        jobs = DataSyncJob.query.order_by(DataSyncJob.id).all()
+        connector_names = dict(db.session.query(ExternalConnector.id, ExternalConnector.connector_name).all())
         
         return jsonify({
             'success': True,
-            'jobs': jobs
+            'jobs': [_serialize_sync_job(job, connector_names) for job in jobs],
+            'entities': list(SYNC_ENTITIES)
         })
         
     except Exception as e:
@@ -345,18 +344,90 @@ def get_sync_jobs():
             'message': f'Failed to load sync jobs: {str(e)}'
         }), 500
 
+@integration_bp.route('/data-sync/jobs', methods=['POST'])
+@jwt_required()
+def create_sync_job():
+    """Create a data synchronization job"""
+    try:
+        data = request.get_json()
+        
+        required_fields = ['name', 'job_code', 'connector_id', 'target_system', 'entity']
+        for field in required_fields:
+            if field not in data:
+                return jsonify({
+                    'success': False,
+                    'message': f'Missing required field: {field}'
+                }), 400
+        
+        mapping = {'entity': data['entity']}
+        for key in ('fields', 'path'):
+            if data.get(key):
+                mapping[key] = data[key]
+        
+        job = DataSyncJob(
+            job_name=data['name'],
+            job_code=data['job_code'],
+            description=data.get('description'),
+            source_connector_id=data['connector_id'],
+            target_system=data['target_system'],
+            sync_type=data.get('sync_type', 'incremental'),
+            sync_direction='export',
+            schedule_type=data.get('schedule_type', 'manual'),
+            schedule_interval_minutes=data.get('schedule_interval_minutes'),
+            mapping_configuration=json.dumps(mapping),
+            filter_conditions=json.dumps(data['filters']) if data.get('filters') else None,
+            error_handling=data.get('error_handling', 'stop'),
+            batch_size=data.get('batch_size', DEFAULT_BATCH_SIZE),
+            parallel_batches=data.get('parallel_batches', DEFAULT_PARALLEL_BATCHES),
+            is_active=data.get('is_active', True),
+            created_by=int(get_jwt_identity())
+        )
+        load_job_config(job)
+        db.session.add(job)
+        db.session.commit()
+        
+        connector_names = dict(db.session.query(ExternalConnector.id, ExternalConnector.connector_name).all())
+        return jsonify({
+            'success': True,
+            'message': 'Sync job created successfully',
+            'job': _serialize_sync_job(job, connector_names)
+        })
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'message': f'Failed to create sync job: {str(e)}'
+        }), 500
+
 @integration_bp.route('/data-sync/jobs/<int:job_id>/run', methods=['POST'])
 @jwt_required()
 def run_sync_job(job_id):
-    """Run data synchronization job manually"""
+    """Run data synchronization job manually, in the background"""
     try:
-        # Mock job execution
+        job = DataSyncJob.query.get_or_404(job_id)
+        try:
+            execution = start_sync_execution(job, 'manual', int(get_jwt_identity()))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 409
+        
+        submit_job(execute_sync, execution.id)
+        
         return jsonify({
             'success': True,
             'message': 'Sync job started successfully',
             'job_id': job_id,
-            'started_at': datetime.utcnow().isoformat()
-        })
+            'execution_id': execution.execution_id,
+            'started_at': execution.started_at.isoformat()
+        }), 202
         
     except Exception as e:
         return jsonify({
@@ -364,13 +435,38 @@ def run_sync_job(job_id):
             'message': f'Failed to start sync job: {str(e)}'
         }), 500
 
+@integration_bp.route('/data-sync/jobs/<int:job_id>/executions', methods=['GET'])
+@jwt_required()
+def get_sync_job_executions(job_id):
+    """Recent executions of a sync job with their throughput, newest first"""
+    try:
+        limit = min(request.args.get('limit', 20, type=int), 200)
+        executions = SyncJobExecution.query.filter_by(job_id=job_id).order_by(
+            SyncJobExecution.id.desc()
+        ).limit(limit).all()
+        
+        return jsonify({
+            'success': True,
+            'executions': [serialize_execution(execution) for execution in executions]
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to load sync job executions: {str(e)}'
+        }), 500
+
 @integration_bp.route('/data-sync/jobs/<int:job_id>', methods=['PATCH'])
 @jwt_required()
 def toggle_sync_job(job_id):
     """Toggle sync job active status"""
     try:
         data = request.get_json()
-        is_active = data.get('is_active')
+        is_active = bool(data.get('is_active'))
+        
+        job = DataSyncJob.query.get_or_404(job_id)
+        job.is_active = is_active
+        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -378,61 +474,61 @@ def toggle_sync_job(job_id):
         })
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Failed to toggle sync job: {str(e)}'
         }), 500
 
 # Webhook Management
+def _serialize_webhook(webhook):
+    return {
+        'id': webhook.id,
+        'name': webhook.webhook_name,
+        'url': webhook.webhook_url,
+        'http_method': webhook.http_method,
+        'events': json.loads(webhook.events or '[]'),
+        'is_active': webhook.is_active,
+        'has_secret': bool(webhook.secret_token),
+        'retry_count': webhook.retry_count,
+        'retry_delay_seconds': webhook.retry_delay_seconds,
+        'timeout_seconds': webhook.timeout_seconds,
+        'last_triggered': webhook.last_triggered_at.isoformat() if webhook.last_triggered_at else None,
+        'last_error': webhook.last_error_message,
+        'success_count': webhook.success_count,
+        'failure_count': webhook.failure_count,
+        'created_at': webhook.created_at.isoformat() if webhook.created_at else None
+    }
+
+
+def _serialize_delivery(delivery):
+    return {
+        'id': delivery.id,
+        'delivery_id': delivery.delivery_id,
+        'event_type': delivery.event_type,
+        'status': delivery.status,
+        'response_status_code': delivery.response_status_code,
+        'response_time_ms': delivery.response_time_ms,
+        'attempt_count': delivery.attempt_count,
+        'max_attempts': delivery.max_attempts,
+        'next_retry_at': delivery.next_retry_at.isoformat() if delivery.next_retry_at else None,
+        'error_message': delivery.error_message,
+        'created_at': delivery.created_at.isoformat() if delivery.created_at else None,
+        'delivered_at': delivery.delivered_at.isoformat() if delivery.delivered_at else None
+    }
+
+
 @integration_bp.route('/webhooks', methods=['GET'])
 @jwt_required()
 def get_webhooks():
     """Get webhook endpoints"""
     try:
-        webhooks = [
-            {
-                'id': 1,
-                'name': 'Order Notifications',
-                'url': 'https://company.com/webhooks/orders',
-                'events': ['order.created', 'order.updated', 'order.completed'],
-                'is_active': True,
-                'retry_count': 3,
-                'timeout_seconds': 30,
-                'last_triggered': (datetime.utcnow() - timedelta(minutes=15)).isoformat(),
-                'success_count': 1250,
-                'failure_count': 5,
-                'created_at': datetime.utcnow().isoformat()
-            },
-            {
-                'id': 2,
-                'name': 'Inventory Alerts',
-                'url': 'https://warehouse.company.com/api/alerts',
-                'events': ['inventory.low_stock', 'inventory.updated'],
-                'is_active': True,
-                'retry_count': 5,
-                'timeout_seconds': 45,
-                'last_triggered': (datetime.utcnow() - timedelta(hours=2)).isoformat(),
-                'success_count': 850,
-                'failure_count': 12,
-                'created_at': datetime.utcnow().isoformat()
-            },
-            {
-                'id': 3,
-                'name': 'User Management',
-                'url': 'https://auth.company.com/webhooks/users',
-                'events': ['user.created', 'user.updated', 'user.deleted'],
-                'is_active': False,
-                'retry_count': 3,
-                'timeout_seconds': 30,
-                'success_count': 120,
-                'failure_count': 8,
-                'created_at': datetime.utcnow().isoformat()
-            }
-        ]
+        webhooks = Webhook.query.order_by(Webhook.id).all()
         
         return jsonify({
             'success': True,
-            'webhooks': webhooks
+            'webhooks': [_serialize_webhook(webhook) for webhook in webhooks],
+            'available_events': list(EVENT_TYPES)
         })
         
     except Exception as e:
@@ -457,27 +553,40 @@ def create_webhook():
                     'message': f'Missing required field: {field}'
                 }), 400
         
-        # Mock webhook creation
-        new_webhook = {
-            'id': 4,
-            'name': data['name'],
-            'url': data['url'],
-            'events': data['events'],
-            'is_active': data.get('is_active', True),
-            'retry_count': data.get('retry_count', 3),
-            'timeout_seconds': data.get('timeout_seconds', 30),
-            'success_count': 0,
-            'failure_count': 0,
-            'created_at': datetime.utcnow().isoformat()
-        }
+        custom_headers = data.get('custom_headers')
+        if custom_headers and not (
+            isinstance(custom_headers, dict)
+            and all(isinstance(value, str) for value in custom_headers.values())
+        ):
+            return jsonify({
+                'success': False,
+                'message': 'custom_headers must be an object of header names to string values'
+            }), 400
+        
+        webhook = Webhook(
+            webhook_name=data['name'],
+            webhook_url=data['url'],
+            http_method=data.get('http_method', 'POST'),
+            secret_token=data.get('secret_token'),
+            custom_headers=json.dumps(custom_headers) if custom_headers else None,
+            events=json.dumps(data['events']),
+            is_active=data.get('is_active', True),
+            retry_count=data.get('retry_count', 3),
+            retry_delay_seconds=data.get('retry_delay_seconds', 60),
+            timeout_seconds=data.get('timeout_seconds', 30),
+            created_by=int(get_jwt_identity())
+        )
+        db.session.add(webhook)
+        db.session.commit()
         
         return jsonify({
             'success': True,
             'message': 'Webhook created successfully',
-            'webhook': new_webhook
+            'webhook': _serialize_webhook(webhook)
         })
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Failed to create webhook: {str(e)}'
@@ -486,21 +595,36 @@ def create_webhook():
 @integration_bp.route('/webhooks/<int:webhook_id>/test', methods=['POST'])
 @jwt_required()
 def test_webhook(webhook_id):
-    """Test webhook endpoint"""
+    """Send a signed test event to the webhook and report the response"""
     try:
-        # Mock webhook test
-        import random
-        success = random.choice([True, False])
-        
-        if success:
+        webhook = Webhook.query.get_or_404(webhook_id)
+        
+        # Delivered here rather than by the dispatcher, once and without retries
+        delivery = WebhookDelivery(
+            webhook_id=webhook.id,
+            delivery_id=str(uuid.uuid4()),
+            event_type='webhook.test',
+            event_data=json.dumps({'webhook_id': webhook.id, 'sent_at': datetime.utcnow().isoformat()}),
+            status='delivering',
+            claimed_at=datetime.utcnow(),
+            attempt_count=0,
+            max_attempts=1
+        )
+        db.session.add(delivery)
+        db.session.commit()
+        delivery = deliver(delivery.id)
+        
+        if delivery.status == 'success':
             return jsonify({
                 'success': True,
-                'message': 'Webhook test successful'
+                'message': 'Webhook test successful',
+                'delivery': _serialize_delivery(delivery)
             })
         else:
             return jsonify({
                 'success': False,
-                'error': 'Webhook endpoint returned HTTP 404'
+                'error': delivery.error_message,
+                'delivery': _serialize_delivery(delivery)
             })
         
     except Exception as e:
@@ -509,13 +633,39 @@ def test_webhook(webhook_id):
             'error': f'Webhook test failed: {str(e)}'
         }), 500
 
+@integration_bp.route('/webhooks/<int:webhook_id>/deliveries', methods=['GET'])
+@jwt_required()
+def get_webhook_deliveries(webhook_id):
+    """Recent delivery attempts of a webhook, newest first"""
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        query = WebhookDelivery.query.filter_by(webhook_id=webhook_id)
+        if request.args.get('status'):
+            query = query.filter_by(status=request.args.get('status'))
+        deliveries = query.order_by(WebhookDelivery.id.desc()).limit(limit).all()
+        
+        return jsonify({
+            'success': True,
+            'deliveries': [_serialize_delivery(delivery) for delivery in deliveries]
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to load webhook deliveries: {str(e)}'
+        }), 500
+
 @integration_bp.route('/webhooks/<int:webhook_id>', methods=['PATCH'])
 @jwt_required()
 def toggle_webhook(webhook_id):
     """Toggle webhook active status"""
     try:
         data = request.get_json()
-        is_active = data.get('is_active')
+        is_active = bool(data.get('is_active'))
+        
+        webhook = Webhook.query.get_or_404(webhook_id)
+        webhook.is_active = is_active
+        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -523,6 +673,7 @@ def toggle_webhook(webhook_id):
         })
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Failed to toggle webhook: {str(e)}'
@@ -531,14 +682,20 @@ def toggle_webhook(webhook_id):
 @integration_bp.route('/webhooks/<int:webhook_id>', methods=['DELETE'])
 @jwt_required()
 def delete_webhook(webhook_id):
-    """Delete webhook"""
+    """Delete webhook and its delivery history"""
     try:
+        webhook = Webhook.query.get_or_404(webhook_id)
+        WebhookDelivery.query.filter_by(webhook_id=webhook.id).delete(synchronize_session=False)
+        db.session.delete(webhook)
+        db.session.commit()
+        
         return jsonify({
             'success': True,
             'message': 'Webhook deleted successfully'
         })
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Failed to delete webhook: {str(e)}'
@@ -1,8 +1,13 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Material, Product, BillOfMaterials, BOMItem, WorkOrder, SalesOrder, SalesForecast, Inventory, Machine, PurchaseOrder
+from models import db, Material, Product, BillOfMaterials, BOMItem, WorkOrder, SalesOrder, SalesForecast, Inventory, Machine, PurchaseOrder, MRPRun, StockSummary
 from sqlalchemy import func
 from utils.i18n import success_response, error_response, get_message
+from services.mrp_engine import load_stock_levels
+from services.mrp_runs import get_requirements_run, serialize_run, RUN_MODES
+from services.bom_graph import bom_graph
+from services.mrp_simulation import run_scenarios, expand_sweep, MAX_SCENARIOS
+from services.mrp_timephased import get_plan, BUCKET_DAYS
 from datetime import datetime, timedelta
 from math import isnan, isinf
 import json
@@ -138,125 +143,23 @@ def get_material_requirements():
         # Get time horizon for MRP calculation
         days_ahead = request.args.get('days_ahead', 30, type=int)
         include_forecasts = request.args.get('include_forecasts', 'true').lower() == 'true'
+        # auto: reuse the last run if nothing changed, else net change (see services/mrp_runs.py)
+        mode = request.args.get('mode', 'auto')
+
+        if mode not in RUN_MODES:
+            return jsonify({'error': f"mode must be one of: {', '.join(RUN_MODES)}"}), 400
 
         start_date = datetime.utcnow().date()
         end_date = start_date + timedelta(days=days_ahead)
 
-        requirements = {}
-
-        # 1. PROCESS CONFIRMED SALES ORDERS
-        sales_orders = SalesOrder.query.filter(
-            SalesOrder.order_date.between(start_date, end_date),
-            SalesOrder.status.in_(['confirmed', 'processing'])
-        ).all()
-
-        for order in sales_orders:
-            for item in order.items:
-                product = item.product
-
-                # Get BOM for this product
-                bom = BillOfMaterials.query.filter_by(
-                    product_id=product.id,
-                    is_active=True
-                ).first()
-
-                if bom:
-                    # Calculate material requirements based on BOM
-                    quantity_needed = item.quantity
-
-                    for bom_item in bom.items:
-                        material_id = bom_item.material_id or bom_item.product_id
-
-                        if material_id not in requirements:
-                            requirements[material_id] = {
-                                'material_id': material_id,
-                                'material_code': bom_item.material.code if bom_item.material else bom_item.product.code,
-                                'material_name': bom_item.material.name if bom_item.material else bom_item.product.name,
-                                'total_quantity': 0,
-                                'confirmed_quantity': 0,
-                                'forecast_quantity': 0,
-                                'uom': bom_item.uom,
-                                'sources': []
-                            }
-
-                        material_qty = quantity_needed * bom_item.quantity * (1 + bom_item.scrap_percent / 100)
-                        requirements[material_id]['total_quantity'] += material_qty
-                        requirements[material_id]['confirmed_quantity'] += material_qty
-
-                        requirements[material_id]['sources'].append({
-                            'type': 'sales_order',
-                            'reference': order.order_number,
-                            'product_name': product.name,
-                            'quantity': material_qty,
-                            'required_date': order.required_date.isoformat() if order.required_date else None,
-                            'status': 'confirmed'
-                        })
-
-        # 2. PROCESS SALES FORECASTS (if enabled)
-        if include_forecasts:
-            forecasts = SalesForecast.query.filter(
-                SalesForecast.period_start <= end_date,
-                SalesForecast.period_end >= start_date,
-                SalesForecast.status.in_(['approved', 'submitted'])
-            ).all()
-
-            for forecast in forecasts:
-                if forecast.product_id:
-                    # Get BOM for forecasted product
-                    bom = BillOfMaterials.query.filter_by(
-                        product_id=forecast.product_id,
-                        is_active=True
-                    ).first()
-
-                    if bom:
-                        # Use most likely forecast value
-                        forecast_quantity = float(forecast.most_likely or 0)
-                        
-                        # Calculate overlap with our planning period
-                        overlap_days = min(end_date, forecast.period_end) - max(start_date, forecast.period_start)
-                        total_forecast_days = (forecast.period_end - forecast.period_start).days
-                        
-                        if total_forecast_days > 0:
-                            period_ratio = overlap_days.days / total_forecast_days
-                            adjusted_quantity = forecast_quantity * period_ratio
-
-                            for bom_item in bom.items:
-                                material_id = bom_item.material_id or bom_item.product_id
-
-                                if material_id not in requirements:
-                                    requirements[material_id] = {
-                                        'material_id': material_id,
-                                        'material_code': bom_item.material.code if bom_item.material else bom_item.product.code,
-                                        'material_name': bom_item.material.name if bom_item.material else bom_item.product.name,
-                                        'total_quantity': 0,
-                                        'confirmed_quantity': 0,
-                                        'forecast_quantity': 0,
-                                        'uom': bom_item.uom,
-                                        'sources': []
-                                    }
-
-                                material_qty = adjusted_quantity * bom_item.quantity * (1 + bom_item.scrap_percent / 100)
-                                requirements[material_id]['total_quantity'] += material_qty
-                                requirements[material_id]['forecast_quantity'] += material_qty
-
-                                requirements[material_id]['sources'].append({
-                                    'type': 'sales_forecast',
-                                    'reference': forecast.forecast_number,
-                                    'product_name': forecast.product.name if forecast.product else 'Unknown',
-                                    'quantity': material_qty,
-                                    'forecast_period': f"{forecast.period_start.isoformat()} to {forecast.period_end.isoformat()}",
-                                    'confidence': forecast.confidence_level,
-                                    'status': 'forecast'
-                                })
-
-        # 3. ADD CURRENT STOCK INFORMATION
-        for material_id in requirements:
-            current_stock = get_current_stock(material_id)
-            requirements[material_id]['current_stock'] = current_stock
-            requirements[material_id]['net_requirement'] = max(0, requirements[material_id]['total_quantity'] - current_stock)
+        user_id = get_jwt_identity()
+        run, requirements = get_requirements_run(
+            start_date, end_date, days_ahead, include_forecasts,
+            mode=mode, user_id=int(user_id) if user_id else None
+        )
 
         return jsonify({
-            'requirements': list(requirements.values()),
+            'requirements': requirements,
             'calculation_period': {
                 'start_date': start_date.isoformat(),
                 'end_date': end_date.isoformat(),
@@ -265,49 +168,133 @@ def get_material_requirements():
             'settings': {
                 'include_forecasts': include_forecasts,
                 'total_materials': len(requirements),
-                'confirmed_orders': len(sales_orders),
-                'forecasts_included': len(forecasts) if include_forecasts else 0
-            }
+                'confirmed_orders': run.confirmed_orders,
+                'forecasts_included': run.forecasts_included
+            },
+            'run': serialize_run(run)
         })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@mrp_bp.route('/runs', methods=['GET'])
+@jwt_required()
+def get_mrp_runs():
+    """List persisted MRP runs, newest first"""
+    try:
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+
+        runs = MRPRun.query.order_by(MRPRun.id.desc()).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+
+        return jsonify({
+            'runs': [serialize_run(run) for run in runs.items],
+            'total': runs.total,
+            'pages': runs.pages,
+            'current_page': runs.page
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@mrp_bp.route('/runs/<int:run_id>', methods=['GET'])
+@jwt_required()
+def get_mrp_run(run_id):
+    """Get one persisted MRP run with its requirement lines"""
+    try:
+        run = MRPRun.query.get_or_404(run_id)
+
+        return jsonify({
+            'run': serialize_run(run),
+            'requirements': [line.to_requirement() for line in run.lines]
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@mrp_bp.route('/time-phased', methods=['GET'])
+@jwt_required()
+def get_time_phased_plan():
+    """Time-phased MRP records per item in daily or weekly buckets"""
+    try:
+        bucket = request.args.get('bucket', 'week')
+        days_ahead = request.args.get('days_ahead', 90, type=int)
+        include_forecasts = request.args.get('include_forecasts', 'false').lower() == 'true'
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        item_type = request.args.get('item_type')
+        item_id = request.args.get('item_id', type=int)
+
+        if bucket not in BUCKET_DAYS:
+            return jsonify({'error': f"bucket must be one of: {', '.join(BUCKET_DAYS)}"}), 400
+        if days_ahead <= 0 or days_ahead > 730:
+            return jsonify({'error': 'days_ahead must be between 1 and 730'}), 400
+
+        start_date = datetime.utcnow().date()
+        plan = get_plan(start_date, bucket, days_ahead, include_forecasts, refresh=refresh)
+
+        with plan.lock:
+            result = plan.serialize(item_type=item_type, item_id=item_id)
+
+        result['calculation_period'] = {
+            'start_date': start_date.isoformat(),
+            'end_date': (start_date + timedelta(days=days_ahead)).isoformat(),
+            'days_ahead': days_ahead
+        }
+        return jsonify(result)
+    except ValueError as e:
+        # Circular BOM structures
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @mrp_bp.route('/planning', methods=['POST'])
 @jwt_required()
 def create_production_plan():
-    """Create production plan based on MRP requirements"""
+    """Create production plan based on MRP requirements
+
+    Pass ``run_id`` to plan from a persisted MRP run instead of posting the
+    requirement lines.
+    """
     try:
-        data = request.get_json()
-        requirements = data.get('requirements', [])
+        data = request.get_json() or {}
+        run_id = data.get('run_id')
+
+        if run_id:
+            run = MRPRun.query.get(run_id)
+            if not run:
+                return jsonify({'error': 'MRP run not found'}), 404
+            requirements = [line.to_requirement() for line in run.lines]
+            stock = {r['material_id']: r['current_stock'] for r in requirements}
+        else:
+            requirements = data.get('requirements', [])
+            stock = load_stock_levels(req['material_id'] for req in requirements)
 
         production_plan = []
+        bom_snapshot = bom_graph.snapshot()
 
         for req in requirements:
             material_id = req['material_id']
             required_quantity = req['total_quantity']
 
-            # Get current inventory
-            current_stock = get_current_stock(material_id)
+            # Current inventory, loaded in bulk above
+            current_stock = stock.get(material_id, 0.0)
 
             if current_stock < required_quantity:
                 # Calculate production needed
                 shortage = required_quantity - current_stock
 
                 # Find BOMs that use this material
-                boms_using_material = BillOfMaterials.query.join(BOMItem).filter(
-                    BillOfMaterials.is_active == True,
-                    BOMItem.material_id == material_id
-                ).all()
+                boms_using_material = bom_snapshot.where_used.get(material_id, [])
 
                 for bom in boms_using_material:
                     # Calculate how many batches to produce
-                    batches_needed = shortage / bom.batch_size
+                    batches_needed = shortage / bom['batch_size'] if bom['batch_size'] else 0
 
                     production_plan.append({
-                        'product_id': bom.product_id,
-                        'product_code': bom.product.code,
-                        'product_name': bom.product.name,
-                        'bom_id': bom.id,
+                        'product_id': bom['product_id'],
+                        'product_code': bom['product_code'],
+                        'product_name': bom['product_name'],
+                        'bom_id': bom['id'],
                         'batches_to_produce': float(batches_needed),
                         'total_quantity': float(shortage),
                         'priority': 'high',
@@ -316,7 +303,8 @@ def create_production_plan():
 
         return jsonify({
             'production_plan': production_plan,
-            'total_items': len(production_plan)
+            'total_items': len(production_plan),
+            'run_id': run_id
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -370,9 +358,9 @@ def get_sales_forecasts():
 def get_current_stock(material_id):
     """Helper function to get current stock level from inventory"""
     try:
-        # Sum all inventory quantities for this material/product
+        # Primary-key lookup on the maintained stock summary
         total_stock = db.session.query(
-            db.func.sum(Inventory.available_quantity)
+            StockSummary.available_quantity
         ).filter_by(product_id=material_id).scalar()
         
         return float(total_stock or 0.0)
@@ -393,158 +381,17 @@ def run_whatif_simulation():
         # Simulation parameters
         days_ahead = data.get('days_ahead', 30)
         scenarios = data.get('scenarios', [])  # List of scenario configurations
+        # Optional parameter sweep, e.g. {'demand_multipliers': [...], 'days_ahead': [...]}
+        scenarios = scenarios + expand_sweep(data.get('sweep'))
+
+        if len(scenarios) > MAX_SCENARIOS:
+            return jsonify({'error': f'At most {MAX_SCENARIOS} scenarios per simulation'}), 400
         
         start_date = datetime.utcnow().date()
         end_date = start_date + timedelta(days=days_ahead)
         
-        simulation_results = []
-        
-        for scenario in scenarios:
-            scenario_name = scenario.get('name', 'Unnamed Scenario')
-            include_forecasts = scenario.get('include_forecasts', True)
-            forecast_confidence = scenario.get('forecast_confidence', 'most_likely')  # best_case, most_likely, worst_case
-            demand_multiplier = scenario.get('demand_multiplier', 1.0)  # Adjust demand by percentage
-            
-            # Calculate requirements for this scenario
-            requirements = {}
-            
-            # 1. PROCESS CONFIRMED SALES ORDERS (always included)
-            sales_orders = SalesOrder.query.filter(
-                SalesOrder.order_date.between(start_date, end_date),
-                SalesOrder.status.in_(['confirmed', 'processing'])
-            ).all()
-
-            for order in sales_orders:
-                for item in order.items:
-                    product = item.product
-                    bom = BillOfMaterials.query.filter_by(
-                        product_id=product.id,
-                        is_active=True
-                    ).first()
-
-                    if bom:
-                        quantity_needed = item.quantity * demand_multiplier
-
-                        for bom_item in bom.items:
-                            material_id = bom_item.material_id or bom_item.product_id
-
-                            if material_id not in requirements:
-                                requirements[material_id] = {
-                                    'material_id': material_id,
-                                    'material_code': bom_item.material.code if bom_item.material else bom_item.product.code,
-                                    'material_name': bom_item.material.name if bom_item.material else bom_item.product.name,
-                                    'confirmed_quantity': 0,
-                                    'forecast_quantity': 0,
-                                    'total_quantity': 0,
-                                    'uom': bom_item.uom,
-                                    'sources': []
-                                }
-
-                            material_qty = quantity_needed * bom_item.quantity * (1 + bom_item.scrap_percent / 100)
-                            requirements[material_id]['confirmed_quantity'] += material_qty
-                            requirements[material_id]['total_quantity'] += material_qty
-
-                            requirements[material_id]['sources'].append({
-                                'type': 'sales_order',
-                                'reference': order.order_number,
-                                'quantity': material_qty,
-                                'scenario_adjusted': demand_multiplier != 1.0
-                            })
-
-            # 2. PROCESS SALES FORECASTS (if enabled in scenario)
-            if include_forecasts:
-                forecasts = SalesForecast.query.filter(
-                    SalesForecast.period_start <= end_date,
-                    SalesForecast.period_end >= start_date,
-                    SalesForecast.status.in_(['approved', 'submitted'])
-                ).all()
-
-                for forecast in forecasts:
-                    if forecast.product_id:
-                        bom = BillOfMaterials.query.filter_by(
-                            product_id=forecast.product_id,
-                            is_active=True
-                        ).first()
-
-                        if bom:
-                            # Select forecast value based on confidence level
-                            if forecast_confidence == 'best_case':
-                                forecast_quantity = float(forecast.best_case or 0)
-                            elif forecast_confidence == 'worst_case':
-                                forecast_quantity = float(forecast.worst_case or 0)
-                            else:  # most_likely
-                                forecast_quantity = float(forecast.most_likely or 0)
-                            
-                            # Apply demand multiplier
-                            forecast_quantity *= demand_multiplier
-                            
-                            # Calculate period overlap
-                            overlap_days = min(end_date, forecast.period_end) - max(start_date, forecast.period_start)
-                            total_forecast_days = (forecast.period_end - forecast.period_start).days
-                            
-                            if total_forecast_days > 0:
-                                period_ratio = overlap_days.days / total_forecast_days
-                                adjusted_quantity = forecast_quantity * period_ratio
-
-                                for bom_item in bom.items:
-                                    material_id = bom_item.material_id or bom_item.product_id
-
-                                    if material_id not in requirements:
-                                        requirements[material_id] = {
-                                            'material_id': material_id,
-                                            'material_code': bom_item.material.code if bom_item.material else bom_item.product.code,
-                                            'material_name': bom_item.material.name if bom_item.material else bom_item.product.name,
-                                            'confirmed_quantity': 0,
-                                            'forecast_quantity': 0,
-                                            'total_quantity': 0,
-                                            'uom': bom_item.uom,
-                                            'sources': []
-                                        }
-
-                                    material_qty = adjusted_quantity * bom_item.quantity * (1 + bom_item.scrap_percent / 100)
-                                    requirements[material_id]['forecast_quantity'] += material_qty
-                                    requirements[material_id]['total_quantity'] += material_qty
-
-                                    requirements[material_id]['sources'].append({
-                                        'type': 'sales_forecast',
-                                        'reference': forecast.forecast_number,
-                                        'quantity': material_qty,
-                                        'confidence': forecast_confidence,
-                                        'scenario_adjusted': demand_multiplier != 1.0
-                                    })
-
-            # 3. ADD CURRENT STOCK AND CALCULATE NET REQUIREMENTS
-            total_shortage_value = 0
-            critical_materials = 0
-            
-            for material_id in requirements:
-                current_stock = get_current_stock(material_id)
-                requirements[material_id]['current_stock'] = current_stock
-                requirements[material_id]['net_requirement'] = max(0, requirements[material_id]['total_quantity'] - current_stock)
-                
-                if requirements[material_id]['net_requirement'] > 0:
-                    critical_materials += 1
-
-            # Scenario summary
-            scenario_result = {
-                'scenario_name': scenario_name,
-                'scenario_config': {
-                    'include_forecasts': include_forecasts,
-                    'forecast_confidence': forecast_confidence,
-                    'demand_multiplier': demand_multiplier,
-                    'days_ahead': days_ahead
-                },
-                'summary': {
-                    'total_materials': len(requirements),
-                    'critical_materials': critical_materials,
-                    'total_shortage_value': total_shortage_value,
-                    'confirmed_orders_count': len(sales_orders),
-                    'forecasts_included': len(forecasts) if include_forecasts else 0
-                },
-                'requirements': list(requirements.values())
-            }
-            
-            simulation_results.append(scenario_result)
+        # All scenarios are evaluated in one pass over shared demand
+        simulation_results = run_scenarios(scenarios, days_ahead, start_date)
 
         return jsonify({
             'simulation_results': simulation_results,
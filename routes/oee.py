@@ -4,6 +4,8 @@ from models import db, Machine, MaintenanceRecord, MaintenanceSchedule, User
 from utils.i18n import success_response, error_response, get_message
 from models.oee import OEERecord, OEEDowntimeRecord, OEETarget, OEEAlert, MaintenanceImpact, OEEAnalytics, QualityDefect
 from utils import generate_number
+from services import oee_rollups, machine_history
+from services.oee_engine import calculate_oee, machine_ideal_rate, current_shift_oee
 from datetime import datetime, date, timedelta
 from sqlalchemy import func, and_, or_, desc
 import json
@@ -40,11 +42,10 @@ def create_record():
         
         record_number = generate_number('OEE', OEERecord, 'record_number')
         
-        # Calculate OEE metrics
-        availability = ((data['planned_production_time'] - data['downtime']) / data['planned_production_time']) * 100
-        performance = ((data['total_pieces_produced'] * data['ideal_cycle_time']) / data['actual_production_time']) * 100 if data['actual_production_time'] > 0 else 0
-        quality = (data['good_pieces'] / data['total_pieces_produced']) * 100 if data['total_pieces_produced'] > 0 else 0
-        oee = (availability * performance * quality) / 10000
+        # Calculate OEE metrics; ideal_cycle_time is in seconds per unit
+        ideal_rate = 3600 / float(data['ideal_cycle_time']) if data.get('ideal_cycle_time') else machine_ideal_rate(data['machine_id'])
+        metrics = calculate_oee(data['planned_production_time'], data['downtime'],
+                                data['total_pieces_produced'], data['good_pieces'], ideal_rate)
         
         record = OEERecord(
             record_number=record_number,
@@ -55,20 +56,20 @@ def create_record():
             planned_production_time=data['planned_production_time'],
             downtime=data['downtime'],
             actual_production_time=data['actual_production_time'],
-            ideal_cycle_time=data['ideal_cycle_time'],
+            ideal_cycle_time=data.get('ideal_cycle_time'),
             total_pieces_produced=data['total_pieces_produced'],
             good_pieces=data['good_pieces'],
             rejected_pieces=data['rejected_pieces'],
-            availability=availability,
-            performance=performance,
-            quality=quality,
-            oee=oee,
+            availability=metrics.availability,
+            performance=metrics.performance,
+            quality=metrics.quality,
+            oee=metrics.oee,
             recorded_by=user_id
         )
         
         db.session.add(record)
         db.session.commit()
-        return jsonify({'message': 'OEE record created', 'record_id': record.id, 'oee': oee}), 201
+        return jsonify({'message': 'OEE record created', 'record_id': record.id, 'oee': metrics.oee}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -122,27 +123,8 @@ def get_oee_dashboard():
         end_date = date.today()
         start_date = end_date - timedelta(days=days)
         
-        # Base query
-        query = OEERecord.query.filter(
-            OEERecord.record_date.between(start_date, end_date)
-        )
-        
-        if machine_id:
-            query = query.filter(OEERecord.machine_id == machine_id)
-        
-        records = query.all()
-        
-        # Calculate overall metrics
-        if records:
-            avg_oee = sum(float(r.oee) for r in records) / len(records)
-            avg_availability = sum(float(r.availability) for r in records) / len(records)
-            avg_performance = sum(float(r.performance) for r in records) / len(records)
-            avg_quality = sum(float(r.quality) for r in records) / len(records)
-            best_oee = max(float(r.oee) for r in records)
-            worst_oee = min(float(r.oee) for r in records)
-        else:
-            avg_oee = avg_availability = avg_performance = avg_quality = 0
-            best_oee = worst_oee = 0
+        # Overall metrics from the daily rollups
+        summary = oee_rollups.summary(start_date, end_date, machine_id)
         
         # Get machine performance data
         machines_query = Machine.query.filter(Machine.is_active == True)
@@ -150,62 +132,30 @@ def get_oee_dashboard():
             machines_query = machines_query.filter(Machine.id == machine_id)
         
         machines = machines_query.all()
+        machine_totals = oee_rollups.machine_totals(start_date, end_date, machine_id)
+        next_maintenance, alert_counts = oee_rollups.machine_status([machine.id for machine in machines])
         machine_performance = []
         
         for machine in machines:
-            machine_records = [r for r in records if r.machine_id == machine.id]
-            if machine_records:
-                machine_avg_oee = sum(float(r.oee) for r in machine_records) / len(machine_records)
-                machine_downtime = sum(r.downtime for r in machine_records)
-                machine_production = sum(r.total_pieces_produced for r in machine_records)
-            else:
-                machine_avg_oee = 0
-                machine_downtime = 0
-                machine_production = 0
-            
-            # Get maintenance info
-            next_maintenance = MaintenanceSchedule.query.filter(
-                MaintenanceSchedule.machine_id == machine.id,
-                MaintenanceSchedule.is_active == True,
-                MaintenanceSchedule.next_maintenance_date >= date.today()
-            ).order_by(MaintenanceSchedule.next_maintenance_date).first()
-            
-            # Get recent alerts
-            recent_alerts = OEEAlert.query.filter(
-                OEEAlert.machine_id == machine.id,
-                OEEAlert.status == 'active'
-            ).count()
+            machine_avg_oee, machine_downtime, machine_production = machine_totals.get(machine.id, (0, 0, 0))
+            machine_next_maintenance = next_maintenance.get(machine.id)
             
             machine_performance.append({
                 'machine_id': machine.id,
                 'machine_name': machine.name,
                 'machine_code': machine.code,
                 'status': machine.status,
-                'avg_oee': round(machine_avg_oee, 2),
+                'avg_oee': machine_avg_oee,
                 'total_downtime': machine_downtime,
                 'total_production': machine_production,
-                'next_maintenance': next_maintenance.next_maintenance_date.isoformat() if next_maintenance else None,
-                'active_alerts': recent_alerts,
+                'next_maintenance': machine_next_maintenance.isoformat() if machine_next_maintenance else None,
+                'active_alerts': alert_counts.get(machine.id, 0),
                 'efficiency': float(machine.efficiency) if machine.efficiency else 100,
                 'availability': float(machine.availability) if machine.availability else 100
             })
         
-        # Get trend data (last 7 days)
-        trend_data = []
-        for i in range(7):
-            trend_date = end_date - timedelta(days=i)
-            day_records = [r for r in records if r.record_date == trend_date]
-            if day_records:
-                day_avg_oee = sum(float(r.oee) for r in day_records) / len(day_records)
-            else:
-                day_avg_oee = 0
-            
-            trend_data.append({
-                'date': trend_date.isoformat(),
-                'oee': round(day_avg_oee, 2)
-            })
-        
-        trend_data.reverse()  # Show oldest to newest
+        # Get trend data (last 7 days, oldest to newest)
+        trend_data = oee_rollups.daily_trend(end_date - timedelta(days=6), end_date, machine_id)
         
         # Get active alerts
         alerts_query = OEEAlert.query.filter(OEEAlert.status == 'active')
@@ -215,28 +165,11 @@ def get_oee_dashboard():
         active_alerts = alerts_query.order_by(desc(OEEAlert.alert_date)).limit(10).all()
         
         # Get downtime analysis
-        downtime_records = OEEDowntimeRecord.query.join(OEERecord).filter(
-            OEERecord.record_date.between(start_date, end_date)
-        )
-        if machine_id:
-            downtime_records = downtime_records.filter(OEEDowntimeRecord.machine_id == machine_id)
-        
-        downtime_by_category = {}
-        for downtime in downtime_records.all():
-            category = downtime.downtime_category
-            if category not in downtime_by_category:
-                downtime_by_category[category] = 0
-            downtime_by_category[category] += downtime.duration_minutes or 0
+        downtime_by_category = oee_rollups.downtime_by_category(start_date, end_date, machine_id)
         
         return jsonify({
             'summary': {
-                'avg_oee': round(avg_oee, 2),
-                'avg_availability': round(avg_availability, 2),
-                'avg_performance': round(avg_performance, 2),
-                'avg_quality': round(avg_quality, 2),
-                'best_oee': round(best_oee, 2),
-                'worst_oee': round(worst_oee, 2),
-                'total_records': len(records),
+                **summary,
                 'date_range': {
                     'start': start_date.isoformat(),
                     'end': end_date.isoformat()
@@ -264,6 +197,70 @@ def get_oee_dashboard():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@oee_bp.route('/shifts/current', methods=['GET'])
+@jwt_required()
+def get_current_shift_oee():
+    """Running OEE of the shift in progress on each machine"""
+    try:
+        machine_id = request.args.get('machine_id', type=int)
+        return jsonify({
+            'timestamp': datetime.now().isoformat(),
+            'machines': current_shift_oee(machine_id=machine_id)
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@oee_bp.route('/history', methods=['GET'])
+@jwt_required()
+def get_machine_history():
+    """Downsampled metric history per machine, for charts
+
+    Query: metric (e.g. shift.oee), start/end (ISO), interval (hour,
+    shift, day, week), aggregate (mean, min, max, sum, count), machine_id
+    (repeatable).
+    """
+    try:
+        start, end = machine_history.parse_range(request.args.get('start'), request.args.get('end'))
+        interval = request.args.get('interval', 'day')
+        aggregate = request.args.get('aggregate', 'mean')
+        return jsonify({
+            'metric': request.args.get('metric', 'shift.oee'),
+            'interval': interval,
+            'aggregate': aggregate,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'series': machine_history.downsample(
+                request.args.get('metric', 'shift.oee'), start, end, interval, aggregate,
+                request.args.getlist('machine_id', type=int)
+            )
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@oee_bp.route('/history/percentiles', methods=['GET'])
+@jwt_required()
+def get_machine_history_percentiles():
+    """Percentiles of a metric per machine over a range (q: comma-separated, default 50,90,95,99)"""
+    try:
+        start, end = machine_history.parse_range(request.args.get('start'), request.args.get('end'))
+        q = request.args.get('q')
+        q = [float(p) for p in q.split(',')] if q else machine_history.DEFAULT_PERCENTILES
+        return jsonify({
+            'metric': request.args.get('metric', 'shift.oee'),
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'percentiles': machine_history.percentiles(
+                request.args.get('metric', 'shift.oee'), start, end, q,
+                request.args.getlist('machine_id', type=int)
+            )
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @oee_bp.route('/alerts', methods=['GET'])
 @jwt_required()
 def get_alerts():
@@ -461,7 +458,11 @@ def get_machine_analytics(machine_id):
                 'total_units_produced': float(a.total_units_produced),
                 'defect_rate': float(a.defect_rate),
                 'maintenance_hours': float(a.maintenance_hours),
-                'breakdown_count': a.breakdown_count
+                'breakdown_count': a.breakdown_count,
+                'total_records': a.total_records,
+                'best_oee': float(a.best_oee or 0),
+                'worst_oee': float(a.worst_oee or 0),
+                'downtime_by_category': a.downtime_by_category or {}
             } for a in analytics],
             'maintenance_impacts': [{
                 'date': mi.impact_date.isoformat(),
@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Machine, WorkOrder, ProductionRecord, BillOfMaterials, BOMItem, ProductionSchedule, Product, Employee
 from utils.i18n import success_response, error_response, get_message
 from utils import generate_number
+from services.oee_engine import period_oee
 from datetime import datetime, timedelta
 from sqlalchemy import func, and_, or_
 
@@ -167,30 +168,18 @@ def get_machine_efficiency(id):
         start_dt = datetime.fromisoformat(start_date)
         end_dt = datetime.fromisoformat(end_date)
         
-        # Get production records for the period
-        records = ProductionRecord.query.filter(
-            ProductionRecord.machine_id == id,
-            ProductionRecord.production_date.between(start_dt, end_dt)
-        ).all()
+        # Shift OEE totals for the period (services/oee_engine.py)
+        totals = period_oee(id, start_dt.date(), end_dt.date())
+        metrics = totals['metrics']
         
-        # Calculate efficiency metrics
-        total_produced = sum(float(r.quantity_produced) for r in records)
-        total_good = sum(float(r.quantity_good) for r in records)
-        total_scrap = sum(float(r.quantity_scrap) for r in records)
-        total_downtime = sum(r.downtime_minutes for r in records)
-        
-        # Calculate efficiency percentages
-        quality_rate = (total_good / total_produced * 100) if total_produced > 0 else 0
+        total_produced = totals['total_quantity']
+        total_good = totals['good_quantity']
+        total_scrap = totals['reject_quantity']
         scrap_rate = (total_scrap / total_produced * 100) if total_produced > 0 else 0
         
-        # Theoretical capacity calculation (assume 8 hours per day)
         days_in_period = (end_dt - start_dt).days + 1
-        theoretical_hours = days_in_period * 8 * 60  # in minutes
-        actual_runtime = theoretical_hours - total_downtime
-        availability_rate = (actual_runtime / theoretical_hours * 100) if theoretical_hours > 0 else 0
-        
-        # Overall Equipment Effectiveness (OEE)
-        oee = (availability_rate * quality_rate * float(machine.efficiency or 100)) / 10000
+        planned_minutes = totals['planned_minutes']
+        actual_runtime = planned_minutes - totals['downtime_minutes']
         
         return jsonify({
             'machine_id': id,
@@ -204,18 +193,19 @@ def get_machine_efficiency(id):
                 'total_produced': total_produced,
                 'total_good': total_good,
                 'total_scrap': total_scrap,
-                'quality_rate': round(quality_rate, 2),
+                'quality_rate': metrics.quality,
                 'scrap_rate': round(scrap_rate, 2)
             },
             'availability': {
-                'theoretical_hours': theoretical_hours / 60,  # convert to hours
-                'total_downtime_hours': total_downtime / 60,
+                'theoretical_hours': planned_minutes / 60,  # planned shift time
+                'total_downtime_hours': totals['downtime_minutes'] / 60,
                 'actual_runtime_hours': actual_runtime / 60,
-                'availability_rate': round(availability_rate, 2)
+                'availability_rate': metrics.availability
             },
             'efficiency': {
-                'performance_rate': float(machine.efficiency or 100),
-                'oee': round(oee, 2)
+                'performance_rate': metrics.performance,
+                'oee': metrics.oee,
+                'shifts': totals['shifts']
             }
         }), 200
     except Exception as e:
@@ -8,6 +8,7 @@ from models.production import Machine, ShiftProduction, DowntimeRecord
 from models.product import Product
 from models.hr import Employee
 from models.user import User
+from services.oee_engine import calculate_oee, machine_ideal_rate, shift_production_oee
 
 production_input_bp = Blueprint('production_input', __name__)
 
@@ -127,15 +128,14 @@ def create_shift_production():
         target_quantity = float(data['target_quantity'])
         
         # Calculate rates
-        quality_rate = (good_quantity / actual_quantity * 100) if actual_quantity > 0 else 0
         efficiency_rate = (actual_quantity / target_quantity * 100) if target_quantity > 0 else 0
         
         planned_runtime = int(data.get('planned_runtime', 480))  # 8 hours default
         actual_runtime = int(data.get('actual_runtime', planned_runtime))
         downtime_minutes = int(data.get('downtime_minutes', 0))
         
-        availability_rate = ((planned_runtime - downtime_minutes) / planned_runtime * 100) if planned_runtime > 0 else 0
-        oee_score = (availability_rate * efficiency_rate * quality_rate) / 10000
+        metrics = calculate_oee(planned_runtime, downtime_minutes, actual_quantity, good_quantity,
+                                machine_ideal_rate(data['machine_id']), target_quantity)
         
         # Create shift production record
         shift_production = ShiftProduction(
@@ -156,9 +156,9 @@ def create_shift_production():
             actual_runtime=actual_runtime,
             downtime_minutes=downtime_minutes,
             setup_time=int(data.get('setup_time', 0)),
-            quality_rate=quality_rate,
+            quality_rate=metrics.quality,
             efficiency_rate=efficiency_rate,
-            oee_score=oee_score,
+            oee_score=metrics.oee,
             operator_id=data.get('operator_id'),
             supervisor_id=data.get('supervisor_id'),
             notes=data.get('notes'),
@@ -207,13 +207,12 @@ def update_shift_production(production_id):
             shift_production.issues = data['issues']
         
         # Recalculate metrics
-        quality_rate = (shift_production.good_quantity / shift_production.actual_quantity * 100) if shift_production.actual_quantity > 0 else 0
         efficiency_rate = (shift_production.actual_quantity / shift_production.target_quantity * 100) if shift_production.target_quantity > 0 else 0
-        availability_rate = ((shift_production.planned_runtime - shift_production.downtime_minutes) / shift_production.planned_runtime * 100) if shift_production.planned_runtime > 0 else 0
+        metrics = shift_production_oee(shift_production)
         
-        shift_production.quality_rate = quality_rate
+        shift_production.quality_rate = metrics.quality
         shift_production.efficiency_rate = efficiency_rate
-        shift_production.oee_score = (availability_rate * efficiency_rate * quality_rate) / 10000
+        shift_production.oee_score = metrics.oee
         
         db.session.commit()
         
@@ -347,8 +346,7 @@ def create_downtime_record():
                 shift_production.downtime_minutes += duration_minutes
                 
                 # Recalculate OEE
-                availability_rate = ((shift_production.planned_runtime - shift_production.downtime_minutes) / shift_production.planned_runtime * 100) if shift_production.planned_runtime > 0 else 0
-                shift_production.oee_score = (availability_rate * shift_production.efficiency_rate * shift_production.quality_rate) / 10000
+                shift_production.oee_score = shift_production_oee(shift_production).oee
         
         db.session.commit()
         
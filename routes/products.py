@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Product, ProductCategory, ProductSpecification, ProductPackaging, Material, Inventory, SalesOrder
+from models import db, Product, ProductCategory, ProductSpecification, ProductPackaging, Material, Inventory, SalesOrder, StockSummary
 from utils.i18n import success_response, error_response, get_message
 from sqlalchemy import or_, func
 from utils.calculations import (
@@ -729,11 +729,23 @@ def get_stock_alerts():
         # Get real stock alerts from database
         alerts = []
         
-        # Get products with low stock or out of stock (simplified for now)
-        stock_alerts = []
+        # Products at or below their minimum stock, from the stock summary
+        stock_alerts = db.session.query(
+            Product.id,
+            Product.name,
+            Product.min_stock_level,
+            StockSummary.available_quantity,
+            StockSummary.updated_at
+        ).join(StockSummary, StockSummary.product_id == Product.id).filter(
+            Product.is_active == True,
+            or_(
+                StockSummary.available_quantity <= 0,
+                StockSummary.available_quantity < Product.min_stock_level
+            )
+        ).order_by(StockSummary.available_quantity).all()
         
         for product_id, product_name, min_stock, current_stock, last_updated in stock_alerts:
-            status = 'out_of_stock' if current_stock == 0 else 'low_stock'
+            status = 'out_of_stock' if current_stock <= 0 else 'low_stock'
             
             alerts.append({
                 'id': product_id,
@@ -8,6 +8,8 @@ from models.quality_enhanced import (
     QualityAudit, QualityTraining, QualityCompetency
 )
 from utils.helpers import generate_number
+from utils import conditional_json
+from services import quality_metrics
 from datetime import datetime, date, timedelta
 from sqlalchemy import func, desc, and_, or_
 import json
@@ -17,127 +19,14 @@ quality_enhanced_bp = Blueprint('quality_enhanced', __name__)
 @quality_enhanced_bp.route('/dashboard', methods=['GET'])
 @jwt_required()
 def get_quality_dashboard():
-    """Enhanced quality dashboard with comprehensive metrics"""
+    """Enhanced quality dashboard with comprehensive metrics (days: window length, default 7)"""
     try:
-        # Date ranges
-        today = date.today()
-        week_start = today - timedelta(days=7)
-        month_start = today.replace(day=1)
-        
-        # Basic quality metrics
-        total_inspections_today = QualityInspection.query.filter(
-            func.date(QualityInspection.inspection_date) == today
-        ).count()
-        
-        total_inspections_week = QualityInspection.query.filter(
-            QualityInspection.inspection_date >= week_start
-        ).count()
-        
-        passed_inspections_week = QualityInspection.query.filter(
-            QualityInspection.inspection_date >= week_start,
-            QualityInspection.result == 'accepted'
-        ).count()
-        
-        pass_rate = (passed_inspections_week / total_inspections_week * 100) if total_inspections_week > 0 else 0
-        
-        # Active alerts
-        active_alerts = QualityAlert.query.filter_by(status='active').count()
-        critical_alerts = QualityAlert.query.filter(
-            QualityAlert.status == 'active',
-            QualityAlert.severity.in_(['high', 'critical'])
-        ).count()
-        
-        # CAPA metrics
-        open_capas = CAPA.query.filter_by(status='open').count()
-        overdue_capas = CAPA.query.filter(
-            CAPA.status.in_(['open', 'in_progress']),
-            CAPA.target_date < today
-        ).count()
-        
-        # Quality costs (simplified)
-        total_defects_week = db.session.query(func.sum(QualityInspection.defect_count)).filter(
-            QualityInspection.inspection_date >= week_start
-        ).scalar() or 0
-        
-        # Trend data - last 7 days pass rate
-        pass_rate_trend = []
-        for i in range(7):
-            trend_date = today - timedelta(days=6-i)
-            daily_inspections = QualityInspection.query.filter(
-                func.date(QualityInspection.inspection_date) == trend_date
-            ).count()
-            daily_passed = QualityInspection.query.filter(
-                func.date(QualityInspection.inspection_date) == trend_date,
-                QualityInspection.result == 'accepted'
-            ).count()
-            daily_pass_rate = (daily_passed / daily_inspections * 100) if daily_inspections > 0 else 0
-            
-            pass_rate_trend.append({
-                'date': trend_date.isoformat(),
-                'pass_rate': round(daily_pass_rate, 2),
-                'inspections': daily_inspections
-            })
-        
-        # Top defect types (from recent inspections)
-        recent_inspections = QualityInspection.query.filter(
-            QualityInspection.inspection_date >= week_start,
-            QualityInspection.findings.isnot(None)
-        ).all()
-        
-        # Machine performance - get real data from database
-        machine_performance = []
-        try:
-            # Get machines that have quality inspections
-            machines_with_inspections = db.session.query(Machine).join(
-                Product, Machine.id == Product.machine_id
-            ).join(
-                QualityInspection, Product.id == QualityInspection.product_id
-            ).filter(
-                QualityInspection.inspection_date >= week_start
-            ).distinct().all()
-            
-            for machine in machines_with_inspections:
-                # Get inspections for products made by this machine
-                machine_inspections = db.session.query(QualityInspection).join(
-                    Product, QualityInspection.product_id == Product.id
-                ).filter(
-                    Product.machine_id == machine.id,
-                    QualityInspection.inspection_date >= week_start
-                ).all()
-                
-                if machine_inspections:
-                    total_inspections = len(machine_inspections)
-                    passed_inspections = len([i for i in machine_inspections if i.result == 'accepted'])
-                    machine_pass_rate = (passed_inspections / total_inspections * 100) if total_inspections > 0 else 0
-                    
-                    machine_performance.append({
-                        'machine': machine.name,
-                        'pass_rate': round(machine_pass_rate, 2),
-                        'total_inspections': total_inspections
-                    })
-        except Exception as e:
-            print(f"Error getting machine performance: {e}")
-            # If error, return empty list instead of dummy data
-            machine_performance = []
-        
-        return jsonify({
-            'summary': {
-                'inspections_today': total_inspections_today,
-                'inspections_this_week': total_inspections_week,
-                'pass_rate': round(pass_rate, 2),
-                'active_alerts': active_alerts,
-                'critical_alerts': critical_alerts,
-                'open_capas': open_capas,
-                'overdue_capas': overdue_capas,
-                'total_defects_week': int(total_defects_week)
-            },
-            'trends': {
-                'pass_rate': pass_rate_trend
-            },
-            'machine_performance': machine_performance,
-            'last_updated': datetime.now().isoformat()
-        }), 200
+        # Grouped per dimension and cached per window, see services/quality_metrics.py
+        entry = quality_metrics.get_dashboard(request.args.get('days', quality_metrics.DEFAULT_WINDOW_DAYS, type=int))
+        return conditional_json(dict(entry.value, last_updated=entry.computed_at.isoformat()), entry.etag)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
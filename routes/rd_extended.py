@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db
+from models import db, ResearchProject
 from models.hr import Employee, Department
 from utils.i18n import success_response, error_response, get_message
 from utils import generate_number
@@ -349,7 +349,7 @@ def create_project_details():
         user_id = int(get_jwt_identity())
         
         # Mock response - actual implementation would create new project
-        project_number = generate_number('RDP', None, None)
+        project_number = generate_number('RDP', ResearchProject, 'project_number')
         
         return jsonify({
             'message': 'Project created successfully',
@@ -1,42 +1,54 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required
-from models import db, SalesOrder, WorkOrder, Inventory, Product, Customer, WasteRecord, MaintenanceRecord, QualityTest
+from flask import Blueprint, Response, request, jsonify, send_file, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, SalesOrder, WorkOrder, Inventory, Product, Customer, WasteRecord, MaintenanceRecord, QualityTest, ReportJob
 from utils.i18n import success_response, error_response, get_message
 from sqlalchemy import func
 from datetime import datetime, timedelta
+from services.background_jobs import submit_job
+from services.report_engine import (
+    REPORTS, REPORT_FORMATS, FORMAT_MIMETYPES, GENERATE_TYPES, INLINE_REPORT_ROWS, parse_date_range, iter_report,
+    create_report_job, run_report_job, serialize_report_job
+)
+from services.identity_cache import get_identity
+import json
+import os
 
 reports_bp = Blueprint('reports', __name__)
 
+def stream_report(report_type):
+    """Stream a report as ``?format=json|ndjson|csv``
+
+    Totals come from SQL aggregates; rows are streamed from the database
+    in batches. For NDJSON and CSV, which carry rows only, the totals are
+    sent in the ``X-Report-Totals`` header.
+    """
+    file_format = request.args.get('format', 'json')
+    if file_format not in REPORT_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(REPORT_FORMATS)}"}), 400
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return report_response(report_type, file_format, start, end, REPORTS[report_type]['totals'](start, end))
+
+def report_response(report_type, file_format, start, end, totals):
+    response = Response(
+        stream_with_context(iter_report(report_type, file_format, start, end, totals)),
+        mimetype=FORMAT_MIMETYPES[file_format]
+    )
+    if file_format != 'json':
+        response.headers['X-Report-Totals'] = json.dumps(totals)
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename={report_type}_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{file_format}'
+        )
+    return response
+
 @reports_bp.route('/sales', methods=['GET'])
 @jwt_required()
 def sales_report():
     try:
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        query = SalesOrder.query
-        
-        if start_date:
-            query = query.filter(SalesOrder.order_date >= datetime.fromisoformat(start_date))
-        if end_date:
-            query = query.filter(SalesOrder.order_date <= datetime.fromisoformat(end_date))
-        
-        orders = query.all()
-        
-        total_orders = len(orders)
-        total_amount = sum(float(o.total_amount) for o in orders)
-        
-        return jsonify({
-            'total_orders': total_orders,
-            'total_amount': total_amount,
-            'orders': [{
-                'order_number': o.order_number,
-                'customer_name': o.customer.company_name,
-                'order_date': o.order_date.isoformat(),
-                'total_amount': float(o.total_amount),
-                'status': o.status
-            } for o in orders]
-        }), 200
+        return stream_report('sales')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -44,36 +56,7 @@ def sales_report():
 @jwt_required()
 def production_report():
     try:
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        
-        query = WorkOrder.query.filter_by(status='completed')
-        
-        if start_date:
-            query = query.filter(WorkOrder.actual_end_date >= datetime.fromisoformat(start_date))
-        if end_date:
-            query = query.filter(WorkOrder.actual_end_date <= datetime.fromisoformat(end_date))
-        
-        work_orders = query.all()
-        
-        total_quantity = sum(float(wo.quantity_produced) for wo in work_orders)
-        total_good = sum(float(wo.quantity_good) for wo in work_orders)
-        total_scrap = sum(float(wo.quantity_scrap) for wo in work_orders)
-        
-        return jsonify({
-            'total_work_orders': len(work_orders),
-            'total_quantity_produced': total_quantity,
-            'total_good': total_good,
-            'total_scrap': total_scrap,
-            'efficiency': (total_good / total_quantity * 100) if total_quantity > 0 else 0,
-            'work_orders': [{
-                'wo_number': wo.wo_number,
-                'product_name': wo.product.name,
-                'quantity_produced': float(wo.quantity_produced),
-                'quantity_good': float(wo.quantity_good),
-                'status': wo.status
-            } for wo in work_orders]
-        }), 200
+        return stream_report('production')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -234,16 +217,38 @@ def quality_report():
 @jwt_required()
 def generate_report(report_type):
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         filters = data.get('filters', {})
         fields = data.get('fields', [])
         
+        # Sales and production reports stream inline up to INLINE_REPORT_ROWS
+        # rows; larger ones (or background=true) are written to a file by a
+        # background job: poll /jobs/<id> and download when completed
+        if report_type in GENERATE_TYPES:
+            name = GENERATE_TYPES[report_type]
+            file_format = data.get('format', 'json')
+            if file_format not in REPORT_FORMATS:
+                return jsonify({'error': f"format must be one of: {', '.join(REPORT_FORMATS)}"}), 400
+            date_range = {key: filters.get(key, request.args.get(key)) for key in ('start_date', 'end_date')}
+            try:
+                start, end = parse_date_range(date_range)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            totals = REPORTS[name]['totals'](start, end)
+            if totals[REPORTS[name]['count_key']] <= INLINE_REPORT_ROWS and not data.get('background'):
+                return report_response(name, file_format, start, end, totals)
+            
+            job = create_report_job(name, file_format, date_range, int(get_jwt_identity()))
+            submit_job(run_report_job, job.id)
+            return jsonify({
+                'job': serialize_report_job(job),
+                'status_url': f'/api/reports/jobs/{job.id}',
+                'download_url': f'/api/reports/jobs/{job.id}/download'
+            }), 202
+        
         # Route to appropriate report function based on type
-        if report_type == 'sales-summary':
-            return sales_report()
-        elif report_type == 'production-efficiency':
-            return production_report()
-        elif report_type == 'inventory-status':
+        if report_type == 'inventory-status':
             return inventory_report()
         elif report_type == 'waste-management':
             return waste_report()
@@ -252,8 +257,53 @@ def generate_report(report_type):
         elif report_type == 'quality-metrics':
             return quality_report()
         else:
-            return jsonify(error_response('api.error', error_code=400)), 400
+            return jsonify({'error': f'Unknown report type: {report_type}'}), 400
             
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+def load_report_job(job_id):
+    """``(job, None)`` for the requester or an admin, else ``(None, error response)``"""
+    job = db.session.get(ReportJob, job_id)
+    if job is None:
+        return None, (jsonify({'error': 'Report job not found'}), 404)
+    user_id = int(get_jwt_identity())
+    if job.requested_by != user_id:
+        identity = get_identity(user_id)
+        if not identity or not identity.is_admin:
+            return None, (jsonify({'error': 'Access denied'}), 403)
+    return job, None
+
+@reports_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_report_job(job_id):
+    try:
+        job, error = load_report_job(job_id)
+        if error:
+            return error
+        return jsonify({'job': serialize_report_job(job)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@reports_bp.route('/jobs/<int:job_id>/download', methods=['GET'])
+@jwt_required()
+def download_report_job(job_id):
+    try:
+        job, error = load_report_job(job_id)
+        if error:
+            return error
+        if job.status != 'completed':
+            return jsonify({'error': f'Report is {job.status}', 'job': serialize_report_job(job)}), 409
+        if not job.file_path or not os.path.exists(job.file_path):
+            return jsonify({'error': 'Report file no longer exists'}), 410
+        
+        return send_file(
+            job.file_path,
+            mimetype=FORMAT_MIMETYPES[job.file_format],
+            as_attachment=True,
+            download_name=os.path.basename(job.file_path)
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1,13 +1,14 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, send_file, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, SystemSetting, CompanyProfile, User, Role
 from utils.i18n import success_response, error_response, get_message
-from datetime import datetime
+from datetime import datetime, timezone
 import json
 import os
 import tempfile
 import zipfile
 from utils import generate_number
+from services.data_export import FORMAT_MIMETYPES, prepare_export, iter_export
 
 settings_bp = Blueprint('settings', __name__)
 
@@ -409,42 +410,45 @@ def download_backup(filename):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@settings_bp.route('/export/data', methods=['POST'])
+@settings_bp.route('/export/data', methods=['GET', 'POST'])
 @jwt_required()
 def export_data():
+    """Stream a data export as ``format=ndjson|csv|xlsx``
+
+    ``type`` is ``full`` (default), a group (``orders``, ``movements``,
+    ``invoices``) or table names, comma separated. ``since`` (ISO time)
+    exports only rows changed after it; the ``X-Export-Until`` header is
+    the ``since`` of the next incremental export. Parameters come from the
+    query string or, for POST, the JSON body.
+    """
     try:
-        data = request.get_json()
-        export_type = data.get('type', 'full')  # full, products, orders, etc.
-        
-        # Create export based on type
-        export_data = {
-            'export_info': {
-                'type': export_type,
-                'created_at': datetime.utcnow().isoformat(),
-                'created_by': int(get_jwt_identity())  # Convert string to int
-            }
-        }
-        
-        if export_type == 'full' or export_type == 'products':
-            from models import Product
-            products = Product.query.all()
-            export_data['products'] = [{
-                'id': p.id,
-                'code': p.code,
-                'name': p.name,
-                'description': p.description,
-                'price': float(p.price) if p.price else 0,
-                'cost': float(p.cost) if p.cost else 0,
-                'material_type': p.material_type
-            } for p in products]
-        
-        return jsonify({
-            'message': 'Data export prepared successfully',
-            'data': export_data,
-            'records_count': len(export_data.get('products', [])),
-            'download_url': '/api/settings/export/download'
-        }), 200
-        
+        params = request.args.to_dict()
+        if request.method == 'POST':
+            params.update(request.get_json(silent=True) or {})
+        export_type = params.get('type', 'full')
+        file_format = params.get('format', 'ndjson')
+
+        since = None
+        if params.get('since'):
+            try:
+                since = datetime.fromisoformat(str(params['since']).replace('Z', '+00:00'))
+            except ValueError:
+                return jsonify({'error': 'since must be an ISO date or time'}), 400
+            if since.tzinfo is not None:
+                since = since.astimezone(timezone.utc).replace(tzinfo=None)
+
+        tables, until, extension = prepare_export(export_type, file_format, since)
+        mimetype = FORMAT_MIMETYPES['zip' if extension == 'zip' else file_format]
+        filename = f"gms_export_{export_type.replace(',', '_')}_{until.strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+        response = Response(stream_with_context(iter_export(tables, file_format, since, until)), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        response.headers['X-Export-Tables'] = ','.join(tables)
+        response.headers['X-Export-Until'] = until.isoformat()
+        return response
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1,19 +1,26 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db
 from utils.i18n import success_response, error_response, get_message
 from models.user import User
 from models.settings import SystemSetting
+from models.backup import BackupRecord
 from models.settings_extended import (
     AdvancedUserRole, AdvancedPermission, AdvancedRolePermission,
     AdvancedUserRoleAssignment, AuditLog, SystemConfiguration, BackupConfiguration
 )
 from datetime import datetime, timedelta
+import csv
+import io
 import json
 import os
 import subprocess
 import shutil
-from sqlalchemy import text
+from sqlalchemy import text, tuple_
+from services.background_jobs import submit_job
+from services.backup_engine import (
+    create_backup_record, run_backup, restore_backup as restore_from_backup, delete_backup as remove_backup
+)
 
 settings_extended_bp = Blueprint('settings_extended', __name__)
 
@@ -229,40 +236,105 @@ def get_permissions():
         }), 500
 
 # Audit Trail
+AUDIT_EXPORT_COLUMNS = (
+    'id', 'timestamp', 'user_id', 'user_name', 'action', 'resource_type', 'resource_id',
+    'request_method', 'request_url', 'status', 'status_code', 'duration_ms', 'ip_address'
+)
+
+
+def _audit_log_filters(args):
+    """Filters on the indexed AuditLog columns from query arguments"""
+    criteria = []
+    if args.get('user_id', type=int):
+        criteria.append(AuditLog.user_id == args.get('user_id', type=int))
+    for column, arg in ((AuditLog.action, 'action'), (AuditLog.resource_type, 'resource_type'),
+                        (AuditLog.status, 'status'), (AuditLog.request_method, 'method')):
+        if args.get(arg):
+            criteria.append(column == args.get(arg))
+    if args.get('start_date'):
+        criteria.append(AuditLog.timestamp >= datetime.fromisoformat(args.get('start_date')))
+    if args.get('end_date'):
+        criteria.append(AuditLog.timestamp <= datetime.fromisoformat(args.get('end_date')))
+    return criteria
+
+
+def _audit_log_query(criteria):
+    return db.session.query(
+        AuditLog.id, AuditLog.timestamp, AuditLog.user_id, User.full_name.label('user_name'),
+        AuditLog.action, AuditLog.resource_type, AuditLog.resource_id, AuditLog.old_values,
+        AuditLog.new_values, AuditLog.request_method, AuditLog.request_url, AuditLog.status,
+        AuditLog.status_code, AuditLog.duration_ms, AuditLog.ip_address, AuditLog.user_agent
+    ).outerjoin(User, AuditLog.user_id == User.id).filter(*criteria)
+
+
+def _serialize_audit_log(row):
+    return {
+        'id': row.id,
+        'user_id': row.user_id,
+        'user_name': row.user_name,
+        'action': row.action,
+        'resource_type': row.resource_type,
+        'resource_id': row.resource_id,
+        'old_values': row.old_values,
+        'new_values': row.new_values,
+        'request_method': row.request_method,
+        'request_url': row.request_url,
+        'status': row.status,
+        'status_code': row.status_code,
+        'duration_ms': row.duration_ms,
+        'ip_address': row.ip_address,
+        'user_agent': row.user_agent,
+        'timestamp': row.timestamp.isoformat() if row.timestamp else None
+    }
+
+
 @settings_extended_bp.route('/audit-logs', methods=['GET'])
 @jwt_required()
 def get_audit_logs():
-    """Get audit trail logs"""
+    """Get audit trail logs, newest first
+
+    Pass ``cursor`` (empty for the first page, then ``next_cursor``) to page
+    by keyset instead of offset; deep pages then cost the same as the first.
+    """
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 50, type=int)
-        
-        # Mock audit logs - in real implementation, these would come from audit log table
-        logs = []
-        for i in range(per_page):
-            logs.append({
-                'id': i + 1,
-                'user_id': 1,
-                'user_name': 'Admin User',
-                'action': ['create', 'update', 'delete', 'login'][i % 4],
-                'resource_type': ['user', 'product', 'order', 'settings'][i % 4],
-                'resource_id': str(i + 1),
-                'old_values': {'field': 'old_value'} if i % 2 == 0 else None,
-                'new_values': {'field': 'new_value'},
-                'ip_address': '192.168.1.100',
-                'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'timestamp': (datetime.utcnow() - timedelta(hours=i)).isoformat(),
-                'status': ['success', 'failed', 'warning'][i % 3]
+        per_page = max(1, min(request.args.get('per_page', 50, type=int), 500))
+        cursor = request.args.get('cursor')
+        query = _audit_log_query(_audit_log_filters(request.args)).order_by(
+            AuditLog.timestamp.desc(), AuditLog.id.desc()
+        )
+
+        if cursor is not None:
+            if cursor:
+                timestamp, log_id = cursor.rsplit('|', 1)
+                query = query.filter(
+                    tuple_(AuditLog.timestamp, AuditLog.id) < (datetime.fromisoformat(timestamp), int(log_id))
+                )
+            rows = query.limit(per_page + 1).all()
+            has_more = len(rows) > per_page
+            rows = rows[:per_page]
+            return jsonify({
+                'success': True,
+                'logs': [_serialize_audit_log(row) for row in rows],
+                'has_more': has_more,
+                'next_cursor': f'{rows[-1].timestamp.isoformat()}|{rows[-1].id}' if has_more else None
             })
-        
+
+        page = max(1, request.args.get('page', 1, type=int))
+        total = query.order_by(None).count()
+        rows = query.offset((page - 1) * per_page).limit(per_page).all()
         return jsonify({
             'success': True,
-            'logs': logs,
-            'total': 1000,
-            'total_pages': 20,
+            'logs': [_serialize_audit_log(row) for row in rows],
+            'total': total,
+            'total_pages': (total + per_page - 1) // per_page,
             'current_page': page
         })
-        
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid audit log filter: {str(e)}'
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -272,20 +344,38 @@ def get_audit_logs():
 @settings_extended_bp.route('/audit-logs/export', methods=['GET'])
 @jwt_required()
 def export_audit_logs():
-    """Export audit logs to CSV"""
+    """Export audit logs to CSV, streamed in batches"""
     try:
-        # Mock CSV export
-        csv_content = "ID,User,Action,Resource,Timestamp,Status\n"
-        csv_content += "1,Admin User,create,user,2024-01-01 10:00:00,success\n"
-        csv_content += "2,Admin User,update,product,2024-01-01 11:00:00,success\n"
-        
-        from flask import Response
+        query = _audit_log_query(_audit_log_filters(request.args)).order_by(
+            AuditLog.timestamp.desc(), AuditLog.id.desc()
+        ).yield_per(1000)
+
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(AUDIT_EXPORT_COLUMNS)
+            for index, row in enumerate(query, 1):
+                writer.writerow([
+                    row.timestamp.isoformat() if column == 'timestamp' and row.timestamp else getattr(row, column)
+                    for column in AUDIT_EXPORT_COLUMNS
+                ])
+                if index % 1000 == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+
         return Response(
-            csv_content,
+            stream_with_context(generate()),
             mimetype='text/csv',
             headers={'Content-Disposition': 'attachment; filename=audit_logs.csv'}
         )
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid audit log filter: {str(e)}'
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -298,27 +388,18 @@ def export_audit_logs():
 def get_backups():
     """Get list of backups"""
     try:
-        # Mock backup list - in real implementation, scan backup directory
-        backups = [
-            {
-                'id': 1,
-                'filename': 'backup_2024_01_15_10_30_00.sql',
-                'size': 15728640,  # 15MB
-                'created_at': (datetime.utcnow() - timedelta(days=1)).isoformat(),
-                'backup_type': 'scheduled',
-                'status': 'completed',
-                'description': 'Scheduled daily backup'
-            },
-            {
-                'id': 2,
-                'filename': 'backup_2024_01_14_02_00_00.sql',
-                'size': 14680064,  # 14MB
-                'created_at': (datetime.utcnow() - timedelta(days=2)).isoformat(),
-                'backup_type': 'scheduled',
-                'status': 'completed',
-                'description': 'Scheduled daily backup'
-            }
-        ]
+        records = BackupRecord.query.order_by(BackupRecord.backup_date.desc()).all()
+        backups = [{
+            'id': record.id,
+            'filename': record.file_name,
+            'size': int(float(record.file_size_mb or 0) * 1024 * 1024),
+            'created_at': record.backup_date.isoformat(),
+            'backup_type': record.backup_type,
+            'compression': record.compression_type,
+            'status': record.status,
+            'description': record.notes or ('Scheduled backup' if record.is_scheduled else 'Manual backup'),
+            'error_message': record.error_message
+        } for record in records]
         
         return jsonify({
             'success': True,
@@ -336,19 +417,22 @@ def get_backups():
 def get_backup_config():
     """Get backup configuration"""
     try:
-        # Default backup configuration
-        config = {
-            'auto_backup_enabled': True,
-            'backup_frequency': 'daily',
-            'backup_time': '02:00',
-            'retention_days': 30,
-            'include_files': True,
-            'compress_backup': True
+        config = BackupConfiguration.query.filter_by(is_active=True).order_by(BackupConfiguration.id).first()
+        settings = {
+            'auto_backup_enabled': config is not None and config.schedule_type != 'manual',
+            'backup_frequency': config.schedule_type if config else 'daily',
+            'backup_time': config.schedule_time.strftime('%H:%M') if config and config.schedule_time else '02:00',
+            'backup_type': config.backup_type if config else 'full',
+            'retention_days': config.retention_days if config else 30,
+            'max_backup_count': config.max_backup_count if config else 10,
+            'include_files': config.include_files if config else True,
+            'compress_backup': config.compress_backup if config else True,
+            'compression_level': config.compression_level if config else 6
         }
         
         return jsonify({
             'success': True,
-            'settings': config
+            'settings': settings
         })
         
     except Exception as e:
@@ -364,8 +448,23 @@ def save_backup_config():
     try:
         data = request.get_json()
         
-        # In real implementation, save to database or config file
-        # For now, just return success
+        config = BackupConfiguration.query.filter_by(is_active=True).order_by(BackupConfiguration.id).first()
+        if config is None:
+            config = BackupConfiguration(config_name='default', backup_type='full', schedule_type='manual',
+                                         created_by=int(get_jwt_identity()))
+            db.session.add(config)
+        
+        if 'auto_backup_enabled' in data or 'backup_frequency' in data:
+            enabled = data.get('auto_backup_enabled', config.schedule_type != 'manual')
+            config.schedule_type = data.get('backup_frequency', 'daily') if enabled else 'manual'
+        if data.get('backup_time'):
+            config.schedule_time = datetime.strptime(data['backup_time'], '%H:%M').time()
+        for field in ('backup_type', 'retention_days', 'max_backup_count', 'include_files', 'compress_backup'):
+            if field in data:
+                setattr(config, field, data[field])
+        if 'compression_level' in data:
+            config.compression_level = min(max(int(data['compression_level']), 1), 9)
+        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -373,6 +472,7 @@ def save_backup_config():
         })
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Failed to save backup configuration: {str(e)}'
@@ -381,30 +481,37 @@ def save_backup_config():
 @settings_extended_bp.route('/backups/create', methods=['POST'])
 @jwt_required()
 def create_backup():
-    """Create a new backup"""
+    """Start a new backup in the background"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         description = data.get('description', 'Manual backup')
         
-        # Mock backup creation
-        # In real implementation, this would:
-        # 1. Create database dump
-        # 2. Optionally include files
-        # 3. Compress if configured
-        # 4. Store in backup directory
-        
-        backup_filename = f"backup_{datetime.utcnow().strftime('%Y_%m_%d_%H_%M_%S')}.sql"
+        record = create_backup_record(
+            backup_type=data.get('backup_type', 'full'),
+            user_id=int(get_jwt_identity()),
+            notes=description
+        )
+        submit_job(run_backup, record.id)
         
         return jsonify({
             'success': True,
-            'message': 'Backup created successfully',
+            'message': 'Backup started',
             'backup': {
-                'filename': backup_filename,
-                'created_at': datetime.utcnow().isoformat()
+                'id': record.id,
+                'filename': record.file_name,
+                'backup_type': record.backup_type,
+                'status': record.status,
+                'created_at': record.backup_date.isoformat()
             }
-        })
+        }), 202
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Failed to create backup: {str(e)}'
@@ -415,18 +522,20 @@ def create_backup():
 def restore_backup(backup_id):
     """Restore from backup"""
     try:
-        # Mock restore process
-        # In real implementation, this would:
-        # 1. Validate backup file
-        # 2. Create current backup before restore
-        # 3. Restore database from backup
-        # 4. Restart services if needed
+        record = BackupRecord.query.get_or_404(backup_id)
+        safety = restore_from_backup(record, int(get_jwt_identity()))
         
         return jsonify({
             'success': True,
-            'message': 'Backup restored successfully'
+            'message': 'Backup restored successfully',
+            'safety_backup': safety.file_name
         })
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -438,15 +547,14 @@ def restore_backup(backup_id):
 def download_backup(backup_id):
     """Download backup file"""
     try:
-        # Mock file download
-        # In real implementation, serve actual backup file
+        record = BackupRecord.query.get_or_404(backup_id)
+        if record.status != 'completed' or not os.path.exists(record.file_path):
+            return jsonify({
+                'success': False,
+                'message': 'Backup file is not available'
+            }), 404
         
-        from flask import Response
-        return Response(
-            "-- Mock backup file content\n-- This would be actual SQL dump\n",
-            mimetype='application/sql',
-            headers={'Content-Disposition': f'attachment; filename=backup_{backup_id}.sql'}
-        )
+        return send_file(record.file_path, as_attachment=True, download_name=record.file_name)
         
     except Exception as e:
         return jsonify({
@@ -459,15 +567,21 @@ def download_backup(backup_id):
 def delete_backup(backup_id):
     """Delete backup"""
     try:
-        # Mock backup deletion
-        # In real implementation, delete actual backup file
+        record = BackupRecord.query.get_or_404(backup_id)
+        remove_backup(record)
         
         return jsonify({
             'success': True,
             'message': 'Backup deleted successfully'
         })
         
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
             'message': f'Failed to delete backup: {str(e)}'
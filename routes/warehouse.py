@@ -1,9 +1,10 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from models import db, WarehouseZone, WarehouseLocation, Inventory, InventoryMovement, Product
+from models import db, WarehouseZone, WarehouseLocation, Inventory, InventoryMovement, Product, StockSummary
 from utils.i18n import success_response, error_response, get_message
-from sqlalchemy import or_, func
+from sqlalchemy import and_, or_, func, tuple_
 from sqlalchemy.orm import joinedload
+from services.stock_ledger import post_movements, post_movement_batch, MAX_BULK_MOVEMENTS
 from datetime import datetime
 
 warehouse_bp = Blueprint('warehouse', __name__)
@@ -115,64 +116,97 @@ def create_location():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def _parse_inventory_cursor(cursor):
+    """Decode a ``product_id:location_id:id`` keyset cursor"""
+    try:
+        product_id, location_id, inventory_id = (int(part) for part in cursor.split(':'))
+    except ValueError:
+        raise ValueError('Invalid cursor, expected product_id:location_id:id')
+    return product_id, location_id, inventory_id
+
 @warehouse_bp.route('/inventory', methods=['GET'])
 @jwt_required()
 def get_inventory():
-    """Get inventory"""
+    """Get inventory
+
+    Pages with ``page``/``per_page`` by default. Passing ``cursor`` (empty
+    for the first page, then the returned ``next_cursor``) switches to keyset
+    pagination on (product_id, location_id, id), which skips the OFFSET scan
+    and the total count on deep pages.
+    """
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
         product_id = request.args.get('product_id', type=int)
         location_id = request.args.get('location_id', type=int)
-        
-        # Use basic query without problematic columns
-        query = db.session.query(Inventory)
-        
+        cursor = request.args.get('cursor')
+        page, per_page = max(page, 1), max(per_page, 1)
+
+        # Only the serialized columns, products and locations joined in
+        query = db.session.query(
+            Inventory.id, Inventory.product_id, Inventory.location_id,
+            Inventory.quantity, Inventory.reserved_quantity, Inventory.available_quantity,
+            Inventory.batch_number, Inventory.expiry_date,
+            Product.code.label('product_code'), Product.name.label('product_name'),
+            WarehouseLocation.location_code
+        ).outerjoin(
+            Product, Inventory.product_id == Product.id
+        ).outerjoin(
+            WarehouseLocation, Inventory.location_id == WarehouseLocation.id
+        )
+
         # Add filters if provided
+        filters = []
         if product_id:
-            query = query.filter(Inventory.product_id == product_id)
-        
+            filters.append(Inventory.product_id == product_id)
         if location_id:
-            query = query.filter(Inventory.location_id == location_id)
-        
-        # Execute query with pagination
-        inventory = query.paginate(page=page, per_page=per_page, error_out=False)
-        
-        inventory_list = []
-        for i in inventory.items:
-            try:
-                # Get related data manually to avoid relationship issues
-                product = None
-                location = None
-                
-                if i.product_id:
-                    product = Product.query.get(i.product_id)
-                
-                if i.location_id:
-                    location = WarehouseLocation.query.get(i.location_id)
-                
-                inventory_list.append({
-                    'id': i.id,
-                    'product_code': product.code if product else 'N/A',
-                    'product_name': product.name if product else 'N/A',
-                    'location_code': location.location_code if location else 'N/A',
-                    'quantity': float(i.quantity) if i.quantity else 0,
-                    'reserved_quantity': float(i.reserved_quantity) if i.reserved_quantity else 0,
-                    'available_quantity': float(i.available_quantity) if i.available_quantity else 0,
-                    'batch_number': i.batch_number or '',
-                    'expiry_date': i.expiry_date.isoformat() if i.expiry_date else None
-                })
-            except Exception as e:
-                print(f"Error processing inventory item {i.id}: {str(e)}")
-                continue
-        
+            filters.append(Inventory.location_id == location_id)
+        query = query.filter(*filters).order_by(
+            Inventory.product_id, Inventory.location_id, Inventory.id
+        )
+
+        if cursor is not None:
+            if cursor:
+                query = query.filter(
+                    tuple_(Inventory.product_id, Inventory.location_id, Inventory.id) >
+                    tuple_(*_parse_inventory_cursor(cursor))
+                )
+            rows = query.limit(per_page + 1).all()
+            has_more = len(rows) > per_page
+            rows = rows[:per_page]
+        else:
+            total = db.session.query(func.count(Inventory.id)).filter(*filters).scalar() or 0
+            rows = query.offset((page - 1) * per_page).limit(per_page).all()
+
+        inventory_list = [{
+            'id': row.id,
+            'product_code': row.product_code or 'N/A',
+            'product_name': row.product_name or 'N/A',
+            'location_code': row.location_code or 'N/A',
+            'quantity': float(row.quantity) if row.quantity else 0,
+            'reserved_quantity': float(row.reserved_quantity) if row.reserved_quantity else 0,
+            'available_quantity': float(row.available_quantity) if row.available_quantity else 0,
+            'batch_number': row.batch_number or '',
+            'expiry_date': row.expiry_date.isoformat() if row.expiry_date else None
+        } for row in rows]
+
+        if cursor is not None:
+            last = rows[-1] if rows else None
+            return jsonify({
+                'inventory': inventory_list,
+                'next_cursor': f'{last.product_id}:{last.location_id}:{last.id}' if has_more else None,
+                'has_more': has_more
+            }), 200
+
         return jsonify({
             'inventory': inventory_list,
-            'total': inventory.total,
-            'pages': inventory.pages,
-            'current_page': inventory.page
+            'total': total,
+            'pages': (total + per_page - 1) // per_page,
+            'current_page': page
         }), 200
-            
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Inventory error: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -185,56 +219,53 @@ def create_movement():
         from flask_jwt_extended import get_jwt_identity
         data = request.get_json()
         user_id = get_jwt_identity()
-        
-        movement = InventoryMovement(
-            product_id=data['product_id'],
-            from_location_id=data.get('from_location_id'),
-            to_location_id=data.get('to_location_id'),
-            movement_type=data['movement_type'],
-            reference_type=data.get('reference_type'),
-            reference_id=data.get('reference_id'),
-            quantity=data['quantity'],
-            uom=data['uom'],
-            batch_number=data.get('batch_number'),
-            notes=data.get('notes'),
-            performed_by=user_id
+
+        # Recorded and applied atomically (see services/stock_ledger.py)
+        records, applied = post_movements([data], user_id)
+
+        return jsonify({
+            'message': 'Movement recorded',
+            'movement_id': records[0].id,
+            'inventory_updates': applied
+        }), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@warehouse_bp.route('/movements/bulk', methods=['POST'])
+@jwt_required()
+def create_movements_bulk():
+    """Record many inventory movements in one request
+
+    Body: ``{"movements": [...], "all_or_nothing": false}``. Rows are
+    validated together; valid rows are inserted and applied to stock in one
+    transaction and every row gets a result in input order.
+    """
+    try:
+        from flask_jwt_extended import get_jwt_identity
+        data = request.get_json() or {}
+        movements = data.get('movements')
+        user_id = get_jwt_identity()
+
+        if not isinstance(movements, list) or not movements:
+            return jsonify({'error': 'movements must be a non-empty list'}), 400
+        if len(movements) > MAX_BULK_MOVEMENTS:
+            return jsonify({'error': f'At most {MAX_BULK_MOVEMENTS} movements per request'}), 400
+
+        results, applied = post_movement_batch(
+            movements, user_id, all_or_nothing=bool(data.get('all_or_nothing'))
         )
-        
-        db.session.add(movement)
-        
-        # Update inventory based on movement type
-        if data['movement_type'] == 'receive' and data.get('to_location_id'):
-            inventory = Inventory.query.filter_by(
-                product_id=data['product_id'],
-                location_id=data['to_location_id']
-            ).first()
-            
-            if inventory:
-                inventory.quantity += data['quantity']
-                inventory.available_quantity += data['quantity']
-            else:
-                inventory = Inventory(
-                    product_id=data['product_id'],
-                    location_id=data['to_location_id'],
-                    quantity=data['quantity'],
-                    available_quantity=data['quantity'],
-                    batch_number=data.get('batch_number')
-                )
-                db.session.add(inventory)
-        
-        elif data['movement_type'] == 'issue' and data.get('from_location_id'):
-            inventory = Inventory.query.filter_by(
-                product_id=data['product_id'],
-                location_id=data['from_location_id']
-            ).first()
-            
-            if inventory:
-                inventory.quantity -= data['quantity']
-                inventory.available_quantity -= data['quantity']
-        
-        db.session.commit()
-        
-        return jsonify({'message': 'Movement recorded', 'movement_id': movement.id}), 201
+        posted = sum(1 for r in results if r['status'] == 'posted')
+
+        return jsonify({
+            'message': f'{posted} of {len(results)} movements recorded',
+            'posted': posted,
+            'rejected': len(results) - posted,
+            'results': results,
+            'inventory_updates': applied
+        }), 201 if posted else 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -248,10 +279,11 @@ def get_stock_summary():
             Product.id,
             Product.code,
             Product.name,
-            func.sum(Inventory.quantity).label('total_quantity'),
-            func.sum(Inventory.available_quantity).label('available_quantity'),
-            func.sum(Inventory.reserved_quantity).label('reserved_quantity')
-        ).join(Inventory).group_by(Product.id, Product.code, Product.name)
+            StockSummary.on_hand_quantity.label('total_quantity'),
+            StockSummary.available_quantity.label('available_quantity'),
+            StockSummary.reserved_quantity.label('reserved_quantity'),
+            StockSummary.stock_value.label('stock_value')
+        ).join(StockSummary, StockSummary.product_id == Product.id).order_by(Product.id)
         
         results = query.all()
         
@@ -262,7 +294,8 @@ def get_stock_summary():
                 'product_name': r.name,
                 'total_quantity': float(r.total_quantity or 0),
                 'available_quantity': float(r.available_quantity or 0),
-                'reserved_quantity': float(r.reserved_quantity or 0)
+                'reserved_quantity': float(r.reserved_quantity or 0),
+                'stock_value': float(r.stock_value or 0)
             } for r in results]
         }), 200
     except Exception as e:
@@ -399,58 +432,48 @@ def get_warehouse_alerts():
     try:
         status = request.args.get('status', 'active')
         
-        # Get low stock alerts
-        low_stock_items = db.session.query(
+        # Low and out of stock per product, straight from the stock summary
+        stock_items = db.session.query(
             Product.id,
             Product.code,
             Product.name,
-            Inventory.quantity,
-            Product.minimum_stock,
-            WarehouseLocation.code.label('location_code')
-        ).join(Inventory).join(WarehouseLocation).filter(
-            and_(
-                Inventory.quantity <= Product.minimum_stock,
-                Product.minimum_stock > 0
+            Product.min_stock_level,
+            StockSummary.available_quantity
+        ).join(StockSummary, StockSummary.product_id == Product.id).filter(
+            or_(
+                StockSummary.available_quantity <= 0,
+                and_(
+                    Product.min_stock_level > 0,
+                    StockSummary.available_quantity < Product.min_stock_level
+                )
             )
-        ).all()
-        
-        # Get out of stock alerts
-        out_of_stock_items = db.session.query(
-            Product.id,
-            Product.code,
-            Product.name,
-            WarehouseLocation.code.label('location_code')
-        ).join(Inventory).join(WarehouseLocation).filter(
-            Inventory.quantity <= 0
-        ).all()
+        ).order_by(StockSummary.available_quantity).all()
         
         alerts = []
         
-        # Add low stock alerts
-        for item in low_stock_items:
-            alerts.append({
-                'id': f"low_stock_{item.id}",
-                'type': 'low_stock',
-                'severity': 'medium',
-                'title': f"Low Stock: {item.code}",
-                'message': f"{item.name} is running low (Current: {item.quantity}, Min: {item.minimum_stock})",
-                'product_id': item.id,
-                'location_code': item.location_code,
-                'created_at': datetime.utcnow().isoformat()
-            })
-        
-        # Add out of stock alerts
-        for item in out_of_stock_items:
-            alerts.append({
-                'id': f"out_of_stock_{item.id}",
-                'type': 'out_of_stock',
-                'severity': 'high',
-                'title': f"Out of Stock: {item.code}",
-                'message': f"{item.name} is out of stock",
-                'product_id': item.id,
-                'location_code': item.location_code,
-                'created_at': datetime.utcnow().isoformat()
-            })
+        for item in stock_items:
+            if item.available_quantity <= 0:
+                alerts.append({
+                    'id': f"out_of_stock_{item.id}",
+                    'type': 'out_of_stock',
+                    'severity': 'high',
+                    'title': f"Out of Stock: {item.code}",
+                    'message': f"{item.name} is out of stock",
+                    'product_id': item.id,
+                    'location_code': None,
+                    'created_at': datetime.utcnow().isoformat()
+                })
+            else:
+                alerts.append({
+                    'id': f"low_stock_{item.id}",
+                    'type': 'low_stock',
+                    'severity': 'medium',
+                    'title': f"Low Stock: {item.code}",
+                    'message': f"{item.name} is running low (Current: {float(item.available_quantity)}, Min: {item.min_stock_level})",
+                    'product_id': item.id,
+                    'location_code': None,
+                    'created_at': datetime.utcnow().isoformat()
+                })
         
         return jsonify({'alerts': alerts}), 200
         
@@ -0,0 +1,105 @@
+"""
+Buffered audit log writer
+
+Request middleware hands audit records to ``audit_writer.record``, which
+only appends to an in-memory queue. A background thread drains the queue
+and inserts the records into AuditLog in batches (one executemany per
+batch), so a request never waits on an audit INSERT. When the queue is
+full, records are dropped and counted rather than blocking the request.
+"""
+
+import atexit
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+
+from models import db, AuditLog
+
+AUDIT_QUEUE_SIZE = 10000
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_SECONDS = 1.0
+
+
+class AuditWriter:
+    """Process-wide audit queue with a batching background writer"""
+
+    def __init__(self, queue_size=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                 flush_seconds=AUDIT_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._app = None
+
+    def start(self, app):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def record(self, values):
+        """Queue one AuditLog row (a column dict); never blocks"""
+        try:
+            self._queue.put_nowait(values)
+        except queue.Full:
+            self.dropped += 1
+
+    def _next_batch(self):
+        """Wait for the first record, then collect until the batch is full or the interval ends"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self._app.app_context():
+            try:
+                db.session.execute(insert(AuditLog), batch)
+                db.session.commit()
+                self.written += len(batch)
+            except Exception as e:
+                db.session.rollback()
+                self.dropped += len(batch)
+                print(f"Audit log: failed to write {len(batch)} records: {e}")
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while True:
+            self._write(self._next_batch())
+
+    def flush(self):
+        """Write everything still queued; used at shutdown and in scripts"""
+        if self._app is None:
+            return
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+
+    def stats(self):
+        return {'queued': self._queue.qsize(), 'written': self.written, 'dropped': self.dropped}
+
+
+audit_writer = AuditWriter()
@@ -0,0 +1,35 @@
+"""
+In-process background job runner
+
+Runs long tasks (report files, imports, backups) on a small thread pool
+inside an application context, so the request that started them can
+return immediately. Job state lives in each feature's own table; the
+runner only executes the callable and cleans up the scoped session.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from models import db
+
+BACKGROUND_WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix='background-job')
+
+
+def submit_job(fn, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` in the background with an app context"""
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                print(f"Background job {getattr(fn, '__name__', fn)} failed: {e}")
+                raise
+            finally:
+                db.session.remove()
+
+    return _executor.submit(run)
@@ -0,0 +1,576 @@
+"""
+Online SQLite backups
+
+Backups copy the live database with the SQLite online backup API, a few
+hundred pages per step, so writers are never blocked for the whole copy and
+the copy is always a consistent snapshot (unlike copying the file, which
+can catch a write half done). The snapshot is then streamed through gzip
+when the active BackupConfiguration asks for compression.
+
+An incremental backup stores only the 64 KiB blocks of the snapshot that
+differ from the latest full backup, using the block hashes saved next to
+every full backup, so restoring one takes the full backup plus one delta.
+
+Retention removes completed backups past ``retention_days`` and beyond
+``max_backup_count``, never removing a full backup that a kept incremental
+still needs.
+
+A restore rebuilds the backup image next to the database and checks it
+with ``PRAGMA integrity_check``. It then takes a safety backup of the
+current data, closes the gate to new requests and waits for in-flight
+ones to drain. Finally it copies the image into the live database with
+the backup API. That write is a single SQLite transaction, so other
+processes with the database open see either the old or the restored data.
+
+The gate only holds the requests of the process running the restore, so a
+restore needs the application to run as a single process. Every process
+holds a shared lock on ``<database>.processes`` from its first request and
+a restore takes it exclusively, so it is refused with RestoreConflict (409)
+while another process serves requests. It is also refused while imports,
+report files, backups, data syncs or webhook deliveries are queued or
+running in any process. Without fcntl (Windows) other processes cannot be
+detected, and running a single process is up to the deployment.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, insert, select
+
+from models import db, BackupRecord, BackupConfiguration, DocumentSequence, ImportJob, ReportJob, SyncJobExecution, WebhookDelivery
+from services.webhook_dispatcher import WEBHOOK_CLAIM_TIMEOUT_SECONDS
+from utils import generate_number
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP_SECONDS = 0.005
+MAX_BACKUP_RESTARTS = 3
+BLOCK_SIZE = 64 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+DRAIN_TIMEOUT_SECONDS = 30
+BACKUP_NUMBER_PREFIX = 'BKP'
+
+# Queued or running jobs older than this were left behind by a stopped process
+ACTIVE_JOB_HOURS = 24
+
+DEFAULT_BACKUP_SETTINGS = {
+    'retention_days': 30,
+    'max_backup_count': 10,
+    'compress_backup': True,
+    'compression_level': 6,
+    'backup_path': None
+}
+
+
+# ===============================
+# CONFIGURATION
+# ===============================
+
+def database_path():
+    """Filesystem path of the application database; raises ValueError for non-SQLite databases"""
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        raise ValueError('Online backups are only supported for file-based SQLite databases')
+    path = url.database
+    if not os.path.isabs(path):
+        # Flask-SQLAlchemy resolves relative SQLite paths against the instance folder
+        path = os.path.join(current_app.instance_path, path)
+    return path
+
+
+def backup_settings():
+    """Settings of the active BackupConfiguration, or the defaults"""
+    config = BackupConfiguration.query.filter_by(is_active=True).order_by(BackupConfiguration.id).first()
+    if config is None:
+        return dict(DEFAULT_BACKUP_SETTINGS)
+    return {
+        'retention_days': config.retention_days,
+        'max_backup_count': config.max_backup_count,
+        'compress_backup': config.compress_backup,
+        'compression_level': min(max(config.compression_level or 6, 1), 9),
+        'backup_path': config.backup_path
+    }
+
+
+def backup_folder(settings):
+    folder = settings.get('backup_path') or current_app.config.get('BACKUP_FOLDER', 'backups')
+    folder = os.path.abspath(folder)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+# ===============================
+# FILE HELPERS
+# ===============================
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def snapshot_database(source_path, target_path):
+    """Consistent copy of a live SQLite database via the online backup API
+
+    The copy runs ``BACKUP_PAGES_PER_STEP`` pages at a time, releasing the
+    database between steps. A write from another connection restarts it,
+    so when writes keep interrupting, the copy falls back to one step
+    under a single read lock.
+    """
+    source = sqlite3.connect(source_path, timeout=DRAIN_TIMEOUT_SECONDS)
+    target = sqlite3.connect(target_path)
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > MAX_BACKUP_RESTARTS:
+                raise _BackupRestarted()
+        state['remaining'] = remaining
+
+    try:
+        with target:
+            try:
+                source.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=progress,
+                              sleep=BACKUP_STEP_SLEEP_SECONDS)
+            except _BackupRestarted:
+                source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def _open_output(path, compress, level):
+    return gzip.open(path, 'wb', compresslevel=level) if compress else open(path, 'wb')
+
+
+def _open_input(path):
+    with open(path, 'rb') as handle:
+        compressed = handle.read(2) == b'\x1f\x8b'
+    return gzip.open(path, 'rb') if compressed else open(path, 'rb')
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def block_hashes(path):
+    with open(path, 'rb') as handle:
+        return [hashlib.sha1(block).hexdigest() for block in iter(lambda: handle.read(BLOCK_SIZE), b'')]
+
+
+def _manifest_path(record):
+    return record.file_path + '.blocks.json'
+
+
+def _remove_files(record):
+    for path in (record.file_path, _manifest_path(record)):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+def write_full(snapshot_path, output_path, settings):
+    with open(snapshot_path, 'rb') as source, \
+            _open_output(output_path, settings['compress_backup'], settings['compression_level']) as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+    with open(output_path + '.blocks.json', 'w') as handle:
+        json.dump({'block_size': BLOCK_SIZE, 'hashes': block_hashes(snapshot_path)}, handle)
+
+
+def write_incremental(snapshot_path, output_path, base, settings):
+    """Write the blocks of ``snapshot_path`` that differ from full backup ``base``"""
+    with open(_manifest_path(base)) as handle:
+        base_hashes = json.load(handle)['hashes']
+    hashes = block_hashes(snapshot_path)
+    changed = [index for index, digest in enumerate(hashes)
+               if index >= len(base_hashes) or base_hashes[index] != digest]
+
+    header = {
+        'base_backup_id': base.id,
+        'block_size': BLOCK_SIZE,
+        'file_size': os.path.getsize(snapshot_path),
+        'blocks': changed
+    }
+    with open(snapshot_path, 'rb') as source, \
+            _open_output(output_path, settings['compress_backup'], settings['compression_level']) as target:
+        target.write(json.dumps(header).encode() + b'\n')
+        for index in changed:
+            source.seek(index * BLOCK_SIZE)
+            target.write(source.read(BLOCK_SIZE))
+    return len(changed), len(hashes)
+
+
+def materialize_backup(record, target_path):
+    """Rebuild the database image of ``record`` at ``target_path``"""
+    if record.backup_type != 'incremental':
+        with _open_input(record.file_path) as source, open(target_path, 'wb') as target:
+            shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+        return
+
+    base = db.session.get(BackupRecord, record.base_backup_id)
+    if base is None or not os.path.exists(base.file_path):
+        raise ValueError('The full backup this incremental backup is based on is missing')
+    materialize_backup(base, target_path)
+    with _open_input(record.file_path) as source, open(target_path, 'r+b') as target:
+        header = json.loads(source.readline())
+        for index in header['blocks']:
+            target.seek(index * header['block_size'])
+            target.write(source.read(header['block_size']))
+        target.truncate(header['file_size'])
+
+
+def verify_database(path):
+    connection = sqlite3.connect(path)
+    try:
+        result = connection.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        connection.close()
+    if result != 'ok':
+        raise ValueError(f'Backup failed the integrity check: {result}')
+
+
+# ===============================
+# BACKUPS
+# ===============================
+
+def latest_full_backup():
+    return BackupRecord.query.filter_by(backup_type='full', status='completed').order_by(
+        BackupRecord.backup_date.desc(), BackupRecord.id.desc()
+    ).first()
+
+
+def create_backup_record(backup_type='full', user_id=None, notes=None, is_scheduled=False):
+    """Queue a backup; run it with ``run_backup(record.id)``"""
+    if backup_type not in ('full', 'incremental'):
+        raise ValueError('backup_type must be full or incremental')
+    database_path()
+
+    base = None
+    if backup_type == 'incremental':
+        base = latest_full_backup()
+        if base is None or not os.path.exists(_manifest_path(base)):
+            # Nothing to diff against yet
+            backup_type = 'full'
+            base = None
+
+    settings = backup_settings()
+    extension = 'db.gz' if settings['compress_backup'] else 'db'
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    file_name = f'backup_{timestamp}_{backup_type}.{extension}'
+    record = BackupRecord(
+        backup_number=generate_number(BACKUP_NUMBER_PREFIX, BackupRecord, 'backup_number'),
+        backup_type=backup_type,
+        file_name=file_name,
+        file_path=os.path.join(backup_folder(settings), file_name),
+        compression_type='gzip' if settings['compress_backup'] else None,
+        base_backup_id=base.id if base else None,
+        status='in_progress',
+        is_scheduled=is_scheduled,
+        retention_days=settings['retention_days'],
+        created_by=user_id,
+        notes=notes
+    )
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def run_backup(record_id):
+    """Snapshot, compress and record a queued backup, then prune old ones"""
+    record = db.session.get(BackupRecord, record_id)
+    settings = backup_settings()
+    snapshot_path = record.file_path + '.snapshot'
+    started = time.perf_counter()
+    try:
+        snapshot_database(database_path(), snapshot_path)
+        if record.backup_type == 'incremental':
+            base = db.session.get(BackupRecord, record.base_backup_id)
+            changed, total = write_incremental(snapshot_path, record.file_path, base, settings)
+            record.notes = ((record.notes + '; ') if record.notes else '') + \
+                f'{changed} of {total} blocks changed since {base.backup_number}'
+        else:
+            write_full(snapshot_path, record.file_path, settings)
+
+        record.file_size_mb = round(os.path.getsize(record.file_path) / (1024 * 1024), 2)
+        record.checksum = file_checksum(record.file_path)
+        record.expiry_date = datetime.utcnow() + timedelta(days=record.retention_days or 30)
+        record.status = 'completed'
+    except Exception as e:
+        db.session.rollback()
+        record = db.session.get(BackupRecord, record_id)
+        _remove_files(record)
+        record.status = 'failed'
+        record.error_message = str(e)
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+    record.duration_seconds = int(round(time.perf_counter() - started))
+    db.session.commit()
+
+    if record.status == 'completed':
+        prune_backups(settings)
+    return record
+
+
+def prune_backups(settings=None):
+    """Delete expired backups and those beyond ``max_backup_count``; returns how many"""
+    settings = settings or backup_settings()
+    now = datetime.utcnow()
+    records = BackupRecord.query.filter_by(status='completed').order_by(
+        BackupRecord.backup_date.desc(), BackupRecord.id.desc()
+    ).all()
+
+    keep = [
+        record for index, record in enumerate(records)
+        if index < settings['max_backup_count']
+        and (record.expiry_date is None or record.expiry_date > now)
+    ]
+    # Keep the full backups that kept incrementals are based on
+    needed = {record.base_backup_id for record in keep if record.base_backup_id}
+    keep_ids = {record.id for record in keep} | needed
+
+    removed = 0
+    for record in records:
+        if record.id in keep_ids:
+            continue
+        _remove_files(record)
+        db.session.delete(record)
+        removed += 1
+    if removed:
+        db.session.commit()
+    return removed
+
+
+def delete_backup(record):
+    if BackupRecord.query.filter_by(base_backup_id=record.id, status='completed').count():
+        raise ValueError('Incremental backups depend on this backup; delete them first')
+    _remove_files(record)
+    db.session.delete(record)
+    db.session.commit()
+
+
+# ===============================
+# RESTORE
+# ===============================
+
+class RequestGate:
+    """Counts in-flight requests and can hold new ones while the database is swapped"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._active = 0
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def enter(self):
+        """Admit a request; False while the gate is closed"""
+        with self._condition:
+            if self._closed:
+                return False
+            self._active += 1
+            return True
+
+    def leave(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def close_and_drain(self, timeout, own_requests=1):
+        """Close the gate and wait until only ``own_requests`` requests remain"""
+        with self._condition:
+            if self._closed:
+                raise ValueError('A restore is already in progress')
+            self._closed = True
+            if not self._condition.wait_for(lambda: self._active <= own_requests, timeout):
+                self._closed = False
+                raise ValueError('Timed out waiting for in-flight requests to finish')
+
+    def open(self):
+        with self._condition:
+            self._closed = False
+
+
+request_gate = RequestGate()
+
+
+class RestoreConflict(Exception):
+    """Another process or a running job would see the database swapped under it"""
+
+
+class ProcessLock:
+    """Shared lock every serving process holds on ``<database>.processes``"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handle = None
+        self._registered = False
+
+    def register(self):
+        """Take the shared lock once per process; waits while another process restores"""
+        if self._registered:
+            return
+        with self._lock:
+            if self._registered:
+                return
+            self._registered = True
+            try:
+                path = database_path()
+            except ValueError:
+                return
+            if fcntl is not None:
+                handle = open(path + '.processes', 'a')
+                fcntl.flock(handle, fcntl.LOCK_SH)
+                self._handle = handle
+
+    def acquire_exclusive(self):
+        """Upgrade to an exclusive lock; RestoreConflict while other processes hold theirs"""
+        self.register()
+        if self._handle is None:
+            return
+        try:
+            fcntl.flock(self._handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            fcntl.flock(self._handle, fcntl.LOCK_SH)
+            raise RestoreConflict('Other application processes are running; a restore needs a single process')
+
+    def release_exclusive(self):
+        if self._handle is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_SH)
+
+
+process_lock = ProcessLock()
+
+
+def active_jobs(now=None):
+    """Counts of the jobs queued or running in any process, by kind"""
+    now = now or datetime.utcnow()
+    since = now - timedelta(hours=ACTIVE_JOB_HOURS)
+    counts = {
+        'imports': ImportJob.query.filter(
+            ImportJob.status.in_(['queued', 'running']), ImportJob.created_at >= since
+        ).count(),
+        'report files': ReportJob.query.filter(
+            ReportJob.status.in_(['queued', 'running']), ReportJob.created_at >= since
+        ).count(),
+        'backups': BackupRecord.query.filter(
+            BackupRecord.status == 'in_progress', BackupRecord.created_at >= since
+        ).count(),
+        'data syncs': SyncJobExecution.query.filter(
+            SyncJobExecution.status == 'in_progress', SyncJobExecution.started_at >= since
+        ).count(),
+        'webhook deliveries': WebhookDelivery.query.filter(
+            WebhookDelivery.status == 'delivering',
+            WebhookDelivery.claimed_at >= now - timedelta(seconds=WEBHOOK_CLAIM_TIMEOUT_SECONDS)
+        ).count()
+    }
+    return {kind: count for kind, count in counts.items() if count}
+
+
+def _refuse_while_busy():
+    busy = active_jobs()
+    if busy:
+        running = ', '.join(f'{count} {kind}' for kind, count in busy.items())
+        raise RestoreConflict(f'Jobs are still running ({running}); retry the restore when they have finished')
+
+
+def restore_backup(record, user_id=None):
+    """Replace the live database contents with ``record``; returns the safety backup
+
+    Raises RestoreConflict while other processes serve requests or jobs are
+    running.
+    """
+    if record.status != 'completed' or not os.path.exists(record.file_path):
+        raise ValueError('Backup file is not available')
+    if record.checksum and file_checksum(record.file_path) != record.checksum:
+        raise ValueError('Backup file checksum does not match')
+
+    live_path = database_path()
+    image_path = live_path + '.restore'
+    process_lock.acquire_exclusive()
+    try:
+        _refuse_while_busy()
+        materialize_backup(record, image_path)
+        verify_database(image_path)
+
+        safety = create_backup_record('full', user_id, notes=f'Automatic backup before restoring {record.backup_number}')
+        safety = run_backup(safety.id)
+        if safety.status != 'completed':
+            raise ValueError(f'Could not back up the current database: {safety.error_message}')
+        safety_id = safety.id
+
+        # The backup catalog describes files on disk, not data; it survives the restore,
+        # together with the counters numbering it
+        catalog = [dict(row._mapping) for row in db.session.execute(select(BackupRecord.__table__))]
+        sequences = DocumentSequence.__table__
+        numbering = [
+            {column: value for column, value in row._mapping.items() if column != 'id'}
+            for row in db.session.execute(select(sequences).where(sequences.c.prefix == BACKUP_NUMBER_PREFIX))
+        ]
+
+        # The calling request holds the only remaining gate slot
+        request_gate.close_and_drain(DRAIN_TIMEOUT_SECONDS)
+        try:
+            # Requests that drained may have started jobs
+            _refuse_while_busy()
+            db.session.remove()
+            db.engine.dispose()
+            source = sqlite3.connect(image_path)
+            target = sqlite3.connect(live_path, timeout=DRAIN_TIMEOUT_SECONDS)
+            try:
+                with target:
+                    source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            db.engine.dispose()
+
+            db.session.execute(delete(BackupRecord))
+            db.session.execute(insert(BackupRecord), catalog)
+            db.session.execute(delete(sequences).where(sequences.c.prefix == BACKUP_NUMBER_PREFIX))
+            if numbering:
+                db.session.execute(insert(sequences), numbering)
+            db.session.commit()
+        finally:
+            request_gate.open()
+    finally:
+        process_lock.release_exclusive()
+        if os.path.exists(image_path):
+            os.remove(image_path)
+
+    return db.session.get(BackupRecord, safety_id)
+
+
+def serialize_backup(record):
+    return {
+        'id': record.id,
+        'backup_number': record.backup_number,
+        'backup_type': record.backup_type,
+        'backup_date': record.backup_date.isoformat() if record.backup_date else None,
+        'file_name': record.file_name,
+        'file_size_mb': float(record.file_size_mb) if record.file_size_mb else 0,
+        'compression_type': record.compression_type,
+        'base_backup_id': record.base_backup_id,
+        'status': record.status,
+        'checksum': record.checksum,
+        'duration_seconds': record.duration_seconds,
+        'expiry_date': record.expiry_date.isoformat() if record.expiry_date else None,
+        'error_message': record.error_message,
+        'notes': record.notes
+    }
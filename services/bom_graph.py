@@ -0,0 +1,343 @@
+"""
+Cached, versioned BOM graph
+
+BOMs change a few times a week but are read by MRP, what-if simulation, WIP
+material costing and the BOM screens thousands of times a day. This module
+keeps one in-process snapshot of every BOM structure, with per-unit
+coefficients (scrap already applied) and lazily flattened multi-level
+material coefficients per product.
+
+The snapshot is dropped whenever a BillOfMaterials or BOMItem row is
+inserted, updated or deleted through the ORM, and again when the
+transaction that changed it commits or rolls back.
+"""
+
+import threading
+from collections import defaultdict, deque
+
+from sqlalchemy import event
+from sqlalchemy.orm import aliased, object_session
+
+from models import db, Material, Product, BillOfMaterials, BOMItem, Supplier
+
+
+class BOMSnapshot:
+    """Immutable view of all BOM structures at one graph version"""
+
+    def __init__(self, version, headers, items):
+        self.version = version
+        # bom_id -> header, for every BOM regardless of status
+        self.headers = headers
+        # bom_id -> ordered component list
+        self.items = items
+        # product_id -> header of the BOM MRP explodes for that product
+        self.boms = {}
+        for bom_id in sorted(headers):
+            header = headers[bom_id]
+            if header['is_active']:
+                # Same choice as filter_by(product_id=..., is_active=True).first()
+                self.boms.setdefault(header['product_id'], header)
+        self.levels = compute_low_level_codes(self.boms, self.items)
+        # material_id -> active BOMs that consume it directly
+        self.where_used = defaultdict(list)
+        for bom_id in sorted(headers):
+            header = headers[bom_id]
+            if not header['is_active']:
+                continue
+            used = set()
+            for component in items.get(bom_id, []):
+                if component['is_material'] and component['material_id'] not in used:
+                    used.add(component['material_id'])
+                    self.where_used[component['material_id']].append(header)
+        self._flattened = {}
+        self._descendants = {}
+        self._lock = threading.Lock()
+
+    def components(self, product_id):
+        """Direct components of the active BOM for ``product_id``"""
+        bom = self.boms.get(product_id)
+        return self.items.get(bom['id'], []) if bom else []
+
+    def material_coefficients(self, product_id):
+        """Per-unit quantity of every leaf material needed for ``product_id``
+
+        Sub-assemblies that have their own active BOM are expanded through all
+        levels, so the result maps material_id to the total quantity (scrap
+        included) consumed by one unit of the product.
+        """
+        flattened = self._flattened.get(product_id)
+        if flattened is not None:
+            return flattened
+
+        flattened = defaultdict(float)
+        for component in self.components(product_id):
+            sub_assembly_id = component['component_product_id']
+            if sub_assembly_id in self.boms:
+                for material_id, coefficient in self.material_coefficients(sub_assembly_id).items():
+                    flattened[material_id] += component['coefficient'] * coefficient
+            else:
+                flattened[component['material_id']] += component['coefficient']
+
+        flattened = dict(flattened)
+        with self._lock:
+            self._flattened[product_id] = flattened
+        return flattened
+
+    def descendants(self, product_id):
+        """Requirement keys of every component below ``product_id`` at any level"""
+        found = self._descendants.get(product_id)
+        if found is not None:
+            return found
+
+        found = set()
+        for component in self.components(product_id):
+            found.add(component['material_id'])
+            sub_assembly_id = component['component_product_id']
+            if sub_assembly_id in self.boms:
+                found |= self.descendants(sub_assembly_id)
+
+        found = frozenset(found)
+        with self._lock:
+            self._descendants[product_id] = found
+        return found
+
+    def unit_material_cost(self, product_id):
+        """Material cost of one unit of ``product_id`` through every BOM level"""
+        cost = 0.0
+        for component in self.components(product_id):
+            sub_assembly_id = component['component_product_id']
+            if sub_assembly_id in self.boms:
+                cost += component['coefficient'] * self.unit_material_cost(sub_assembly_id)
+            else:
+                cost += component['coefficient'] * component['unit_cost']
+        return cost
+
+
+class BOMGraph:
+    """Process-wide holder of the current BOM snapshot"""
+
+    def __init__(self):
+        self._version = 0
+        self._snapshot = None
+        self._state_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def snapshot(self):
+        """Return the current snapshot, loading it once if it was invalidated"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        # Single-flight: concurrent readers wait for one loader
+        with self._load_lock:
+            if self._snapshot is not None:
+                return self._snapshot
+
+            version = self._version
+            headers, items = load_bom_structure()
+            snapshot = BOMSnapshot(version, headers, items)
+
+            with self._state_lock:
+                # Don't publish a snapshot that was invalidated while loading
+                if version == self._version:
+                    self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self):
+        with self._state_lock:
+            self._version += 1
+            self._snapshot = None
+
+
+bom_graph = BOMGraph()
+
+
+# ===============================
+# LOADING
+# ===============================
+
+def load_bom_structure():
+    """Load every BOM header and BOM item in two queries
+
+    Returns ``(headers, items)`` where ``headers`` maps bom_id to the BOM
+    header and ``items`` maps bom_id to its components, each carrying the
+    per-unit coefficient (quantity including scrap).
+    """
+    headers = {}
+    rows = db.session.query(
+        BillOfMaterials.id, BillOfMaterials.bom_number, BillOfMaterials.product_id,
+        BillOfMaterials.is_active, BillOfMaterials.batch_size, BillOfMaterials.batch_uom,
+        Product.code, Product.name, Product.lead_time_days
+    ).join(Product, BillOfMaterials.product_id == Product.id)
+
+    for (bom_id, bom_number, product_id, is_active, batch_size, batch_uom,
+         product_code, product_name, production_lead_time) in rows:
+        headers[bom_id] = {
+            'id': bom_id,
+            'bom_number': bom_number,
+            'product_id': product_id,
+            'product_code': product_code,
+            'product_name': product_name,
+            'is_active': is_active,
+            'batch_size': float(batch_size or 0),
+            'batch_uom': batch_uom,
+            # Production lead time of the parent product
+            'lead_time_days': production_lead_time or 0
+        }
+
+    component_product = aliased(Product)
+    rows = db.session.query(
+        BOMItem.id, BOMItem.bom_id, BOMItem.line_number,
+        BOMItem.material_id, BOMItem.product_id,
+        BOMItem.quantity, BOMItem.scrap_percent, BOMItem.uom,
+        BOMItem.is_critical, BOMItem.unit_cost, BOMItem.lead_time_days,
+        BOMItem.supplier_id, Supplier.company_name, Supplier.lead_time_days,
+        Material.code, Material.name, Material.material_type, Material.cost_per_unit,
+        Material.lead_time_days,
+        component_product.code, component_product.name,
+        component_product.material_type, component_product.cost,
+        component_product.lead_time_days
+    ).outerjoin(
+        Material, BOMItem.material_id == Material.id
+    ).outerjoin(
+        component_product, BOMItem.product_id == component_product.id
+    ).outerjoin(
+        Supplier, BOMItem.supplier_id == Supplier.id
+    ).order_by(BOMItem.bom_id, BOMItem.line_number)
+
+    items = defaultdict(list)
+    for (item_id, bom_id, line_number, material_id, product_id,
+         quantity, scrap_percent, uom, is_critical, unit_cost, lead_time_days,
+         supplier_id, supplier_name, supplier_lead_time,
+         material_code, material_name, material_type, material_cost, material_lead_time,
+         product_code, product_name, product_type, product_cost, product_lead_time) in rows:
+        quantity = float(quantity or 0)
+        scrap_percent = float(scrap_percent or 0)
+
+        # Same precedence as BOMItem.total_cost
+        if unit_cost:
+            resolved_cost = float(unit_cost)
+        elif material_id and material_cost:
+            resolved_cost = float(material_cost)
+        elif product_id and product_cost:
+            resolved_cost = float(product_cost)
+        else:
+            resolved_cost = 0.0
+
+        items[bom_id].append({
+            'item_id': item_id,
+            'line_number': line_number,
+            'material_id': material_id or product_id,
+            # Only product lines can be sub-assemblies with their own BOM
+            'component_product_id': product_id if not material_id else None,
+            'code': material_code if material_id else product_code,
+            'name': material_name if material_id else product_name,
+            'item_type': material_type if material_id else product_type,
+            'is_material': bool(material_id),
+            'uom': uom,
+            'quantity': quantity,
+            'scrap_percent': scrap_percent,
+            'coefficient': quantity * (1 + scrap_percent / 100),
+            'is_critical': bool(is_critical),
+            'unit_cost': resolved_cost,
+            'has_unit_cost': bool(unit_cost),
+            'lead_time_days': lead_time_days or 0,
+            # BOM line lead time, else the supplier's, else the item master's
+            'effective_lead_time_days': (
+                lead_time_days or supplier_lead_time
+                or (material_lead_time if material_id else product_lead_time) or 0
+            ),
+            'supplier_id': supplier_id,
+            'supplier_name': supplier_name
+        })
+
+    return headers, dict(items)
+
+
+def compute_low_level_codes(boms, items):
+    """Return the low-level code of every product that has an active BOM
+
+    The low-level code is the deepest level at which a product appears in any
+    product structure, so exploding in ascending code order guarantees all
+    dependent demand for a sub-assembly is known before it is netted.
+    """
+    children = {}
+    for product_id, bom in boms.items():
+        children[product_id] = {
+            component['component_product_id']
+            for component in items.get(bom['id'], [])
+            if component['component_product_id'] in boms
+        }
+
+    indegree = {product_id: 0 for product_id in children}
+    for components in children.values():
+        for component_id in components:
+            indegree[component_id] += 1
+
+    levels = {product_id: 0 for product_id in children}
+    queue = deque(product_id for product_id, degree in indegree.items() if degree == 0)
+    visited = 0
+
+    while queue:
+        product_id = queue.popleft()
+        visited += 1
+        for component_id in children[product_id]:
+            levels[component_id] = max(levels[component_id], levels[product_id] + 1)
+            indegree[component_id] -= 1
+            if indegree[component_id] == 0:
+                queue.append(component_id)
+
+    if visited < len(children):
+        cyclic = sorted(product_id for product_id, degree in indegree.items() if degree > 0)
+        raise ValueError(f'Circular BOM structure detected for products: {cyclic}')
+
+    return levels
+
+
+# ===============================
+# INVALIDATION
+# ===============================
+
+BOM_MODELS = (BillOfMaterials, BOMItem)
+
+
+def _bom_row_changed(mapper, connection, target):
+    """Drop the snapshot as soon as a BOM row is flushed"""
+    bom_graph.invalidate()
+    session = object_session(target)
+    if session is not None:
+        session.info['bom_graph_dirty'] = True
+
+
+for _model in BOM_MODELS:
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _bom_row_changed)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _bom_transaction_committed(session):
+    """Drop again on commit so no reader keeps a snapshot of pre-commit rows"""
+    if session.info.pop('bom_graph_dirty', False):
+        bom_graph.invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _bom_transaction_rolled_back(session):
+    """Drop a snapshot that may have been rebuilt from the rolled-back rows"""
+    if session.info.pop('bom_graph_dirty', False):
+        bom_graph.invalidate()
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _bom_bulk_statement(orm_execute_state):
+    """Bulk insert()/update()/delete() statements bypass the mapper events"""
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in BOM_MODELS:
+        bom_graph.invalidate()
+        orm_execute_state.session.info['bom_graph_dirty'] = True
@@ -0,0 +1,487 @@
+"""
+Bulk data import
+
+Imports products, materials and inventory from CSV or Excel files as a
+background job (ImportJob). Files are read in chunks of IMPORT_CHUNK_SIZE
+rows: CSVs through pandas' chunked reader and xlsx sheets row by row in
+read-only mode, so a large supplier catalogue is never loaded whole.
+
+Each chunk is validated and coerced column by column, existing records
+are found with one IN query per chunk, and the chunk is written with
+bulk INSERT / UPDATE statements and committed on its own, which keeps
+the job's progress visible while it runs. Rows that fail validation are
+skipped and collected into a CSV error report with their row number.
+"""
+
+import csv
+import os
+from datetime import datetime
+from itertools import islice
+
+import pandas as pd
+from flask import current_app
+from sqlalchemy import func, insert, select, update
+
+from models import db, Product, ProductCategory, Material, Supplier, Inventory, WarehouseLocation, ImportJob
+from services.stock_summary import refresh_stock_summaries, revalue_stock_summaries
+
+IMPORT_TYPES = ('products', 'materials', 'inventory')
+IMPORT_MODES = ('skip', 'upsert')
+IMPORT_CHUNK_SIZE = 5000
+IN_CLAUSE_CHUNK = 500
+MAX_STORED_ERRORS = 100  # on the job row; the error report has all of them
+
+REQUIRED_COLUMNS = {
+    'products': ['product_code', 'product_name', 'category', 'material_type'],
+    'materials': ['material_code', 'material_name', 'type', 'unit'],
+    'inventory': ['product_code', 'location_code', 'quantity']
+}
+
+
+# ===============================
+# FILE READING
+# ===============================
+
+def _xlsx_chunks(file_path, chunk_size):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name).strip() if name is not None else '' for name in header]
+        while True:
+            batch = list(islice(rows, chunk_size))
+            if not batch:
+                break
+            yield pd.DataFrame(batch, columns=columns).astype(object).where(lambda f: f.notna(), '').astype(str)
+    finally:
+        workbook.close()
+
+
+def read_chunks(file_path, chunk_size=IMPORT_CHUNK_SIZE):
+    """Yield the file as DataFrames of at most ``chunk_size`` text columns"""
+    if file_path.lower().endswith('.csv'):
+        reader = pd.read_csv(file_path, chunksize=chunk_size, dtype=str, keep_default_na=False, skipinitialspace=True)
+        for frame in reader:
+            frame.columns = [str(name).strip() for name in frame.columns]
+            yield frame
+    elif file_path.lower().endswith('.xlsx'):
+        yield from _xlsx_chunks(file_path, chunk_size)
+    else:
+        # Legacy .xls has no streaming reader
+        frame = pd.read_excel(file_path, dtype=str).fillna('')
+        frame.columns = [str(name).strip() for name in frame.columns]
+        for offset in range(0, len(frame), chunk_size):
+            yield frame.iloc[offset:offset + chunk_size]
+
+
+def count_rows(file_path):
+    """Data rows in the file, for progress reporting (None when unknown)"""
+    if file_path.lower().endswith('.csv'):
+        with open(file_path, 'rb') as handle:
+            lines = sum(1 for _ in handle)
+        return max(lines - 1, 0)
+    if file_path.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            return max((workbook.active.max_row or 1) - 1, 0)
+        finally:
+            workbook.close()
+    return None
+
+
+# ===============================
+# COLUMN VALIDATION
+# ===============================
+
+class ChunkValidator:
+    """Column-wise coercion of one chunk, remembering the first problem of every row"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.problems = pd.Series('', index=frame.index, dtype=object)
+
+    def flag(self, mask, message):
+        """Record ``message`` (a string or a per-row Series) for rows in ``mask`` without an earlier problem"""
+        self.problems = self.problems.mask(mask & (self.problems == ''), message)
+
+    def text(self, column, default='', required=False):
+        if column not in self.frame.columns:
+            return pd.Series(default, index=self.frame.index, dtype=object)
+        values = self.frame[column].astype(str).str.strip()
+        if required:
+            self.flag(values == '', f'{column} is required')
+        return values.mask(values == '', default)
+
+    def number(self, column, default=None, required=False, minimum=0):
+        if column not in self.frame.columns:
+            return pd.Series(default, index=self.frame.index, dtype=object)
+        raw = self.frame[column].astype(str).str.strip().str.replace(',', '', regex=False)
+        values = pd.to_numeric(raw, errors='coerce')
+        blank = raw == ''
+        if required:
+            self.flag(blank, f'{column} is required')
+        self.flag(~blank & values.isna(), f'{column} is not a number')
+        if minimum is not None:
+            self.flag(values < minimum, f'{column} must not be less than {minimum}')
+        return values.astype(object).where(values.notna(), default)
+
+    def date(self, column):
+        if column not in self.frame.columns:
+            return pd.Series(None, index=self.frame.index, dtype=object)
+        raw = self.frame[column].astype(str).str.strip()
+        values = pd.to_datetime(raw, errors='coerce')
+        self.flag((raw != '') & values.isna(), f'{column} is not a date')
+        return pd.Series(
+            [value.date() if not pd.isna(value) else None for value in values], index=self.frame.index, dtype=object
+        )
+
+    def lookup(self, column, values, mapping):
+        """Map ``values`` through ``mapping``, flagging values that are missing from it"""
+        ids = pd.Series([mapping.get(value) for value in values], index=values.index, dtype=object)
+        self.flag((values != '') & ids.isna(), column + ' not found: ' + values.astype(str))
+        return ids
+
+    @property
+    def valid(self):
+        return self.problems == ''
+
+
+def _in_chunks(values):
+    values = list(values)
+    for offset in range(0, len(values), IN_CLAUSE_CHUNK):
+        yield values[offset:offset + IN_CLAUSE_CHUNK]
+
+
+def _id_map(key_column, id_column, keys):
+    """{key: id} for ``keys``, with one IN query per IN_CLAUSE_CHUNK keys"""
+    mapping = {}
+    for chunk in _in_chunks(set(keys) - {''}):
+        mapping.update(db.session.execute(select(key_column, id_column).where(key_column.in_(chunk))).all())
+    return mapping
+
+
+def _records(columns, mask):
+    """Row dicts of the ``mask`` rows of the coerced ``columns``, without their blank values
+
+    Leaving blanks out lets column defaults apply to new records and keeps
+    the current value of existing ones on upsert.
+    """
+    frame = pd.DataFrame(columns)[mask]
+    return [
+        {name: value for name, value in row.items() if value is not None and not pd.isna(value)}
+        for row in frame.to_dict('records')
+    ]
+
+
+# ===============================
+# IMPORT TYPES
+# ===============================
+
+def _prepare_products(check):
+    categories = check.text('category', required=True)
+    category_ids = {}
+    for chunk in _in_chunks(set(categories) - {''}):
+        for category_id, code, name in db.session.execute(
+            select(ProductCategory.id, ProductCategory.code, ProductCategory.name).where(
+                ProductCategory.code.in_(chunk) | ProductCategory.name.in_(chunk)
+            )
+        ):
+            category_ids.setdefault(code, category_id)
+            category_ids.setdefault(name, category_id)
+
+    return {
+        'code': check.text('product_code', required=True),
+        'name': check.text('product_name', required=True),
+        'category_id': check.lookup('category', categories, category_ids),
+        'material_type': check.text('material_type', required=True),
+        'primary_uom': check.text('unit', default=None),
+        'price': check.number('unit_price'),
+        'cost': check.number('cost_price'),
+        'description': check.text('description', default=None)
+    }
+
+
+def _prepare_materials(check):
+    material_type = check.text('type', required=True)
+    suppliers = check.text('supplier')
+    supplier_ids = _id_map(Supplier.company_name, Supplier.id, suppliers)
+    supplier_ids.update(_id_map(Supplier.code, Supplier.id, set(suppliers) - set(supplier_ids)))
+
+    return {
+        'code': check.text('material_code', required=True),
+        'name': check.text('material_name', required=True),
+        'material_type': material_type,
+        'category': check.text('category', default=None),
+        'primary_uom': check.text('unit', required=True),
+        'supplier_id': check.lookup('supplier', suppliers, supplier_ids),
+        'cost_per_unit': check.number('unit_cost'),
+        'min_stock_level': check.number('minimum_stock'),
+        'description': check.text('description', default=None)
+    }
+
+
+def _prepare_inventory(check):
+    product_codes = check.text('product_code', required=True)
+    location_codes = check.text('location_code', required=True)
+    return {
+        'product_id': check.lookup('product_code', product_codes, _id_map(Product.code, Product.id, product_codes)),
+        'location_id': check.lookup(
+            'location_code', location_codes,
+            _id_map(WarehouseLocation.location_code, WarehouseLocation.id, location_codes)
+        ),
+        'quantity': check.number('quantity', required=True),
+        'batch_number': check.text('batch_number'),  # '' rather than NULL, so the unique key holds
+        'lot_number': check.text('lot_number', default=None),
+        'production_date': check.date('production_date'),
+        'expiry_date': check.date('expiry_date')
+    }
+
+
+def _existing_by_code(model):
+    def find(records):
+        found = {}
+        for chunk in _in_chunks({record['code'] for record in records}):
+            found.update(
+                (code, {'id': record_id})
+                for record_id, code in db.session.execute(select(model.id, model.code).where(model.code.in_(chunk)))
+            )
+        return found
+    return find
+
+
+def _inventory_key(record):
+    return record['product_id'], record['location_id'], record.get('batch_number', '')
+
+
+def _existing_inventory(records):
+    found = {}
+    batch_number = func.coalesce(Inventory.batch_number, '')
+    for chunk in _in_chunks({record['product_id'] for record in records}):
+        rows = db.session.execute(
+            select(Inventory.id, Inventory.product_id, Inventory.location_id, batch_number, Inventory.reserved_quantity)
+            .where(Inventory.product_id.in_(chunk))
+        )
+        for record_id, product_id, location_id, batch, reserved in rows:
+            found[(product_id, location_id, batch)] = {'id': record_id, 'reserved_quantity': reserved or 0}
+    return found
+
+
+def _inventory_values(record, existing):
+    reserved = existing['reserved_quantity'] if existing else 0
+    record['available_quantity'] = record['quantity'] - float(reserved)
+    return record
+
+
+IMPORTERS = {
+    'products': {
+        'model': Product,
+        'prepare': _prepare_products,
+        'key': lambda record: record['code'],
+        'key_label': 'product_code',
+        'existing': _existing_by_code(Product),
+        'defaults': lambda record: {'primary_uom': 'PCS', **record}
+    },
+    'materials': {
+        'model': Material,
+        'prepare': _prepare_materials,
+        'key': lambda record: record['code'],
+        'key_label': 'material_code',
+        'existing': _existing_by_code(Material),
+        'defaults': lambda record: {'category': record['material_type'], **record}
+    },
+    'inventory': {
+        'model': Inventory,
+        'prepare': _prepare_inventory,
+        'key': _inventory_key,
+        'key_label': 'product_code/location_code/batch_number',
+        'existing': _existing_inventory,
+        'values': _inventory_values,
+        # Stock levels are always replaced by the file
+        'upsert': True
+    }
+}
+
+
+# ===============================
+# IMPORT EXECUTION
+# ===============================
+
+def import_chunk(import_type, frame, mode, first_row, seen_keys):
+    """Validate and write one chunk; returns (inserted, updated, skipped, errors)
+
+    ``first_row`` is the file row number of the chunk's first row (the
+    header is row 1) and ``seen_keys`` the keys imported by earlier
+    chunks, so a key repeated in the file is reported instead of written
+    twice. The caller commits.
+    """
+    importer = IMPORTERS[import_type]
+    model = importer['model']
+    upsert = importer.get('upsert', mode == 'upsert')
+
+    check = ChunkValidator(frame.reset_index(drop=True))
+    columns = importer['prepare'](check)
+    row_numbers = pd.Series(range(first_row, first_row + len(frame)), index=check.frame.index)
+
+    records = _records(columns, check.valid)
+    valid_rows = row_numbers[check.valid].tolist()
+
+    keep, keep_rows = [], []
+    for record, row_number in zip(records, valid_rows):
+        key = importer['key'](record)
+        if key in seen_keys:
+            check.problems[row_number - first_row] = f"duplicate {importer['key_label']} in file"
+            continue
+        seen_keys.add(key)
+        keep.append(record)
+        keep_rows.append(row_number)
+
+    existing = importer['existing'](keep) if keep else {}
+    now = datetime.utcnow()
+    inserts, updates, skipped = [], [], 0
+    for record in keep:
+        found = existing.get(importer['key'](record))
+        if found and not upsert:
+            skipped += 1
+            continue
+        if 'values' in importer:
+            record = importer['values'](record, found)
+        record['updated_at'] = now
+        if found:
+            updates.append(dict(record, id=found['id']))
+        else:
+            record['created_at'] = now
+            inserts.append(importer['defaults'](record) if 'defaults' in importer else record)
+
+    if inserts:
+        db.session.execute(insert(model), inserts)
+    if updates:
+        db.session.execute(update(model), updates)
+    if model is Inventory and (inserts or updates):
+        # Bulk statements bypass the mapper events that keep stock summaries current
+        refresh_stock_summaries(db.session.connection(), [record['product_id'] for record in inserts + updates])
+    if model is Product:
+        # ... and the one revaluing stock when a product's cost changes
+        revalued = [record['id'] for record in updates if 'cost' in record]
+        if revalued:
+            revalue_stock_summaries(db.session.connection(), revalued)
+
+    failed = check.problems != ''
+    errors = [
+        {'row': int(row_number), 'error': problem}
+        for row_number, problem in zip(row_numbers[failed], check.problems[failed])
+    ]
+    return len(inserts), len(updates), skipped, errors
+
+
+def missing_columns(import_type, columns):
+    return [column for column in REQUIRED_COLUMNS[import_type] if column not in columns]
+
+
+def create_import_job(import_type, mode, file_name, file_path, user_id):
+    if import_type not in IMPORT_TYPES:
+        raise ValueError(f'Unknown import type: {import_type}')
+    if mode not in IMPORT_MODES:
+        raise ValueError(f'Unknown import mode: {mode}')
+    job = ImportJob(
+        import_type=import_type,
+        mode=mode,
+        file_name=file_name,
+        file_path=file_path,
+        requested_by=user_id
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def _write_error_report(job, errors):
+    path = os.path.abspath(os.path.join(
+        current_app.config.get('REPORT_FOLDER', 'reports'), f'import_{job.id}_errors.csv'
+    ))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(['row', 'error'])
+        writer.writerows((error['row'], error['error']) for error in errors)
+    return path
+
+
+def run_import_job(job_id, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import a queued job's file chunk by chunk; runs in a background worker"""
+    job = db.session.get(ImportJob, job_id)
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    job.rows_processed = job.rows_inserted = job.rows_updated = job.rows_skipped = job.rows_failed = 0
+    db.session.commit()
+
+    errors = []
+    try:
+        job.total_rows = count_rows(job.file_path)
+        db.session.commit()
+
+        seen_keys = set()
+        first_row = 2
+        for frame in read_chunks(job.file_path, chunk_size):
+            if first_row == 2:
+                missing = missing_columns(job.import_type, frame.columns)
+                if missing:
+                    raise ValueError(f'Missing required columns: {", ".join(missing)}')
+
+            inserted, updated, skipped, chunk_errors = import_chunk(
+                job.import_type, frame, job.mode, first_row, seen_keys
+            )
+            errors.extend(chunk_errors)
+            first_row += len(frame)
+
+            job.rows_processed += len(frame)
+            job.rows_inserted += inserted
+            job.rows_updated += updated
+            job.rows_skipped += skipped
+            job.rows_failed += len(chunk_errors)
+            db.session.commit()
+
+        if job.total_rows is None or job.total_rows < job.rows_processed:
+            job.total_rows = job.rows_processed
+        job.status = 'completed'
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(ImportJob, job_id)
+        job.status = 'failed'
+        job.error_message = str(e)
+
+    if errors:
+        job.errors = errors[:MAX_STORED_ERRORS]
+        job.error_report_path = _write_error_report(job, errors)
+    job.completed_at = datetime.utcnow()
+    db.session.commit()
+
+    if os.path.exists(job.file_path):
+        os.remove(job.file_path)
+
+
+def serialize_import_job(job):
+    return {
+        'id': job.id,
+        'import_type': job.import_type,
+        'mode': job.mode,
+        'file_name': job.file_name,
+        'status': job.status,
+        'total_rows': job.total_rows,
+        'rows_processed': job.rows_processed,
+        'rows_inserted': job.rows_inserted,
+        'rows_updated': job.rows_updated,
+        'rows_skipped': job.rows_skipped,
+        'rows_failed': job.rows_failed,
+        'progress': round(100 * job.rows_processed / job.total_rows, 1) if job.total_rows else None,
+        'errors': job.errors or [],
+        'has_error_report': bool(job.error_report_path),
+        'error_message': job.error_message,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None
+    }
@@ -0,0 +1,84 @@
+"""
+Short-lived per-process result cache
+
+``TTLCache`` keeps computed values for a few seconds so that many pollers
+of the same endpoint share one computation. Recomputation is single-flight
+per key: when an entry expires, the first caller recomputes it while
+concurrent callers for that key wait and then read the fresh entry.
+
+Every entry carries an ETag derived from its value so routes can answer
+conditional requests with 304.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+CachedValue = namedtuple('CachedValue', ['value', 'etag', 'computed_at', 'expires_at'])
+
+
+def compute_etag(value):
+    """Stable hash of a JSON-serializable value"""
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+class TTLCache:
+    """Per-process cache with a time-to-live and single-flight refresh"""
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._key_locks = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            return entry
+        return None
+
+    def get(self, key, compute):
+        """Return the cached entry for ``key``, computing it when missing or expired"""
+        entry = self._fresh(key)
+        if entry is not None:
+            return entry
+
+        with self._key_lock(key):
+            entry = self._fresh(key)
+            if entry is not None:
+                return entry
+
+            version = self._version
+            value = compute()
+            entry = CachedValue(
+                value=value,
+                etag=compute_etag(value),
+                computed_at=datetime.utcnow(),
+                expires_at=time.monotonic() + self.ttl_seconds
+            )
+            with self._lock:
+                # Don't publish a value that was invalidated while computing
+                if version == self._version:
+                    self._entries[key] = entry
+            return entry
+
+    def invalidate(self, key=None):
+        """Drop one entry, or every entry when ``key`` is None"""
+        with self._lock:
+            self._version += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,144 @@
+"""
+Dashboard KPI aggregation
+
+Computes the KPI set behind /api/dashboard/overview and
+/api/dashboard/executive with a handful of grouped queries (sales grouped
+by day, work orders and machines grouped by status) instead of one
+count()/sum() per figure and one query per trend day. The result is cached
+for ``DASHBOARD_CACHE_SECONDS`` and shared by both endpoints, so every
+browser and TV polling the dashboards costs one computation per interval.
+"""
+
+from datetime import date, timedelta
+
+from sqlalchemy import case, func
+
+from models import db, SalesOrder, WorkOrder, Machine, Product, StockSummary
+from models.oee import OEERecord, OEEAlert
+from services.cache import TTLCache
+
+DASHBOARD_CACHE_SECONDS = 15
+SALES_TREND_DAYS = 7
+OEE_WINDOW_DAYS = 7
+
+kpi_cache = TTLCache(DASHBOARD_CACHE_SECONDS)
+
+
+# ===============================
+# GROUPED QUERIES
+# ===============================
+
+def load_sales_by_day(since):
+    """Order value per order date from ``since`` onwards"""
+    rows = db.session.query(
+        SalesOrder.order_date, func.sum(SalesOrder.total_amount)
+    ).filter(SalesOrder.order_date >= since).group_by(SalesOrder.order_date)
+    return {order_date: float(total or 0) for order_date, total in rows}
+
+
+def load_work_order_counts(today):
+    """Work orders per status, plus how many completed ``today``"""
+    rows = db.session.query(
+        WorkOrder.status,
+        func.count(WorkOrder.id),
+        func.sum(case((func.date(WorkOrder.actual_end_date) == today, 1), else_=0))
+    ).group_by(WorkOrder.status)
+
+    counts, completed_today = {}, 0
+    for status, count, ended_today in rows:
+        counts[status] = count
+        if status == 'completed':
+            completed_today = int(ended_today or 0)
+    return counts, completed_today
+
+
+def load_machine_counts():
+    """Machines per (status, is_active)"""
+    rows = db.session.query(
+        Machine.status, Machine.is_active, func.count(Machine.id)
+    ).group_by(Machine.status, Machine.is_active)
+    return {(status, bool(is_active)): count for status, is_active, count in rows}
+
+
+def load_inventory_totals():
+    """Products below their minimum stock and total stock value"""
+    low_stock, total_value = db.session.query(
+        func.sum(case((StockSummary.available_quantity < Product.min_stock_level, 1), else_=0)),
+        func.sum(StockSummary.stock_value)
+    ).join(Product, StockSummary.product_id == Product.id).one()
+    return int(low_stock or 0), float(total_value or 0)
+
+
+def load_oee_totals(since):
+    """Average OEE since ``since`` and the number of open critical alerts"""
+    average_oee = db.session.query(func.avg(OEERecord.oee)).filter(
+        OEERecord.record_date >= since
+    ).scalar()
+    critical_alerts = db.session.query(func.count(OEEAlert.id)).filter(
+        OEEAlert.status == 'active',
+        OEEAlert.severity.in_(['high', 'critical'])
+    ).scalar()
+    return float(average_oee or 0), critical_alerts or 0
+
+
+# ===============================
+# KPI SET
+# ===============================
+
+def compute_kpis(today=None):
+    """Compute the full dashboard KPI set"""
+    today = today or date.today()
+    month_start = today.replace(day=1)
+    trend_start = today - timedelta(days=SALES_TREND_DAYS - 1)
+
+    sales = load_sales_by_day(min(month_start, trend_start))
+    work_orders, completed_today = load_work_order_counts(today)
+    machines = load_machine_counts()
+    low_stock_items, stock_value = load_inventory_totals()
+    average_oee, critical_alerts = load_oee_totals(today - timedelta(days=OEE_WINDOW_DAYS))
+
+    def machines_with(status, active_only=False):
+        return sum(
+            count for (machine_status, is_active), count in machines.items()
+            if machine_status == status and (is_active or not active_only)
+        )
+
+    active_machines = sum(count for (_, is_active), count in machines.items() if is_active)
+    running_active = machines_with('running', active_only=True)
+
+    return {
+        'date': today.isoformat(),
+        'sales': {
+            'today': sales.get(today, 0.0),
+            'this_month': sum((total for day, total in sales.items() if day >= month_start), 0.0),
+            'trend': [{
+                'date': (trend_start + timedelta(days=i)).isoformat(),
+                'value': sales.get(trend_start + timedelta(days=i), 0.0)
+            } for i in range(SALES_TREND_DAYS)]
+        },
+        'production': {
+            'active_work_orders': work_orders.get('in_progress', 0),
+            'completed_today': completed_today
+        },
+        'inventory': {
+            'low_stock_items': low_stock_items,
+            'total_value': stock_value
+        },
+        'machines': {
+            'running': machines_with('running'),
+            'idle': machines_with('idle'),
+            'maintenance': machines_with('maintenance'),
+            'running_active': running_active,
+            'total_active': active_machines,
+            'utilization': (running_active / active_machines * 100) if active_machines > 0 else 0
+        },
+        'oee': {
+            'average_oee': average_oee,
+            'critical_alerts': critical_alerts
+        }
+    }
+
+
+def get_kpis():
+    """Cached KPI set; concurrent callers share one computation"""
+    return kpi_cache.get('kpis', compute_kpis)
@@ -0,0 +1,261 @@
+"""
+Streaming data export
+
+Exports the major business tables as NDJSON, CSV or XLSX without holding
+a table in memory. Every table is read through a ``yield_per`` cursor
+EXPORT_BATCH_SIZE rows at a time and written out batch by batch:
+
+- ``ndjson``: one ``{"table": ..., "record": {...}}`` line per row;
+- ``csv``: a plain CSV for a single table, a zip with one CSV per table
+  for several tables, built on the fly on a non-seekable stream;
+- ``xlsx``: an openpyxl write-only workbook with one sheet per table,
+  spooled to a temporary file and streamed from there.
+
+``since`` limits every table to rows changed after that time (updated_at,
+or created_at for append-only tables). Each export is bounded by its start
+time less EXPORT_LAG_SECONDS, which is returned as the ``until`` to pass as
+``since`` next time, so successive incremental exports neither miss nor
+repeat rows; the lag covers transactions that stamped a row before the
+export started but committed after it.
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from models import (
+    db, Product, Material, Customer, Supplier, SalesOrder, SalesOrderItem, PurchaseOrder, PurchaseOrderItem,
+    WorkOrder, Inventory, InventoryMovement, Invoice, InvoiceItem
+)
+
+EXPORT_FORMATS = ('ndjson', 'csv', 'xlsx')
+EXPORT_BATCH_SIZE = 1000
+XLSX_MAX_ROWS = 1048575  # data rows per sheet below Excel's limit, after the header
+FILE_CHUNK_SIZE = 64 * 1024
+
+# Rows stamped this recently may belong to transactions that have not
+# committed yet; they are left for the next export
+EXPORT_LAG_SECONDS = 30
+
+EXPORT_TABLES = {
+    'products': Product,
+    'materials': Material,
+    'customers': Customer,
+    'suppliers': Supplier,
+    'sales_orders': SalesOrder,
+    'sales_order_items': SalesOrderItem,
+    'purchase_orders': PurchaseOrder,
+    'purchase_order_items': PurchaseOrderItem,
+    'work_orders': WorkOrder,
+    'inventory': Inventory,
+    'inventory_movements': InventoryMovement,
+    'invoices': Invoice,
+    'invoice_items': InvoiceItem
+}
+
+# Export types accepted besides single table names
+EXPORT_GROUPS = {
+    'full': list(EXPORT_TABLES),
+    'orders': ['sales_orders', 'sales_order_items', 'purchase_orders', 'purchase_order_items'],
+    'movements': ['inventory_movements'],
+    'invoices': ['invoices', 'invoice_items']
+}
+
+FORMAT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'zip': 'application/zip',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+
+# ===============================
+# TABLE READING
+# ===============================
+
+def resolve_tables(export_type):
+    """Table names of an export type: a group, a table name or a comma separated list of them"""
+    tables = []
+    for name in (part.strip() for part in (export_type or 'full').split(',')):
+        if name in EXPORT_GROUPS:
+            tables.extend(EXPORT_GROUPS[name])
+        elif name in EXPORT_TABLES:
+            tables.append(name)
+        else:
+            raise ValueError(f'Unknown export type: {name}')
+    return list(dict.fromkeys(tables))
+
+
+def change_column(model):
+    table = model.__table__
+    return table.c.updated_at if 'updated_at' in table.c else table.c.created_at
+
+
+def table_columns(table_name):
+    return [column.name for column in EXPORT_TABLES[table_name].__table__.columns]
+
+
+def table_statement(table_name, since=None, until=None):
+    model = EXPORT_TABLES[table_name]
+    table = model.__table__
+    changed = change_column(model)
+    criteria = []
+    if since is not None:
+        criteria.append(changed > since)
+    if until is not None:
+        criteria.append(changed <= until)
+    return select(table).where(*criteria).order_by(table.c.id)
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def iter_batches(table_name, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+    """Rows of one table as tuples in column order, ``batch_size`` at a time from a server-side cursor"""
+    statement = table_statement(table_name, since, until).execution_options(
+        yield_per=batch_size, stream_results=True
+    )
+    result = db.session.execute(statement)
+    try:
+        for partition in result.partitions(batch_size):
+            yield [tuple(row) for row in partition]
+    finally:
+        result.close()
+
+
+# ===============================
+# WRITERS
+# ===============================
+
+def iter_ndjson(tables, since, until, stats):
+    for table_name in tables:
+        columns = table_columns(table_name)
+        for batch in iter_batches(table_name, since, until):
+            stats[table_name] = stats.get(table_name, 0) + len(batch)
+            yield ''.join(
+                json.dumps({'table': table_name, 'record': {
+                    column: _plain(value) for column, value in zip(columns, row)
+                }}) + '\n'
+                for row in batch
+            ).encode('utf-8')
+
+
+def _csv_chunks(table_name, since, until, stats):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(table_columns(table_name))
+    yield buffer.getvalue().encode('utf-8')
+    for batch in iter_batches(table_name, since, until):
+        stats[table_name] = stats.get(table_name, 0) + len(batch)
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_plain(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _StreamBuffer:
+    """Write-only file object for ZipFile; the caller drains it between writes"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_csv_zip(tables, since, until, stats):
+    """A zip archive with ``<table>.csv`` per table, yielded as it is compressed"""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for table_name in tables:
+            with archive.open(f'{table_name}.csv', 'w', force_zip64=True) as member:
+                for chunk in _csv_chunks(table_name, since, until, stats):
+                    member.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def iter_xlsx(tables, since, until, stats):
+    """An xlsx workbook with one sheet per table, spooled to disk by openpyxl's write-only mode"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for table_name in tables:
+        columns = table_columns(table_name)
+        sheet, sheet_rows, part = None, XLSX_MAX_ROWS, 1
+        for batch in iter_batches(table_name, since, until):
+            stats[table_name] = stats.get(table_name, 0) + len(batch)
+            for row in batch:
+                if sheet_rows >= XLSX_MAX_ROWS:
+                    sheet = workbook.create_sheet(table_name if part == 1 else f'{table_name} ({part})')
+                    sheet.append(columns)
+                    sheet_rows, part = 0, part + 1
+                sheet.append([_plain(value) for value in row])
+                sheet_rows += 1
+        if sheet is None:
+            workbook.create_sheet(table_name).append(columns)
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, 'rb') as handle:
+            while True:
+                data = handle.read(FILE_CHUNK_SIZE)
+                if not data:
+                    break
+                yield data
+    finally:
+        os.remove(path)
+
+
+def prepare_export(export_type, file_format, since=None):
+    """Validate an export and return (tables, until, file extension)
+
+    ``until`` is EXPORT_LAG_SECONDS before now; rows changed later belong to
+    the next incremental export.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f'format must be one of: {", ".join(EXPORT_FORMATS)}')
+    tables = resolve_tables(export_type)
+    until = datetime.utcnow() - timedelta(seconds=EXPORT_LAG_SECONDS)
+    if since is not None and since >= until:
+        raise ValueError('since must be in the past')
+    extension = 'zip' if file_format == 'csv' and len(tables) > 1 else file_format
+    return tables, until, extension
+
+
+def iter_export(tables, file_format, since=None, until=None, stats=None):
+    """Yield the export of ``tables`` as bytes; the rows written per table are counted into ``stats``"""
+    stats = stats if stats is not None else {}
+    if file_format == 'ndjson':
+        return iter_ndjson(tables, since, until, stats)
+    if file_format == 'xlsx':
+        return iter_xlsx(tables, since, until, stats)
+    if len(tables) == 1:
+        return _csv_chunks(tables[0], since, until, stats)
+    return iter_csv_zip(tables, since, until, stats)
@@ -0,0 +1,460 @@
+"""
+Incremental data sync engine
+
+Runs DataSyncJob exports of master data (products, customers) to an
+external connector. A run reads only the rows changed since the job's
+watermark, the ``(updated_at, id)`` of the last row pushed by earlier
+runs, in keyset order from a ``yield_per`` cursor. The rows are pushed in
+``batch_size`` batches, ``parallel_batches`` at a time. The watermark
+moves to the last row of the leading batches that were all pushed, so the
+rows of a failed batch and everything read after it are pushed again by
+the next run, also when ``error_handling`` is ``continue``. A run with a
+failed batch is recorded as failed.
+
+A job's ``mapping_configuration`` names what it syncs::
+
+    {"entity": "products", "path": "/items/bulk", "fields": {"code": "sku", "name": "name"}}
+
+``fields`` maps local columns to the names sent (all columns when
+omitted). ``filter_conditions`` holds ``{"column": value}`` equality
+filters. Scheduled jobs (``schedule_type`` interval) are run by the worker
+started with ``flask data-sync worker``.
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import click
+from flask import current_app
+from sqlalchemy import or_, select, tuple_, update
+
+from models import db, DataSyncJob, SyncJobExecution, ExternalConnector, Product, Customer
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PARALLEL_BATCHES = 4
+MAX_PARALLEL_BATCHES = 16
+
+# Rows stamped this recently may belong to transactions that have not
+# committed yet; they are left for the next run
+WATERMARK_LAG_SECONDS = 30
+
+# A run still marked in progress after this long is assumed dead
+STALE_RUN_HOURS = 6
+
+SCHEDULER_POLL_SECONDS = 30
+
+SYNC_ENTITIES = {
+    'products': (Product, (
+        'id', 'code', 'name', 'description', 'category_id', 'nonwoven_category', 'primary_uom',
+        'secondary_uom', 'price', 'cost', 'material_type', 'min_stock_level', 'reorder_point',
+        'is_active', 'is_sellable', 'is_purchasable', 'is_producible', 'lead_time_days', 'updated_at'
+    )),
+    'customers': (Customer, (
+        'id', 'code', 'company_name', 'contact_person', 'email', 'phone', 'tax_id',
+        'billing_address', 'billing_city', 'billing_state', 'billing_country', 'billing_postal_code',
+        'credit_limit', 'payment_terms_days', 'customer_type', 'is_active', 'updated_at'
+    ))
+}
+
+
+# ===============================
+# JOB CONFIGURATION
+# ===============================
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def load_job_config(job):
+    """Entity, column mapping and filters of a job; raises ValueError when invalid"""
+    try:
+        mapping = json.loads(job.mapping_configuration or '{}')
+        filters = json.loads(job.filter_conditions or '{}')
+    except ValueError:
+        raise ValueError('mapping_configuration and filter_conditions must be JSON')
+
+    entity = mapping.get('entity')
+    if entity not in SYNC_ENTITIES:
+        raise ValueError(f"mapping_configuration.entity must be one of: {', '.join(SYNC_ENTITIES)}")
+    model, columns = SYNC_ENTITIES[entity]
+
+    fields = mapping.get('fields') or {column: column for column in columns}
+    unknown = [column for column in list(fields) + list(filters) if column not in columns]
+    if unknown:
+        raise ValueError(f"Unknown {entity} columns: {', '.join(unknown)}")
+
+    return {
+        'entity': entity,
+        'model': model,
+        'fields': fields,
+        'filters': filters,
+        'path': mapping.get('path', entity)
+    }
+
+
+def changed_rows_statement(config, watermark, cutoff, batch_size):
+    """Rows changed after ``watermark`` (or all rows) up to ``cutoff``, in watermark order"""
+    model = config['model']
+    criteria = [getattr(model, column) == value for column, value in config['filters'].items()]
+    if watermark is None:
+        criteria.append(or_(model.updated_at <= cutoff, model.updated_at.is_(None)))
+    else:
+        criteria.append(model.updated_at <= cutoff)
+        criteria.append(tuple_(model.updated_at, model.id) > watermark)
+
+    # updated_at and id ride along for the watermark even when not mapped
+    columns = list(config['fields'])
+    statement = select(model.updated_at, model.id, *[getattr(model, column) for column in columns])
+    return columns, statement.where(*criteria).order_by(model.updated_at, model.id).execution_options(
+        yield_per=batch_size
+    )
+
+
+# ===============================
+# TARGETS
+# ===============================
+
+def connector_headers(connector):
+    headers = {'Content-Type': 'application/json', 'User-Agent': 'ERP-DataSync/1.0'}
+    auth_type = connector.authentication_type
+    if auth_type == 'api_key' and connector.api_key:
+        headers['X-API-Key'] = connector.api_key
+    elif auth_type in ('bearer', 'oauth') and (connector.oauth_token or connector.api_key):
+        headers['Authorization'] = f'Bearer {connector.oauth_token or connector.api_key}'
+    elif auth_type == 'basic_auth' and connector.username:
+        credentials = base64.b64encode(f'{connector.username}:{connector.password or ""}'.encode()).decode()
+        headers['Authorization'] = f'Basic {credentials}'
+    if connector.headers:
+        try:
+            headers.update(json.loads(connector.headers))
+        except ValueError:
+            pass
+    return headers
+
+
+def api_pusher(connector, config):
+    """Batch pusher POSTing ``{"entity", "records"}`` to the connector, with retries"""
+    url = connector.endpoint_url.rstrip('/') + '/' + config['path'].lstrip('/')
+    headers = connector_headers(connector)
+    timeout = connector.timeout_seconds or 30
+    attempts = 1 + (connector.retry_attempts or 0)
+    delay = connector.retry_delay_seconds if connector.retry_delay_seconds is not None else 5
+
+    def push(records):
+        body = json.dumps({'entity': config['entity'], 'records': records}).encode()
+        for attempt in range(1, attempts + 1):
+            try:
+                request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                return
+            except Exception:
+                if attempt == attempts:
+                    raise
+                time.sleep(delay * 2 ** (attempt - 1))
+
+    return push
+
+
+def file_pusher(path):
+    """Batch pusher appending NDJSON records to ``path``"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lock = threading.Lock()
+
+    def push(records):
+        chunk = ''.join(json.dumps(record) + '\n' for record in records)
+        with lock, open(path, 'a', encoding='utf-8') as handle:
+            handle.write(chunk)
+
+    return push
+
+
+def build_pusher(job, config, execution):
+    if job.target_system == 'external_api':
+        connector = db.session.get(ExternalConnector, job.source_connector_id)
+        if connector is None or not connector.is_active:
+            raise ValueError('The job connector is missing or inactive')
+        return api_pusher(connector, config)
+    if job.target_system == 'file_system':
+        return file_pusher(os.path.abspath(os.path.join(
+            current_app.config.get('SYNC_EXPORT_FOLDER', 'sync_exports'),
+            f'{job.job_code}_{execution.execution_id}.ndjson'
+        )))
+    raise ValueError(f'Unsupported sync target: {job.target_system}')
+
+
+# ===============================
+# EXECUTION
+# ===============================
+
+def start_sync_execution(job, triggered_by, user_id=None):
+    """Claim ``job`` for a run and record its SyncJobExecution
+
+    Raises ValueError when the job is already running. The claim is a
+    conditional UPDATE, so two workers never run the same job at once.
+    """
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(DataSyncJob).where(
+            DataSyncJob.id == job.id,
+            or_(
+                DataSyncJob.last_run_status.is_(None),
+                DataSyncJob.last_run_status != 'in_progress',
+                DataSyncJob.last_run_at < now - timedelta(hours=STALE_RUN_HOURS)
+            )
+        ).values(
+            last_run_status='in_progress',
+            last_run_at=now,
+            next_run_at=(now + timedelta(minutes=job.schedule_interval_minutes)
+                         if job.schedule_type == 'interval' and job.schedule_interval_minutes else job.next_run_at)
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        raise ValueError('Sync job is already running')
+
+    execution = SyncJobExecution(
+        job_id=job.id,
+        execution_id=str(uuid.uuid4()),
+        started_at=now,
+        status='in_progress',
+        triggered_by=triggered_by,
+        triggered_by_user_id=user_id,
+        watermark_from=job.watermark_updated_at if job.sync_type != 'full' else None
+    )
+    db.session.add(execution)
+    db.session.commit()
+    return execution
+
+
+def _push_batches(rows, push, batch_size, parallel, stop_on_error, stats):
+    """Push ``rows`` in batches on a bounded pool
+
+    Returns the watermark of the last row of the leading batches that were
+    all pushed, or None when the first batch was not.
+    """
+    batches = []  # [watermark of the batch's last row, pushed], in read order
+    pending = set()
+
+    def submit(batch, watermark):
+        future = pool.submit(push, batch)
+        future.batch_size = len(batch)
+        future.outcome = [watermark, False]
+        batches.append(future.outcome)
+        pending.add(future)
+        stats['batches'] += 1
+
+    def settle(done):
+        for future in done:
+            count = future.batch_size
+            try:
+                future.result()
+                stats['success'] += count
+                future.outcome[1] = True
+            except Exception as e:
+                stats['failed'] += count
+                stats['errors'].append(str(e))
+
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='data-sync') as pool:
+        batch = []
+        watermark = None
+        for row in rows:
+            batch.append(row[1])
+            watermark = row[0]
+            if len(batch) < batch_size:
+                continue
+            if stop_on_error and stats['errors']:
+                break
+            submit(batch, watermark)
+            batch = []
+            # Keep at most two batches per worker read ahead
+            if len(pending) >= parallel * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                settle(done)
+        if batch and not (stop_on_error and stats['errors']):
+            submit(batch, watermark)
+        done, _ = wait(pending)
+        settle(done)
+
+    # Batches finish out of order; stop at the first one not pushed
+    pushed_watermark = None
+    for watermark, pushed in batches:
+        if not pushed:
+            break
+        pushed_watermark = watermark
+    return pushed_watermark
+
+
+def execute_sync(execution_pk):
+    """Run a claimed sync execution to completion and record its outcome"""
+    execution = db.session.get(SyncJobExecution, execution_pk)
+    job = db.session.get(DataSyncJob, execution.job_id)
+    started = time.perf_counter()
+    stats = {'success': 0, 'failed': 0, 'batches': 0, 'errors': []}
+    watermark = None
+    error = None
+
+    try:
+        config = load_job_config(job)
+        push = build_pusher(job, config, execution)
+        batch_size = max(job.batch_size or DEFAULT_BATCH_SIZE, 1)
+        parallel = min(max(job.parallel_batches or DEFAULT_PARALLEL_BATCHES, 1), MAX_PARALLEL_BATCHES)
+        since = None
+        if job.sync_type != 'full' and job.watermark_updated_at is not None:
+            since = (job.watermark_updated_at, job.watermark_record_id or 0)
+        cutoff = datetime.utcnow() - timedelta(seconds=WATERMARK_LAG_SECONDS)
+
+        columns, statement = changed_rows_statement(config, since, cutoff, batch_size)
+        fields = config['fields']
+        rows = (
+            ((row[0], row[1]), {fields[column]: _plain(value) for column, value in zip(columns, row[2:])})
+            for row in db.session.execute(statement)
+        )
+        watermark = _push_batches(rows, push, batch_size, parallel, job.error_handling != 'continue', stats)
+        if stats['errors'] and job.error_handling != 'continue':
+            error = stats['errors'][0]
+    except Exception as e:
+        db.session.rollback()
+        error = str(e)
+
+    duration = time.perf_counter() - started
+    processed = stats['success'] + stats['failed']
+    failed = error is not None or stats['failed'] > 0
+    now = datetime.utcnow()
+
+    execution = db.session.get(SyncJobExecution, execution_pk)
+    job = db.session.get(DataSyncJob, execution.job_id)
+    execution.completed_at = now
+    execution.status = 'failed' if failed else 'success'
+    execution.duration_seconds = int(round(duration))
+    execution.records_processed = processed
+    execution.records_success = stats['success']
+    execution.records_failed = stats['failed']
+    execution.batches_total = stats['batches']
+    execution.records_per_second = round(processed / duration, 2) if duration > 0 else None
+    execution.error_message = error or ('; '.join(stats['errors'][:5]) or None)
+    execution.execution_log = (
+        f"{stats['batches']} batches, {processed} records in {duration:.2f}s; "
+        f"watermark {execution.watermark_from.isoformat() if execution.watermark_from else 'start'}"
+        f" -> {watermark[0].isoformat() if watermark and watermark[0] else 'unchanged'}"
+    )
+
+    if watermark is not None and watermark[0] is not None:
+        job.watermark_updated_at, job.watermark_record_id = watermark
+        execution.watermark_to = watermark[0]
+    job.last_run_status = execution.status
+    job.last_run_duration_seconds = execution.duration_seconds
+    job.last_run_records_processed = processed
+    job.last_run_records_success = stats['success']
+    job.last_run_records_failed = stats['failed']
+    job.last_run_error_message = execution.error_message
+    job.total_runs = (job.total_runs or 0) + 1
+    if failed:
+        job.failed_runs = (job.failed_runs or 0) + 1
+    else:
+        job.successful_runs = (job.successful_runs or 0) + 1
+
+    if job.target_system == 'external_api':
+        db.session.execute(update(ExternalConnector).where(ExternalConnector.id == job.source_connector_id).values(
+            last_sync_at=now,
+            sync_status=execution.status,
+            sync_error_message=execution.error_message,
+            request_count=ExternalConnector.request_count + stats['batches'],
+            success_count=ExternalConnector.success_count + (0 if failed else 1),
+            failure_count=ExternalConnector.failure_count + (1 if failed else 0)
+        ))
+    db.session.commit()
+    return execution
+
+
+def serialize_execution(execution):
+    return {
+        'id': execution.id,
+        'execution_id': execution.execution_id,
+        'status': execution.status,
+        'triggered_by': execution.triggered_by,
+        'started_at': execution.started_at.isoformat() if execution.started_at else None,
+        'completed_at': execution.completed_at.isoformat() if execution.completed_at else None,
+        'duration_seconds': execution.duration_seconds,
+        'records_processed': execution.records_processed,
+        'records_success': execution.records_success,
+        'records_failed': execution.records_failed,
+        'batches_total': execution.batches_total,
+        'records_per_second': float(execution.records_per_second) if execution.records_per_second is not None else None,
+        'watermark_from': execution.watermark_from.isoformat() if execution.watermark_from else None,
+        'watermark_to': execution.watermark_to.isoformat() if execution.watermark_to else None,
+        'error_message': execution.error_message,
+        'execution_log': execution.execution_log
+    }
+
+
+# ===============================
+# SCHEDULER
+# ===============================
+
+def due_jobs(now):
+    return DataSyncJob.query.filter(
+        DataSyncJob.is_active == True,
+        DataSyncJob.schedule_type == 'interval',
+        DataSyncJob.schedule_interval_minutes > 0,
+        or_(DataSyncJob.next_run_at.is_(None), DataSyncJob.next_run_at <= now)
+    ).order_by(DataSyncJob.next_run_at).all()
+
+
+def run_due_jobs():
+    """Run every due interval job once; returns the finished executions"""
+    executions = []
+    for job in due_jobs(datetime.utcnow()):
+        try:
+            execution = start_sync_execution(job, 'scheduled')
+        except ValueError:
+            continue
+        executions.append(execute_sync(execution.id))
+    return executions
+
+
+def register_commands(app):
+    """Register ``flask data-sync worker|run``"""
+
+    @app.cli.group('data-sync')
+    def data_sync_cli():
+        """Run incremental data sync jobs"""
+
+    @data_sync_cli.command('worker')
+    @click.option('--poll-seconds', default=SCHEDULER_POLL_SECONDS, show_default=True)
+    def worker_command(poll_seconds):
+        """Run scheduled sync jobs until interrupted"""
+        click.echo('Data sync worker started')
+        while True:
+            for execution in run_due_jobs():
+                click.echo(f'job {execution.job_id}: {execution.status}, {execution.execution_log}')
+            db.session.remove()
+            time.sleep(poll_seconds)
+
+    @data_sync_cli.command('run')
+    @click.argument('job_code')
+    def run_command(job_code):
+        """Run one sync job now"""
+        job = DataSyncJob.query.filter_by(job_code=job_code).first()
+        if job is None:
+            raise click.ClickException(f'No sync job {job_code}')
+        try:
+            execution = start_sync_execution(job, 'manual')
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        execution = execute_sync(execution.id)
+        click.echo(f'{execution.status}: {execution.execution_log}')
+        if execution.status != 'success':
+            raise SystemExit(1)
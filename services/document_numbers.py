@@ -0,0 +1,201 @@
+"""
+Document number allocation
+
+Hands out numbers of the form ``PREFIX-YYYYMM-00001`` from a counter row
+per (prefix, document column, period) in DocumentSequence, advanced with a
+single atomic ``UPDATE ... RETURNING``, instead of scanning the document
+table for its highest number. Concurrent requests can no longer receive
+the same number and the sequence restarts every month. Tables sharing a
+prefix (WO for work orders and maintenance records) keep a sequence each,
+as they did when every table was scanned for its own highest number.
+
+By default a number is allocated inside the caller's transaction: the
+counter row stays locked until the document is committed, and a rolled
+back document gives its number back, so numbers have no gaps.
+
+High-volume documents can instead reserve blocks of numbers (see
+DOCUMENT_NUMBER_BLOCKS) in a short transaction of their own; each worker
+process then hands out its block from memory without touching the
+counter row. Numbers from blocks are unique but may have gaps and are not
+strictly in creation order across processes. SQLite allows a single
+writer only and the caller's transaction may already hold it, so there
+blocks are not used.
+
+The first allocation of a period seeds the counter from the document
+column's highest existing number for that period, once.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, DocumentSequence
+
+NUMBER_DIGITS = 5
+
+# Numbers reserved per round trip for documents created in bulk
+DOCUMENT_NUMBER_BLOCKS = {
+    'WO': 20,
+    'QI': 50,
+    'QT': 50,
+    'MR': 20
+}
+
+
+def current_period():
+    return datetime.now().strftime('%Y%m')
+
+
+def format_number(prefix, period, value):
+    return f'{prefix}-{period}-{value:0{NUMBER_DIGITS}d}'
+
+
+def document_key(model, field_name):
+    """The ``table.column`` a counter numbers, '' for numbers stored nowhere known"""
+    if model is None or not field_name:
+        return ''
+    return f'{model.__tablename__}.{field_name}'
+
+
+def block_size(prefix):
+    blocks = DOCUMENT_NUMBER_BLOCKS
+    if has_app_context():
+        blocks = current_app.config.get('DOCUMENT_NUMBER_BLOCKS', blocks)
+    return max(int(blocks.get(prefix, 1)), 1)
+
+
+# ===============================
+# COUNTER ROWS
+# ===============================
+
+def _existing_max(connection, prefix, period, model, field_name):
+    """Highest sequence already used by ``model.field_name`` in the period"""
+    column = getattr(model, field_name, None) if model is not None and field_name else None
+    if column is None:
+        return 0
+    highest = connection.execute(
+        select(func.max(column)).where(column.like(f'{prefix}-{period}-%'))
+    ).scalar()
+    try:
+        return int(highest.rsplit('-', 1)[-1]) if highest else 0
+    except ValueError:
+        return 0
+
+
+def _create_counter(connection, prefix, document, period, seed):
+    """Insert the period's counter row unless a concurrent caller just did"""
+    table = DocumentSequence.__table__
+    values = {
+        'prefix': prefix, 'document': document, 'period': period, 'last_value': seed, 'updated_at': datetime.utcnow()
+    }
+    dialect = connection.dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        connection.execute(insert(table).values(**values).on_conflict_do_nothing(
+            index_elements=[table.c.prefix, table.c.document, table.c.period]
+        ))
+        return
+
+    exists = connection.execute(
+        select(table.c.id).where(table.c.prefix == prefix, table.c.document == document, table.c.period == period)
+    ).first()
+    if exists is None:
+        connection.execute(table.insert().values(**values))
+
+
+def advance_counter(connection, prefix, period, count=1, model=None, field_name=None):
+    """Reserve ``count`` numbers; returns the last one of the reserved range
+
+    The UPDATE locks the counter row until ``connection``'s transaction
+    ends, so concurrent callers are serialized on that row only.
+    """
+    table = DocumentSequence.__table__
+    document = document_key(model, field_name)
+    counter = (table.c.prefix == prefix, table.c.document == document, table.c.period == period)
+    statement = update(table).where(*counter).values(
+        last_value=table.c.last_value + count, updated_at=datetime.utcnow()
+    )
+
+    for _ in range(2):
+        if connection.dialect.update_returning:
+            last_value = connection.execute(statement.returning(table.c.last_value)).scalar()
+        else:
+            result = connection.execute(statement)
+            last_value = connection.execute(
+                select(table.c.last_value).where(*counter)
+            ).scalar() if result.rowcount else None
+        if last_value is not None:
+            return last_value
+        _create_counter(
+            connection, prefix, document, period, _existing_max(connection, prefix, period, model, field_name)
+        )
+
+    raise RuntimeError(f'Could not allocate a {prefix} number for {period}')
+
+
+# ===============================
+# BLOCK CACHE
+# ===============================
+
+class NumberBlocks:
+    """Per-process blocks of reserved numbers, keyed by (prefix, document, period)"""
+
+    def __init__(self):
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, size, reserve):
+        """Next number from the block, calling ``reserve(size)`` for a new block when it is used up"""
+        with self._lock:
+            next_value, last_value = self._blocks.get(key, (1, 0))
+            if next_value > last_value:
+                last_value = reserve(size)
+                next_value = last_value - size + 1
+            self._blocks[key] = (next_value + 1, last_value)
+            return next_value
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+number_blocks = NumberBlocks()
+
+# A forked worker must not hand out the numbers of its parent's blocks
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=number_blocks.clear)
+
+
+def _reserve_block(prefix, period, size, model, field_name):
+    with db.engine.begin() as connection:
+        return advance_counter(connection, prefix, period, size, model, field_name)
+
+
+# ===============================
+# ALLOCATION
+# ===============================
+
+def allocate_number(prefix, model=None, field_name=None):
+    """Next document number for ``prefix`` in the current month
+
+    ``model``/``field_name`` name the column the numbers are stored in;
+    each column has its own sequence, seeded from its existing documents
+    when a period starts.
+    """
+    period = current_period()
+    size = block_size(prefix)
+
+    if size > 1 and db.engine.dialect.name != 'sqlite':
+        value = number_blocks.take(
+            (prefix, document_key(model, field_name), period), size,
+            lambda count: _reserve_block(prefix, period, count, model, field_name)
+        )
+    else:
+        value = advance_counter(db.session.connection(), prefix, period, 1, model, field_name)
+
+    return format_number(prefix, period, value)
@@ -0,0 +1,129 @@
+"""
+Per-process identity and permission cache
+
+Authorization checks read a cached ``Identity`` (active and admin flags,
+role names, permission set) per user instead of loading the user and its
+roles on every request. Entries live for IDENTITY_TTL_SECONDS and are
+dropped as soon as a commit in this process changes a user, a role
+assignment, a role or its permissions; other processes pick the change
+up when their entry expires.
+
+Changes are collected from ORM flushes and from bulk UPDATE / DELETE
+statements on those models, and applied after the commit, so a request
+running concurrently cannot re-cache the state being replaced. The
+cache's version counter keeps an entry computed before an invalidation
+from being stored after it.
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import event, select
+
+from models import db, User, Role, UserRole, Permission, RolePermission
+from services.cache import TTLCache
+
+IDENTITY_TTL_SECONDS = 60
+
+# Changes to these invalidate every identity, since any user may hold the role
+ROLE_MODELS = (Role, RolePermission, Permission)
+
+Identity = namedtuple('Identity', ['user_id', 'is_active', 'is_admin', 'roles', 'permissions'])
+
+identity_cache = TTLCache(IDENTITY_TTL_SECONDS)
+
+
+def _load_identity(user_id):
+    user = db.session.execute(
+        select(User.is_active, User.is_admin).where(User.id == user_id)
+    ).first()
+    if user is None:
+        return None
+
+    roles, permissions = set(), set()
+    rows = db.session.execute(
+        select(Role.name, Permission.name, Permission.resource, Permission.action)
+        .select_from(UserRole)
+        .join(Role, UserRole.role_id == Role.id)
+        .outerjoin(RolePermission, RolePermission.role_id == Role.id)
+        .outerjoin(Permission, RolePermission.permission_id == Permission.id)
+        .where(UserRole.user_id == user_id, Role.is_active == True)
+    )
+    for role_name, permission_name, resource, action in rows:
+        roles.add(role_name)
+        if permission_name:
+            permissions.add(permission_name)
+            permissions.add(f'{resource}.{action}')
+
+    return Identity(
+        user_id=user_id,
+        is_active=bool(user.is_active),
+        is_admin=bool(user.is_admin),
+        roles=frozenset(roles),
+        permissions=frozenset(permissions)
+    )
+
+
+def get_identity(user_id):
+    """Cached Identity of ``user_id`` (the JWT identity), or None for an unknown user"""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    return identity_cache.get(user_id, lambda: _load_identity(user_id)).value
+
+
+def has_permission(identity, permission):
+    """Whether ``identity`` may perform ``permission`` ('module.action')
+
+    Admins hold every permission; ``module.*`` grants every action of a
+    module.
+    """
+    if identity is None or not identity.is_active:
+        return False
+    if identity.is_admin or permission in identity.permissions:
+        return True
+    module = permission.split('.', 1)[0]
+    return f'{module}.*' in identity.permissions
+
+
+# ===============================
+# CHANGE TRACKING
+# ===============================
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_identity_changes(session, flush_context):
+    changed = session.info.setdefault('identities_changed', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+        elif isinstance(obj, UserRole):
+            changed.add(obj.user_id)
+        elif isinstance(obj, ROLE_MODELS):
+            changed.add(None)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _collect_bulk_identity_changes(orm_execute_state):
+    # Query.delete() / update() bypass the flush
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, (User, UserRole) + ROLE_MODELS):
+        orm_execute_state.session.info.setdefault('identities_changed', set()).add(None)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_identities(session):
+    changed = session.info.pop('identities_changed', None)
+    if not changed:
+        return
+    if None in changed:
+        identity_cache.invalidate()
+    else:
+        for user_id in changed:
+            identity_cache.invalidate(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_identity_changes(session):
+    session.info.pop('identities_changed', None)
@@ -0,0 +1,422 @@
+"""
+Machine performance history
+
+A columnar store of per-machine time series, in two layers:
+
+- MachineMetricSample holds one narrow (machine, metric, time, value)
+  row per measured value, tagged with the source row it came from. It
+  is the log the blocks are built from and lets an edited or deleted
+  source row find and replace its samples.
+- MachineMetricBlock packs one month of one metric of a machine into two
+  column arrays (int64 times, float64 values). A year of a metric for 40
+  machines is about 480 block rows, decoded with ``np.frombuffer``
+  instead of tens of thousands of result rows.
+
+Times are whole seconds of local wall-clock time. Range, downsample
+(hour, shift, day, week) and percentile queries run as NumPy / pandas
+operations over the decoded arrays.
+
+Samples are fed from OEERecord, MachinePerformance, ShiftProduction and
+DowntimeRecord in the same flush that writes them, and only the blocks
+whose samples changed are re-encoded. Metric names are prefixed with
+their source (``shift.oee``, ``oee_record.oee``, ...) so series of
+different provenance are never mixed.
+
+``flask machine-history rebuild`` refills both layers from the source
+tables.
+"""
+
+import calendar
+from datetime import datetime, time, timedelta
+from itertools import chain
+
+import click
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, delete, event, insert, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, ShiftProduction, DowntimeRecord
+from models.oee import OEERecord, MachinePerformance, MachineMetricSample, MachineMetricBlock
+from services.oee_engine import shift_window
+
+# Bucket width and offset in seconds; shifts start at 07:00, weeks on Monday
+INTERVALS = {
+    'hour': (3600, 0),
+    'shift': (8 * 3600, 7 * 3600),
+    'day': (86400, 0),
+    'week': (7 * 86400, 4 * 86400)
+}
+AGGREGATES = ('mean', 'min', 'max', 'sum', 'count')
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+REBUILD_BATCH_SIZE = 5000
+
+
+def _midnight(value):
+    return datetime.combine(value.date() if isinstance(value, datetime) else value, time.min)
+
+
+def _shift_start(row):
+    return shift_window(row.production_date, row.shift_start, row.shift_end)[0]
+
+
+# Model -> (source name, sample time, {metric: attribute})
+SOURCES = {
+    OEERecord: ('oee_record', lambda row: _midnight(row.record_date), {
+        'oee_record.oee': 'oee',
+        'oee_record.availability': 'availability',
+        'oee_record.performance': 'performance',
+        'oee_record.quality': 'quality',
+        'oee_record.output': 'total_pieces_produced',
+        'oee_record.good_output': 'good_pieces',
+        'oee_record.downtime_minutes': 'downtime'
+    }),
+    MachinePerformance: ('machine_performance', lambda row: _midnight(row.performance_date), {
+        'performance.oee': 'average_oee',
+        'performance.efficiency': 'efficiency_percentage',
+        'performance.utilization': 'utilization_percentage',
+        'performance.output': 'total_output',
+        'performance.energy_kwh': 'energy_consumed_kwh'
+    }),
+    ShiftProduction: ('shift_production', _shift_start, {
+        'shift.oee': 'oee_score',
+        'shift.output': 'actual_quantity',
+        'shift.good_output': 'good_quantity',
+        'shift.reject_output': 'reject_quantity',
+        'shift.downtime_minutes': 'downtime_minutes'
+    }),
+    DowntimeRecord: ('downtime', lambda row: row.start_time, {
+        'downtime.minutes': 'duration_minutes'
+    })
+}
+METRICS = tuple(metric for _, _, metrics in SOURCES.values() for metric in metrics)
+
+
+def to_ts(value):
+    """Seconds since 1970-01-01 of a naive local datetime (or date)"""
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time.min)
+    return calendar.timegm(value.timetuple())
+
+
+def samples_of(model, row):
+    """Sample rows of one source row; metrics without a value are left out"""
+    source, sampled_at, metrics = SOURCES[model]
+    if row.machine_id is None:
+        return []
+    ts = to_ts(sampled_at(row))
+    return [
+        {'machine_id': row.machine_id, 'metric': metric, 'ts': ts, 'value': float(value),
+         'source': source, 'source_id': row.id}
+        for metric, attribute in metrics.items()
+        for value in (getattr(row, attribute),) if value is not None
+    ]
+
+
+def month_start(ts):
+    """First second of the month containing ``ts``"""
+    moment = datetime.utcfromtimestamp(ts)
+    return calendar.timegm(moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timetuple())
+
+
+def _next_month(period_start):
+    return month_start(period_start + 32 * 86400)
+
+
+def encode_block(ts, values):
+    return {
+        'sample_count': len(ts),
+        'ts_data': np.asarray(ts, dtype='<i8').tobytes(),
+        'value_data': np.asarray(values, dtype='<f8').tobytes()
+    }
+
+
+# ===============================
+# FEED
+# ===============================
+
+samples_table = MachineMetricSample.__table__
+blocks_table = MachineMetricBlock.__table__
+BLOCK_KEY = ('metric', 'machine_id', 'period_start')
+
+INSERT_SAMPLES = insert(samples_table)
+
+DELETE_SOURCE_SAMPLES = delete(samples_table).where(
+    samples_table.c.source == bindparam('key_source'),
+    samples_table.c.source_id == bindparam('key_source_id')
+)
+
+SOURCE_SAMPLE_KEYS = select(samples_table.c.metric, samples_table.c.machine_id, samples_table.c.ts).where(
+    samples_table.c.source == bindparam('source'),
+    samples_table.c.source_id.in_(bindparam('source_ids', expanding=True))
+)
+
+BLOCK_SAMPLES = select(samples_table.c.ts, samples_table.c.value).where(
+    samples_table.c.metric == bindparam('metric'),
+    samples_table.c.machine_id == bindparam('machine_id'),
+    samples_table.c.ts >= bindparam('period_start'),
+    samples_table.c.ts < bindparam('period_end')
+).order_by(samples_table.c.ts)
+
+DELETE_BLOCK = delete(blocks_table).where(
+    *(blocks_table.c[name] == bindparam(f'key_{name}') for name in BLOCK_KEY)
+)
+
+_upsert_statements = {}
+
+
+def _upsert_statement(dialect):
+    """INSERT ... ON CONFLICT (metric, machine, month) DO UPDATE, built once per dialect"""
+    if dialect not in _upsert_statements:
+        insert_for = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert_for(blocks_table)
+        _upsert_statements[dialect] = statement.on_conflict_do_update(
+            index_elements=list(BLOCK_KEY),
+            set_={name: statement.excluded[name] for name in ('sample_count', 'ts_data', 'value_data')}
+        )
+    return _upsert_statements[dialect]
+
+
+def _write_blocks(connection, rows):
+    dialect = connection.dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        connection.execute(_upsert_statement(dialect), rows)
+        return
+
+    # Generic fallback: replace the rows
+    connection.execute(DELETE_BLOCK, [{f'key_{name}': row[name] for name in BLOCK_KEY} for row in rows])
+    connection.execute(insert(blocks_table), rows)
+
+
+def refresh_blocks(connection, keys):
+    """Re-encode the (metric, machine_id, period_start) blocks from their samples"""
+    rows, empty = [], []
+    for metric, machine_id, period_start in sorted(keys):
+        samples = connection.execute(BLOCK_SAMPLES, {
+            'metric': metric, 'machine_id': machine_id,
+            'period_start': period_start, 'period_end': _next_month(period_start)
+        }).all()
+        if samples:
+            ts, values = zip(*samples)
+            rows.append(dict(encode_block(ts, values), metric=metric, machine_id=machine_id, period_start=period_start))
+        else:
+            empty.append({'key_metric': metric, 'key_machine_id': machine_id, 'key_period_start': period_start})
+    if rows:
+        _write_blocks(connection, rows)
+    if empty:
+        connection.execute(DELETE_BLOCK, empty)
+
+
+def _pending(target):
+    session = inspect(target).session
+    return session.info.setdefault('machine_history', {}) if session is not None else {}
+
+
+def _capture_samples(mapper, connection, target):
+    model = mapper.class_
+    _pending(target)[(SOURCES[model][0], target.id)] = samples_of(model, target)
+
+
+def _drop_samples(mapper, connection, target):
+    _pending(target)[(SOURCES[mapper.class_][0], target.id)] = []
+
+
+for _model in SOURCES:
+    event.listen(_model, 'after_insert', _capture_samples)
+    event.listen(_model, 'after_update', _capture_samples)
+    event.listen(_model, 'before_delete', _drop_samples)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _write_samples(session, flush_context):
+    pending = session.info.pop('machine_history', None)
+    if not pending:
+        return
+    connection = session.connection()
+
+    # Blocks holding the replaced samples, then the blocks of the new ones
+    by_source = {}
+    for source, source_id in pending:
+        by_source.setdefault(source, []).append(source_id)
+    blocks = {
+        (metric, machine_id, month_start(ts))
+        for source, source_ids in by_source.items()
+        for metric, machine_id, ts in connection.execute(SOURCE_SAMPLE_KEYS, {'source': source, 'source_ids': source_ids})
+    }
+
+    connection.execute(DELETE_SOURCE_SAMPLES, [
+        {'key_source': source, 'key_source_id': source_id} for source, source_id in pending
+    ])
+    samples = list(chain.from_iterable(pending.values()))
+    if samples:
+        connection.execute(INSERT_SAMPLES, samples)
+    blocks.update((sample['metric'], sample['machine_id'], month_start(sample['ts'])) for sample in samples)
+    refresh_blocks(connection, blocks)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_samples(session):
+    session.info.pop('machine_history', None)
+
+
+# ===============================
+# QUERIES
+# ===============================
+
+def _check_metric(metric):
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'; expected one of: {', '.join(METRICS)}")
+
+
+def load_series(metric, start, end, machine_ids=None):
+    """(machine_ids, ts, values) arrays of ``metric`` samples in [start, end)
+
+    Ordered by machine, then time.
+    """
+    _check_metric(metric)
+    start_ts, end_ts = to_ts(start), to_ts(end)
+    blocks = blocks_table.c
+    statement = select(blocks.machine_id, blocks.sample_count, blocks.ts_data, blocks.value_data).where(
+        blocks.metric == metric,
+        blocks.period_start >= month_start(start_ts),
+        blocks.period_start < end_ts
+    ).order_by(blocks.machine_id, blocks.period_start)
+    if machine_ids:
+        statement = statement.where(blocks.machine_id.in_(machine_ids))
+
+    rows = db.session.execute(statement).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    machines = np.repeat([row.machine_id for row in rows], [row.sample_count for row in rows])
+    ts = np.frombuffer(b''.join(row.ts_data for row in rows), dtype='<i8')
+    values = np.frombuffer(b''.join(row.value_data for row in rows), dtype='<f8')
+    in_range = (ts >= start_ts) & (ts < end_ts)
+    return machines[in_range], ts[in_range], values[in_range]
+
+
+def bucket_starts(ts, interval):
+    """Start of the ``interval`` bucket of each timestamp"""
+    if interval not in INTERVALS:
+        raise ValueError(f"interval must be one of: {', '.join(INTERVALS)}")
+    width, offset = INTERVALS[interval]
+    return (ts - offset) // width * width + offset
+
+
+def _iso(ts):
+    """ISO strings of ``ts``, formatting each distinct time once (buckets repeat across machines)"""
+    unique, inverse = np.unique(ts, return_inverse=True)
+    return np.datetime_as_string(unique.astype('datetime64[s]')).astype(object)[inverse]
+
+
+def downsample(metric, start, end, interval='day', aggregate='mean', machine_ids=None):
+    """{machine_id: {'timestamps': [...], 'values': [...]}} of ``metric`` per ``interval`` bucket"""
+    if aggregate not in AGGREGATES:
+        raise ValueError(f"aggregate must be one of: {', '.join(AGGREGATES)}")
+    machines, ts, values = load_series(metric, start, end, machine_ids)
+    if not len(values):
+        return {}
+
+    grouped = pd.Series(values).groupby([machines, bucket_starts(ts, interval)], sort=True).agg(aggregate)
+    bucket_machines = grouped.index.get_level_values(0).to_numpy()
+    buckets = grouped.index.get_level_values(1).to_numpy()
+    results = np.round(grouped.to_numpy(dtype=np.float64), 4)
+
+    timestamps = _iso(buckets)
+
+    series = {}
+    boundaries = np.flatnonzero(np.diff(bucket_machines)) + 1
+    for indexes in np.split(np.arange(len(buckets)), boundaries):
+        series[int(bucket_machines[indexes[0]])] = {
+            'timestamps': timestamps[indexes].tolist(),
+            'values': results[indexes].tolist()
+        }
+    return series
+
+
+def percentiles(metric, start, end, q=DEFAULT_PERCENTILES, machine_ids=None):
+    """{machine_id: {'p50': ..., 'count': n}} of ``metric`` samples in the range"""
+    machines, _, values = load_series(metric, start, end, machine_ids)
+    if not len(values):
+        return {}
+
+    result = {}
+    boundaries = np.flatnonzero(np.diff(machines)) + 1
+    for machine_values, machine_id in zip(np.split(values, boundaries), machines[np.r_[0, boundaries]]):
+        points = np.percentile(machine_values, q)
+        result[int(machine_id)] = dict(
+            {f'p{p:g}': round(float(point), 4) for p, point in zip(q, points)},
+            count=len(machine_values)
+        )
+    return result
+
+
+def parse_range(start=None, end=None, default_days=30):
+    """(start, end) datetimes from ISO strings; the end date is inclusive when given as a date"""
+    end_at = datetime.fromisoformat(end) if end else datetime.now()
+    if end and len(end) == 10:
+        end_at += timedelta(days=1)
+    start_at = datetime.fromisoformat(start) if start else end_at - timedelta(days=default_days)
+    return start_at, end_at
+
+
+# ===============================
+# REBUILD
+# ===============================
+
+def _rebuild_blocks(connection):
+    """Encode every block from the samples in one ordered scan of the covering index"""
+    connection.execute(delete(blocks_table))
+    samples = samples_table.c
+    for metric in METRICS:
+        rows = connection.execute(
+            select(samples.machine_id, samples.ts, samples.value).where(samples.metric == metric)
+            .order_by(samples.machine_id, samples.ts)
+        ).all()
+        if not rows:
+            continue
+        flat = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * 3).reshape(-1, 3)
+        machines, ts, values = flat[:, 0].astype(np.int64), flat[:, 1].astype(np.int64), flat[:, 2]
+        periods = ts.astype('datetime64[s]').astype('datetime64[M]').astype('datetime64[s]').astype(np.int64)
+
+        boundaries = np.flatnonzero((np.diff(machines) != 0) | (np.diff(periods) != 0)) + 1
+        connection.execute(insert(blocks_table), [
+            dict(encode_block(ts[indexes], values[indexes]), metric=metric,
+                 machine_id=int(machines[indexes[0]]), period_start=int(periods[indexes[0]]))
+            for indexes in np.split(np.arange(len(ts)), boundaries)
+        ])
+
+
+def rebuild_history():
+    """Refill MachineMetricSample and MachineMetricBlock from every source table; returns the sample count"""
+    connection = db.session.connection()
+    connection.execute(delete(samples_table))
+    count = 0
+    for model in SOURCES:
+        batch = []
+        for row in db.session.query(model).yield_per(REBUILD_BATCH_SIZE):
+            batch.extend(samples_of(model, row))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                connection.execute(INSERT_SAMPLES, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            connection.execute(INSERT_SAMPLES, batch)
+            count += len(batch)
+    _rebuild_blocks(connection)
+    db.session.commit()
+    return count
+
+
+def register_commands(app):
+    """Register ``flask machine-history rebuild``"""
+
+    @app.cli.group('machine-history')
+    def machine_history_cli():
+        """Maintain the machine metric history (MachineMetricSample)"""
+
+    @machine_history_cli.command('rebuild')
+    def rebuild_command():
+        count = rebuild_history()
+        click.echo(f'Rebuilt machine history with {count} samples')
@@ -0,0 +1,288 @@
+"""
+Set-based MRP explosion engine
+
+Loads open demand and stock in a handful of bulk queries, takes the BOM
+structure from the cached BOM graph and explodes multi-level BOMs in memory
+in low-level-code order, so the cost of an MRP run no longer grows with one
+query per order line.
+"""
+
+from collections import defaultdict
+
+from sqlalchemy import func
+
+from models import db, Product, SalesOrder, SalesOrderItem, SalesForecast, StockSummary
+from services.bom_graph import bom_graph
+
+CONFIRMED_ORDER_STATUSES = ('confirmed', 'processing')
+FORECAST_STATUSES = ('approved', 'submitted')
+FORECAST_CONFIDENCE_FIELDS = ('best_case', 'most_likely', 'worst_case')
+
+# Keep IN lists well below SQLite's bound-parameter limit
+IN_CLAUSE_CHUNK = 500
+
+
+# ===============================
+# BULK LOADERS
+# ===============================
+
+def _rows_for_ids(query, column, ids):
+    """Run ``query`` unfiltered, or once per IN-list chunk when ``ids`` is given"""
+    if ids is None:
+        return list(query)
+
+    ids = list(set(ids))
+    rows = []
+    for offset in range(0, len(ids), IN_CLAUSE_CHUNK):
+        rows.extend(query.filter(column.in_(ids[offset:offset + IN_CLAUSE_CHUNK])))
+    return rows
+
+
+def load_order_demand(start_date, end_date, product_ids=None):
+    """Load confirmed sales order lines in the horizon with one joined query
+
+    ``product_ids`` restricts the result to lines for those products.
+    """
+    query = db.session.query(
+        SalesOrder.id, SalesOrder.order_number, SalesOrder.order_date, SalesOrder.required_date,
+        SalesOrderItem.product_id, SalesOrderItem.quantity, Product.name
+    ).join(
+        SalesOrderItem, SalesOrderItem.order_id == SalesOrder.id
+    ).join(
+        Product, SalesOrderItem.product_id == Product.id
+    ).filter(
+        SalesOrder.order_date.between(start_date, end_date),
+        SalesOrder.status.in_(CONFIRMED_ORDER_STATUSES)
+    ).order_by(SalesOrder.id, SalesOrderItem.line_number)
+    rows = _rows_for_ids(query, SalesOrderItem.product_id, product_ids)
+
+    return [{
+        'order_id': order_id,
+        'reference': order_number,
+        'order_date': order_date,
+        'required_date': required_date,
+        'product_id': product_id,
+        'product_name': product_name,
+        'quantity': float(quantity or 0)
+    } for order_id, order_number, order_date, required_date, product_id, quantity, product_name in rows]
+
+
+def count_confirmed_orders(start_date, end_date):
+    """Count confirmed sales orders in the horizon"""
+    return db.session.query(func.count(SalesOrder.id)).filter(
+        SalesOrder.order_date.between(start_date, end_date),
+        SalesOrder.status.in_(CONFIRMED_ORDER_STATUSES)
+    ).scalar() or 0
+
+
+def count_forecasts(start_date, end_date):
+    """Count approved/submitted forecasts overlapping the horizon"""
+    return db.session.query(func.count(SalesForecast.id)).filter(
+        SalesForecast.period_start <= end_date,
+        SalesForecast.period_end >= start_date,
+        SalesForecast.status.in_(FORECAST_STATUSES)
+    ).scalar() or 0
+
+
+def load_forecast_demand(start_date, end_date, product_ids=None):
+    """Load approved/submitted forecasts overlapping the horizon
+
+    Every confidence level is returned so callers can pick one per scenario
+    without re-querying. ``period_ratio`` is the share of the forecast period
+    that falls inside the horizon (None when the period is empty).
+    """
+    query = db.session.query(
+        SalesForecast.id, SalesForecast.forecast_number, SalesForecast.product_id,
+        SalesForecast.period_start, SalesForecast.period_end,
+        SalesForecast.best_case, SalesForecast.most_likely, SalesForecast.worst_case,
+        SalesForecast.confidence_level, Product.name
+    ).outerjoin(
+        Product, SalesForecast.product_id == Product.id
+    ).filter(
+        SalesForecast.period_start <= end_date,
+        SalesForecast.period_end >= start_date,
+        SalesForecast.status.in_(FORECAST_STATUSES)
+    ).order_by(SalesForecast.id)
+    rows = _rows_for_ids(query, SalesForecast.product_id, product_ids)
+
+    forecasts = []
+    for (forecast_id, forecast_number, product_id, period_start, period_end,
+         best_case, most_likely, worst_case, confidence_level, product_name) in rows:
+        total_days = (period_end - period_start).days
+        overlap_days = (min(end_date, period_end) - max(start_date, period_start)).days
+
+        forecasts.append({
+            'forecast_id': forecast_id,
+            'reference': forecast_number,
+            'product_id': product_id,
+            'product_name': product_name or 'Unknown',
+            'period_start': period_start,
+            'period_end': period_end,
+            'best_case': float(best_case or 0),
+            'most_likely': float(most_likely or 0),
+            'worst_case': float(worst_case or 0),
+            'confidence_level': confidence_level,
+            'period_ratio': overlap_days / total_days if total_days > 0 else None
+        })
+
+    return forecasts
+
+
+def load_stock_levels(product_ids):
+    """Available stock per product from the stock summary, one query per chunk"""
+    query = db.session.query(StockSummary.product_id, StockSummary.available_quantity)
+
+    return {
+        product_id: float(total or 0)
+        for product_id, total in _rows_for_ids(query, StockSummary.product_id, product_ids)
+    }
+
+
+# ===============================
+# EXPLOSION
+# ===============================
+
+def _new_requirement(component):
+    return {
+        'material_id': component['material_id'],
+        'material_code': component['code'],
+        'material_name': component['name'],
+        'total_quantity': 0,
+        'confirmed_quantity': 0,
+        'forecast_quantity': 0,
+        'uom': component['uom'],
+        'sources': []
+    }
+
+
+def explode_requirements(order_lines, forecasts, boms, items, levels, stock,
+                         forecast_confidence='most_likely', demand_multiplier=1.0):
+    """Explode independent demand through every BOM level
+
+    Top-level demand is exploded gross, exactly like the single-level MRP did.
+    Dependent demand on sub-assemblies is accumulated per product, netted
+    against on-hand stock in low-level-code order and only the shortfall is
+    exploded further down the structure.
+    """
+    requirements = {}
+    dependent = defaultdict(lambda: {'confirmed': 0.0, 'forecast': 0.0, 'name': None})
+
+    def add(component, confirmed_qty, forecast_qty, source):
+        material_id = component['material_id']
+        if material_id not in requirements:
+            requirements[material_id] = _new_requirement(component)
+
+        requirement = requirements[material_id]
+        requirement['total_quantity'] += confirmed_qty + forecast_qty
+        requirement['confirmed_quantity'] += confirmed_qty
+        requirement['forecast_quantity'] += forecast_qty
+        requirement['sources'].append(source)
+
+        sub_assembly_id = component['component_product_id']
+        if sub_assembly_id in boms:
+            dependent[sub_assembly_id]['confirmed'] += confirmed_qty
+            dependent[sub_assembly_id]['forecast'] += forecast_qty
+            dependent[sub_assembly_id]['name'] = component['name']
+
+    # 1. CONFIRMED SALES ORDERS
+    for line in order_lines:
+        bom = boms.get(line['product_id'])
+        if not bom:
+            continue
+
+        quantity_needed = line['quantity'] * demand_multiplier
+        required_date = line['required_date'].isoformat() if line['required_date'] else None
+
+        for component in items.get(bom['id'], []):
+            material_qty = quantity_needed * component['coefficient']
+            add(component, material_qty, 0.0, {
+                'type': 'sales_order',
+                'reference': line['reference'],
+                'product_name': line['product_name'],
+                'quantity': material_qty,
+                'required_date': required_date,
+                'status': 'confirmed'
+            })
+
+    # 2. SALES FORECASTS
+    for forecast in forecasts:
+        bom = boms.get(forecast['product_id']) if forecast['product_id'] else None
+        if not bom or forecast['period_ratio'] is None:
+            continue
+
+        adjusted_quantity = forecast[forecast_confidence] * demand_multiplier * forecast['period_ratio']
+        forecast_period = f"{forecast['period_start'].isoformat()} to {forecast['period_end'].isoformat()}"
+
+        for component in items.get(bom['id'], []):
+            material_qty = adjusted_quantity * component['coefficient']
+            add(component, 0.0, material_qty, {
+                'type': 'sales_forecast',
+                'reference': forecast['reference'],
+                'product_name': forecast['product_name'],
+                'quantity': material_qty,
+                'forecast_period': forecast_period,
+                'confidence': forecast['confidence_level'],
+                'status': 'forecast'
+            })
+
+    # 3. DEPENDENT DEMAND IN LOW-LEVEL-CODE ORDER
+    max_level = max(levels.values(), default=0)
+    for level in range(1, max_level + 1):
+        for product_id in sorted(p for p in list(dependent) if levels.get(p) == level):
+            gross = dependent[product_id]['confirmed'] + dependent[product_id]['forecast']
+            net = gross - stock.get(product_id, 0.0)
+            if gross <= 0 or net <= 0:
+                continue
+
+            scale = net / gross
+            bom = boms[product_id]
+
+            for component in items.get(bom['id'], []):
+                confirmed_qty = dependent[product_id]['confirmed'] * scale * component['coefficient']
+                forecast_qty = dependent[product_id]['forecast'] * scale * component['coefficient']
+                add(component, confirmed_qty, forecast_qty, {
+                    'type': 'dependent_demand',
+                    'reference': bom['bom_number'],
+                    'product_name': dependent[product_id]['name'],
+                    'quantity': confirmed_qty + forecast_qty,
+                    'low_level_code': level,
+                    'status': 'planned'
+                })
+
+    return requirements
+
+
+def apply_stock(requirements, stock):
+    """Attach current stock and net requirement to every exploded line"""
+    for material_id, requirement in requirements.items():
+        current_stock = stock.get(material_id, 0.0)
+        requirement['current_stock'] = current_stock
+        requirement['net_requirement'] = max(0, requirement['total_quantity'] - current_stock)
+    return requirements
+
+
+def calculate_material_requirements(start_date, end_date, include_forecasts=True):
+    """Run a full multi-level MRP explosion for the planning horizon
+
+    Returns a dict with the exploded ``requirements`` list plus the counts the
+    /api/mrp/requirements response reports.
+    """
+    snapshot = bom_graph.snapshot()
+    boms, items, levels = snapshot.boms, snapshot.items, snapshot.levels
+
+    order_lines = load_order_demand(start_date, end_date)
+    forecasts = load_forecast_demand(start_date, end_date) if include_forecasts else []
+
+    # Sub-assembly stock is needed for netting before the deeper levels exist
+    sub_assembly_stock = load_stock_levels(p for p, level in levels.items() if level > 0)
+    requirements = explode_requirements(order_lines, forecasts, boms, items, levels, sub_assembly_stock)
+
+    stock = load_stock_levels(m for m in requirements if m not in sub_assembly_stock)
+    stock.update(sub_assembly_stock)
+    apply_stock(requirements, stock)
+
+    return {
+        'requirements': list(requirements.values()),
+        'confirmed_orders': count_confirmed_orders(start_date, end_date),
+        'forecasts_included': len(forecasts)
+    }
@@ -0,0 +1,301 @@
+"""
+Persisted MRP runs with net-change re-planning
+
+Every requirements calculation is stored as an MRPRun with its lines. A
+later request for the same horizon is answered straight from the latest run
+when none of the rows it depends on changed since the run's watermark.
+Otherwise only the materials reachable from the changed demand and stock
+rows are re-planned ("net change") and merged over the previous run.
+
+Whether anything changed is read from the watched tables themselves when
+a run is requested: each run records every table's row count and highest
+id. Rows inserted since then are counted by id, so a count that does not
+add up means rows were deleted. Rows stamped after the run's watermark
+minus CHANGE_LAG_SECONDS count as changed; the lag covers transactions that
+committed after the run read the tables but stamped their rows before its
+watermark. A deletion, any BOM edit, a change that ``updated_at`` cannot
+attribute to a product or a moved horizon start forces a full run. Writers
+take no shared lock for this, so stock movements and order saves do not
+queue behind each other.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_
+
+from models import (
+    db, MRPRun, MRPRunLine, SalesOrder, SalesOrderItem, SalesForecast,
+    Inventory, BillOfMaterials, BOMItem
+)
+from services.bom_graph import bom_graph
+from services.mrp_engine import (
+    calculate_material_requirements, count_confirmed_orders, count_forecasts, explode_requirements,
+    apply_stock, load_order_demand, load_forecast_demand, load_stock_levels
+)
+
+RUN_MODES = ('auto', 'cached', 'net_change', 'full')
+
+# Tables an MRP run reads; their row counts and highest ids are kept with each run
+WATCHED_TABLES = {
+    'sales_orders': SalesOrder,
+    'sales_order_items': SalesOrderItem,
+    'sales_forecasts': SalesForecast,
+    'inventory': Inventory,
+    'bill_of_materials': BillOfMaterials,
+    'bom_items': BOMItem
+}
+BOM_TABLES = ('bill_of_materials', 'bom_items')
+
+# Rows stamped this long before a run's watermark are looked at again by the next run
+CHANGE_LAG_SECONDS = 30
+
+
+# ===============================
+# TABLE STATES
+# ===============================
+
+def _table_state(model):
+    """Row count, highest id and latest ``updated_at`` of ``model``'s table, in one pass"""
+    count, highest, latest = db.session.query(
+        func.count(model.id), func.max(model.id), func.max(model.updated_at)
+    ).one()
+    return count, highest or 0, latest
+
+
+def current_table_states():
+    """``{table: [row count, highest id]}`` for every watched table"""
+    return {name: list(_table_state(model)[:2]) for name, model in WATCHED_TABLES.items()}
+
+
+# ===============================
+# CHANGE DETECTION
+# ===============================
+
+def detect_changes(run):
+    """Work out what changed since ``run`` was taken
+
+    Returns a dict with ``full_replan`` (a reason string, or None when a
+    net-change run is possible), ``demand_products`` (products whose order
+    lines or forecasts changed), ``stock_items`` (inventory product ids
+    whose stock changed) and the ``table_states`` read for the next run.
+    """
+    changes = {'full_replan': None, 'demand_products': set(), 'stock_items': set(), 'table_states': {}}
+    since = run.watermark - timedelta(seconds=CHANGE_LAG_SECONDS)
+    previous = run.table_states or {}
+    any_touched = False
+
+    for name, model in WATCHED_TABLES.items():
+        count, highest, latest = _table_state(model)
+        changes['table_states'][name] = [count, highest]
+        if name not in previous:
+            changes['full_replan'] = 'run has no table states'
+            continue
+        previous_count, previous_highest = previous[name]
+        inserted = db.session.query(func.count(model.id)).filter(
+            model.id > previous_highest
+        ).scalar() if highest > previous_highest else 0
+        touched = bool(inserted) or (latest is not None and latest > since)
+        if count < previous_count + inserted:
+            changes['full_replan'] = f'rows deleted from {name}'
+        elif count > previous_count + inserted:
+            changes['full_replan'] = f'rows committed out of id order in {name}'
+        elif touched and name in BOM_TABLES:
+            changes['full_replan'] = 'BOM structure changed'
+        any_touched = any_touched or touched
+
+    if run.start_date != datetime.utcnow().date():
+        changes['full_replan'] = 'planning horizon moved'
+    if changes['full_replan'] or not any_touched:
+        return changes
+
+    order_products = db.session.query(SalesOrderItem.product_id).join(
+        SalesOrder, SalesOrderItem.order_id == SalesOrder.id
+    ).filter(
+        or_(SalesOrderItem.updated_at > since, SalesOrder.updated_at > since)
+    ).distinct()
+    forecast_products = db.session.query(SalesForecast.product_id).filter(
+        SalesForecast.updated_at > since,
+        SalesForecast.product_id.isnot(None)
+    ).distinct()
+    stock_items = db.session.query(Inventory.product_id).filter(
+        Inventory.updated_at > since
+    ).distinct()
+
+    changes['demand_products'] = {p for p, in order_products} | {p for p, in forecast_products}
+    changes['stock_items'] = {p for p, in stock_items}
+    if not (changes['demand_products'] or changes['stock_items']):
+        # Inserted with an old stamp, or committed later than the lag allows
+        changes['full_replan'] = 'changes not attributable to products'
+    return changes
+
+
+def has_changes(changes):
+    return bool(changes['full_replan'] or changes['demand_products'] or changes['stock_items'])
+
+
+# ===============================
+# RUNS
+# ===============================
+
+def latest_run(start_date, days_ahead, include_forecasts):
+    return MRPRun.query.filter_by(
+        start_date=start_date,
+        days_ahead=days_ahead,
+        include_forecasts=include_forecasts,
+        status='completed'
+    ).order_by(MRPRun.id.desc()).first()
+
+
+def _net_change_requirements(run, changes, start_date, end_date):
+    """Re-plan only the materials affected by ``changes`` on top of ``run``
+
+    A material is affected when it sits below a product whose demand
+    changed, below a sub-assembly whose stock changed, or its own stock
+    changed. Every product whose structure contains an affected material is
+    re-exploded so that the affected totals, and the sub-assembly netting
+    above them, see their complete demand.
+    """
+    snapshot = bom_graph.snapshot()
+    boms, items, levels = snapshot.boms, snapshot.items, snapshot.levels
+
+    affected = set(changes['stock_items'])
+    for product_id in changes['demand_products'] | changes['stock_items']:
+        if product_id in boms:
+            affected |= snapshot.descendants(product_id)
+
+    products = {p for p in boms if not affected.isdisjoint(snapshot.descendants(p))}
+    if products:
+        order_lines = load_order_demand(start_date, end_date, product_ids=products)
+        forecasts = load_forecast_demand(start_date, end_date, product_ids=products) if run.include_forecasts else []
+    else:
+        order_lines, forecasts = [], []
+
+    sub_assembly_stock = load_stock_levels(p for p, level in levels.items() if level > 0)
+    exploded = explode_requirements(order_lines, forecasts, boms, items, levels, sub_assembly_stock)
+    recomputed = {m: r for m, r in exploded.items() if m in affected}
+
+    stock = load_stock_levels(recomputed)
+    apply_stock(recomputed, stock)
+
+    requirements = [
+        line.to_requirement() for line in run.lines if line.material_id not in affected
+    ]
+    requirements.extend(recomputed.values())
+    requirements.sort(key=lambda r: r['material_id'])
+
+    # Forecast count covers the whole horizon, not just the re-planned products
+    forecasts_included = count_forecasts(start_date, end_date) if run.include_forecasts else 0
+    return requirements, len(affected), forecasts_included
+
+
+def _save_run(mode, base_run, start_date, end_date, days_ahead, include_forecasts,
+              watermark, table_states, requirements, confirmed_orders, forecasts_included,
+              changed_products, recomputed_materials, started, user_id):
+    run = MRPRun(
+        run_number=f"MRP-{watermark.strftime('%Y%m%d%H%M%S%f')}",
+        mode=mode,
+        base_run_id=base_run.id if base_run else None,
+        start_date=start_date,
+        end_date=end_date,
+        days_ahead=days_ahead,
+        include_forecasts=include_forecasts,
+        watermark=watermark,
+        table_states=table_states,
+        total_materials=len(requirements),
+        confirmed_orders=confirmed_orders,
+        forecasts_included=forecasts_included,
+        changed_products=changed_products,
+        recomputed_materials=recomputed_materials,
+        created_by=user_id
+    )
+    db.session.add(run)
+    db.session.flush()
+
+    if requirements:
+        db.session.execute(MRPRunLine.__table__.insert(), [{
+            'run_id': run.id,
+            'material_id': r['material_id'],
+            'material_code': r['material_code'],
+            'material_name': r['material_name'],
+            'uom': r['uom'],
+            'confirmed_quantity': r['confirmed_quantity'],
+            'forecast_quantity': r['forecast_quantity'],
+            'total_quantity': r['total_quantity'],
+            'current_stock': r['current_stock'],
+            'net_requirement': r['net_requirement'],
+            'sources': r['sources']
+        } for r in requirements])
+
+    if base_run is not None:
+        base_run.status = 'superseded'
+
+    run.duration_ms = int((time.perf_counter() - started) * 1000)
+    db.session.commit()
+    return run
+
+
+def get_requirements_run(start_date, end_date, days_ahead, include_forecasts, mode='auto', user_id=None):
+    """Return ``(run, requirements)`` for the horizon
+
+    ``auto`` serves the latest run when nothing changed and runs a net
+    change (or a full run when one is required) otherwise. ``cached``
+    always serves the latest run if there is one, ``net_change`` skips the
+    unchanged shortcut and ``full`` recalculates everything.
+    """
+    if mode not in RUN_MODES:
+        raise ValueError(f"mode must be one of: {', '.join(RUN_MODES)}")
+
+    started = time.perf_counter()
+    watermark = datetime.utcnow()
+    base_run = latest_run(start_date, days_ahead, include_forecasts) if mode != 'full' else None
+
+    if base_run is not None and mode == 'cached':
+        return base_run, [line.to_requirement() for line in base_run.lines]
+
+    changes = detect_changes(base_run) if base_run is not None else None
+
+    if base_run is not None and mode == 'auto' and not has_changes(changes):
+        return base_run, [line.to_requirement() for line in base_run.lines]
+
+    if base_run is None or changes['full_replan']:
+        # Table states are read before calculating so later writes show up as changes
+        table_states = current_table_states() if base_run is None else changes['table_states']
+        result = calculate_material_requirements(start_date, end_date, include_forecasts)
+        run = _save_run(
+            'full', base_run, start_date, end_date, days_ahead, include_forecasts,
+            watermark, table_states, result['requirements'], result['confirmed_orders'],
+            result['forecasts_included'], 0, len(result['requirements']), started, user_id
+        )
+        return run, result['requirements']
+
+    requirements, recomputed, forecasts_included = _net_change_requirements(
+        base_run, changes, start_date, end_date
+    )
+    run = _save_run(
+        'net_change', base_run, start_date, end_date, days_ahead, include_forecasts,
+        watermark, changes['table_states'], requirements, count_confirmed_orders(start_date, end_date),
+        forecasts_included, len(changes['demand_products']), recomputed, started, user_id
+    )
+    return run, requirements
+
+
+def serialize_run(run):
+    return {
+        'id': run.id,
+        'run_number': run.run_number,
+        'mode': run.mode,
+        'base_run_id': run.base_run_id,
+        'start_date': run.start_date.isoformat(),
+        'end_date': run.end_date.isoformat(),
+        'days_ahead': run.days_ahead,
+        'include_forecasts': run.include_forecasts,
+        'total_materials': run.total_materials,
+        'confirmed_orders': run.confirmed_orders,
+        'forecasts_included': run.forecasts_included,
+        'changed_products': run.changed_products,
+        'recomputed_materials': run.recomputed_materials,
+        'duration_ms': run.duration_ms,
+        'status': run.status,
+        'created_at': run.created_at.isoformat() if run.created_at else None
+    }
@@ -0,0 +1,457 @@
+"""
+Time-phased MRP
+
+Buckets gross requirements (by required date), scheduled receipts (open
+purchase order lines) and projected on-hand per item into daily or weekly
+buckets, nets them lot-for-lot and offsets planned orders by lead time. The
+planned order releases of a parent become the gross requirements of its
+components, level by level in low-level-code order.
+
+Plans are kept per process. When a sales order is confirmed only the items
+touched by that order, and the components whose planned releases actually
+change as a result, are re-netted.
+"""
+
+import heapq
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import object_session
+
+from models import (
+    db, Product, StockSummary, SalesOrder, SalesOrderItem,
+    PurchaseOrder, PurchaseOrderItem
+)
+from services.bom_graph import bom_graph
+from services.mrp_engine import CONFIRMED_ORDER_STATUSES, load_forecast_demand
+
+OPEN_PO_STATUSES = ('sent', 'confirmed', 'partial')
+BUCKET_DAYS = {'day': 1, 'week': 7}
+
+# Inventory and purchase orders are not tracked incrementally, so a cached
+# plan is fully rebuilt after this many seconds
+MAX_PLAN_AGE_SECONDS = 15 * 60
+
+
+class BucketCalendar:
+    """Maps dates onto fixed-size planning buckets"""
+
+    def __init__(self, start_date, bucket, days_ahead):
+        self.bucket = bucket
+        self.bucket_days = BUCKET_DAYS[bucket]
+        # Weekly buckets start on Monday
+        self.start_date = start_date - timedelta(days=start_date.weekday()) if bucket == 'week' else start_date
+        self.end_date = start_date + timedelta(days=days_ahead)
+        self.count = (self.end_date - self.start_date).days // self.bucket_days + 1
+
+    def index(self, day):
+        """Bucket for ``day``; past-due dates land in the first bucket"""
+        if day is None or day > self.end_date:
+            return None
+        return max(0, (day - self.start_date).days // self.bucket_days)
+
+    def lead_buckets(self, lead_time_days):
+        return math.ceil((lead_time_days or 0) / self.bucket_days)
+
+    def periods(self):
+        return [{
+            'index': i,
+            'start': (self.start_date + timedelta(days=i * self.bucket_days)).isoformat(),
+            'end': (self.start_date + timedelta(days=(i + 1) * self.bucket_days - 1)).isoformat()
+        } for i in range(self.count)]
+
+
+class TimePhasedPlan:
+    """Per-item bucket arrays for one bucket size / horizon / forecast setting"""
+
+    def __init__(self, calendar, include_forecasts, snapshot):
+        self.calendar = calendar
+        self.include_forecasts = include_forecasts
+        self.snapshot = snapshot
+        self.bom_version = snapshot.version
+        self.generated_at = datetime.utcnow()
+        self.updated_at = self.generated_at
+        self.created_monotonic = time.monotonic()
+        self.incremental_updates = 0
+        self.records = {}
+        self.levels = self._item_levels()
+        self.lock = threading.Lock()
+
+    def _item_levels(self):
+        """Low-level code for every item reachable through an active BOM"""
+        levels = {('product', product_id): level for product_id, level in self.snapshot.levels.items()}
+        for product_id in sorted(self.snapshot.boms, key=lambda p: self.snapshot.levels[p]):
+            parent_level = levels[('product', product_id)]
+            for component in self.snapshot.components(product_id):
+                key = component_key(component)
+                levels[key] = max(levels.get(key, 0), parent_level + 1)
+        return levels
+
+    def record(self, key, meta=None):
+        record = self.records.get(key)
+        if record is None:
+            count = self.calendar.count
+            record = self.records[key] = {
+                'key': key,
+                'code': None,
+                'name': None,
+                'uom': None,
+                'on_hand': 0.0,
+                'lead_time_days': 0,
+                'independent': np.zeros(count),
+                'dependent': np.zeros(count),
+                'receipts': np.zeros(count),
+                'projected': np.zeros(count),
+                'planned_receipts': np.zeros(count),
+                'planned_releases': np.zeros(count),
+                'past_due_release': 0.0
+            }
+        if meta:
+            for field in ('code', 'name', 'uom'):
+                if record[field] is None and meta.get(field) is not None:
+                    record[field] = meta[field]
+        return record
+
+    def _net(self, record):
+        """Lot-for-lot netting with lead-time offset for one item"""
+        gross = record['independent'] + record['dependent']
+        available = record['on_hand'] + np.cumsum(record['receipts'] - gross)
+        planned_cumulative = np.maximum.accumulate(np.maximum(0.0, -available))
+        planned_receipts = np.diff(planned_cumulative, prepend=0.0)
+
+        lead = self.calendar.lead_buckets(record['lead_time_days'])
+        releases = np.zeros_like(planned_receipts)
+        if lead:
+            releases[:-lead or None] = planned_receipts[lead:]
+            # Orders that should already have been released
+            past_due = planned_receipts[:lead].sum()
+            releases[0] += past_due
+        else:
+            releases = planned_receipts.copy()
+            past_due = 0.0
+
+        record['projected'] = available + planned_cumulative
+        record['planned_receipts'] = planned_receipts
+        record['planned_releases'] = releases
+        record['past_due_release'] = float(past_due)
+
+    def renet(self, keys):
+        """Re-net ``keys`` and cascade release changes down the BOM
+
+        Items are processed in low-level-code order; a component is only
+        revisited when its parent's planned releases actually changed.
+        """
+        heap = [(self.levels.get(key, 0), key) for key in set(keys)]
+        heapq.heapify(heap)
+        queued = set(keys)
+        renetted = 0
+
+        while heap:
+            _, key = heapq.heappop(heap)
+            queued.discard(key)
+            record = self.record(key)
+            previous_releases = record['planned_releases']
+            self._net(record)
+            renetted += 1
+
+            kind, item_id = key
+            if kind != 'product' or item_id not in self.snapshot.boms:
+                continue
+
+            delta = record['planned_releases'] - previous_releases
+            if not delta.any():
+                continue
+
+            for component in self.snapshot.components(item_id):
+                child_key = component_key(component)
+                child = self.record(child_key, component)
+                child['dependent'] += delta * component['coefficient']
+                if child_key not in queued:
+                    queued.add(child_key)
+                    heapq.heappush(heap, (self.levels.get(child_key, 0), child_key))
+
+        return renetted
+
+    def serialize(self, item_type=None, item_id=None):
+        records = []
+        for (kind, key_id), record in sorted(self.records.items(), key=lambda r: (self.levels.get(r[0], 0), r[0])):
+            if item_type and kind != item_type:
+                continue
+            if item_id and key_id != item_id:
+                continue
+            gross = record['independent'] + record['dependent']
+            if not gross.any() and not record['planned_receipts'].any():
+                continue
+
+            records.append({
+                'item_type': kind,
+                'item_id': key_id,
+                'code': record['code'],
+                'name': record['name'],
+                'uom': record['uom'],
+                'low_level_code': self.levels.get((kind, key_id), 0),
+                'lead_time_days': record['lead_time_days'],
+                'on_hand': record['on_hand'],
+                'gross_requirements': gross.tolist(),
+                'scheduled_receipts': record['receipts'].tolist(),
+                'projected_on_hand': record['projected'].tolist(),
+                'planned_order_receipts': record['planned_receipts'].tolist(),
+                'planned_order_releases': record['planned_releases'].tolist(),
+                'past_due_release': record['past_due_release']
+            })
+
+        return {
+            'buckets': self.calendar.periods(),
+            'records': records,
+            'plan': {
+                'bucket': self.calendar.bucket,
+                'include_forecasts': self.include_forecasts,
+                'generated_at': self.generated_at.isoformat(),
+                'updated_at': self.updated_at.isoformat(),
+                'incremental_updates': self.incremental_updates,
+                'bom_version': self.bom_version
+            }
+        }
+
+
+def component_key(component):
+    if component['is_material']:
+        return ('material', component['material_id'])
+    return ('product', component['component_product_id'])
+
+
+# ===============================
+# LOADERS
+# ===============================
+
+def _demand_due_date():
+    return func.coalesce(SalesOrderItem.required_date, SalesOrder.required_date, SalesOrder.order_date)
+
+
+def load_open_order_demand(end_date, order_ids=None):
+    """Open (unshipped) quantity of confirmed order lines by due date"""
+    due_date = _demand_due_date()
+    query = db.session.query(
+        SalesOrderItem.product_id, SalesOrderItem.quantity, SalesOrderItem.quantity_shipped,
+        due_date, Product.code, Product.name, Product.primary_uom
+    ).join(
+        SalesOrder, SalesOrderItem.order_id == SalesOrder.id
+    ).join(
+        Product, SalesOrderItem.product_id == Product.id
+    ).filter(
+        SalesOrder.status.in_(CONFIRMED_ORDER_STATUSES),
+        due_date <= end_date
+    )
+    if order_ids is not None:
+        query = query.filter(SalesOrder.id.in_(order_ids))
+
+    return [{
+        'key': ('product', product_id),
+        'quantity': float(quantity or 0) - float(shipped or 0),
+        'due_date': due,
+        'meta': {'code': code, 'name': name, 'uom': uom}
+    } for product_id, quantity, shipped, due, code, name, uom in query]
+
+
+def load_scheduled_receipts():
+    """Open purchase order quantity per item by expected receipt date"""
+    rows = db.session.query(
+        PurchaseOrderItem.material_id, PurchaseOrderItem.product_id,
+        PurchaseOrderItem.quantity, PurchaseOrderItem.quantity_received,
+        PurchaseOrder.expected_date, PurchaseOrderItem.required_date,
+        PurchaseOrder.required_date, PurchaseOrder.order_date
+    ).join(
+        PurchaseOrder, PurchaseOrderItem.po_id == PurchaseOrder.id
+    ).filter(
+        PurchaseOrder.status.in_(OPEN_PO_STATUSES)
+    )
+
+    receipts = []
+    for (material_id, product_id, quantity, received,
+         expected_date, line_required_date, po_required_date, order_date) in rows:
+        open_quantity = float(quantity or 0) - float(received or 0)
+        if open_quantity <= 0:
+            continue
+        receipts.append({
+            'key': ('material', material_id) if material_id else ('product', product_id),
+            'quantity': open_quantity,
+            'due_date': expected_date or line_required_date or po_required_date or order_date
+        })
+    return receipts
+
+
+def load_all_stock_levels():
+    """Available quantity per product, read from the stock summary"""
+    rows = db.session.query(StockSummary.product_id, StockSummary.available_quantity)
+    return {product_id: float(total or 0) for product_id, total in rows}
+
+
+# ===============================
+# PLAN BUILDING
+# ===============================
+
+def _add_demand(plan, demand_rows):
+    """Bucket demand rows into independent requirements; returns touched keys"""
+    touched = set()
+    for row in demand_rows:
+        bucket = plan.calendar.index(row['due_date'])
+        if bucket is None or row['quantity'] <= 0:
+            continue
+        record = plan.record(row['key'], row['meta'])
+        record['independent'][bucket] += row['quantity']
+        touched.add(row['key'])
+    return touched
+
+
+def _add_forecasts(plan, start_date):
+    """Spread forecast quantities evenly over the days of their period"""
+    calendar = plan.calendar
+    touched = set()
+    for forecast in load_forecast_demand(start_date, calendar.end_date):
+        product_id = forecast['product_id']
+        total_days = (forecast['period_end'] - forecast['period_start']).days
+        if not product_id or total_days <= 0 or not forecast['most_likely']:
+            continue
+
+        per_day = forecast['most_likely'] / total_days
+        record = plan.record(('product', product_id), {'name': forecast['product_name']})
+        day = max(start_date, forecast['period_start'])
+        last_day = min(calendar.end_date, forecast['period_end'] - timedelta(days=1))
+        while day <= last_day:
+            record['independent'][calendar.index(day)] += per_day
+            day += timedelta(days=1)
+        touched.add(('product', product_id))
+    return touched
+
+
+def build_plan(start_date, bucket='week', days_ahead=90, include_forecasts=False):
+    """Build a complete time-phased plan from scratch"""
+    snapshot = bom_graph.snapshot()
+    calendar = BucketCalendar(start_date, bucket, days_ahead)
+    plan = TimePhasedPlan(calendar, include_forecasts, snapshot)
+
+    # Item master data and lead times from the BOM graph
+    for product_id, header in snapshot.boms.items():
+        record = plan.record(('product', product_id), {
+            'code': header['product_code'], 'name': header['product_name'], 'uom': header['batch_uom']
+        })
+        record['lead_time_days'] = header['lead_time_days']
+    for product_id in snapshot.boms:
+        for component in snapshot.components(product_id):
+            key = component_key(component)
+            record = plan.record(key, component)
+            if key[0] == 'material' or key[1] not in snapshot.boms:
+                record['lead_time_days'] = max(record['lead_time_days'], component['effective_lead_time_days'])
+
+    touched = _add_demand(plan, load_open_order_demand(calendar.end_date))
+    if include_forecasts:
+        touched |= _add_forecasts(plan, start_date)
+
+    for receipt in load_scheduled_receipts():
+        bucket_index = calendar.index(receipt['due_date'])
+        if bucket_index is not None:
+            plan.record(receipt['key'])['receipts'][bucket_index] += receipt['quantity']
+            touched.add(receipt['key'])
+
+    stock = load_all_stock_levels()
+    for (kind, item_id), record in plan.records.items():
+        record['on_hand'] = stock.get(item_id, 0.0)
+
+    plan.renet(touched | set(plan.records))
+    return plan
+
+
+# ===============================
+# PLAN CACHE AND INCREMENTAL UPDATES
+# ===============================
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def _plan_is_current(plan, start_date):
+    return (
+        plan.calendar.start_date == BucketCalendar(start_date, plan.calendar.bucket, 0).start_date
+        and plan.bom_version == bom_graph.version
+        and time.monotonic() - plan.created_monotonic < MAX_PLAN_AGE_SECONDS
+    )
+
+
+def get_plan(start_date, bucket='week', days_ahead=90, include_forecasts=False, refresh=False):
+    """Return the cached plan for these settings, rebuilding it when stale"""
+    cache_key = (bucket, days_ahead, include_forecasts)
+    plan = _plans.get(cache_key)
+    if plan is not None and not refresh and _plan_is_current(plan, start_date):
+        return plan
+
+    plan = build_plan(start_date, bucket, days_ahead, include_forecasts)
+    with _plans_lock:
+        _plans[cache_key] = plan
+    return plan
+
+
+def apply_confirmed_orders(demand_rows):
+    """Fold newly confirmed order lines into every cached plan"""
+    for plan in list(_plans.values()):
+        with plan.lock:
+            touched = _add_demand(plan, demand_rows)
+            if touched:
+                plan.renet(touched)
+                plan.incremental_updates += 1
+                plan.updated_at = datetime.utcnow()
+
+
+def _order_newly_confirmed(target, check_history):
+    if target.status not in CONFIRMED_ORDER_STATUSES:
+        return False
+    if not check_history:
+        return True
+    history = inspect(target).attrs.status.history
+    previous = history.deleted[0] if history.deleted else None
+    return history.has_changes() and previous not in CONFIRMED_ORDER_STATUSES
+
+
+def _mark_confirmed(target, check_history):
+    if not _plans or not _order_newly_confirmed(target, check_history):
+        return
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('mrp_confirmed_orders', set()).add(target.id)
+
+
+@event.listens_for(SalesOrder, 'after_insert')
+def _sales_order_inserted(mapper, connection, target):
+    _mark_confirmed(target, check_history=False)
+
+
+@event.listens_for(SalesOrder, 'after_update')
+def _sales_order_updated(mapper, connection, target):
+    _mark_confirmed(target, check_history=True)
+
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def _collect_confirmed_demand(session, flush_context):
+    """Read the confirmed lines while the transaction can still emit SQL"""
+    order_ids = session.info.pop('mrp_confirmed_orders', None)
+    if not order_ids or not _plans:
+        return
+    end_date = max(plan.calendar.end_date for plan in _plans.values())
+    rows = load_open_order_demand(end_date, order_ids=list(order_ids))
+    session.info.setdefault('mrp_confirmed_demand', []).extend(rows)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_confirmed_demand(session):
+    rows = session.info.pop('mrp_confirmed_demand', None)
+    if rows:
+        apply_confirmed_orders(rows)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_confirmed_demand(session):
+    session.info.pop('mrp_confirmed_orders', None)
+    session.info.pop('mrp_confirmed_demand', None)
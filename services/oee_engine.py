@@ -0,0 +1,419 @@
+"""
+OEE calculation engine
+
+One definition of availability, performance, quality and OEE for every
+place that reports them (shift production input, hand-entered OEE
+records, machine efficiency, TV displays):
+
+- availability = run time / planned time, run time = planned - downtime
+- performance  = output / (Machine.capacity_per_hour x run time), or
+  output / target quantity when the machine has no capacity; capped at
+  100% so an understated capacity cannot hide availability or quality
+  losses
+- quality      = good output / output
+
+ShiftOEE keeps one row per machine and shift with the totals of the
+shift's ShiftProduction and DowntimeRecord rows. It is refreshed in the
+same flush as production input, so the running OEE of the current shift
+is a single-row computation (see ``running_metrics``) instead of an
+aggregation over production and downtime records. Downtime of a shift
+production is the larger of its ``downtime_minutes`` and the closed
+DowntimeRecord durations linked to it, so downtime entered either way is
+counted once.
+
+``flask shift-oee rebuild`` recreates the table from the source rows.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import bindparam, delete, event, func, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Machine, ShiftProduction, DowntimeRecord
+from models.oee import ShiftOEE
+
+OEEMetrics = namedtuple('OEEMetrics', ['availability', 'performance', 'quality', 'oee'])
+
+
+# ===============================
+# CALCULATION
+# ===============================
+
+def calculate_oee(planned_minutes, downtime_minutes, total_quantity, good_quantity, ideal_rate=None, target_quantity=None):
+    """OEEMetrics (percentages) of one period of production
+
+    ``ideal_rate`` is the machine's capacity in units per hour;
+    ``target_quantity`` the output expected over ``planned_minutes``, used
+    when the ideal rate is unknown. Without either, performance is taken
+    as 100%.
+    """
+    planned = max(float(planned_minutes or 0), 0)
+    downtime = min(max(float(downtime_minutes or 0), 0), planned)
+    total = float(total_quantity or 0)
+    good = float(good_quantity or 0)
+    run = planned - downtime
+
+    availability = run / planned * 100 if planned else 0
+    if ideal_rate:
+        expected = float(ideal_rate) * run / 60
+        performance = total / expected * 100 if expected else 0
+    elif target_quantity:
+        performance = total / float(target_quantity) * 100
+    else:
+        performance = 100
+    performance = min(performance, 100.0)
+    quality = good / total * 100 if total else 0
+
+    return OEEMetrics(
+        availability=round(availability, 2),
+        performance=round(performance, 2),
+        quality=round(quality, 2),
+        oee=round(availability * performance * quality / 10000, 2)
+    )
+
+
+def machine_ideal_rate(machine_id):
+    """Machine.capacity_per_hour of ``machine_id``, or None"""
+    rate = db.session.execute(select(Machine.capacity_per_hour).where(Machine.id == machine_id)).scalar()
+    return float(rate) if rate else None
+
+
+def shift_production_oee(shift_production):
+    """OEEMetrics of a single ShiftProduction, at its machine's ideal rate"""
+    return calculate_oee(
+        shift_production.planned_runtime, shift_production.downtime_minutes,
+        shift_production.actual_quantity, shift_production.good_quantity,
+        machine_ideal_rate(shift_production.machine_id), shift_production.target_quantity
+    )
+
+
+def shift_window(production_date, shift_start, shift_end):
+    """(start, end) datetimes of a shift; a shift ending at or before its start ends the next day"""
+    start = datetime.combine(production_date, shift_start)
+    end = datetime.combine(production_date, shift_end)
+    if end <= start:
+        end += timedelta(days=1)
+    return start, end
+
+
+def running_metrics(row, now=None):
+    """OEEMetrics of a ShiftOEE row as of ``now``
+
+    While the shift is in progress only the time elapsed so far is
+    planned, downtime still open counts up to ``now`` and the target is
+    prorated; after the shift this equals the stored metrics.
+    """
+    now = now or datetime.now()
+    planned_minutes = row.planned_minutes or 0
+    elapsed = max((min(now, row.shift_end_at) - row.shift_start_at).total_seconds() / 60, 0)
+    planned = min(planned_minutes, elapsed) if now < row.shift_end_at else planned_minutes
+
+    downtime = row.downtime_minutes or 0
+    if row.open_downtime_since is not None and row.open_downtime_since < now:
+        downtime += (now - row.open_downtime_since).total_seconds() / 60
+
+    target = float(row.target_quantity or 0) * planned / planned_minutes if planned_minutes else 0
+    return calculate_oee(planned, downtime, row.total_quantity, row.good_quantity, row.ideal_rate, target)
+
+
+# ===============================
+# SHIFT TOTALS
+# ===============================
+
+# Built once: constructing these per shift costs more than running them
+SHIFT_PRODUCTIONS = select(
+    ShiftProduction.id,
+    ShiftProduction.shift_start,
+    ShiftProduction.shift_end,
+    ShiftProduction.planned_runtime,
+    ShiftProduction.downtime_minutes,
+    ShiftProduction.target_quantity,
+    ShiftProduction.actual_quantity,
+    ShiftProduction.good_quantity,
+    ShiftProduction.reject_quantity
+).where(
+    ShiftProduction.machine_id == bindparam('machine_id'),
+    ShiftProduction.production_date == bindparam('production_date'),
+    ShiftProduction.shift == bindparam('shift'),
+    ShiftProduction.status.is_distinct_from('cancelled')
+).order_by(ShiftProduction.id)
+
+SHIFT_DOWNTIME = select(
+    DowntimeRecord.shift_production_id,
+    DowntimeRecord.end_time.is_(None),
+    func.coalesce(func.sum(DowntimeRecord.duration_minutes), 0),
+    func.min(DowntimeRecord.start_time)
+).where(
+    DowntimeRecord.shift_production_id.in_(bindparam('production_ids', expanding=True))
+).group_by(DowntimeRecord.shift_production_id, DowntimeRecord.end_time.is_(None))
+
+MACHINE_RATE = select(Machine.capacity_per_hour).where(Machine.id == bindparam('machine_id'))
+
+SHIFT_KEY = ('machine_id', 'production_date', 'shift')
+
+DELETE_SHIFT = delete(ShiftOEE.__table__).where(
+    *(ShiftOEE.__table__.c[name] == bindparam(f'key_{name}') for name in SHIFT_KEY)
+)
+
+PRODUCTION_KEYS = select(ShiftProduction.machine_id, ShiftProduction.production_date, ShiftProduction.shift).where(
+    ShiftProduction.id.in_(bindparam('production_ids', expanding=True))
+)
+
+
+def _shift_values(connection, machine_id, production_date, shift):
+    productions = connection.execute(SHIFT_PRODUCTIONS, {
+        'machine_id': machine_id, 'production_date': production_date, 'shift': shift
+    }).all()
+    if not productions:
+        return None
+
+    closed, open_since = {}, None
+    for production_id, is_open, minutes, started in connection.execute(
+        SHIFT_DOWNTIME, {'production_ids': [p.id for p in productions]}
+    ):
+        if is_open:
+            # Downtime without an end time has no duration yet; keep when the earliest began
+            open_since = started if open_since is None else min(open_since, started)
+        else:
+            closed[production_id] = int(minutes)
+
+    planned = sum(p.planned_runtime or 0 for p in productions)
+    downtime = sum(max(p.downtime_minutes or 0, closed.get(p.id, 0)) for p in productions)
+    target = sum(float(p.target_quantity or 0) for p in productions)
+    total = sum(float(p.actual_quantity or 0) for p in productions)
+    good = sum(float(p.good_quantity or 0) for p in productions)
+    rejected = sum(float(p.reject_quantity or 0) for p in productions)
+    rate = connection.execute(MACHINE_RATE, {'machine_id': machine_id}).scalar()
+    rate = float(rate) if rate else None
+    shift_start_at, shift_end_at = shift_window(production_date, productions[0].shift_start, productions[0].shift_end)
+    metrics = calculate_oee(planned, downtime, total, good, rate, target)
+
+    return {
+        'machine_id': machine_id,
+        'production_date': production_date,
+        'shift': shift,
+        'shift_start_at': shift_start_at,
+        'shift_end_at': shift_end_at,
+        'production_count': len(productions),
+        'planned_minutes': planned,
+        'downtime_minutes': downtime,
+        'open_downtime_since': open_since,
+        'target_quantity': target,
+        'total_quantity': total,
+        'good_quantity': good,
+        'reject_quantity': rejected,
+        'ideal_rate': rate,
+        'availability': metrics.availability,
+        'performance': metrics.performance,
+        'quality': metrics.quality,
+        'oee': metrics.oee,
+        'updated_at': datetime.utcnow()
+    }
+
+
+_upsert_statements = {}
+
+
+def _upsert_statement(dialect):
+    """INSERT ... ON CONFLICT (machine, date, shift) DO UPDATE, built once per dialect"""
+    if dialect not in _upsert_statements:
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(ShiftOEE.__table__)
+        _upsert_statements[dialect] = statement.on_conflict_do_update(
+            index_elements=list(SHIFT_KEY),
+            set_={
+                column.name: statement.excluded[column.name] for column in ShiftOEE.__table__.columns
+                if column.name not in SHIFT_KEY + ('id', 'created_at')
+            }
+        )
+    return _upsert_statements[dialect]
+
+
+def _upsert_shifts(connection, rows):
+    dialect = connection.dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        connection.execute(_upsert_statement(dialect), rows)
+        return
+
+    # Generic fallback: update, then insert when the row does not exist yet
+    table = ShiftOEE.__table__
+    for values in rows:
+        changes = {name: value for name, value in values.items() if name not in SHIFT_KEY}
+        result = connection.execute(update(table).where(
+            *(table.c[name] == values[name] for name in SHIFT_KEY)
+        ).values(**changes))
+        if not result.rowcount:
+            connection.execute(table.insert().values(**values))
+
+
+def refresh_shift_oee(connection, keys):
+    """Recompute the ShiftOEE rows of the (machine_id, production_date, shift) ``keys``"""
+    rows, empty = [], []
+    for machine_id, production_date, shift in sorted(key for key in keys if None not in key):
+        values = _shift_values(connection, machine_id, production_date, shift)
+        if values is None:
+            empty.append({'key_machine_id': machine_id, 'key_production_date': production_date, 'key_shift': shift})
+        else:
+            rows.append(values)
+    if rows:
+        _upsert_shifts(connection, rows)
+    if empty:
+        connection.execute(DELETE_SHIFT, empty)
+
+
+# ===============================
+# CHANGE TRACKING
+# ===============================
+
+def _info(target):
+    session = inspect(target).session
+    return session.info if session is not None else {}
+
+
+def _mark_shift(mapper, connection, target):
+    _info(target).setdefault('shift_oee_keys', set()).add(
+        (target.machine_id, target.production_date, target.shift)
+    )
+
+
+def _mark_previous_shift(mapper, connection, target):
+    """Before an UPDATE that moves a shift production, note the shift it leaves"""
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in SHIFT_KEY):
+        return
+    previous = connection.execute(PRODUCTION_KEYS, {'production_ids': [state.identity[0]]}).first()
+    if previous is not None:
+        _info(target).setdefault('shift_oee_keys', set()).add(tuple(previous))
+
+
+def _mark_downtime(mapper, connection, target):
+    _info(target).setdefault('shift_oee_productions', set()).add(target.shift_production_id)
+
+
+def _mark_previous_downtime(mapper, connection, target):
+    history = inspect(target).attrs.shift_production_id.history
+    for production_id in history.deleted or ():
+        _info(target).setdefault('shift_oee_productions', set()).add(production_id)
+
+
+event.listen(ShiftProduction, 'after_insert', _mark_shift)
+event.listen(ShiftProduction, 'before_update', _mark_previous_shift)
+event.listen(ShiftProduction, 'after_update', _mark_shift)
+event.listen(ShiftProduction, 'before_delete', _mark_shift)
+event.listen(DowntimeRecord, 'after_insert', _mark_downtime)
+event.listen(DowntimeRecord, 'before_update', _mark_previous_downtime)
+event.listen(DowntimeRecord, 'after_update', _mark_downtime)
+event.listen(DowntimeRecord, 'before_delete', _mark_downtime)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _refresh_marked_shifts(session, flush_context):
+    keys = session.info.pop('shift_oee_keys', None) or set()
+    production_ids = session.info.pop('shift_oee_productions', None)
+    if not keys and not production_ids:
+        return
+    connection = session.connection()
+    if production_ids:
+        keys.update(tuple(row) for row in connection.execute(
+            PRODUCTION_KEYS, {'production_ids': [i for i in production_ids if i is not None]}
+        ))
+    refresh_shift_oee(connection, keys)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_marked_shifts(session):
+    session.info.pop('shift_oee_keys', None)
+    session.info.pop('shift_oee_productions', None)
+
+
+# ===============================
+# READERS
+# ===============================
+
+def current_shift_oee(now=None, machine_id=None):
+    """Running OEE of every machine whose shift is in progress at ``now``"""
+    now = now or datetime.now()
+    query = db.session.query(ShiftOEE, Machine.code, Machine.name).join(
+        Machine, Machine.id == ShiftOEE.machine_id
+    ).filter(ShiftOEE.shift_start_at <= now, ShiftOEE.shift_end_at > now)
+    if machine_id:
+        query = query.filter(ShiftOEE.machine_id == machine_id)
+
+    result = []
+    for row, machine_code, machine_name in query.order_by(Machine.code):
+        metrics = running_metrics(row, now)
+        result.append(dict(
+            metrics._asdict(),
+            machine_id=row.machine_id,
+            machine_code=machine_code,
+            machine_name=machine_name,
+            shift=row.shift,
+            shift_start=row.shift_start_at.isoformat(),
+            shift_end=row.shift_end_at.isoformat(),
+            total_quantity=float(row.total_quantity or 0),
+            good_quantity=float(row.good_quantity or 0),
+            downtime_open=row.open_downtime_since is not None
+        ))
+    return result
+
+
+def period_oee(machine_id, start_date, end_date):
+    """Totals and OEEMetrics of a machine's shifts from ``start_date`` to ``end_date``"""
+    rows = db.session.query(ShiftOEE).filter(
+        ShiftOEE.machine_id == machine_id,
+        ShiftOEE.production_date.between(start_date, end_date)
+    ).all()
+
+    planned = sum(row.planned_minutes or 0 for row in rows)
+    downtime = sum(min(row.downtime_minutes or 0, row.planned_minutes or 0) for row in rows)
+    total = sum(float(row.total_quantity or 0) for row in rows)
+    good = sum(float(row.good_quantity or 0) for row in rows)
+    rejected = sum(float(row.reject_quantity or 0) for row in rows)
+    # Expected output per shift at the rate in force then, so performance weights shifts by run time
+    expected = sum(
+        float(row.ideal_rate) * ((row.planned_minutes or 0) - min(row.downtime_minutes or 0, row.planned_minutes or 0)) / 60
+        if row.ideal_rate else float(row.target_quantity or 0)
+        for row in rows
+    )
+
+    return {
+        'shifts': len(rows),
+        'planned_minutes': planned,
+        'downtime_minutes': downtime,
+        'total_quantity': total,
+        'good_quantity': good,
+        'reject_quantity': rejected,
+        'metrics': calculate_oee(planned, downtime, total, good, target_quantity=expected)
+    }
+
+
+# ===============================
+# REBUILD
+# ===============================
+
+def rebuild_shift_oee():
+    """Recreate every ShiftOEE row from ShiftProduction and DowntimeRecord; returns the shift count"""
+    connection = db.session.connection()
+    connection.execute(delete(ShiftOEE.__table__))
+    keys = set(db.session.query(
+        ShiftProduction.machine_id, ShiftProduction.production_date, ShiftProduction.shift
+    ).distinct())
+    refresh_shift_oee(connection, keys)
+    db.session.commit()
+    return len(keys)
+
+
+def register_commands(app):
+    """Register ``flask shift-oee rebuild``"""
+
+    @app.cli.group('shift-oee')
+    def shift_oee_cli():
+        """Maintain the per-shift OEE table (ShiftOEE)"""
+
+    @shift_oee_cli.command('rebuild')
+    def rebuild_command():
+        count = rebuild_shift_oee()
+        click.echo(f'Rebuilt OEE for {count} machine shifts')
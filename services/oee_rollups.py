@@ -0,0 +1,388 @@
+"""
+Incremental OEE rollups
+
+OEEAnalytics holds one row per machine and daily, weekly (Monday) or
+monthly period with the averages, best and worst OEE, production and
+downtime totals of that period. Rows are kept current in the same
+transaction as the OEERecord / OEEDowntimeRecord changes behind them:
+mapper events note the (machine, day) each flushed row belongs to, before
+and after the change, and at the end of the flush only the daily, weekly
+and monthly buckets of those days are re-aggregated from their source
+rows.
+
+Every rollup also stores the sums behind its averages, so a dashboard can
+combine daily rollups over any range with one aggregate query, weighting
+each day by its record count exactly like averaging the records would.
+
+``flask oee-rollups rebuild`` recreates the table from the source rows,
+e.g. after bulk loads that bypass the ORM.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import click
+from sqlalchemy import bindparam, delete, event, func, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, MaintenanceSchedule
+from models.oee import OEERecord, OEEDowntimeRecord, OEEAlert, OEEAnalytics
+
+PERIOD_TYPES = ('daily', 'weekly', 'monthly')
+
+# Downtime categories reported separately on each rollup
+BREAKDOWN_CATEGORY = 'breakdown'
+MAINTENANCE_CATEGORY = 'planned_maintenance'
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def period_bounds(period_type, day):
+    """(start, end) dates, both inclusive, of the period containing ``day``"""
+    if period_type == 'daily':
+        return day, day
+    if period_type == 'weekly':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    start = day.replace(day=1)
+    next_month = (start + timedelta(days=32)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+
+# ===============================
+# AGGREGATION
+# ===============================
+
+# Built once: constructing these per bucket costs more than running them
+RECORD_TOTALS = select(
+    func.count(OEERecord.id),
+    func.coalesce(func.sum(OEERecord.availability), 0),
+    func.coalesce(func.sum(OEERecord.performance), 0),
+    func.coalesce(func.sum(OEERecord.quality), 0),
+    func.coalesce(func.sum(OEERecord.oee), 0),
+    func.max(OEERecord.oee),
+    func.min(OEERecord.oee),
+    func.coalesce(func.sum(OEERecord.downtime), 0),
+    func.coalesce(func.sum(OEERecord.actual_production_time), 0),
+    func.coalesce(func.sum(OEERecord.total_pieces_produced), 0),
+    func.coalesce(func.sum(OEERecord.good_pieces), 0),
+    func.coalesce(func.sum(OEERecord.rejected_pieces), 0)
+).where(
+    OEERecord.machine_id == bindparam('machine_id'),
+    OEERecord.record_date.between(bindparam('start'), bindparam('end'))
+)
+
+DOWNTIME_TOTALS = select(
+    OEEDowntimeRecord.downtime_category,
+    func.coalesce(func.sum(OEEDowntimeRecord.duration_minutes), 0),
+    func.count(OEEDowntimeRecord.id)
+).where(
+    OEEDowntimeRecord.machine_id == bindparam('machine_id'),
+    OEEDowntimeRecord.start_time >= bindparam('since'),
+    OEEDowntimeRecord.start_time < bindparam('until')
+).group_by(OEEDowntimeRecord.downtime_category)
+
+ROLLUP_KEY = ('machine_id', 'analysis_date', 'period_type')
+
+DELETE_ROLLUP = delete(OEEAnalytics.__table__).where(
+    *(OEEAnalytics.__table__.c[name] == bindparam(f'key_{name}') for name in ROLLUP_KEY)
+)
+
+
+def _downtime_totals(connection, machine_id, start, end):
+    """({category: minutes}, breakdown count) of downtime starting in the period"""
+    rows = connection.execute(DOWNTIME_TOTALS, {
+        'machine_id': machine_id,
+        'since': datetime.combine(start, datetime.min.time()),
+        'until': datetime.combine(end + timedelta(days=1), datetime.min.time())
+    }).all()
+    minutes = {category: int(total) for category, total, _ in rows}
+    breakdowns = sum(count for category, _, count in rows if category == BREAKDOWN_CATEGORY)
+    return minutes, breakdowns
+
+
+def _rollup_values(connection, machine_id, period_type, start, end):
+    (count, availability, performance, quality, oee, best, worst,
+     downtime, production_minutes, produced, good, rejected) = connection.execute(
+        RECORD_TOTALS, {'machine_id': machine_id, 'start': start, 'end': end}
+    ).one()
+    by_category, breakdowns = _downtime_totals(connection, machine_id, start, end)
+    if not count and not by_category:
+        return None
+
+    def average(total):
+        return round(float(total) / count, 2) if count else 0
+
+    return {
+        'machine_id': machine_id,
+        'analysis_date': start,
+        'period_type': period_type,
+        'total_records': count,
+        'avg_availability': average(availability),
+        'avg_performance': average(performance),
+        'avg_quality': average(quality),
+        'avg_oee': average(oee),
+        'best_oee': best or 0,
+        'worst_oee': worst or 0,
+        'sum_availability': availability,
+        'sum_performance': performance,
+        'sum_quality': quality,
+        'sum_oee': oee,
+        'downtime_minutes': int(downtime),
+        'total_downtime_hours': round(int(downtime) / 60, 2),
+        'total_production_hours': round(int(production_minutes) / 60, 2),
+        'total_units_produced': produced,
+        'total_good_units': good,
+        'defect_rate': round(int(rejected) * 100 / int(produced), 2) if produced else 0,
+        'maintenance_hours': round(by_category.get(MAINTENANCE_CATEGORY, 0) / 60, 2),
+        'breakdown_count': breakdowns,
+        'downtime_by_category': by_category,
+        'updated_at': datetime.utcnow()
+    }
+
+
+_upsert_statements = {}
+
+
+def _upsert_statement(dialect):
+    """INSERT ... ON CONFLICT (machine, date, period) DO UPDATE, built once per dialect"""
+    if dialect not in _upsert_statements:
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(OEEAnalytics.__table__)
+        _upsert_statements[dialect] = statement.on_conflict_do_update(
+            index_elements=list(ROLLUP_KEY),
+            set_={
+                column.name: statement.excluded[column.name] for column in OEEAnalytics.__table__.columns
+                if column.name not in ROLLUP_KEY + ('id', 'created_at')
+            }
+        )
+    return _upsert_statements[dialect]
+
+
+def _upsert_rollups(connection, rows):
+    dialect = connection.dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        connection.execute(_upsert_statement(dialect), rows)
+        return
+
+    # Generic fallback: update, then insert when the row does not exist yet
+    table = OEEAnalytics.__table__
+    for values in rows:
+        changes = {name: value for name, value in values.items() if name not in ROLLUP_KEY}
+        result = connection.execute(update(table).where(
+            *(table.c[name] == values[name] for name in ROLLUP_KEY)
+        ).values(**changes))
+        if not result.rowcount:
+            connection.execute(table.insert().values(**values))
+
+
+def refresh_rollups(connection, keys):
+    """Re-aggregate every period containing the (machine_id, day) ``keys``"""
+    buckets = {
+        (machine_id, period_type) + period_bounds(period_type, day)
+        for machine_id, day in keys if machine_id is not None and day is not None
+        for period_type in PERIOD_TYPES
+    }
+    rows, empty = [], []
+    for machine_id, period_type, start, end in sorted(buckets):
+        values = _rollup_values(connection, machine_id, period_type, start, end)
+        if values is None:
+            empty.append({'key_machine_id': machine_id, 'key_analysis_date': start, 'key_period_type': period_type})
+        else:
+            rows.append(values)
+    if rows:
+        _upsert_rollups(connection, rows)
+    if empty:
+        connection.execute(DELETE_ROLLUP, empty)
+
+
+# ===============================
+# CHANGE TRACKING
+# ===============================
+
+# Source model -> (machine column, column giving the day)
+SOURCES = {
+    OEERecord: ('machine_id', 'record_date'),
+    OEEDowntimeRecord: ('machine_id', 'start_time')
+}
+
+
+def _mark(target, machine_id, day):
+    session = inspect(target).session
+    if session is not None:
+        session.info.setdefault('oee_rollup_keys', set()).add((machine_id, _day(day)))
+
+
+def _mark_current(mapper, connection, target):
+    machine_field, day_field = SOURCES[mapper.class_]
+    _mark(target, getattr(target, machine_field), getattr(target, day_field))
+
+
+def _mark_previous(mapper, connection, target):
+    """Before an UPDATE that moves the row, note the bucket it leaves"""
+    machine_field, day_field = SOURCES[mapper.class_]
+    state = inspect(target)
+    if not (state.attrs[machine_field].history.has_changes() or state.attrs[day_field].history.has_changes()):
+        return
+    table = mapper.local_table
+    previous = connection.execute(
+        select(table.c[machine_field], table.c[day_field]).where(table.c.id == state.identity[0])
+    ).first()
+    if previous is not None:
+        _mark(target, *previous)
+
+
+for _model in SOURCES:
+    event.listen(_model, 'after_insert', _mark_current)
+    event.listen(_model, 'before_update', _mark_previous)
+    event.listen(_model, 'after_update', _mark_current)
+    # Before the DELETE so expired attributes can still be loaded
+    event.listen(_model, 'before_delete', _mark_current)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _refresh_marked_rollups(session, flush_context):
+    keys = session.info.pop('oee_rollup_keys', None)
+    if keys:
+        refresh_rollups(session.connection(), keys)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_marked_rollups(session):
+    session.info.pop('oee_rollup_keys', None)
+
+
+# ===============================
+# READERS
+# ===============================
+
+def _daily_filters(start, end, machine_id=None):
+    criteria = [
+        OEEAnalytics.period_type == 'daily',
+        OEEAnalytics.analysis_date.between(start, end)
+    ]
+    if machine_id:
+        criteria.append(OEEAnalytics.machine_id == machine_id)
+    return criteria
+
+
+def _average(total, count):
+    return round(float(total or 0) / count, 2) if count else 0
+
+
+def summary(start, end, machine_id=None):
+    """Record-weighted OEE averages, best and worst over ``start``..``end``"""
+    count, availability, performance, quality, oee, best, worst = db.session.query(
+        func.coalesce(func.sum(OEEAnalytics.total_records), 0),
+        func.sum(OEEAnalytics.sum_availability),
+        func.sum(OEEAnalytics.sum_performance),
+        func.sum(OEEAnalytics.sum_quality),
+        func.sum(OEEAnalytics.sum_oee),
+        func.max(OEEAnalytics.best_oee),
+        func.min(OEEAnalytics.worst_oee)
+    ).filter(*_daily_filters(start, end, machine_id), OEEAnalytics.total_records > 0).one()
+    count = int(count)
+    return {
+        'avg_oee': _average(oee, count),
+        'avg_availability': _average(availability, count),
+        'avg_performance': _average(performance, count),
+        'avg_quality': _average(quality, count),
+        'best_oee': round(float(best or 0), 2),
+        'worst_oee': round(float(worst or 0), 2),
+        'total_records': count
+    }
+
+
+def machine_totals(start, end, machine_id=None):
+    """{machine_id: (avg OEE, downtime minutes, pieces produced)} over the range"""
+    rows = db.session.query(
+        OEEAnalytics.machine_id,
+        func.sum(OEEAnalytics.total_records),
+        func.sum(OEEAnalytics.sum_oee),
+        func.sum(OEEAnalytics.downtime_minutes),
+        func.sum(OEEAnalytics.total_units_produced)
+    ).filter(*_daily_filters(start, end, machine_id)).group_by(OEEAnalytics.machine_id)
+    return {
+        row_machine_id: (_average(oee, int(count or 0)), int(downtime or 0), int(produced or 0))
+        for row_machine_id, count, oee, downtime, produced in rows
+    }
+
+
+def daily_trend(start, end, machine_id=None):
+    """[{date, oee}] for every day of the range, 0 on days without records"""
+    by_day = {
+        day: _average(oee, int(count or 0))
+        for day, count, oee in db.session.query(
+            OEEAnalytics.analysis_date,
+            func.sum(OEEAnalytics.total_records),
+            func.sum(OEEAnalytics.sum_oee)
+        ).filter(*_daily_filters(start, end, machine_id)).group_by(OEEAnalytics.analysis_date)
+    }
+    days = (end - start).days + 1
+    return [
+        {'date': day.isoformat(), 'oee': by_day.get(day, 0)}
+        for day in (start + timedelta(days=offset) for offset in range(days))
+    ]
+
+
+def downtime_by_category(start, end, machine_id=None):
+    """{category: minutes} of downtime records starting in the range"""
+    totals = defaultdict(int)
+    for categories, in db.session.query(OEEAnalytics.downtime_by_category).filter(
+        *_daily_filters(start, end, machine_id)
+    ):
+        for category, minutes in (categories or {}).items():
+            totals[category] += minutes
+    return dict(totals)
+
+
+def machine_status(machine_ids):
+    """({machine_id: next maintenance date}, {machine_id: active alert count}) in two grouped queries"""
+    if not machine_ids:
+        return {}, {}
+    next_maintenance = dict(db.session.query(
+        MaintenanceSchedule.machine_id, func.min(MaintenanceSchedule.next_maintenance_date)
+    ).filter(
+        MaintenanceSchedule.machine_id.in_(machine_ids),
+        MaintenanceSchedule.is_active == True,
+        MaintenanceSchedule.next_maintenance_date >= date.today()
+    ).group_by(MaintenanceSchedule.machine_id).all())
+    alerts = dict(db.session.query(OEEAlert.machine_id, func.count(OEEAlert.id)).filter(
+        OEEAlert.machine_id.in_(machine_ids),
+        OEEAlert.status == 'active'
+    ).group_by(OEEAlert.machine_id).all())
+    return next_maintenance, alerts
+
+
+# ===============================
+# REBUILD
+# ===============================
+
+def rebuild_rollups():
+    """Recreate every rollup from OEERecord and OEEDowntimeRecord; returns the machine-day count"""
+    connection = db.session.connection()
+    connection.execute(delete(OEEAnalytics.__table__))
+    keys = set(db.session.query(OEERecord.machine_id, OEERecord.record_date).distinct())
+    keys.update(
+        (machine_id, _day(start_time))
+        for machine_id, start_time in db.session.query(OEEDowntimeRecord.machine_id, OEEDowntimeRecord.start_time)
+    )
+    refresh_rollups(connection, keys)
+    db.session.commit()
+    return len(keys)
+
+
+def register_commands(app):
+    """Register ``flask oee-rollups rebuild``"""
+
+    @app.cli.group('oee-rollups')
+    def oee_rollups_cli():
+        """Maintain the OEE rollup table (OEEAnalytics)"""
+
+    @oee_rollups_cli.command('rebuild')
+    def rebuild_command():
+        count = rebuild_rollups()
+        click.echo(f'Rebuilt OEE rollups for {count} machine days')
@@ -0,0 +1,211 @@
+"""
+Quality dashboard aggregation
+
+Computes the figures behind /api/quality-enhanced/dashboard with one
+grouped query per dimension: inspections grouped by day (counts, accepted
+counts and defect sums, from which today, the window totals and the daily
+pass-rate trend are derived), inspections grouped by the machines that
+make the inspected product, alerts grouped by status and severity, and
+CAPAs grouped by status. This replaces a count() per figure, two counts
+per trend day and loading every inspection of every machine to count
+accepted ones in Python.
+
+Results are cached per time window for QUALITY_CACHE_SECONDS. A commit in
+this process that changes a QualityInspection, QualityAlert or CAPA (via
+the ORM or a bulk UPDATE / DELETE) drops every cached window; other
+processes pick the change up when their entry expires, as they do for
+work orders moving a product to another machine.
+"""
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, event, func
+
+from models import db, Machine, WorkOrder
+from models.quality import QualityInspection, CAPA
+from models.quality_enhanced import QualityAlert
+from services.cache import TTLCache
+
+QUALITY_CACHE_SECONDS = 30
+DEFAULT_WINDOW_DAYS = 7
+MAX_WINDOW_DAYS = 90
+
+# Changes to these make every cached window stale
+SOURCE_MODELS = (QualityInspection, QualityAlert, CAPA)
+
+quality_cache = TTLCache(QUALITY_CACHE_SECONDS)
+
+ACCEPTED = case((QualityInspection.result == 'accepted', 1), else_=0)
+
+
+def _as_date(value):
+    # func.date() returns a string on SQLite and a date elsewhere
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _pass_rate(passed, total):
+    return round(passed / total * 100, 2) if total > 0 else 0
+
+
+# ===============================
+# GROUPED QUERIES
+# ===============================
+
+def load_inspections_by_day(since):
+    """Inspections, accepted inspections and defects per inspection day from ``since`` onwards"""
+    day = func.date(QualityInspection.inspection_date)
+    rows = db.session.query(
+        day,
+        func.count(QualityInspection.id),
+        func.sum(ACCEPTED),
+        func.sum(QualityInspection.defect_count)
+    ).filter(
+        QualityInspection.inspection_date >= datetime.combine(since, datetime.min.time())
+    ).group_by(day)
+    return {
+        _as_date(inspection_day): (count, int(passed or 0), int(defects or 0))
+        for inspection_day, count, passed, defects in rows
+    }
+
+
+def load_machine_pass_rates(since):
+    """Inspections, accepted inspections and defects per machine
+
+    Products carry no machine, so an inspection counts for every machine
+    with a work order for the inspected product.
+    """
+    product_machines = db.session.query(
+        WorkOrder.product_id, WorkOrder.machine_id
+    ).filter(WorkOrder.machine_id.isnot(None)).distinct().subquery()
+
+    rows = db.session.query(
+        Machine.name,
+        func.count(QualityInspection.id),
+        func.sum(ACCEPTED),
+        func.sum(QualityInspection.defect_count)
+    ).join(
+        product_machines, product_machines.c.machine_id == Machine.id
+    ).join(
+        QualityInspection, QualityInspection.product_id == product_machines.c.product_id
+    ).filter(
+        QualityInspection.inspection_date >= datetime.combine(since, datetime.min.time())
+    ).group_by(Machine.id, Machine.name).order_by(Machine.name)
+    return [{
+        'machine': name,
+        'pass_rate': _pass_rate(int(passed or 0), count),
+        'total_inspections': count,
+        'total_defects': int(defects or 0)
+    } for name, count, passed, defects in rows]
+
+
+def load_alert_counts():
+    """Active alerts and active high/critical alerts"""
+    rows = db.session.query(
+        QualityAlert.severity, func.count(QualityAlert.id)
+    ).filter(QualityAlert.status == 'active').group_by(QualityAlert.severity)
+    counts = dict(rows.all())
+    return sum(counts.values()), counts.get('high', 0) + counts.get('critical', 0)
+
+
+def load_capa_counts(today):
+    """Open CAPAs and open or in-progress CAPAs past their target date"""
+    rows = db.session.query(
+        CAPA.status,
+        func.count(CAPA.id),
+        func.sum(case((CAPA.target_date < today, 1), else_=0))
+    ).filter(CAPA.status.in_(['open', 'in_progress'])).group_by(CAPA.status)
+
+    open_capas = overdue_capas = 0
+    for status, count, overdue in rows:
+        if status == 'open':
+            open_capas = count
+        overdue_capas += int(overdue or 0)
+    return open_capas, overdue_capas
+
+
+# ===============================
+# DASHBOARD
+# ===============================
+
+def compute_dashboard(days=DEFAULT_WINDOW_DAYS, today=None):
+    """Compute the quality dashboard for the last ``days`` days"""
+    today = today or date.today()
+    window_start = today - timedelta(days=days)
+    trend_start = today - timedelta(days=days - 1)
+
+    by_day = load_inspections_by_day(window_start)
+    window_inspections = sum(count for count, _, _ in by_day.values())
+    window_passed = sum(passed for _, passed, _ in by_day.values())
+    window_defects = sum(defects for _, _, defects in by_day.values())
+    active_alerts, critical_alerts = load_alert_counts()
+    open_capas, overdue_capas = load_capa_counts(today)
+
+    pass_rate_trend = []
+    for i in range(days):
+        trend_date = trend_start + timedelta(days=i)
+        count, passed, _ = by_day.get(trend_date, (0, 0, 0))
+        pass_rate_trend.append({
+            'date': trend_date.isoformat(),
+            'pass_rate': _pass_rate(passed, count),
+            'inspections': count
+        })
+
+    return {
+        'summary': {
+            'inspections_today': by_day.get(today, (0, 0, 0))[0],
+            'inspections_this_week': window_inspections,
+            'pass_rate': _pass_rate(window_passed, window_inspections),
+            'active_alerts': active_alerts,
+            'critical_alerts': critical_alerts,
+            'open_capas': open_capas,
+            'overdue_capas': overdue_capas,
+            'total_defects_week': window_defects
+        },
+        'trends': {
+            'pass_rate': pass_rate_trend
+        },
+        'machine_performance': load_machine_pass_rates(window_start)
+    }
+
+
+def get_dashboard(days=DEFAULT_WINDOW_DAYS):
+    """Cached dashboard for a ``days``-day window; concurrent callers share one computation"""
+    if not 1 <= days <= MAX_WINDOW_DAYS:
+        raise ValueError(f'days must be between 1 and {MAX_WINDOW_DAYS}')
+    today = date.today()
+    return quality_cache.get((today, days), lambda: compute_dashboard(days, today))
+
+
+# ===============================
+# CHANGE TRACKING
+# ===============================
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_quality_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SOURCE_MODELS):
+            session.info['quality_changed'] = True
+            return
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _collect_bulk_quality_changes(orm_execute_state):
+    # Query.delete() / update() bypass the flush
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, SOURCE_MODELS):
+        orm_execute_state.session.info['quality_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_quality_dashboard(session):
+    if session.info.pop('quality_changed', False):
+        quality_cache.invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_quality_changes(session):
+    session.info.pop('quality_changed', None)
@@ -0,0 +1,285 @@
+"""
+Streaming report generation
+
+Sales and production reports compute their totals with SQL aggregates and
+stream their rows from a ``yield_per`` cursor as JSON, NDJSON or CSV, so a
+report over a year of orders never holds every row in memory. The same
+writers produce the files of background report jobs (ReportJob), which
+large ranges are generated as.
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from models import db, SalesOrder, WorkOrder, Product, Customer, ReportJob
+
+REPORT_FORMATS = ('json', 'ndjson', 'csv')
+STREAM_BATCH_SIZE = 1000
+
+FORMAT_MIMETYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+# ===============================
+# REPORT DEFINITIONS
+# ===============================
+
+def _date_filters(column, start, end):
+    criteria = []
+    if start is not None:
+        criteria.append(column >= start)
+    if end is not None:
+        criteria.append(column <= end)
+    return criteria
+
+
+def _sales_filters(start, end):
+    # order_date is a Date column
+    return _date_filters(
+        SalesOrder.order_date,
+        start.date() if start is not None else None,
+        end.date() if end is not None else None
+    )
+
+
+def sales_totals(start, end):
+    total_orders, total_amount = db.session.query(
+        func.count(SalesOrder.id), func.coalesce(func.sum(SalesOrder.total_amount), 0)
+    ).filter(*_sales_filters(start, end)).one()
+    return {'total_orders': total_orders, 'total_amount': float(total_amount)}
+
+
+def sales_rows(start, end):
+    return select(
+        SalesOrder.order_number,
+        Customer.company_name.label('customer_name'),
+        SalesOrder.order_date,
+        SalesOrder.total_amount,
+        SalesOrder.status
+    ).outerjoin(Customer, SalesOrder.customer_id == Customer.id).where(
+        *_sales_filters(start, end)
+    ).order_by(SalesOrder.order_date, SalesOrder.id)
+
+
+def _production_filters(start, end):
+    return [WorkOrder.status == 'completed'] + _date_filters(WorkOrder.actual_end_date, start, end)
+
+
+def production_totals(start, end):
+    count, produced, good, scrap = db.session.query(
+        func.count(WorkOrder.id),
+        func.coalesce(func.sum(WorkOrder.quantity_produced), 0),
+        func.coalesce(func.sum(WorkOrder.quantity_good), 0),
+        func.coalesce(func.sum(WorkOrder.quantity_scrap), 0)
+    ).filter(*_production_filters(start, end)).one()
+    produced, good, scrap = float(produced), float(good), float(scrap)
+    return {
+        'total_work_orders': count,
+        'total_quantity_produced': produced,
+        'total_good': good,
+        'total_scrap': scrap,
+        'efficiency': (good / produced * 100) if produced > 0 else 0
+    }
+
+
+def production_rows(start, end):
+    return select(
+        WorkOrder.wo_number,
+        Product.name.label('product_name'),
+        WorkOrder.quantity_produced,
+        WorkOrder.quantity_good,
+        WorkOrder.status
+    ).outerjoin(Product, WorkOrder.product_id == Product.id).where(
+        *_production_filters(start, end)
+    ).order_by(WorkOrder.actual_end_date, WorkOrder.id)
+
+
+REPORTS = {
+    'sales': {
+        'rows_key': 'orders',
+        'count_key': 'total_orders',
+        'columns': ('order_number', 'customer_name', 'order_date', 'total_amount', 'status'),
+        'totals': sales_totals,
+        'rows': sales_rows
+    },
+    'production': {
+        'rows_key': 'work_orders',
+        'count_key': 'total_work_orders',
+        'columns': ('wo_number', 'product_name', 'quantity_produced', 'quantity_good', 'status'),
+        'totals': production_totals,
+        'rows': production_rows
+    }
+}
+
+# /generate/<report_type> names of the streamable reports
+GENERATE_TYPES = {
+    'sales-summary': 'sales',
+    'production-efficiency': 'production'
+}
+
+# /generate streams reports up to this many rows inline; larger ones become background jobs
+INLINE_REPORT_ROWS = 5000
+
+
+def parse_date_range(values):
+    """``(start, end)`` datetimes from ``start_date``/``end_date`` ISO strings"""
+    start, end = values.get('start_date'), values.get('end_date')
+    try:
+        return (
+            datetime.fromisoformat(start) if start else None,
+            datetime.fromisoformat(end) if end else None
+        )
+    except (TypeError, ValueError):
+        raise ValueError('start_date and end_date must be ISO dates')
+
+
+# ===============================
+# STREAMING
+# ===============================
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def iter_rows(report_type, start, end):
+    """Report rows as dicts, fetched ``STREAM_BATCH_SIZE`` at a time"""
+    report = REPORTS[report_type]
+    statement = report['rows'](start, end).execution_options(yield_per=STREAM_BATCH_SIZE)
+    for row in db.session.execute(statement):
+        yield {column: _plain(value) for column, value in zip(report['columns'], row)}
+
+
+def _batched(rows, stats):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= STREAM_BATCH_SIZE:
+            stats['rows'] += len(batch)
+            yield batch
+            batch = []
+    if batch:
+        stats['rows'] += len(batch)
+        yield batch
+
+
+def iter_report(report_type, file_format, start, end, totals=None, stats=None):
+    """Yield the report as text chunks in ``file_format``
+
+    ``json`` keeps the shape of the original endpoints (totals plus a row
+    list), ``ndjson`` and ``csv`` contain the rows only. The number of rows
+    written is counted into ``stats['rows']``.
+    """
+    report = REPORTS[report_type]
+    rows = iter_rows(report_type, start, end)
+    stats = stats if stats is not None else {}
+    stats.setdefault('rows', 0)
+
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(report['columns'])
+        yield buffer.getvalue()
+        for batch in _batched(rows, stats):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([row[column] for column in report['columns']] for row in batch)
+            yield buffer.getvalue()
+    elif file_format == 'ndjson':
+        for batch in _batched(rows, stats):
+            yield ''.join(json.dumps(row) + '\n' for row in batch)
+    else:
+        totals = totals if totals is not None else report['totals'](start, end)
+        yield json.dumps(totals)[:-1] + f', "{report["rows_key"]}": ['
+        separator = ''
+        for batch in _batched(rows, stats):
+            yield separator + ', '.join(json.dumps(row) for row in batch)
+            separator = ', '
+        yield ']}'
+
+
+# ===============================
+# BACKGROUND JOBS
+# ===============================
+
+def create_report_job(report_type, file_format, filters, user_id):
+    job = ReportJob(
+        report_type=report_type,
+        file_format=file_format,
+        filters=filters,
+        requested_by=user_id
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def run_report_job(job_id):
+    """Write a queued report job to its file; runs in a background worker"""
+    job = db.session.get(ReportJob, job_id)
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    path = os.path.abspath(os.path.join(
+        current_app.config.get('REPORT_FOLDER', 'reports'),
+        f"{job.report_type}_report_{job.id}_{job.started_at.strftime('%Y%m%d_%H%M%S')}.{job.file_format}"
+    ))
+    try:
+        start, end = parse_date_range(job.filters or {})
+        report = REPORTS[job.report_type]
+        totals = report['totals'](start, end)
+        job.summary = totals
+        job.total_rows = totals[report['count_key']]
+
+        stats = {'rows': 0}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.part', 'w', newline='', encoding='utf-8') as handle:
+            for chunk in iter_report(job.report_type, job.file_format, start, end, totals, stats):
+                handle.write(chunk)
+        os.replace(path + '.part', path)
+
+        job.rows_written = stats['rows']
+        job.file_path = path
+        job.file_size = os.path.getsize(path)
+        job.status = 'completed'
+    except Exception as e:
+        db.session.rollback()
+        if os.path.exists(path + '.part'):
+            os.remove(path + '.part')
+        job = db.session.get(ReportJob, job_id)
+        job.status = 'failed'
+        job.error_message = str(e)
+    job.completed_at = datetime.utcnow()
+    db.session.commit()
+
+
+def serialize_report_job(job):
+    return {
+        'id': job.id,
+        'report_type': job.report_type,
+        'format': job.file_format,
+        'filters': job.filters,
+        'status': job.status,
+        'summary': job.summary,
+        'total_rows': job.total_rows,
+        'rows_written': job.rows_written,
+        'file_size': job.file_size,
+        'error_message': job.error_message,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None
+    }
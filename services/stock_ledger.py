@@ -0,0 +1,394 @@
+"""
+Stock posting service
+
+Applies inventory movements with atomic ``quantity = quantity + :delta``
+updates keyed on (product, location, batch), so concurrent postings against
+the same stock row can no longer overwrite each other. A batch of movements
+is recorded and applied in one transaction; deltas are summed per stock row
+first and applied in key order, so two batches touching the same rows lock
+them in the same order.
+
+Bulk feeds (scanners, PLC shift-end uploads) are validated column-wise with
+pandas and inserted with a single executemany.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import pandas as pd
+from sqlalchemy import case, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Inventory, InventoryMovement, Product, WarehouseLocation
+from services.stock_summary import adjust_stock_summary
+
+MOVEMENT_TYPES = ('receive', 'issue', 'transfer', 'adjust')
+MAX_BULK_MOVEMENTS = 20000
+
+# Keep IN lists well below SQLite's bound-parameter limit
+IN_CLAUSE_CHUNK = 500
+
+
+def _to_decimal(value, field):
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f'{field} must be a number')
+
+
+def normalize_movement(data):
+    """Validate one movement payload and return it with typed values"""
+    for field in ('product_id', 'movement_type', 'quantity', 'uom'):
+        if data.get(field) in (None, ''):
+            raise ValueError(f'{field} is required')
+
+    movement_type = data['movement_type']
+    if movement_type not in MOVEMENT_TYPES:
+        raise ValueError(f"movement_type must be one of: {', '.join(MOVEMENT_TYPES)}")
+
+    quantity = _to_decimal(data['quantity'], 'quantity')
+    if movement_type != 'adjust' and quantity <= 0:
+        raise ValueError('quantity must be greater than zero')
+
+    from_location_id = data.get('from_location_id')
+    to_location_id = data.get('to_location_id')
+    if movement_type == 'receive' and not to_location_id:
+        raise ValueError('to_location_id is required for receive')
+    if movement_type == 'issue' and not from_location_id:
+        raise ValueError('from_location_id is required for issue')
+    if movement_type == 'transfer' and not (from_location_id and to_location_id):
+        raise ValueError('from_location_id and to_location_id are required for transfer')
+    if movement_type == 'adjust' and not (to_location_id or from_location_id):
+        raise ValueError('a location is required for adjust')
+
+    return dict(
+        data,
+        product_id=int(data['product_id']),
+        from_location_id=int(from_location_id) if from_location_id else None,
+        to_location_id=int(to_location_id) if to_location_id else None,
+        quantity=quantity,
+        batch_number=data.get('batch_number') or None
+    )
+
+
+def movement_deltas(movement):
+    """Stock row changes caused by one normalized movement
+
+    Returns ``(product_id, location_id, batch_number, delta)`` tuples.
+    Adjustments carry a signed quantity.
+    """
+    product_id = movement['product_id']
+    batch_number = movement['batch_number']
+    quantity = movement['quantity']
+    movement_type = movement['movement_type']
+
+    if movement_type == 'receive':
+        return [(product_id, movement['to_location_id'], batch_number, quantity)]
+    if movement_type == 'issue':
+        return [(product_id, movement['from_location_id'], batch_number, -quantity)]
+    if movement_type == 'transfer':
+        return [
+            (product_id, movement['from_location_id'], batch_number, -quantity),
+            (product_id, movement['to_location_id'], batch_number, quantity)
+        ]
+    return [(product_id, movement['to_location_id'] or movement['from_location_id'], batch_number, quantity)]
+
+
+def aggregate_deltas(movements):
+    """Net stock change per (product, location, batch) for normalized movements"""
+    totals = defaultdict(Decimal)
+    for movement in movements:
+        for product_id, location_id, batch_number, delta in movement_deltas(movement):
+            totals[(product_id, location_id, batch_number)] += delta
+    return {key: delta for key, delta in totals.items() if delta}
+
+
+def _batch_filter(batch_number):
+    if batch_number is None:
+        return Inventory.batch_number.is_(None)
+    return Inventory.batch_number == batch_number
+
+
+def _increment(criteria, delta):
+    """Atomically add ``delta`` to the stock rows matching ``criteria``"""
+    result = db.session.execute(
+        update(Inventory).where(*criteria).values(
+            quantity=Inventory.quantity + delta,
+            available_quantity=Inventory.available_quantity + delta,
+            updated_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def _fallback_row_id(product_id, location_id):
+    """Stock row an unbatched outbound posting draws from
+
+    The unbatched row if there is one, otherwise the batch expiring first.
+    The row is locked where the database supports SELECT ... FOR UPDATE.
+    """
+    row = db.session.query(Inventory.id).filter(
+        Inventory.product_id == product_id,
+        Inventory.location_id == location_id
+    ).order_by(
+        case((Inventory.batch_number.is_(None), 0), else_=1),
+        Inventory.expiry_date.is_(None),
+        Inventory.expiry_date,
+        Inventory.id
+    ).with_for_update().first()
+    return row[0] if row else None
+
+
+def apply_delta(product_id, location_id, batch_number, delta):
+    """Apply one stock change atomically; returns how it was applied
+
+    ``'updated'`` when the stock row existed, ``'created'`` when a receipt
+    created it, ``'fallback'`` when an unbatched outbound posting drew from
+    another batch, and ``'missing'`` when there was no stock row to draw
+    from (the movement is still recorded, as before). The product's stock
+    summary is adjusted in the same transaction.
+    """
+    result = _apply_to_stock_row(product_id, location_id, batch_number, delta)
+    if result != 'missing':
+        adjust_stock_summary(db.session.connection(), product_id, on_hand=delta, available=delta)
+    return result
+
+
+def _apply_to_stock_row(product_id, location_id, batch_number, delta):
+    criteria = (
+        Inventory.product_id == product_id,
+        Inventory.location_id == location_id,
+        _batch_filter(batch_number)
+    )
+    if _increment(criteria, delta):
+        return 'updated'
+
+    if delta < 0:
+        if batch_number is None:
+            row_id = _fallback_row_id(product_id, location_id)
+            if row_id is not None:
+                _increment((Inventory.id == row_id,), delta)
+                return 'fallback'
+        return 'missing'
+
+    # Serialize first receipts of a product; NULL batch numbers are not
+    # covered by unique_inventory_item on every database
+    db.session.query(Product.id).filter(Product.id == product_id).with_for_update().first()
+    if _increment(criteria, delta):
+        return 'updated'
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(Inventory.__table__.insert().values(
+                product_id=product_id,
+                location_id=location_id,
+                batch_number=batch_number,
+                quantity=delta,
+                reserved_quantity=0,
+                available_quantity=delta,
+                created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow()
+            ))
+        return 'created'
+    except IntegrityError:
+        # Another transaction created the row first
+        _increment(criteria, delta)
+        return 'updated'
+
+
+def post_movements(movements, user_id):
+    """Record and apply a batch of movements in one transaction
+
+    ``movements`` are raw payloads as accepted by ``normalize_movement``.
+    Any invalid movement rejects the whole batch with a ValueError naming
+    its position. Returns the created InventoryMovement rows and the stock
+    rows that were changed.
+    """
+    normalized = []
+    for index, data in enumerate(movements):
+        try:
+            normalized.append(normalize_movement(data))
+        except ValueError as e:
+            raise ValueError(f'Movement {index + 1}: {e}')
+
+    try:
+        records = [InventoryMovement(
+            product_id=m['product_id'],
+            from_location_id=m['from_location_id'],
+            to_location_id=m['to_location_id'],
+            movement_type=m['movement_type'],
+            reference_type=m.get('reference_type'),
+            reference_id=m.get('reference_id'),
+            quantity=m['quantity'],
+            uom=m['uom'],
+            batch_number=m['batch_number'],
+            lot_number=m.get('lot_number'),
+            serial_number=m.get('serial_number'),
+            notes=m.get('notes'),
+            performed_by=user_id
+        ) for m in normalized]
+        db.session.add_all(records)
+        db.session.flush()
+
+        applied = apply_deltas(aggregate_deltas(normalized))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return records, applied
+
+
+def apply_deltas(deltas):
+    """Apply aggregated stock changes in key order"""
+    applied = []
+    for key in sorted(deltas, key=lambda k: (k[0], k[1], k[2] or '')):
+        product_id, location_id, batch_number = key
+        applied.append({
+            'product_id': product_id,
+            'location_id': location_id,
+            'batch_number': batch_number,
+            'delta': float(deltas[key]),
+            'result': apply_delta(product_id, location_id, batch_number, deltas[key])
+        })
+    return applied
+
+
+# ===============================
+# BULK POSTING
+# ===============================
+
+def _existing_ids(model, ids):
+    ids = [int(i) for i in set(ids)]
+    found = set()
+    for offset in range(0, len(ids), IN_CLAUSE_CHUNK):
+        chunk = ids[offset:offset + IN_CLAUSE_CHUNK]
+        found.update(i for i, in db.session.query(model.id).filter(model.id.in_(chunk)))
+    return found
+
+
+def validate_movement_batch(movements):
+    """Validate movement payloads column-wise
+
+    Returns ``(valid, errors)``: ``valid`` is a list of ``(index, movement)``
+    pairs in the shape ``normalize_movement`` produces, ``errors`` maps the
+    index of every rejected payload to its first error.
+    """
+    frame = pd.DataFrame.from_records(
+        [m if isinstance(m, dict) else {} for m in movements],
+        columns=['product_id', 'movement_type', 'quantity', 'uom',
+                 'from_location_id', 'to_location_id', 'batch_number']
+    )
+    errors = pd.Series('', index=frame.index, dtype=object)
+
+    def reject(mask, message):
+        errors[mask & (errors == '')] = message
+
+    reject(pd.Series([not isinstance(m, dict) for m in movements], index=frame.index), 'movement must be an object')
+
+    product_id = pd.to_numeric(frame['product_id'], errors='coerce')
+    quantity = pd.to_numeric(frame['quantity'], errors='coerce')
+    from_location = pd.to_numeric(frame['from_location_id'], errors='coerce')
+    to_location = pd.to_numeric(frame['to_location_id'], errors='coerce')
+    movement_type = frame['movement_type']
+    uom = frame['uom'].fillna('').astype(str).str.strip()
+
+    reject(product_id.isna(), 'product_id is required')
+    reject(product_id % 1 != 0, 'product_id must be an integer')
+    reject(~movement_type.isin(MOVEMENT_TYPES), f"movement_type must be one of: {', '.join(MOVEMENT_TYPES)}")
+    reject(quantity.isna(), 'quantity must be a number')
+    reject((movement_type != 'adjust') & (quantity <= 0), 'quantity must be greater than zero')
+    reject(uom == '', 'uom is required')
+    reject((movement_type == 'receive') & to_location.isna(), 'to_location_id is required for receive')
+    reject((movement_type == 'issue') & from_location.isna(), 'from_location_id is required for issue')
+    reject((movement_type == 'transfer') & (from_location.isna() | to_location.isna()),
+           'from_location_id and to_location_id are required for transfer')
+    reject((movement_type == 'adjust') & from_location.isna() & to_location.isna(), 'a location is required for adjust')
+
+    # One IN query per chunk for all referenced products and locations
+    products = _existing_ids(Product, product_id.dropna())
+    reject(product_id.notna() & ~product_id.isin(products), 'product not found')
+    locations = _existing_ids(WarehouseLocation, pd.concat([from_location, to_location]).dropna())
+    reject(from_location.notna() & ~from_location.isin(locations), 'from_location_id not found')
+    reject(to_location.notna() & ~to_location.isin(locations), 'to_location_id not found')
+
+    valid = []
+    for index in frame.index[errors == '']:
+        data = movements[index]
+        valid.append((int(index), dict(
+            data,
+            product_id=int(product_id[index]),
+            movement_type=movement_type[index],
+            from_location_id=int(from_location[index]) if pd.notna(from_location[index]) else None,
+            to_location_id=int(to_location[index]) if pd.notna(to_location[index]) else None,
+            quantity=Decimal(str(data['quantity'])),
+            uom=uom[index],
+            batch_number=data.get('batch_number') or None
+        )))
+
+    return valid, {int(i): message for i, message in errors[errors != ''].items()}
+
+
+def post_movement_batch(movements, user_id, all_or_nothing=False):
+    """Validate, record and apply a bulk movement upload
+
+    Valid rows are inserted with one executemany and their stock changes
+    applied in the same transaction; invalid rows are reported and skipped,
+    or reject the whole upload when ``all_or_nothing`` is set. Returns
+    per-row results in input order and the applied stock changes.
+    """
+    valid, errors = validate_movement_batch(movements)
+    if errors and all_or_nothing:
+        valid = []
+
+    movement_ids = []
+    applied = []
+    if valid:
+        now = datetime.utcnow()
+        rows = [{
+            'product_id': m['product_id'],
+            'from_location_id': m['from_location_id'],
+            'to_location_id': m['to_location_id'],
+            'movement_type': m['movement_type'],
+            'reference_type': m.get('reference_type'),
+            'reference_id': m.get('reference_id'),
+            'quantity': m['quantity'],
+            'uom': m['uom'],
+            'batch_number': m['batch_number'],
+            'lot_number': m.get('lot_number'),
+            'serial_number': m.get('serial_number'),
+            'notes': m.get('notes'),
+            'movement_date': now,
+            'performed_by': user_id,
+            'created_at': now
+        } for _, m in valid]
+
+        try:
+            statement = insert(InventoryMovement.__table__)
+            if db.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+                result = db.session.execute(
+                    statement.returning(InventoryMovement.id, sort_by_parameter_order=True), rows
+                )
+                movement_ids = [row[0] for row in result]
+            else:
+                db.session.execute(statement, rows)
+
+            applied = apply_deltas(aggregate_deltas([m for _, m in valid]))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    ids = dict(zip((index for index, _ in valid), movement_ids))
+    posted = {index for index, _ in valid}
+    results = []
+    for index in range(len(movements)):
+        if index in posted:
+            results.append({'index': index, 'status': 'posted', 'movement_id': ids.get(index)})
+        elif index in errors:
+            results.append({'index': index, 'status': 'rejected', 'error': errors[index]})
+        else:
+            results.append({'index': index, 'status': 'skipped', 'error': 'upload rejected because other rows are invalid'})
+
+    return results, applied
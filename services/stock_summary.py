@@ -0,0 +1,317 @@
+"""
+Materialized per-product stock summary
+
+StockSummary holds on-hand, reserved and available quantity plus stock
+value per product, so stock lookups are a primary-key read instead of a
+SUM over every Inventory row. Rows are adjusted in the same transaction as
+the Inventory change that caused them:
+
+- ORM flushes of Inventory rows subtract the row's previous values and
+  add its new ones;
+- the stock ledger's atomic UPDATE statements call ``adjust_stock_summary``
+  with the same delta;
+- a change of a product's cost revalues its row, through the mapper event
+  for ORM flushes and ``revalue_stock_summaries`` after bulk UPDATEs.
+
+``flask stock-summary verify`` compares the table against Inventory and
+``flask stock-summary rebuild`` recreates it.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+
+import click
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Inventory, Product, StockSummary
+
+STOCK_FIELDS = ('quantity', 'reserved_quantity', 'available_quantity')
+
+# Numeric columns are floats on SQLite, so allow for rounding when verifying
+VERIFY_TOLERANCE = Decimal('0.01')
+
+# Keep IN lists well below SQLite's bound-parameter limit
+IN_CLAUSE_CHUNK = 500
+
+
+def _cost(product_id):
+    return select(func.coalesce(Product.cost, 0)).where(Product.id == product_id).scalar_subquery()
+
+
+def _upsert(connection, values, on_conflict):
+    """INSERT ... ON CONFLICT (product_id) DO UPDATE where the dialect has it"""
+    table = StockSummary.__table__
+    dialect = connection.dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        connection.execute(insert(table).values(**values).on_conflict_do_update(
+            index_elements=[table.c.product_id], set_=on_conflict
+        ))
+        return
+
+    # Generic fallback: update, then insert when the row does not exist yet
+    result = connection.execute(
+        update(table).where(table.c.product_id == values['product_id']).values(**on_conflict)
+    )
+    if not result.rowcount:
+        connection.execute(table.insert().values(**values))
+
+
+def _upsert_many(connection, rows):
+    """Replace the summary rows in ``rows`` with one executemany upsert where the dialect has it"""
+    table = StockSummary.__table__
+    dialect = connection.dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(table)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.product_id],
+            set_={name: statement.excluded[name] for name in rows[0] if name != 'product_id'}
+        ), rows)
+        return
+
+    for row in rows:
+        _upsert(connection, row, {name: value for name, value in row.items() if name != 'product_id'})
+
+
+def adjust_stock_summary(connection, product_id, on_hand=0, reserved=0, available=0):
+    """Add deltas to one product's summary row atomically"""
+    on_hand, reserved, available = (Decimal(str(v or 0)) for v in (on_hand, reserved, available))
+    if not (on_hand or reserved or available):
+        return
+
+    table = StockSummary.__table__
+    now = datetime.utcnow()
+    new_on_hand = table.c.on_hand_quantity + on_hand
+
+    _upsert(connection, {
+        'product_id': product_id,
+        'on_hand_quantity': on_hand,
+        'reserved_quantity': reserved,
+        'available_quantity': available,
+        'stock_value': _cost(product_id) * on_hand,
+        'updated_at': now
+    }, {
+        'on_hand_quantity': new_on_hand,
+        'reserved_quantity': table.c.reserved_quantity + reserved,
+        'available_quantity': table.c.available_quantity + available,
+        'stock_value': new_on_hand * _cost(product_id),
+        'updated_at': now
+    })
+
+
+def refresh_stock_summaries(connection, product_ids):
+    """Recompute the summary of ``product_ids`` from their Inventory rows"""
+    product_ids = list(set(product_ids))
+    now = datetime.utcnow()
+
+    for offset in range(0, len(product_ids), IN_CLAUSE_CHUNK):
+        chunk = product_ids[offset:offset + IN_CLAUSE_CHUNK]
+        totals = {product_id: (0, 0, 0, 0) for product_id in chunk}
+        rows = connection.execute(
+            select(
+                Inventory.product_id,
+                func.sum(Inventory.quantity),
+                func.sum(Inventory.reserved_quantity),
+                func.sum(Inventory.available_quantity),
+                func.sum(Inventory.quantity) * func.coalesce(func.max(Product.cost), 0)
+            ).select_from(Inventory).outerjoin(
+                Product, Inventory.product_id == Product.id
+            ).where(Inventory.product_id.in_(chunk)).group_by(Inventory.product_id)
+        )
+        for product_id, on_hand, reserved, available, value in rows:
+            totals[product_id] = (on_hand or 0, reserved or 0, available or 0, value or 0)
+
+        _upsert_many(connection, [{
+            'product_id': product_id,
+            'on_hand_quantity': on_hand,
+            'reserved_quantity': reserved,
+            'available_quantity': available,
+            'stock_value': value,
+            'updated_at': now
+        } for product_id, (on_hand, reserved, available, value) in totals.items()])
+
+
+def revalue_stock_summaries(connection, product_ids):
+    """Recompute the stock value of ``product_ids`` from their current cost"""
+    product_ids = list(set(product_ids))
+    table = StockSummary.__table__
+
+    for offset in range(0, len(product_ids), IN_CLAUSE_CHUNK):
+        chunk = product_ids[offset:offset + IN_CLAUSE_CHUNK]
+        connection.execute(
+            update(table).where(table.c.product_id.in_(chunk)).values(
+                stock_value=table.c.on_hand_quantity * _cost(table.c.product_id)
+            )
+        )
+
+
+# ===============================
+# READERS
+# ===============================
+
+def get_available_stock(product_id):
+    """Available quantity of one product"""
+    available = db.session.query(StockSummary.available_quantity).filter(
+        StockSummary.product_id == product_id
+    ).scalar()
+    return float(available or 0)
+
+
+def get_available_stock_levels(product_ids=None):
+    """Available quantity per product, for ``product_ids`` or every product"""
+    query = db.session.query(StockSummary.product_id, StockSummary.available_quantity)
+    if product_ids is None:
+        return {product_id: float(available or 0) for product_id, available in query}
+
+    product_ids = list(set(product_ids))
+    stock = {}
+    for offset in range(0, len(product_ids), IN_CLAUSE_CHUNK):
+        chunk = product_ids[offset:offset + IN_CLAUSE_CHUNK]
+        for product_id, available in query.filter(StockSummary.product_id.in_(chunk)):
+            stock[product_id] = float(available or 0)
+    return stock
+
+
+# ===============================
+# INVENTORY LISTENERS
+# ===============================
+
+def _current(target):
+    return [getattr(target, field) or 0 for field in STOCK_FIELDS]
+
+
+def _stock_changed(state):
+    return any(state.attrs[field].history.has_changes() for field in STOCK_FIELDS + ('product_id',))
+
+
+def _previous_row(connection, state):
+    """(product_id, quantity, reserved, available) before this flush
+
+    Taken from the attribute history when the old values were loaded, and
+    from the database row otherwise (attributes assigned on an expired
+    instance carry no old value).
+    """
+    previous = []
+    for field in ('product_id',) + STOCK_FIELDS:
+        history = state.attrs[field].history
+        if history.deleted:
+            previous.append(history.deleted[0])
+        elif history.unchanged:
+            previous.append(history.unchanged[0])
+        else:
+            return connection.execute(
+                select(Inventory.product_id, *(getattr(Inventory, f) for f in STOCK_FIELDS))
+                .where(Inventory.id == state.identity[0])
+            ).one()
+    return previous
+
+
+@event.listens_for(Inventory, 'after_insert')
+def _inventory_inserted(mapper, connection, target):
+    adjust_stock_summary(connection, target.product_id, *_current(target))
+
+
+@event.listens_for(Inventory, 'before_update')
+def _inventory_updating(mapper, connection, target):
+    state = inspect(target)
+    if _stock_changed(state):
+        product_id, *old_values = _previous_row(connection, state)
+        adjust_stock_summary(connection, product_id, *(-Decimal(str(v or 0)) for v in old_values))
+
+
+@event.listens_for(Inventory, 'after_update')
+def _inventory_updated(mapper, connection, target):
+    if _stock_changed(inspect(target)):
+        adjust_stock_summary(connection, target.product_id, *_current(target))
+
+
+@event.listens_for(Inventory, 'before_delete')
+def _inventory_deleted(mapper, connection, target):
+    # Before the DELETE so expired attributes can still be loaded
+    adjust_stock_summary(connection, target.product_id, *(-Decimal(str(v)) for v in _current(target)))
+
+
+@event.listens_for(Product, 'after_update')
+def _product_cost_changed(mapper, connection, target):
+    if not inspect(target).attrs.cost.history.has_changes():
+        return
+    table = StockSummary.__table__
+    connection.execute(
+        update(table).where(table.c.product_id == target.id).values(
+            stock_value=table.c.on_hand_quantity * (target.cost or 0)
+        )
+    )
+
+
+# ===============================
+# REBUILD AND VERIFY
+# ===============================
+
+def rebuild_stock_summaries():
+    """Recreate every summary row from Inventory; returns the row count"""
+    connection = db.session.connection()
+    connection.execute(StockSummary.__table__.delete())
+    product_ids = [product_id for product_id, in db.session.query(Inventory.product_id).distinct()]
+    refresh_stock_summaries(connection, product_ids)
+    db.session.commit()
+    return len(product_ids)
+
+
+def verify_stock_summaries():
+    """Compare the summary table against Inventory; returns the mismatches"""
+    expected = {
+        product_id: (Decimal(str(on_hand or 0)), Decimal(str(reserved or 0)), Decimal(str(available or 0)))
+        for product_id, on_hand, reserved, available in db.session.query(
+            Inventory.product_id,
+            func.sum(Inventory.quantity),
+            func.sum(Inventory.reserved_quantity),
+            func.sum(Inventory.available_quantity)
+        ).group_by(Inventory.product_id)
+    }
+    actual = {
+        product_id: (Decimal(str(on_hand or 0)), Decimal(str(reserved or 0)), Decimal(str(available or 0)))
+        for product_id, on_hand, reserved, available in db.session.query(
+            StockSummary.product_id, StockSummary.on_hand_quantity,
+            StockSummary.reserved_quantity, StockSummary.available_quantity
+        )
+    }
+
+    zero = (Decimal(0), Decimal(0), Decimal(0))
+    mismatches = []
+    for product_id in sorted(set(expected) | set(actual)):
+        want = expected.get(product_id, zero)
+        have = actual.get(product_id, zero)
+        if any(abs(w - h) > VERIFY_TOLERANCE for w, h in zip(want, have)):
+            mismatches.append({
+                'product_id': product_id,
+                'expected': [float(v) for v in want],
+                'actual': [float(v) for v in have]
+            })
+    return mismatches
+
+
+def register_commands(app):
+    """Register ``flask stock-summary rebuild|verify``"""
+
+    @app.cli.group('stock-summary')
+    def stock_summary_cli():
+        """Maintain the materialized stock summary table"""
+
+    @stock_summary_cli.command('rebuild')
+    def rebuild_command():
+        count = rebuild_stock_summaries()
+        click.echo(f'Rebuilt stock summary for {count} products')
+
+    @stock_summary_cli.command('verify')
+    def verify_command():
+        mismatches = verify_stock_summaries()
+        for mismatch in mismatches:
+            click.echo(f"product {mismatch['product_id']}: expected (on hand, reserved, available) "
+                       f"{mismatch['expected']}, summary has {mismatch['actual']}")
+        click.echo(f'{len(mismatches)} mismatched products')
+        if mismatches:
+            raise SystemExit(1)
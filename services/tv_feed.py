@@ -0,0 +1,375 @@
+"""
+Shop-floor TV display feed
+
+Builds the payload of each TV display type (production, overview,
+shipping, roster) once per interval and pushes it to every connected
+screen over Server-Sent Events, so database load no longer grows with the
+number of TVs on the floor.
+
+A single background producer per process recomputes the displays that
+have subscribers every ``TV_REFRESH_SECONDS``, or sooner when a commit in
+this process touched rows a display reads. Each published version stores
+the delta against the previous one; a subscriber that is exactly one
+version behind receives the delta, anything further behind (a new or slow
+screen) receives the full payload. The polling endpoints read the same
+cached payloads.
+"""
+
+import json
+import threading
+from datetime import datetime
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import joinedload
+
+from models import (
+    db, WorkOrder, ShippingOrder, Machine, ProductionRecord, EmployeeRoster, Employee, ShiftSchedule,
+    ShiftProduction, DowntimeRecord
+)
+from services.cache import TTLCache
+from services.oee_engine import current_shift_oee
+
+TV_REFRESH_SECONDS = 5
+KEEPALIVE_SECONDS = 15
+ACTIVE_SHIPPING_STATUSES = ('preparing', 'packed', 'shipped', 'in_transit')
+
+# Models each display reads; a commit touching one wakes the producer
+DISPLAY_SOURCES = {
+    'production': (WorkOrder, Machine, ProductionRecord, ShiftProduction, DowntimeRecord),
+    'overview': (WorkOrder, Machine, ProductionRecord, ShiftProduction, DowntimeRecord, ShippingOrder, EmployeeRoster),
+    'shipping': (ShippingOrder,),
+    'roster': (Machine, ShiftSchedule, EmployeeRoster, Employee)
+}
+DISPLAY_TYPES = tuple(DISPLAY_SOURCES)
+
+payload_cache = TTLCache(TV_REFRESH_SECONDS)
+
+
+# ===============================
+# PAYLOADS
+# ===============================
+
+def _today_production(today):
+    return float(db.session.query(func.sum(ProductionRecord.quantity_produced)).filter(
+        func.date(ProductionRecord.production_date) == today
+    ).scalar() or 0)
+
+
+def build_production_payload():
+    active_wos = WorkOrder.query.options(
+        joinedload(WorkOrder.product), joinedload(WorkOrder.machine)
+    ).filter_by(status='in_progress').all()
+    machines = Machine.query.filter_by(is_active=True).all()
+
+    return {
+        'type': 'production',
+        'active_work_orders': [{
+            'wo_number': wo.wo_number,
+            'product_name': wo.product.name,
+            'quantity': float(wo.quantity),
+            'quantity_produced': float(wo.quantity_produced),
+            'progress': (float(wo.quantity_produced) / float(wo.quantity) * 100) if wo.quantity > 0 else 0,
+            'machine': wo.machine.name if wo.machine else None,
+            'status': wo.status
+        } for wo in active_wos],
+        'machines': [{
+            'code': m.code,
+            'name': m.name,
+            'status': m.status,
+            'efficiency': float(m.efficiency)
+        } for m in machines],
+        'today_production': _today_production(datetime.now().date()),
+        'current_shift_oee': current_shift_oee()
+    }
+
+
+def build_overview_payload():
+    today = datetime.now().date()
+    shift_oee = current_shift_oee()
+    active_work_orders = db.session.query(func.count(WorkOrder.id)).filter(
+        WorkOrder.status == 'in_progress'
+    ).scalar()
+    machines = db.session.query(Machine.status, Machine.efficiency).filter(Machine.is_active == True).all()
+    active_shipments = ShippingOrder.query.options(joinedload(ShippingOrder.customer)).filter(
+        ShippingOrder.status.in_(ACTIVE_SHIPPING_STATUSES)
+    ).order_by(ShippingOrder.shipping_date).limit(5).all()
+    rosters = db.session.query(EmployeeRoster.machine_id).filter(
+        EmployeeRoster.roster_date == today,
+        EmployeeRoster.is_off_day == False
+    ).all()
+
+    machines_with_operators = len({machine_id for machine_id, in rosters if machine_id})
+
+    return {
+        'type': 'overview',
+        'production': {
+            'active_work_orders': active_work_orders,
+            'active_machines': len([status for status, _ in machines if status == 'running']),
+            'today_production': _today_production(today),
+            'efficiency_avg': sum(float(efficiency) for _, efficiency in machines) / len(machines) if machines else 0,
+            'current_shift_oee_avg': round(sum(m['oee'] for m in shift_oee) / len(shift_oee), 2) if shift_oee else 0
+        },
+        'shipping': {
+            'active_shipments': len(active_shipments),
+            'preparing_count': len([s for s in active_shipments if s.status == 'preparing']),
+            'shipped_count': len([s for s in active_shipments if s.status == 'shipped'])
+        },
+        'roster': {
+            'total_assignments': len(rosters),
+            'machines_with_operators': machines_with_operators,
+            'unassigned_machines': len(machines) - machines_with_operators
+        },
+        'top_active_shipments': [{
+            'shipping_number': s.shipping_number,
+            'customer_name': s.customer.company_name,
+            'status': s.status,
+            'shipping_date': s.shipping_date.isoformat()
+        } for s in active_shipments[:3]]
+    }
+
+
+def build_shipping_payload():
+    today = datetime.now().date()
+    active_shipments = ShippingOrder.query.options(joinedload(ShippingOrder.customer)).filter(
+        ShippingOrder.status.in_(ACTIVE_SHIPPING_STATUSES)
+    ).order_by(ShippingOrder.shipping_date).all()
+    today_shipments_count = db.session.query(func.count(ShippingOrder.id)).filter(
+        func.date(ShippingOrder.shipping_date) == today
+    ).scalar()
+
+    return {
+        'type': 'shipping',
+        'active_shipments': [{
+            'shipping_number': s.shipping_number,
+            'customer_name': s.customer.company_name,
+            'shipping_date': s.shipping_date.isoformat(),
+            'expected_delivery': s.expected_delivery_date.isoformat() if s.expected_delivery_date else None,
+            'status': s.status,
+            'tracking_number': s.tracking_number,
+            'driver_name': s.driver_name
+        } for s in active_shipments],
+        'today_shipments_count': today_shipments_count,
+        'preparing_count': len([s for s in active_shipments if s.status == 'preparing']),
+        'shipped_count': len([s for s in active_shipments if s.status == 'shipped'])
+    }
+
+
+def build_roster_payload():
+    today = datetime.now().date()
+    machines = Machine.query.filter_by(is_active=True).all()
+    shifts = ShiftSchedule.query.all()
+    today_rosters = EmployeeRoster.query.options(
+        joinedload(EmployeeRoster.employee).joinedload(Employee.department)
+    ).filter(
+        EmployeeRoster.roster_date == today,
+        EmployeeRoster.is_off_day == False
+    ).all()
+
+    roster_display = {'date': today.isoformat(), 'machines': {}}
+    for machine in machines:
+        roster_display['machines'][machine.id] = {
+            'machine_id': machine.id,
+            'machine_code': machine.code,
+            'machine_name': machine.name,
+            'machine_type': machine.machine_type,
+            'status': machine.status,
+            'shifts': {
+                shift.id: {
+                    'shift_id': shift.id,
+                    'shift_name': shift.name,
+                    'start_time': shift.start_time.isoformat() if shift.start_time else None,
+                    'end_time': shift.end_time.isoformat() if shift.end_time else None,
+                    'assigned_employees': []
+                } for shift in shifts
+            }
+        }
+
+    for roster in today_rosters:
+        machine = roster_display['machines'].get(roster.machine_id)
+        if machine and roster.shift_id in machine['shifts']:
+            machine['shifts'][roster.shift_id]['assigned_employees'].append({
+                'employee_id': roster.employee_id,
+                'employee_name': roster.employee.full_name,
+                'employee_number': roster.employee.employee_number,
+                'department': roster.employee.department.name if roster.employee.department else None
+            })
+
+    return {
+        'type': 'roster',
+        'date': today.isoformat(),
+        'roster_data': roster_display,
+        'summary': {
+            'total_machines': len(machines),
+            'total_assignments': len(today_rosters),
+            'machines_with_assignments': len([m for m in roster_display['machines'].values() if any(
+                shift['assigned_employees'] for shift in m['shifts'].values()
+            )])
+        }
+    }
+
+
+PAYLOAD_BUILDERS = {
+    'production': build_production_payload,
+    'overview': build_overview_payload,
+    'shipping': build_shipping_payload,
+    'roster': build_roster_payload
+}
+
+
+def get_display_payload(display_type):
+    """Cached payload entry for ``display_type``, computed at most once per interval"""
+    return payload_cache.get(display_type, PAYLOAD_BUILDERS[display_type])
+
+
+# ===============================
+# FEED
+# ===============================
+
+def payload_delta(previous, current):
+    """Top-level keys of ``current`` that differ from ``previous``, plus removed keys"""
+    return {
+        'changed': {key: value for key, value in current.items() if previous.get(key) != value},
+        'removed': [key for key in previous if key not in current]
+    }
+
+
+def format_event(event_name, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_name}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class DisplayFeed:
+    """Latest published version of one display type"""
+
+    def __init__(self, display_type):
+        self.display_type = display_type
+        self.version = 0
+        self.etag = None
+        self.payload = None
+        self.delta = None
+        self.timestamp = None
+        self.subscribers = 0
+        self.changed = threading.Event()
+
+
+class TVFeedProducer:
+    """Background thread that recomputes displays and wakes their subscribers"""
+
+    def __init__(self):
+        self.feeds = {display_type: DisplayFeed(display_type) for display_type in DISPLAY_TYPES}
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+        self._thread = None
+        self._app = None
+
+    def start(self, app):
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='tv-feed-producer', daemon=True)
+            self._thread.start()
+
+    def mark_changed(self, display_types):
+        for display_type in display_types:
+            self.feeds[display_type].changed.set()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                active = [feed for feed in self.feeds.values() if feed.subscribers]
+            for feed in active:
+                self._refresh(feed)
+            self._wake.wait(TV_REFRESH_SECONDS)
+            self._wake.clear()
+
+    def _refresh(self, feed):
+        try:
+            with self._app.app_context():
+                if feed.changed.is_set():
+                    feed.changed.clear()
+                    payload_cache.invalidate(feed.display_type)
+                entry = get_display_payload(feed.display_type)
+                db.session.remove()
+        except Exception as e:
+            print(f"TV feed: failed to build {feed.display_type} display: {e}")
+            return
+        self.publish(feed, entry)
+
+    def publish(self, feed, entry):
+        """Publish a cache entry as the next version when its content changed"""
+        with self._condition:
+            if entry.etag == feed.etag:
+                return
+            feed.delta = payload_delta(feed.payload, entry.value) if feed.payload is not None else None
+            feed.payload = entry.value
+            feed.etag = entry.etag
+            feed.timestamp = entry.computed_at.isoformat()
+            feed.version += 1
+            self._condition.notify_all()
+
+    def stream(self, display_type, app):
+        """SSE generator for one screen"""
+        feed = self.feeds[display_type]
+        with self._condition:
+            feed.subscribers += 1
+        self.start(app)
+
+        try:
+            if feed.payload is None:
+                # First screen for this display: build it now instead of waiting a tick
+                with app.app_context():
+                    entry = get_display_payload(display_type)
+                    db.session.remove()
+                self.publish(feed, entry)
+
+            yield f'retry: {TV_REFRESH_SECONDS * 1000}\n\n'
+            sent_version = 0
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: feed.version != sent_version, KEEPALIVE_SECONDS)
+                    version, payload, delta, timestamp = feed.version, feed.payload, feed.delta, feed.timestamp
+
+                if version == sent_version:
+                    yield ': keepalive\n\n'
+                elif version == sent_version + 1 and delta is not None:
+                    yield format_event('delta', dict(delta, timestamp=timestamp), version)
+                else:
+                    yield format_event('snapshot', dict(payload, timestamp=timestamp), version)
+                sent_version = version
+        finally:
+            with self._condition:
+                feed.subscribers -= 1
+
+
+tv_feed = TVFeedProducer()
+
+
+# ===============================
+# CHANGE TRACKING
+# ===============================
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_display_changes(session, flush_context):
+    touched = session.info.setdefault('tv_displays_changed', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        for display_type, sources in DISPLAY_SOURCES.items():
+            if isinstance(obj, sources):
+                touched.add(display_type)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_display_changes(session):
+    touched = session.info.pop('tv_displays_changed', None)
+    if touched:
+        tv_feed.mark_changed(touched)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_display_changes(session):
+    session.info.pop('tv_displays_changed', None)
@@ -0,0 +1,452 @@
+"""
+Webhook event dispatch
+
+Business events (a sales order confirmed, a work order or shift production
+completed) are written as pending WebhookDelivery rows in the same flush
+as the change that fired them, one per active Webhook subscribed to the
+event, so an event is never lost to a rollback or a restart.
+
+A dispatcher thread claims due deliveries and hands them to a bounded
+worker pool, never running more than ``WEBHOOK_ENDPOINT_CONCURRENCY``
+requests against one webhook at a time. Each request is signed with the
+webhook's ``secret_token`` (HMAC-SHA256 over ``"<timestamp>.<body>"``),
+timed and recorded on its delivery row. Failed attempts are retried with
+exponential backoff from ``retry_delay_seconds`` until ``retry_count``
+retries are used up.
+
+Every server process runs its own dispatcher, started by its first
+request so CLI commands and the reloader's watcher process don't. A
+delivery is claimed with a conditional UPDATE that only one process can
+win. A claim older than ``WEBHOOK_CLAIM_TIMEOUT_SECONDS`` is taken to
+belong to a process that died mid-delivery and is put back in the queue.
+"""
+
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import event, func, inspect, insert, or_, select, update
+
+from models import db, Webhook, WebhookDelivery, SalesOrder, WorkOrder, ShiftProduction
+
+WEBHOOK_WORKERS = 8
+WEBHOOK_ENDPOINT_CONCURRENCY = 2
+WEBHOOK_POLL_SECONDS = 5
+WEBHOOK_MAX_BACKOFF_SECONDS = 6 * 60 * 60
+WEBHOOK_RESPONSE_BODY_LIMIT = 10000
+# Longer than any webhook's timeout_seconds, so only dead processes' claims expire
+WEBHOOK_CLAIM_TIMEOUT_SECONDS = 15 * 60
+
+# Delivery statuses the dispatcher picks up
+DUE_STATUSES = ('pending', 'retrying')
+
+
+# ===============================
+# EVENTS
+# ===============================
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _snapshot(obj, columns):
+    return {column: _plain(getattr(obj, column)) for column in columns}
+
+
+# (model, status value) -> (event type, payload columns)
+STATUS_EVENTS = {
+    (SalesOrder, 'confirmed'): (
+        'sales_order.confirmed',
+        ('id', 'order_number', 'customer_id', 'order_date', 'required_date', 'total_amount', 'status')
+    ),
+    (WorkOrder, 'completed'): (
+        'work_order.completed',
+        ('id', 'wo_number', 'product_id', 'quantity_produced', 'quantity_good', 'quantity_scrap',
+         'actual_end_date', 'status')
+    ),
+    (ShiftProduction, 'completed'): (
+        'shift_production.completed',
+        ('id', 'production_date', 'shift', 'machine_id', 'product_id', 'work_order_id',
+         'target_quantity', 'actual_quantity', 'good_quantity', 'reject_quantity', 'oee_score', 'status')
+    )
+}
+EVENT_MODELS = tuple({model for model, _ in STATUS_EVENTS})
+EVENT_TYPES = tuple(event_type for event_type, _ in STATUS_EVENTS.values())
+
+
+def _status_event(obj, is_new):
+    """Event fired by ``obj`` in this flush: a new row in, or a move to, a trigger status"""
+    definition = STATUS_EVENTS.get((type(obj), obj.status))
+    if definition is None:
+        return None
+    if not is_new and not inspect(obj).attrs.status.history.added:
+        return None
+    event_type, columns = definition
+    return event_type, _snapshot(obj, columns)
+
+
+def _subscribed_webhooks(connection, event_types):
+    """``{event_type: [(webhook_id, max_attempts)]}`` of the active webhooks"""
+    subscriptions = {event_type: [] for event_type in event_types}
+    rows = connection.execute(
+        select(Webhook.id, Webhook.events, Webhook.retry_count).where(Webhook.is_active == True)
+    )
+    for webhook_id, events, retry_count in rows:
+        try:
+            subscribed = set(json.loads(events or '[]'))
+        except ValueError:
+            continue
+        for event_type in event_types:
+            if event_type in subscribed or '*' in subscribed:
+                subscriptions[event_type].append((webhook_id, 1 + (retry_count or 0)))
+    return subscriptions
+
+
+def enqueue_event(connection, event_type, data, webhook_ids=None):
+    """Insert one pending delivery per webhook subscribed to ``event_type``
+
+    ``webhook_ids`` restricts the delivery to the given webhooks whatever
+    they subscribe to (used to send test events). Returns the new
+    delivery ids.
+    """
+    if webhook_ids is None:
+        targets = _subscribed_webhooks(connection, [event_type])[event_type]
+    else:
+        targets = list(connection.execute(
+            select(Webhook.id, 1 + func.coalesce(Webhook.retry_count, 0)).where(Webhook.id.in_(webhook_ids))
+        ))
+    if not targets:
+        return []
+
+    now = datetime.utcnow()
+    event_data = json.dumps(data, default=str)
+    rows = [{
+        'webhook_id': webhook_id,
+        'delivery_id': str(uuid.uuid4()),
+        'event_type': event_type,
+        'event_data': event_data,
+        'status': 'pending',
+        'attempt_count': 0,
+        'max_attempts': max_attempts,
+        'next_retry_at': now,
+        'created_at': now
+    } for webhook_id, max_attempts in targets]
+    connection.execute(insert(WebhookDelivery), rows)
+    return [row['delivery_id'] for row in rows]
+
+
+@event.listens_for(db.session, 'after_flush')
+def _enqueue_flushed_events(session, flush_context):
+    fired = []
+    for obj in session.new:
+        if isinstance(obj, EVENT_MODELS):
+            fired.append(_status_event(obj, True))
+    for obj in session.dirty:
+        if isinstance(obj, EVENT_MODELS):
+            fired.append(_status_event(obj, False))
+    fired = [item for item in fired if item is not None]
+    if not fired:
+        return
+
+    connection = session.connection()
+    subscriptions = _subscribed_webhooks(connection, {event_type for event_type, _ in fired})
+    enqueued = False
+    for event_type, data in fired:
+        webhook_ids = [webhook_id for webhook_id, _ in subscriptions[event_type]]
+        if webhook_ids:
+            enqueue_event(connection, event_type, data, webhook_ids)
+            enqueued = True
+    if enqueued:
+        session.info['webhook_events_enqueued'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_dispatcher(session):
+    if session.info.pop('webhook_events_enqueued', False):
+        webhook_dispatcher.wake()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_enqueued_events(session):
+    session.info.pop('webhook_events_enqueued', None)
+
+
+# ===============================
+# DELIVERY
+# ===============================
+
+def sign_payload(secret, timestamp, body):
+    """``sha256=<hex>`` HMAC of ``"<timestamp>.<body>"`` with the webhook secret"""
+    message = f'{timestamp}.'.encode() + body
+    return 'sha256=' + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def retry_delay(base_seconds, attempt):
+    """Exponential backoff with jitter after failed attempt number ``attempt``"""
+    delay = min((base_seconds or 60) * 2 ** (attempt - 1), WEBHOOK_MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _build_request(webhook, delivery):
+    timestamp = str(int(time.time()))
+    body = json.dumps({
+        'id': delivery.delivery_id,
+        'event': delivery.event_type,
+        'created_at': delivery.created_at.isoformat(),
+        'data': json.loads(delivery.event_data or 'null')
+    }).encode()
+
+    headers = {
+        'Content-Type': webhook.content_type or 'application/json',
+        'User-Agent': 'ERP-Webhooks/1.0',
+        'X-Webhook-Event': delivery.event_type,
+        'X-Webhook-Delivery': delivery.delivery_id,
+        'X-Webhook-Timestamp': timestamp,
+        'X-Webhook-Attempt': str(delivery.attempt_count + 1)
+    }
+    if webhook.secret_token:
+        headers['X-Webhook-Signature'] = sign_payload(webhook.secret_token, timestamp, body)
+    if webhook.custom_headers:
+        try:
+            custom_headers = json.loads(webhook.custom_headers)
+        except ValueError:
+            custom_headers = None
+        # Rows saved before create_webhook checked the type may hold other JSON
+        if isinstance(custom_headers, dict):
+            headers.update(custom_headers)
+    return headers, body
+
+
+def _send(webhook, headers, body):
+    """``(status_code, response_headers, response_body, error)`` of one HTTP attempt"""
+    http_request = urllib.request.Request(
+        webhook.webhook_url, data=body, headers=headers, method=webhook.http_method or 'POST'
+    )
+    try:
+        with urllib.request.urlopen(http_request, timeout=webhook.timeout_seconds or 30) as response:
+            return response.status, dict(response.headers), response.read(WEBHOOK_RESPONSE_BODY_LIMIT), None
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers or {}), e.read(WEBHOOK_RESPONSE_BODY_LIMIT), f'HTTP {e.code}'
+    except Exception as e:
+        return None, None, None, str(e) or type(e).__name__
+
+
+def deliver(delivery_pk):
+    """Make one attempt at a delivery and record its outcome; returns the delivery
+
+    Runs inside an app context (a dispatcher worker or a request).
+    """
+    delivery = db.session.get(WebhookDelivery, delivery_pk)
+    webhook = db.session.get(Webhook, delivery.webhook_id)
+    headers, body = _build_request(webhook, delivery)
+
+    started = time.perf_counter()
+    status_code, response_headers, response_body, error = _send(webhook, headers, body)
+    elapsed_ms = int((time.perf_counter() - started) * 1000)
+
+    now = datetime.utcnow()
+    delivery.attempt_count += 1
+    delivery.request_headers = json.dumps(headers)
+    delivery.request_body = body.decode()
+    delivery.response_status_code = status_code
+    delivery.response_headers = json.dumps(response_headers) if response_headers is not None else None
+    delivery.response_body = response_body.decode(errors='replace') if response_body is not None else None
+    delivery.response_time_ms = elapsed_ms
+
+    counters = {'last_triggered_at': now}
+    if error is None:
+        delivery.status = 'success'
+        delivery.error_message = None
+        delivery.next_retry_at = None
+        delivery.delivered_at = now
+        counters.update(success_count=Webhook.success_count + 1, last_success_at=now)
+    else:
+        delivery.error_message = error
+        if delivery.attempt_count < delivery.max_attempts:
+            delivery.status = 'retrying'
+            delivery.next_retry_at = now + timedelta(
+                seconds=retry_delay(webhook.retry_delay_seconds, delivery.attempt_count)
+            )
+        else:
+            delivery.status = 'failed'
+            delivery.next_retry_at = None
+        counters.update(
+            failure_count=Webhook.failure_count + 1, last_failure_at=now, last_error_message=error
+        )
+
+    # Counters are incremented in SQL so concurrent workers don't overwrite each other
+    db.session.execute(update(Webhook).where(Webhook.id == webhook.id).values(**counters))
+    db.session.commit()
+    return delivery
+
+
+def record_failed_attempt(delivery_pk, error):
+    """Count an attempt that failed before a response was recorded
+
+    Retries with the usual backoff until ``max_attempts``; a delivery whose
+    webhook is gone fails at once.
+    """
+    delivery = db.session.get(WebhookDelivery, delivery_pk)
+    if delivery is None:
+        return None
+    webhook = db.session.get(Webhook, delivery.webhook_id)
+
+    delivery.attempt_count += 1
+    delivery.error_message = error
+    if webhook is not None and delivery.attempt_count < delivery.max_attempts:
+        delivery.status = 'retrying'
+        delivery.next_retry_at = datetime.utcnow() + timedelta(
+            seconds=retry_delay(webhook.retry_delay_seconds, delivery.attempt_count)
+        )
+    else:
+        delivery.status = 'failed'
+        delivery.next_retry_at = None
+    db.session.commit()
+    return delivery
+
+
+# ===============================
+# DISPATCHER
+# ===============================
+
+class WebhookDispatcher:
+    """Claims due deliveries and runs them on a bounded pool, per-endpoint limited"""
+
+    def __init__(self, workers=WEBHOOK_WORKERS, endpoint_concurrency=WEBHOOK_ENDPOINT_CONCURRENCY,
+                 poll_seconds=WEBHOOK_POLL_SECONDS):
+        self.workers = workers
+        self.endpoint_concurrency = endpoint_concurrency
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._in_flight = {}  # webhook_id -> running deliveries
+        self._executor = None
+        self._thread = None
+        self._app = None
+
+    def start(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._app = app
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='webhook-delivery')
+            self._thread = threading.Thread(target=self._run, name='webhook-dispatcher', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        release_due = 0
+        while True:
+            try:
+                with self._app.app_context():
+                    try:
+                        if time.monotonic() >= release_due:
+                            self._release_stale_claims()
+                            release_due = time.monotonic() + WEBHOOK_CLAIM_TIMEOUT_SECONDS / 3
+                        claimed = self._claim_due()
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                print(f"Webhook dispatcher: failed to load due deliveries: {e}")
+                claimed = []
+            for delivery_pk, webhook_id in claimed:
+                self._executor.submit(self._deliver, delivery_pk, webhook_id)
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _release_stale_claims(self):
+        """Put deliveries claimed longer than WEBHOOK_CLAIM_TIMEOUT_SECONDS ago back in the queue"""
+        now = datetime.utcnow()
+        db.session.execute(
+            update(WebhookDelivery).where(
+                WebhookDelivery.status == 'delivering',
+                or_(
+                    WebhookDelivery.claimed_at.is_(None),
+                    WebhookDelivery.claimed_at < now - timedelta(seconds=WEBHOOK_CLAIM_TIMEOUT_SECONDS)
+                )
+            ).values(status='retrying', next_retry_at=now, claimed_at=None)
+        )
+        db.session.commit()
+
+    def _free_slots(self):
+        with self._lock:
+            busy = sum(self._in_flight.values())
+            return self.workers - busy, dict(self._in_flight)
+
+    def _claim_due(self):
+        """Mark the deliveries that fit the free worker and endpoint slots as delivering"""
+        free, in_flight = self._free_slots()
+        if free <= 0:
+            return []
+
+        due = db.session.execute(
+            select(WebhookDelivery.id, WebhookDelivery.webhook_id).where(
+                WebhookDelivery.status.in_(DUE_STATUSES),
+                WebhookDelivery.next_retry_at <= datetime.utcnow()
+            ).order_by(WebhookDelivery.next_retry_at, WebhookDelivery.id).limit(free * 4)
+        ).all()
+
+        now = datetime.utcnow()
+        claimed = []
+        for delivery_pk, webhook_id in due:
+            if len(claimed) >= free:
+                break
+            if in_flight.get(webhook_id, 0) >= self.endpoint_concurrency:
+                continue
+            # Only one process wins the claim; another may have taken the row since the SELECT
+            won = db.session.execute(
+                update(WebhookDelivery).where(
+                    WebhookDelivery.id == delivery_pk,
+                    WebhookDelivery.status.in_(DUE_STATUSES)
+                ).values(status='delivering', claimed_at=now)
+            ).rowcount == 1
+            if won:
+                in_flight[webhook_id] = in_flight.get(webhook_id, 0) + 1
+                claimed.append((delivery_pk, webhook_id))
+        db.session.commit()
+        if not claimed:
+            return []
+
+        with self._lock:
+            for _, webhook_id in claimed:
+                self._in_flight[webhook_id] = self._in_flight.get(webhook_id, 0) + 1
+        return claimed
+
+    def _deliver(self, delivery_pk, webhook_id):
+        try:
+            with self._app.app_context():
+                try:
+                    deliver(delivery_pk)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Webhook dispatcher: delivery {delivery_pk} failed: {e}")
+                    record_failed_attempt(delivery_pk, str(e) or type(e).__name__)
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._in_flight[webhook_id] -= 1
+                if not self._in_flight[webhook_id]:
+                    del self._in_flight[webhook_id]
+            # A slot opened: look for more due deliveries
+            self._wake.set()
+
+
+webhook_dispatcher = WebhookDispatcher()
@@ -1,30 +1,16 @@
 from functools import wraps
-from flask import jsonify
+from flask import jsonify, request
 from flask_jwt_extended import get_jwt_identity
-from models import User
+from services.identity_cache import get_identity, has_permission
+from services.document_numbers import allocate_number
 
-def generate_number(prefix, model, field_name='number'):
-    """Generate sequential number for entities"""
-    from datetime import datetime
-    
-    year = datetime.now().strftime('%Y')
-    month = datetime.now().strftime('%m')
-    
-    # Get last number
-    last_record = model.query.order_by(getattr(model, field_name).desc()).first()
-    
-    if last_record:
-        last_number = getattr(last_record, field_name)
-        # Extract sequence number
-        try:
-            seq = int(last_number.split('-')[-1])
-            new_seq = seq + 1
-        except:
-            new_seq = 1
-    else:
-        new_seq = 1
-    
-    return f"{prefix}-{year}{month}-{new_seq:05d}"
+def generate_number(prefix, model=None, field_name='number'):
+    """Generate sequential number for entities (PREFIX-YYYYMM-00001)
+
+    Numbers come from the counters in services/document_numbers.py, one per
+    prefix and ``model``/``field_name``, the column the number is stored in.
+    """
+    return allocate_number(prefix, model, field_name)
 
 def paginate_query(query, page=1, per_page=50):
     """Helper function to paginate queries"""
@@ -39,6 +25,14 @@ def paginate_query(query, page=1, per_page=50):
         'has_prev': paginated.has_prev
     }
 
+def conditional_json(payload, etag):
+    """JSON response with a weak ETag; answers 304 when the client's copy matches"""
+    response = jsonify(payload)
+    response.set_etag(etag, weak=True)
+    # Clients may keep the body but must revalidate before reusing it
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 def serialize_model(obj, fields=None, exclude=None):
     """Serialize SQLAlchemy model to dictionary"""
     if fields is None:
@@ -66,12 +60,28 @@ def admin_required():
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
-            user_id = get_jwt_identity()
-            user = User.query.get(user_id)
+            identity = get_identity(get_jwt_identity())
             
-            if not user or not user.is_admin:
+            if not identity or not identity.is_active or not identity.is_admin:
                 return jsonify({'error': 'Admin access required'}), 403
             
             return fn(*args, **kwargs)
         return decorator
     return wrapper
+
+def permission_required(permission):
+    """Decorator to require a permission such as 'sales_orders.create'
+
+    Checked against the cached identity of the JWT user; admins pass.
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            identity = get_identity(get_jwt_identity())
+            
+            if not has_permission(identity, permission):
+                return jsonify({'error': f'Permission required: {permission}'}), 403
+            
+            return fn(*args, **kwargs)
+        return decorator
+    return wrapper